@@ -72,4 +72,26 @@ module kb_blast {
     funcdef tBLASTn_Search (BLAST_Params params)  returns (BLAST_Output) authentication required;
     funcdef tBLASTx_Search (BLAST_Params params)  returns (BLAST_Output) authentication required;
     funcdef psiBLAST_msa_start_Search (BLAST_Params params)  returns (BLAST_Output) authentication required;
+
+
+    /* BLAST Refilter Input Params
+    **
+    **    report_ref: report of an earlier search, which keeps its raw hits
+    **    thresholds not given are those of the earlier search
+    */
+    typedef structure {
+        workspace_name workspace_name;
+	data_obj_ref   report_ref;
+        data_obj_name  output_filtered_name;
+	string         genome_disp_name_config;
+
+	float  ident_thresh;
+	float  bitscore;
+	float  overlap_fraction;
+    } BLAST_Refilter_Params;
+
+    /*  Method to filter the hits of an earlier search again, with new thresholds,
+    **  without running BLAST
+    */
+    funcdef BLAST_Refilter (BLAST_Refilter_Params params)  returns (BLAST_Output) authentication required;
 };
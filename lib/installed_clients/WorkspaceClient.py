@@ -23,7 +23,8 @@ class Workspace(object):
             self, url=None, timeout=30 * 60, user_id=None,
             password=None, token=None, ignore_authrc=False,
             trust_all_ssl_certificates=False,
-            auth_svc='https://ci.kbase.us/services/auth/api/legacy/KBase/Sessions/Login'):
+            auth_svc='https://ci.kbase.us/services/auth/api/legacy/KBase/Sessions/Login',
+            compress_requests=False):
         if url is None:
             raise ValueError('A url is required')
         self._service_ver = None
@@ -31,7 +32,7 @@ class Workspace(object):
             url, timeout=timeout, user_id=user_id, password=password,
             token=token, ignore_authrc=ignore_authrc,
             trust_all_ssl_certificates=trust_all_ssl_certificates,
-            auth_svc=auth_svc)
+            auth_svc=auth_svc, compress_requests=compress_requests)
 
     def ver(self, context=None):
         """
@@ -1506,7 +1507,7 @@ class Workspace(object):
         return self._client.call_method('Workspace.get_objects',
                                         [object_ids], self._service_ver, context)
 
-    def get_objects2(self, params, context=None):
+    def get_objects2(self, params, context=None, stream=True):
         """
         Get objects from the workspace.
         :param params: instance of type "GetObjects2Params" (Input parameters
@@ -1948,7 +1949,8 @@ class Workspace(object):
            "handle_stacktrace" of String
         """
         return self._client.call_method('Workspace.get_objects2',
-                                        [params], self._service_ver, context)
+                                        [params], self._service_ver, context,
+                                        stream)
 
     def get_object_subset(self, sub_object_ids, context=None):
         """
@@ -1,20 +1,38 @@
 # -*- coding: utf-8 -*-
+import copy
+import glob
+import hashlib
+import json
+import logging
 import os
 import re
-import subprocess
-import sys
+import threading
 import traceback
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pprint import pformat
 
 # SDK Utils
-from installed_clients.KBaseDataObjectToFileUtilsClient import KBaseDataObjectToFileUtils
-from installed_clients.kb_SetUtilitiesClient import kb_SetUtilities
 from installed_clients.DataFileUtilClient import DataFileUtil as DFUClient
+from installed_clients.KBaseDataObjectToFileUtilsClient import KBaseDataObjectToFileUtils
 from installed_clients.KBaseReportClient import KBaseReport
 from installed_clients.WorkspaceClient import Workspace as workspaceService
 
+# BlastUtil helpers
+from kb_blast.Utils.Checkpoint import JobCheckpoint
+from kb_blast.Utils.ClientPool import get_client
+from kb_blast.Utils.HitTable import HIT_TABLE_EXT, read_hit_table, read_outfmt7, trim_target_feature_info, write_hit_table, write_outfmt7
+from kb_blast.Utils.JobLog import JobLog, SubprocessLog
+from kb_blast.Utils.JobProfiler import JobProfiler, profile_memory, profile_mode
+from kb_blast.Utils.ObjectFetch import get_obj_subset
+from kb_blast.Utils.ProcessLimits import ProcessLimitExceeded, ProcessLimits
+from kb_blast.Utils.ProcessMetrics import ProcessMetrics, db_size_bytes, fasta_residues
+from kb_blast.Utils.ResultCache import ResultCache
+from kb_blast.Utils.ScratchManager import ScratchManager
+from kb_blast.Utils.StageTimer import StageTimer
+from kb_blast.Utils.UploadQueue import UploadQueue
+
 
 ###############################################################################
 # BlastUtil: methods to support Apps in kb_blast KBase module
@@ -47,6 +65,18 @@ class BlastUtil:
     tBLASTx       = '/kb/module/blast/bin/tblastx'
     psiBLAST      = '/kb/module/blast/bin/psiblast'
 
+    # raw BLAST outputs (outfmt 7 and extra formats) are gzipped before upload
+    compress_BLAST_output = True
+
+    # split bulk save_objects() calls so no single request gets too large
+    max_save_objects_payload = 100*1024*1024
+
+    # DOTFU jobs run on the callback server alongside everything else
+    max_concurrent_DOTFU_jobs = 8
+
+    # BLAST output kept across jobs when 'result-cache-dir' is configured (or
+    # $KB_BLAST_RESULT_CACHE_DIR is set), least recently used evicted past this
+    result_cache_max_bytes = 20*1024*1024*1024
 
     # timestamp
     def now_ISO(self):
@@ -55,13 +85,9 @@ class BlastUtil:
         now_timestamp_in_iso = datetime.fromtimestamp(int(now_secs_from_epoch)).strftime('%Y-%m-%d_%T')
         return now_timestamp_in_iso
 
-    # message logging
+    # message logging (leveled and buffered, see Utils/JobLog.py)
     def log(self, target, message):
-        message = '['+self.now_ISO()+'] '+message
-        if target is not None:
-            target.append(message)
-        print(message)
-        sys.stdout.flush()
+        self.job_log.log(target, message)
 
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -70,6 +96,7 @@ class BlastUtil:
         #BEGIN_CONSTRUCTOR
         self.config = config
         self.ctx = ctx
+        self.job_log = JobLog()
 
         self.workspaceURL = config['workspace-url']
         self.shockURL = config['shock-url']
@@ -88,29 +115,54 @@ class BlastUtil:
             os.makedirs(self.scratch)
 
         try:
-            self.wsClient = workspaceService(self.workspaceURL, token=self.ctx['token'])
+            # large FeatureSet saves are gzipped if the deploy config says
+            # the workspace accepts gzip request bodies
+            compress_ws_requests = config.get('workspace-gzip-requests') or \
+                                   os.environ.get('KB_BLAST_WORKSPACE_GZIP_REQUESTS') or ''
+            self.wsClient = get_client(workspaceService, self.workspaceURL, token=self.ctx['token'],
+                                       compress_requests=str(compress_ws_requests).strip().lower() in ('1', 'true', 'yes', 'on'))
         except:
             raise ValueError ("Failed to connect to workspace service")
         try:
             REPORT_SERVICE_VER = 'release'
-            self.reportClient = KBaseReport(self.callbackURL, token=self.ctx['token'], service_ver=REPORT_SERVICE_VER)
+            self.reportClient = get_client(KBaseReport, self.callbackURL, token=self.ctx['token'], service_ver=REPORT_SERVICE_VER)
         except:
             raise ValueError ("Failed to instantiate KBaseReport client")
-        try:
-            SU_SERVICE_VER = 'release'
-            self.set_util_Client = kb_SetUtilities(url=self.callbackURL, token=self.ctx['token'], service_ver=SU_SERVICE_VER)  # SDK Local
-            #self.set_util_Client = kb_SetUtilities(url=self.serviceWizardURL, token=self.ctx['token'], service_ver=SU_SERVICE_VER)  # Service
-        except:
-            raise ValueError("unable to instantiate kb_SetUtilities client")
         try:
             DOTFU_SERVICE_VER = 'release'
             #DOTFU_SERVICE_VER = 'beta'  # DEBUG
-            self.DOTFU = KBaseDataObjectToFileUtils (url=self.callbackURL, token=self.ctx['token'], service_ver=DOTFU_SERVICE_VER)
+            self.DOTFU = get_client(KBaseDataObjectToFileUtils, self.callbackURL, token=self.ctx['token'], service_ver=DOTFU_SERVICE_VER)
         except:
             raise ValueError ("Failed to instantiate DataObjectToFileUtils client")
+        self.DOTFU_semaphore = threading.BoundedSemaphore(self.max_concurrent_DOTFU_jobs)
+        try:
+            self.upload_queue = UploadQueue(self.callbackURL, token=self.ctx['token'])
+        except:
+            raise ValueError ("Failed to instantiate upload queue")
 
         self.genome_id_feature_id_delim = '.f:'
 
+        # this job's own scratch dirs, removed when it's done (see cleanup_scratch())
+        self.scratch_manager = ScratchManager.for_job(self.scratch, config)
+        # finished stages of an earlier try of the same job (set per job)
+        self.checkpoint = JobCheckpoint(None, None)
+
+        # per-stage wall/cpu/RSS spans, attached to the report as a timeline
+        self.stage_timer = StageTimer()
+        # rusage of every makeblastdb and BLAST run, attached to the report
+        self.process_metrics = ProcessMetrics()
+        # time budgets, cancellation and memory caps for those runs
+        self.process_limits = ProcessLimits.for_job(config)
+        # full makeblastdb and BLAST output, attached to the report
+        self.subprocess_log = SubprocessLog(os.path.join(self.scratch_manager.stage_dir('logs'), 'subprocess_output.txt'))
+        # opt-in profile of run_BLAST_App(), attached to the report
+        self.profiler = JobProfiler(None)
+        # BLAST output from earlier jobs with the same query, target and settings
+        self.result_cache = ResultCache(config.get('result-cache-dir') or os.environ.get('KB_BLAST_RESULT_CACHE_DIR'),
+                                        int(config.get('result-cache-max-bytes') or
+                                            os.environ.get('KB_BLAST_RESULT_CACHE_MAX_BYTES') or
+                                            self.result_cache_max_bytes))
+
 
         #END_CONSTRUCTOR
         pass
@@ -125,7 +177,8 @@ class BlastUtil:
 
         provenance = [{}]
         if 'provenance' in self.ctx:
-            provenance = self.ctx['provenance']
+            # copy so objects saved together in bulk don't share input refs
+            provenance = copy.deepcopy(self.ctx['provenance'])
         # add additional info to provenance here, in this case the input data object reference
         provenance[0]['input_ws_objects'] = []
         if input_obj_refs:
@@ -268,12 +321,15 @@ class BlastUtil:
         # determine query object type
         #
         try:
-            ws = workspaceService(self.workspaceURL, token=self.ctx['token'])
             #objects = ws.get_objects([{'ref': input_one_ref}])
-            objects = self.wsClient.get_objects2({'objects':[{'ref': input_one_ref}]})['data']
-            input_one_data = objects[0]['data']
-            input_one_name = str(objects[0]['info'][1])
-            info = objects[0]['info']
+            # only the first sequence of a SequenceSet is used, and DOTFU reads
+            # FeatureSets itself
+            obj = get_obj_subset(self.wsClient, input_one_ref,
+                                 {'SequenceSet': ['/sequences/0'],
+                                  'FeatureSet': None})
+            input_one_data = obj['data']
+            input_one_name = str(obj['info'][1])
+            info = obj['info']
                                                              
             query_type_name = info[2].split('.')[1].split('-')[0]
         except Exception as e:
@@ -307,7 +363,7 @@ class BlastUtil:
             else:
                 appropriate_sequence_found_in_one_input = True
 
-            query_fasta_file_path = os.path.join(self.scratch, header_id+'.fasta')
+            query_fasta_file_path = os.path.join(self.scratch_manager.stage_dir('query'), header_id+'.fasta')
             query_fasta_file_handle = open(query_fasta_file_path, 'w')
             self.log(console, 'writing reads file: '+str(query_fasta_file_path))
             query_fasta_file_handle.write('>'+header_id+"\n")
@@ -321,7 +377,7 @@ class BlastUtil:
         elif query_type_name == 'FeatureSet':
             # retrieve sequences for features
             #input_one_featureSet = input_one_data
-            query_fasta_file_dir = self.scratch
+            query_fasta_file_dir = self.scratch_manager.stage_dir('query')
             query_fasta_file = input_one_name+".fasta"
 
             # DEBUG
@@ -362,20 +418,11 @@ class BlastUtil:
               })
                  
 
-    #### Get the input_many object
+    #### Get the input_many object and set up its FASTA conversion
     ##
-    def write_target_obj_to_file (self, params, input_many_ref, seq_type):
+    def _prep_target_obj_conversion (self, params, input_many_ref, seq_type):
         console = []
         invalid_msgs = []
-        appropriate_sequence_found_in_many_input = False
-        target_feature_info = { 'feature_ids': None,
-                                'feature_ids_by_genome_ref': None,
-                                'feature_ids_by_genome_id': None,
-                                'feature_id_to_function': None,
-                                'genome_ref_to_sci_name': None,
-                                'genome_ref_to_obj_name': None,
-                                'genome_id_to_genome_ref': None
-        }
         target_fasta_file_compression = None
         sequencing_tech = 'N/A'
 
@@ -386,9 +433,16 @@ class BlastUtil:
         
         try:
             #objects = ws.get_objects([{'ref': input_many_ref}])
-            objects = self.wsClient.get_objects2({'objects':[{'ref': input_many_ref}]})['data']
-            input_many_data = objects[0]['data']
-            info = objects[0]['info']
+            # DOTFU reads the objects itself, so only fetch the genome refs
+            # needed to fill target_feature_info
+            obj = get_obj_subset(self.wsClient, input_many_ref,
+                                 {'FeatureSet': None,
+                                  'Genome': None,
+                                  'AnnotatedMetagenomeAssembly': None,
+                                  'GenomeSet': ['/elements'],
+                                  'Tree': ['/ws_refs']})
+            input_many_data = obj['data']
+            info = obj['info']
             input_many_name = str(info[1])
             target_type_name = info[2].split('.')[1].split('-')[0]
 
@@ -537,13 +591,11 @@ class BlastUtil:
         #elif target_type_name == 'FeatureSet':
         if target_type_name == 'FeatureSet':
             # retrieve sequences for features
-            input_many_featureSet = input_many_data
-            target_fasta_file_dir = self.scratch
+            target_fasta_file_dir = self.scratch_manager.stage_dir('targets', input_many_ref)
             target_fasta_file = input_many_name+".fasta"
 
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            FeatureSetToFASTA_params = {
+            DOTFU_method = 'FeatureSetToFASTA'
+            DOTFU_params = {
                 'featureSet_ref':      input_many_ref,
                 'file':                target_fasta_file,
                 'dir':                 target_fasta_file_dir,
@@ -560,30 +612,15 @@ class BlastUtil:
                 'merge_fasta_files':   'TRUE'
                 }
 
-            FeatureSetToFASTA_retVal = self.DOTFU.FeatureSetToFASTA (FeatureSetToFASTA_params)
-            target_fasta_file_path = FeatureSetToFASTA_retVal['fasta_file_path']
-            target_feature_info['short_id_to_rec_id'] = FeatureSetToFASTA_retVal['short_id_to_rec_id']
-            target_feature_info['feature_ids_by_genome_ref'] = FeatureSetToFASTA_retVal['feature_ids_by_genome_ref']
-            if len(list(target_feature_info['feature_ids_by_genome_ref'].keys())) > 0:
-                appropriate_sequence_found_in_many_input = True
-            target_feature_info['feature_id_to_function'] = FeatureSetToFASTA_retVal['feature_id_to_function']
-            target_feature_info['genome_ref_to_sci_name'] = FeatureSetToFASTA_retVal['genome_ref_to_sci_name']
-            target_feature_info['genome_ref_to_obj_name'] = FeatureSetToFASTA_retVal['genome_ref_to_obj_name']
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "FeatureSetToFasta() took "+str(end_time-beg_time)+" secs")
-
 
         # Genome
         #
         elif target_type_name == 'Genome':
-            target_fasta_file_dir = self.scratch
+            target_fasta_file_dir = self.scratch_manager.stage_dir('targets', input_many_ref)
             target_fasta_file = input_many_name+".fasta"
 
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            GenomeToFASTA_params = {
+            DOTFU_method = 'GenomeToFASTA'
+            DOTFU_params = {
                 'genome_ref':          input_many_ref,
                 'file':                target_fasta_file,
                 'dir':                 target_fasta_file_dir,
@@ -599,32 +636,15 @@ class BlastUtil:
                 'write_off_code_prot_seq': params['write_off_code_prot_seq']
                 }
 
-            GenomeToFASTA_retVal = self.DOTFU.GenomeToFASTA (GenomeToFASTA_params)
-            target_fasta_file_path = GenomeToFASTA_retVal['fasta_file_path']
-            target_feature_info['short_id_to_rec_id'] = GenomeToFASTA_retVal['short_id_to_rec_id']
-            target_feature_info['feature_ids'] = GenomeToFASTA_retVal['feature_ids']
-            if len(target_feature_info['feature_ids']) > 0:
-                appropriate_sequence_found_in_many_input = True
-            target_feature_info['feature_id_to_function'] = GenomeToFASTA_retVal['feature_id_to_function']
-            target_feature_info['genome_ref_to_sci_name'] = GenomeToFASTA_retVal['genome_ref_to_sci_name']
-            target_feature_info['genome_ref_to_obj_name'] = GenomeToFASTA_retVal['genome_ref_to_obj_name']
-            
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "Genome2Fasta() took "+str(end_time-beg_time)+" secs")
-
 
         # GenomeSet
         #
         elif target_type_name == 'GenomeSet':
-            input_many_genomeSet = input_many_data
-            target_fasta_file_dir = self.scratch
+            target_fasta_file_dir = self.scratch_manager.stage_dir('targets', input_many_ref)
             target_fasta_file = input_many_name+".fasta"
 
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            GenomeSetToFASTA_params = {
+            DOTFU_method = 'GenomeSetToFASTA'
+            DOTFU_params = {
                 'genomeSet_ref':       input_many_ref,
                 'file':                target_fasta_file,
                 'dir':                 target_fasta_file_dir,
@@ -641,36 +661,15 @@ class BlastUtil:
                 'merge_fasta_files':   'TRUE'
                 }
 
-            GenomeSetToFASTA_retVal = self.DOTFU.GenomeSetToFASTA (GenomeSetToFASTA_params)
-            target_fasta_file_path = GenomeSetToFASTA_retVal['fasta_file_path_list'][0]
-            target_feature_info['short_id_to_rec_id'] = GenomeSetToFASTA_retVal['short_id_to_rec_id']
-            target_feature_info['feature_ids_by_genome_id'] = GenomeSetToFASTA_retVal['feature_ids_by_genome_id']
-            if len(list(target_feature_info['feature_ids_by_genome_id'].keys())) > 0:
-                appropriate_sequence_found_in_many_input = True
-            target_feature_info['feature_id_to_function'] = GenomeSetToFASTA_retVal['feature_id_to_function']
-            target_feature_info['genome_ref_to_sci_name'] = GenomeSetToFASTA_retVal['genome_ref_to_sci_name']
-            target_feature_info['genome_ref_to_obj_name'] = GenomeSetToFASTA_retVal['genome_ref_to_obj_name']
-
-            target_feature_info['genome_id_to_genome_ref'] = dict()
-            for genome_id in input_many_genomeSet['elements'].keys():
-                genome_ref = input_many_genomeSet['elements'][genome_id]['ref']
-                target_feature_info['genome_id_to_genome_ref'][genome_id] = genome_ref
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "GenomeSetToFasta() took "+str(end_time-beg_time)+" secs")
-
 
         # SpeciesTree
         #
         elif target_type_name == 'Tree':
-            input_many_speciesTree = input_many_data
-            target_fasta_file_dir = self.scratch
+            target_fasta_file_dir = self.scratch_manager.stage_dir('targets', input_many_ref)
             target_fasta_file = input_many_name+".fasta"
 
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            SpeciesTreeToFASTA_params = {
+            DOTFU_method = 'SpeciesTreeToFASTA'
+            DOTFU_params = {
                 'tree_ref':            input_many_ref,
                 'file':                target_fasta_file,
                 'dir':                 target_fasta_file_dir,
@@ -687,35 +686,15 @@ class BlastUtil:
                 'merge_fasta_files':   'TRUE'
                 }
 
-            SpeciesTreeToFASTA_retVal = self.DOTFU.SpeciesTreeToFASTA (SpeciesTreeToFASTA_params)
-            target_fasta_file_path = SpeciesTreeToFASTA_retVal['fasta_file_path_list'][0]
-            target_feature_info['short_id_to_rec_id'] = SpeciesTreeToFASTA_retVal['short_id_to_rec_id']
-            target_feature_info['feature_ids_by_genome_id'] = SpeciesTreeToFASTA_retVal['feature_ids_by_genome_id']
-            if len(list(target_feature_info['feature_ids_by_genome_id'].keys())) > 0:
-                appropriate_sequence_found_in_many_input = True
-            target_feature_info['feature_id_to_function'] = SpeciesTreeToFASTA_retVal['feature_id_to_function']
-            target_feature_info['genome_ref_to_sci_name'] = SpeciesTreeToFASTA_retVal['genome_ref_to_sci_name']
-            target_feature_info['genome_ref_to_obj_name'] = SpeciesTreeToFASTA_retVal['genome_ref_to_obj_name']
-
-            target_feature_info['genome_id_to_genome_ref'] = dict()
-            for genome_id in input_many_speciesTree['ws_refs'].keys():
-                genome_ref = input_many_speciesTree['ws_refs'][genome_id]['g'][0]
-                target_feature_info['genome_id_to_genome_ref'][genome_id] = genome_ref
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "SpeciesTreeToFasta() took "+str(end_time-beg_time)+" secs")
-
 
         # AnnotatedMetagenomeAssembly
         #
         elif target_type_name == 'AnnotatedMetagenomeAssembly':
-            target_fasta_file_dir = self.scratch
+            target_fasta_file_dir = self.scratch_manager.stage_dir('targets', input_many_ref)
             target_fasta_file = input_many_name+".fasta"
 
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            AnnotatedMetagenomeAssemblyToFASTA_params = {
+            DOTFU_method = 'AnnotatedMetagenomeAssemblyToFASTA'
+            DOTFU_params = {
                 'ama_ref':             input_many_ref,
                 'file':                target_fasta_file,
                 'dir':                 target_fasta_file_dir,
@@ -731,50 +710,176 @@ class BlastUtil:
                 'id_len_limit':        49
                 }
 
-            AnnotatedMetagenomeAssemblyToFASTA_retVal = self.DOTFU.AnnotatedMetagenomeAssemblyToFASTA (AnnotatedMetagenomeAssemblyToFASTA_params)
-            target_fasta_file_path = AnnotatedMetagenomeAssemblyToFASTA_retVal['fasta_file_path']
-            target_feature_info['short_id_to_rec_id'] = AnnotatedMetagenomeAssemblyToFASTA_retVal['short_id_to_rec_id']
-            target_feature_info['feature_ids'] = AnnotatedMetagenomeAssemblyToFASTA_retVal['feature_ids']
+
+        # Missing proper input_target_type
+        #
+        else:
+            raise ValueError('Cannot yet handle input_many type of: '+target_type_name)
+
+
+        return ({ 'target_name': input_many_name,
+                  'target_type_name': target_type_name,
+                  'input_many_data': input_many_data,
+                  'invalid_msgs': invalid_msgs,
+                  'DOTFU_method': DOTFU_method,
+                  'DOTFU_params': DOTFU_params
+              })
+
+
+    #### Collect FASTA conversion output for the input_many object
+    ##
+    def _finish_target_obj_conversion (self, target_conversion, DOTFU_retVal):
+        appropriate_sequence_found_in_many_input = False
+        target_feature_info = { 'feature_ids': None,
+                                'feature_ids_by_genome_ref': None,
+                                'feature_ids_by_genome_id': None,
+                                'feature_id_to_function': None,
+                                'genome_ref_to_sci_name': None,
+                                'genome_ref_to_obj_name': None,
+                                'genome_id_to_genome_ref': None
+        }
+        target_type_name = target_conversion['target_type_name']
+        input_many_data = target_conversion['input_many_data']
+
+        # FeatureSet
+        #
+        if target_type_name == 'FeatureSet':
+            target_fasta_file_path = DOTFU_retVal['fasta_file_path']
+            target_feature_info['short_id_to_rec_id'] = DOTFU_retVal['short_id_to_rec_id']
+            target_feature_info['feature_ids_by_genome_ref'] = DOTFU_retVal['feature_ids_by_genome_ref']
+            if len(list(target_feature_info['feature_ids_by_genome_ref'].keys())) > 0:
+                appropriate_sequence_found_in_many_input = True
+            target_feature_info['feature_id_to_function'] = DOTFU_retVal['feature_id_to_function']
+            target_feature_info['genome_ref_to_sci_name'] = DOTFU_retVal['genome_ref_to_sci_name']
+            target_feature_info['genome_ref_to_obj_name'] = DOTFU_retVal['genome_ref_to_obj_name']
+
+        # Genome
+        #
+        elif target_type_name == 'Genome':
+            target_fasta_file_path = DOTFU_retVal['fasta_file_path']
+            target_feature_info['short_id_to_rec_id'] = DOTFU_retVal['short_id_to_rec_id']
+            target_feature_info['feature_ids'] = DOTFU_retVal['feature_ids']
             if len(target_feature_info['feature_ids']) > 0:
                 appropriate_sequence_found_in_many_input = True
-            target_feature_info['feature_id_to_function'] = AnnotatedMetagenomeAssemblyToFASTA_retVal['feature_id_to_function']
-            target_feature_info['ama_ref_to_obj_name'] = AnnotatedMetagenomeAssemblyToFASTA_retVal['ama_ref_to_obj_name']
+            target_feature_info['feature_id_to_function'] = DOTFU_retVal['feature_id_to_function']
+            target_feature_info['genome_ref_to_sci_name'] = DOTFU_retVal['genome_ref_to_sci_name']
+            target_feature_info['genome_ref_to_obj_name'] = DOTFU_retVal['genome_ref_to_obj_name']
 
-            # DEBUG
-            #with open (target_fasta_file_path, 'r') as fasta_handle:
-            #    for fasta_line in fasta_handle.readlines():
-            #        print ("FASTA_LINE: '"+fasta_line)
-            
+        # GenomeSet
+        #
+        elif target_type_name == 'GenomeSet':
+            target_fasta_file_path = DOTFU_retVal['fasta_file_path_list'][0]
+            target_feature_info['short_id_to_rec_id'] = DOTFU_retVal['short_id_to_rec_id']
+            target_feature_info['feature_ids_by_genome_id'] = DOTFU_retVal['feature_ids_by_genome_id']
+            if len(list(target_feature_info['feature_ids_by_genome_id'].keys())) > 0:
+                appropriate_sequence_found_in_many_input = True
+            target_feature_info['feature_id_to_function'] = DOTFU_retVal['feature_id_to_function']
+            target_feature_info['genome_ref_to_sci_name'] = DOTFU_retVal['genome_ref_to_sci_name']
+            target_feature_info['genome_ref_to_obj_name'] = DOTFU_retVal['genome_ref_to_obj_name']
 
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "Genome2Fasta() took "+str(end_time-beg_time)+" secs")
+            target_feature_info['genome_id_to_genome_ref'] = dict()
+            for genome_id in input_many_data['elements'].keys():
+                genome_ref = input_many_data['elements'][genome_id]['ref']
+                target_feature_info['genome_id_to_genome_ref'][genome_id] = genome_ref
 
+        # SpeciesTree
+        #
+        elif target_type_name == 'Tree':
+            target_fasta_file_path = DOTFU_retVal['fasta_file_path_list'][0]
+            target_feature_info['short_id_to_rec_id'] = DOTFU_retVal['short_id_to_rec_id']
+            target_feature_info['feature_ids_by_genome_id'] = DOTFU_retVal['feature_ids_by_genome_id']
+            if len(list(target_feature_info['feature_ids_by_genome_id'].keys())) > 0:
+                appropriate_sequence_found_in_many_input = True
+            target_feature_info['feature_id_to_function'] = DOTFU_retVal['feature_id_to_function']
+            target_feature_info['genome_ref_to_sci_name'] = DOTFU_retVal['genome_ref_to_sci_name']
+            target_feature_info['genome_ref_to_obj_name'] = DOTFU_retVal['genome_ref_to_obj_name']
 
-        # Missing proper input_target_type
+            target_feature_info['genome_id_to_genome_ref'] = dict()
+            for genome_id in input_many_data['ws_refs'].keys():
+                genome_ref = input_many_data['ws_refs'][genome_id]['g'][0]
+                target_feature_info['genome_id_to_genome_ref'][genome_id] = genome_ref
+
+        # AnnotatedMetagenomeAssembly
         #
-        else:
-            raise ValueError('Cannot yet handle input_many type of: '+target_type_name)
+        elif target_type_name == 'AnnotatedMetagenomeAssembly':
+            target_fasta_file_path = DOTFU_retVal['fasta_file_path']
+            target_feature_info['short_id_to_rec_id'] = DOTFU_retVal['short_id_to_rec_id']
+            target_feature_info['feature_ids'] = DOTFU_retVal['feature_ids']
+            if len(target_feature_info['feature_ids']) > 0:
+                appropriate_sequence_found_in_many_input = True
+            target_feature_info['feature_id_to_function'] = DOTFU_retVal['feature_id_to_function']
+            target_feature_info['ama_ref_to_obj_name'] = DOTFU_retVal['ama_ref_to_obj_name']
 
 
-        return ({ 'target_name': input_many_name,
+        return ({ 'target_name': target_conversion['target_name'],
                   'target_type_name': target_type_name,
                   'target_fasta_file_path': target_fasta_file_path,
                   'appropriate_sequence_found_in_many_input': appropriate_sequence_found_in_many_input,
-                  'invalid_msgs': invalid_msgs,
+                  'invalid_msgs': target_conversion['invalid_msgs'],
                   'target_feature_info': target_feature_info
               })
 
 
-    # input data failed validation.  Need to return
+    # _run_DOTFU_conversion(): limited to max_concurrent_DOTFU_jobs at a time
+    #
+    def _run_DOTFU_conversion (self, DOTFU_method, DOTFU_params, target_ref=None):
+        with self.DOTFU_semaphore:
+            with self.stage_timer.span('target_convert', target=target_ref, method=DOTFU_method):
+                return getattr(self.DOTFU, DOTFU_method)(DOTFU_params)
+
+
+    #### Write the input_many object to a FASTA file
+    ##
+    def write_target_obj_to_file (self, params, input_many_ref, seq_type):
+        target_conversion = self._prep_target_obj_conversion (params, input_many_ref, seq_type)
+        DOTFU_retVal = self._run_DOTFU_conversion (target_conversion['DOTFU_method'],
+                                                   target_conversion['DOTFU_params'],
+                                                   target_ref=input_many_ref)
+        return self._finish_target_obj_conversion (target_conversion, DOTFU_retVal)
+
+
+    #### Write all input_many objects to FASTA files
+    ##
+    #   the DOTFU conversions are submitted together and awaited together,
+    #   so the stage takes as long as the slowest target.  The stage is timed
+    #   here, on the calling thread; its target_convert spans run on the
+    #   pool's threads
+    #
+    def write_target_objs_to_files (self, params, input_many_refs, seq_type):
+        console = []
+        with self.stage_timer.span('target_write', num_targets=len(input_many_refs)):
+            target_conversions = dict()
+            for input_many_ref in input_many_refs:
+                with self.stage_timer.span('target_fetch', target=input_many_ref):
+                    target_conversions[input_many_ref] = self._prep_target_obj_conversion (params, input_many_ref, seq_type)
+
+            self.log(console, 'CONVERTING '+str(len(target_conversions))+' TARGETS TO FASTA')
+            max_workers = max(1, min(len(target_conversions), self.max_concurrent_DOTFU_jobs))
+            write_target_obj_to_file_results = dict()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                DOTFU_futures = dict()
+                for input_many_ref, target_conversion in target_conversions.items():
+                    DOTFU_futures[input_many_ref] = executor.submit(self._run_DOTFU_conversion,
+                                                                    target_conversion['DOTFU_method'],
+                                                                    target_conversion['DOTFU_params'],
+                                                                    input_many_ref)
+                for input_many_ref, target_conversion in target_conversions.items():
+                    write_target_obj_to_file_results[input_many_ref] = \
+                        self._finish_target_obj_conversion (target_conversion,
+                                                            DOTFU_futures[input_many_ref].result())
+
+        return write_target_obj_to_file_results
+
+
+    # input data failed validation, or BLAST was stopped.  Need to return
     #
-    def save_error_report_with_invalid_msgs (self, invalid_msgs, input_one_ref, input_many_refs, method_name):
+    def save_error_report_with_invalid_msgs (self, invalid_msgs, input_one_ref, input_many_refs, method_name, workspace_name):
         console = []
 
         # build output report object
         #
         self.log(console,"BUILDING REPORT")  # DEBUG
-        report += "FAILURE:\n\n"+"\n".join(invalid_msgs)+"\n"
+        report = "FAILURE:\n\n"+"\n".join(invalid_msgs)+"\n"
         reportObj = {
             'objects_created':[],
             'text_message':report
@@ -783,7 +888,7 @@ class BlastUtil:
         reportName = 'blast_report_'+str(uuid.uuid4())
         report_obj_info = self.wsClient.save_objects({
             #'id':info[6],
-            'workspace':params['workspace_name'],
+            'workspace':workspace_name,
             'objects':[
                 {
                     'type':'KBaseReport.Report',
@@ -792,7 +897,7 @@ class BlastUtil:
                     'meta':{},
                     'hidden':1,
                     'provenance': self._instantiate_provenance(method_name = method_name,
-                                                               input_obj_refs = [input_one_ref]+input_many_refs)
+                                                               input_obj_refs = ([input_one_ref] if input_one_ref else [])+input_many_refs)
                 }
             ]
         })[0]
@@ -807,7 +912,7 @@ class BlastUtil:
     ##
     def format_BLAST_db (self, search_tool_name, target_fasta_file_path):
         console = []
-        BLAST_FORMAT_successful = True
+        BLAST_DB_FORMAT_successful = True
 
         # set seq type
         if search_tool_name == 'BLASTn' or search_tool_name == 'tBLASTn':
@@ -848,22 +953,20 @@ class BlastUtil:
 #        report += "\n"+'running Make_BLAST_DB:'+"\n"
 #        report += '    '+' '.join(makeblastdb_cmd)+"\n"
 
-        p = subprocess.Popen(makeblastdb_cmd, \
-                             cwd = self.scratch, \
-                             stdout = subprocess.PIPE, \
-                             stderr = subprocess.STDOUT, \
-                             shell = False)
-
-        while True:
-            line = p.stdout.readline().decode()
-            if not line: break
-            self.log(console, line.replace('\n', ''))
-
-        p.stdout.close()
-        p.wait()
-        self.log(console, 'return code: ' + str(p.returncode))
-        if p.returncode != 0:
-            self.log(console,'Error running makeblastdb, return code: '+str(p.returncode) + '\n\n')
+        self.job_log.flush()
+        makeblastdb_metrics = self.process_metrics.run(makeblastdb_cmd,
+                                                       cwd = self.scratch_manager.job_dir,
+                                                       line_handler = self.subprocess_log.start(makeblastdb_cmd),
+                                                       limits = self.process_limits,
+                                                       stage = 'format_db',
+                                                       fasta_bytes = os.path.getsize(target_fasta_file_path) if os.path.isfile(target_fasta_file_path) else 0)
+        makeblastdb_metrics['db_size_bytes'] = db_size_bytes(target_fasta_file_path)
+        returncode = makeblastdb_metrics['returncode']
+
+        self.log(console, 'return code: ' + str(returncode))
+        if returncode != 0:
+            self.log(console,'Error running makeblastdb, return code: '+str(returncode) + '\n\n' +
+                     '\n'.join(self.subprocess_log.get_tail()))
             #'\n\n'+ '\n'.join(console))
             BLAST_DB_FORMAT_successful = False
 
@@ -879,7 +982,7 @@ class BlastUtil:
             self.log(console,"makeblastdb created empty DB file '"+target_fasta_file_path+"."+db_ext+"'")
             BLAST_DB_FORMAT_successful = False
 
-        return BLAST_FORMAT_successful
+        return BLAST_DB_FORMAT_successful
 
 
     # _check_BLAST_input_ready()
@@ -943,10 +1046,7 @@ class BlastUtil:
     # _set_BLAST_output_path()
     #
     def _set_BLAST_output_path (self, BLAST_output_format_str):
-        timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()*1000)
-        output_dir = os.path.join(self.scratch,'output.'+str(timestamp))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        output_dir = self.scratch_manager.new_dir('search')
 
         return os.path.join(output_dir, 'alnout_m='+BLAST_output_format_str+'.txt');
         #output_filtered_fasta_file_path = os.path.join(output_dir, 'output_filtered.fna');  # only for SingleEndLibrary
@@ -955,11 +1055,8 @@ class BlastUtil:
     # _set_HTML_outdir()
     #
     def _set_HTML_outdir (self):
-        timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()*1000)
-        output_dir = os.path.join(self.scratch,'output.'+str(timestamp))
+        output_dir = self.scratch_manager.new_dir('report')
         html_output_dir = os.path.join(output_dir,'html')
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
         if not os.path.exists(html_output_dir):
             os.makedirs(html_output_dir)
 
@@ -1016,7 +1113,9 @@ class BlastUtil:
 
     # _exec_BLAST()
     #
-    def _exec_BLAST (self, BLAST_cmd):
+    #   metrics_attrs (db size, query residues...) go in the process metrics
+    #
+    def _exec_BLAST (self, BLAST_cmd, **metrics_attrs):
         console = []
 
         # Run BLAST, capture output as it happens
@@ -1024,22 +1123,18 @@ class BlastUtil:
         self.log(console, ' '.join(BLAST_cmd))
         self.log(console, '--------------------------------------')
 
-        p = subprocess.Popen(BLAST_cmd, \
-                             cwd = self.scratch, \
-                             stdout = subprocess.PIPE, \
-                             stderr = subprocess.STDOUT, \
-                             shell = False)
-
-        while True:
-            line = p.stdout.readline().decode()
-            if not line: break
-            self.log(console, line.replace('\n', ''))
+        self.job_log.flush()
+        BLAST_metrics = self.process_metrics.run(BLAST_cmd,
+                                                 cwd = self.scratch_manager.job_dir,
+                                                 line_handler = self.subprocess_log.start(BLAST_cmd),
+                                                 limits = self.process_limits,
+                                                 stage = 'search',
+                                                 **metrics_attrs)
+        returncode = BLAST_metrics['returncode']
 
-        p.stdout.close()
-        p.wait()
-        self.log(console, 'return code: ' + str(p.returncode))
-        if p.returncode != 0:
-            return 'Error running BLAST, return code: '+str(p.returncode) + '\n\n'+ '\n'.join(console)
+        self.log(console, 'return code: ' + str(returncode))
+        if returncode != 0:
+            return 'Error running BLAST, return code: '+str(returncode) + '\n\n'+ '\n'.join(console + self.subprocess_log.get_tail())
 
         return 'Success'
 
@@ -1070,31 +1165,87 @@ class BlastUtil:
 
 
         # execute BLAST
-        BLAST_exec_return_msg = self._exec_BLAST (BLAST_cmd)
+        BLAST_exec_return_msg = self._exec_BLAST (BLAST_cmd,
+                                                  outfmt = BLAST_output_format_str,
+                                                  db_size_bytes = db_size_bytes(target_fasta_file_path),
+                                                  query_residues = fasta_residues(query_fasta_file_path))
         if BLAST_exec_return_msg != 'Success':
             self.log(console, BLAST_exec_return_msg)
             raise ValueError ("FAILURE executing BLAST with command: \n\n"+"\n".join(BLAST_cmd))
 
 
-        # upload BLAST output
-        dfu = DFUClient(self.callbackURL)
-        try:
-            bulk_save_info = dfu.file_to_shock({'file_path': output_aln_file_path,
-                                                 # DEBUG
-                                                 # 'make_handle': 0,
-                                                 # 'pack': 'zip'})
-                                                 'make_handle': 0})
-        except:
-            raise ValueError ('error uploading '+output_aln_file_path+' file')
+        # start upload of BLAST output (waited on when building report)
+        upload_key = self.upload_queue.submit(output_aln_file_path,
+                                              compress=self.compress_BLAST_output)
 
 
         # return info
         return {
             'output_aln_file_path': output_aln_file_path,
-            'bulk_save_info': bulk_save_info
+            'upload_key': upload_key
         }
 
 
+    #### _fetch_cached_BLAST_outputs()
+    ##
+    #   output files from the result cache for every target that has all of
+    #   BLAST_output_formats cached, and the cache key of each target/format
+    #   for storing the rest.  The key covers the query and target FASTA
+    #   (by content, so it follows the target object's version), the BLAST
+    #   program and its version, and the settings that change the output.
+    #
+    def _fetch_cached_BLAST_outputs (self, search_tool_name, params, query_fasta_file_path,
+                                     input_many_refs, targets_fasta_file_path, BLAST_output_formats):
+        console = []
+        cached_output_paths = dict()
+        cache_keys = dict()
+        if not self.result_cache.enabled:
+            return (cached_output_paths, cache_keys)
+
+        query_sha256 = self.result_cache.file_sha256(query_fasta_file_path)
+        BLAST_version = self.result_cache.BLAST_version(self._set_BLAST_bin (search_tool_name))
+        for input_many_ref in input_many_refs:
+            target_sha256 = self.result_cache.file_sha256(targets_fasta_file_path[input_many_ref])
+            cache_keys[input_many_ref] = dict()
+            for BLAST_output_format_str in BLAST_output_formats:
+                cache_keys[input_many_ref][BLAST_output_format_str] = \
+                    self.result_cache.key(program = search_tool_name,
+                                          BLAST_version = BLAST_version,
+                                          query_sha256 = query_sha256,
+                                          target_sha256 = target_sha256,
+                                          e_value = str(params['e_value']),
+                                          maxaccepts = str(params['maxaccepts']),
+                                          outfmt = BLAST_output_format_str)
+
+            output_dir = self.scratch_manager.new_dir('cache')
+            target_output_paths = dict()
+            for BLAST_output_format_str in BLAST_output_formats:
+                output_aln_file_path = self.result_cache.get(cache_keys[input_many_ref][BLAST_output_format_str],
+                                                             os.path.join(output_dir, 'alnout_m='+BLAST_output_format_str+'.txt'))
+                if output_aln_file_path is None:
+                    break
+                target_output_paths[BLAST_output_format_str] = output_aln_file_path
+            if len(target_output_paths) == len(BLAST_output_formats):
+                self.log(console, 'REUSING CACHED BLAST OUTPUT for '+input_many_ref)
+                cached_output_paths[input_many_ref] = target_output_paths
+
+        return (cached_output_paths, cache_keys)
+
+
+    # _cache_BLAST_output(): keep a finished BLAST output for later jobs
+    #
+    def _cache_BLAST_output (self, cache_keys, input_many_ref, BLAST_output_format_str, output_aln_file_path):
+        if input_many_ref not in cache_keys:
+            return
+        try:
+            self.result_cache.put(cache_keys[input_many_ref][BLAST_output_format_str], output_aln_file_path,
+                                  target_ref = input_many_ref,
+                                  outfmt = BLAST_output_format_str)
+        except Exception as e:
+            # the cache must never fail the job
+            self.log([], 'unable to cache BLAST output for '+input_many_ref+': '+str(e))
+
+
     #### get_query_len()
     ##
     def get_query_len (self, query_fasta_file_path):
@@ -1119,7 +1270,8 @@ class BlastUtil:
                                 target_ref = None,
                                 target_name = None,
                                 target_type_name = None,
-                                target_feature_info = None):
+                                target_feature_info = None,
+                                target_seq_total = None):
         console = []
         invalid_msgs = []
         [OBJID_I, NAME_I, TYPE_I, SAVE_DATE_I, VERSION_I, SAVED_BY_I, WSID_I, WORKSPACE_I, CHSUM_I, SIZE_I, META_I] = list(range(11))  # object_info tuple
@@ -1140,9 +1292,9 @@ class BlastUtil:
         output_aln_buf = output_aln_file_handle.readlines()
         output_aln_file_handle.close()
 
-        # DEBUG
-        self.log(console, "BLAST_OUTPUT:")
-        self.log(console, "".join(output_aln_buf))
+        # the whole output goes with the report as the m7 file; here only at DEBUG
+        if self.job_log.logger.isEnabledFor(logging.DEBUG):
+            self.job_log.debug(None, "BLAST_OUTPUT:\n"+"".join(output_aln_buf))
 
         hit_total = 0
         high_bitscore_line = dict()
@@ -1207,22 +1359,22 @@ class BlastUtil:
             if 'ident_thresh' in params and float(params['ident_thresh']) > 100*float(high_bitscore_ident[hit_seq_id]):
                 filter = True
                 filtering_fields[hit_seq_id]['ident_thresh'] = True
-                self.log (console, "FILTERING "+hit_seq_id+" on IDENT")  # DEBUG
+                self.job_log.limited(console, 'FILTERING', "FILTERING "+hit_seq_id+" on IDENT")
             if 'bitscore' in params and float(params['bitscore']) > float(high_bitscore_score[hit_seq_id]):
                 filter = True
                 filtering_fields[hit_seq_id]['bitscore'] = True
-                self.log (console, "FILTERING "+hit_seq_id+" on BITSCORE")  # DEBUG
+                self.job_log.limited(console, 'FILTERING', "FILTERING "+hit_seq_id+" on BITSCORE")
             if 'overlap_fraction' in params and float(params['overlap_fraction']) > 100*float(high_bitscore_alnlen[hit_seq_id])/float(query_len):
                 filter = True
                 filtering_fields[hit_seq_id]['overlap_fraction'] = True
-                self.log (console, "FILTERING "+hit_seq_id+" on OVERLAP")  # DEBUG
+                self.job_log.limited(console, 'FILTERING', "FILTERING "+hit_seq_id+" on OVERLAP")
 
             if filter:
                 continue
             
             hit_total += 1
             hit_seq_ids[hit_seq_id] = True
-            self.log(console, "HIT: '"+hit_seq_id+"'")  # DEBUG
+            self.job_log.limited(console, 'HIT', "HIT: '"+hit_seq_id+"'")
         
 
         self.log(console, 'EXTRACTING HITS FROM INPUT')
@@ -1383,7 +1535,7 @@ class BlastUtil:
                 id_untrans = fid
                 id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
                 if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
-                    self.log(console, 'FOUND HIT '+fid)  # DEBUG
+                    self.job_log.limited(console, 'FOUND HIT', 'FOUND HIT '+fid)
                     #output_featureSet['element_ordering'].append(fid)
                     accept_fids[id_untrans] = True
                     #fid = input_many_ref+self.genome_id_feature_id_delim+id_untrans  # don't change fId for output FeatureSet
@@ -1448,7 +1600,7 @@ class BlastUtil:
                 #print ("TESTING FEATURES: ID_UNTRANS: '"+id_untrans+"'")  # DEBUG
                 #print ("TESTING FEATURES: ID_TRANS: '"+id_trans+"'")  # DEBUG
                 if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
-                    self.log(console, 'FOUND HIT '+fid)  # DEBUG
+                    self.job_log.limited(console, 'FOUND HIT', 'FOUND HIT '+fid)
                     #output_featureSet['element_ordering'].append(fid)
                     accept_fids[id_untrans] = True
                     #fid = input_many_ref+self.genome_id_feature_id_delim+id_untrans  # don't change fId for output FeatureSet
@@ -1457,11 +1609,11 @@ class BlastUtil:
                     output_featureSet['elements'][fid] = [ama_ref]
 
 
-        # Upload results
+        # Build output object (saved in bulk with the other targets' outputs)
         #
-        output_featureSet_ref = None
+        output_featureSet_obj = None
         if len(invalid_msgs) == 0 and len(list(hit_seq_ids.keys())) > 0:
-            self.log(console,"UPLOADING RESULTS")  # DEBUG
+            self.log(console,"BUILDING OUTPUT OBJECT")  # DEBUG
 
             # we are now making FeatureSets with AMA feature
             if target_type_name != 'SingleEndLibrary' and target_type_name != 'SequenceSet':  
@@ -1469,22 +1621,20 @@ class BlastUtil:
                     output_featureSet_name = params['output_filtered_name']
                 else:
                     output_featureSet_name = params['output_filtered_name']+'-'+target_name
-                new_obj_info = self.wsClient.save_objects({
-                            'workspace': params['workspace_name'],
-                            'objects':[{
-                                    'type': 'KBaseCollections.FeatureSet',
-                                    'data': output_featureSet,
-                                    'name': output_featureSet_name,
-                                    'meta': {},
-                                    'provenance': self._instantiate_provenance (method_name=method_name,
-                                                                                input_obj_refs=[params['input_one_ref'],target_ref])
-                                }]
-                        })[0]
-                output_featureSet_ref = '/'.join([str(new_obj_info[WSID_I]),
-                                                  str(new_obj_info[OBJID_I]),
-                                                  str(new_obj_info[VERSION_I])])
+                output_featureSet_obj = {
+                    'type': 'KBaseCollections.FeatureSet',
+                    'data': output_featureSet,
+                    'name': output_featureSet_name,
+                    'meta': {},
+                    'provenance': self._instantiate_provenance (method_name=method_name,
+                                                                input_obj_refs=[params['input_one_ref'],target_ref])
+                }
             else:
                 raise ValueError ("Not currently supporting SingleEndLibrary nor SequenceSet as target type")
+
+        # refiltered hits only carry the target's hit features
+        if target_seq_total is not None:
+            seq_total = target_seq_total
                 
         return {
             'accept_fids': accept_fids,
@@ -1493,9 +1643,68 @@ class BlastUtil:
             'hit_order': hit_order,
             'hit_total': hit_total,
             'hit_buf': hit_buf,
-            'output_featureSet_ref': output_featureSet_ref
+            'output_featureSet_obj': output_featureSet_obj,
+            'output_featureSet_ref': None
         }
 
+
+    #### merge_FeatureSets(): combine per-target outputs without another job
+    ##
+    def merge_FeatureSets (self, featureSets, desc):
+        merged_featureSet = { 'description': desc,
+                              'element_ordering': [],
+                              'elements': dict()
+                          }
+        for featureSet in featureSets:
+            for fId in featureSet['element_ordering']:
+                if fId not in merged_featureSet['elements']:
+                    merged_featureSet['elements'][fId] = []
+                    merged_featureSet['element_ordering'].append(fId)
+                for genome_ref in featureSet['elements'][fId]:
+                    if genome_ref not in merged_featureSet['elements'][fId]:
+                        merged_featureSet['elements'][fId].append(genome_ref)
+
+        return merged_featureSet
+
+
+    #### save_output_objects(): bulk save, chunked by payload size
+    ##
+    ##   returns the saved refs by object name, as the workspace reports them
+    ##
+    def save_output_objects (self, workspace_name, output_objs):
+        console = []
+        [OBJID_I, NAME_I, TYPE_I, SAVE_DATE_I, VERSION_I, SAVED_BY_I, WSID_I, WORKSPACE_I, CHSUM_I, SIZE_I, META_I] = list(range(11))  # object_info tuple
+
+        # group objects into save_objects() calls
+        chunks = []
+        this_chunk = []
+        this_chunk_size = 0
+        for output_obj in output_objs:
+            obj_size = len(json.dumps(output_obj['data']))
+            if len(this_chunk) > 0 and this_chunk_size + obj_size > self.max_save_objects_payload:
+                chunks.append(this_chunk)
+                this_chunk = []
+                this_chunk_size = 0
+            this_chunk.append(output_obj)
+            this_chunk_size += obj_size
+        if len(this_chunk) > 0:
+            chunks.append(this_chunk)
+
+        # save
+        output_refs = dict()
+        for chunk in chunks:
+            self.log(console,"UPLOADING "+str(len(chunk))+" OUTPUT OBJECTS")  # DEBUG
+            new_obj_infos = self.wsClient.save_objects({
+                'workspace': workspace_name,
+                'objects': chunk
+            })
+            for new_obj_info in new_obj_infos:
+                output_refs[new_obj_info[NAME_I]] = '/'.join([str(new_obj_info[WSID_I]),
+                                                             str(new_obj_info[OBJID_I]),
+                                                             str(new_obj_info[VERSION_I])])
+        return output_refs
+
+
     # _get_html_file_name
     #
     def _get_html_file_name(self, this_target_name, search_tool_name):
@@ -1761,6 +1970,78 @@ class BlastUtil:
         return (html_dir, html_files)
 
 
+    # _upload_job_files(): diagnostics attached to the report as file_links
+    #
+    #   written just before the report is saved, so the uploaded timeline
+    #   covers every stage but the report save itself (which is only in the
+    #   logged stage summary).  Every subprocess has finished by then, so
+    #   the process metrics are complete.
+    #
+    def _upload_job_files (self, search_tool_name):
+        console = []
+        self.stage_timeline_path = os.path.join(self.scratch_manager.stage_dir('logs'), 'stage_timeline.json')
+        self.stage_timer.write_timeline(self.stage_timeline_path,
+                                        job_info={'method': search_tool_name+'_Search'})
+        self.process_metrics_path = os.path.join(self.scratch_manager.stage_dir('logs'), 'process_metrics.json')
+        self.process_metrics.write(self.process_metrics_path,
+                                   job_info={'method': search_tool_name+'_Search'})
+        job_files = [(self.stage_timeline_path,
+                      search_tool_name+'_Search-stage_timeline.json',
+                      search_tool_name+' stage timings'),
+                     (self.process_metrics_path,
+                      search_tool_name+'_Search-process_metrics.json',
+                      search_tool_name+' makeblastdb/BLAST resource usage')]
+        self.subprocess_log.close()
+        if os.path.isfile(self.subprocess_log.log_path):
+            job_files.append((self.subprocess_log.log_path,
+                              search_tool_name+'_Search-subprocess_output.txt',
+                              search_tool_name+' makeblastdb/BLAST output'))
+        # the profile stops here, so it covers all but the report save
+        job_files.extend(self.profiler.write_files(self.scratch_manager.stage_dir('logs'), search_tool_name+'_Search'))
+
+        file_links = []
+        for (file_path, name, label) in job_files:
+            try:
+                upload_ret = self.upload_queue.wait(self.upload_queue.submit(file_path))
+            except ValueError as e:
+                # diagnostics must never fail the job
+                self.log(console, 'unable to attach '+name+': '+str(e))
+                continue
+            file_links.append({'shock_id': upload_ret['shock_id'],
+                               'name': name,
+                               'label': label})
+        return file_links
+
+
+    #### _build_text_report(): per-target summary and hit lines
+    ##
+    def _build_text_report (self, input_many_refs, targets_name, all_parsed_BLAST_results):
+        console = []
+        report_lines = []
+        all_hit_total = 0
+        all_hit_order = []
+        for input_many_ref in input_many_refs:
+            target_name = targets_name[input_many_ref]
+            seq_total = all_parsed_BLAST_results[input_many_ref]['seq_total']
+            hit_order = all_parsed_BLAST_results[input_many_ref]['hit_order']
+            hit_total = all_parsed_BLAST_results[input_many_ref]['hit_total']
+            hit_buf   = all_parsed_BLAST_results[input_many_ref]['hit_buf']
+
+            all_hit_total += hit_total
+            all_hit_order.extend(hit_order)
+
+            target_report_lines = ['TARGET: '+target_name+"\n",
+                                   'sequences in search db: '+str(seq_total)+"\n",
+                                   'sequences in hit set: '+str(len(hit_order))+"\n",
+                                   'sequences in accepted hit set: '+str(hit_total)+"\n",
+                                   "\n"]
+            target_report_lines.extend(hit_buf)
+            self.log (console, ''.join(target_report_lines))
+            report_lines.extend(target_report_lines)
+
+        return (''.join(report_lines), all_hit_total, all_hit_order)
+
+
     #### build output report
     ##
     def build_BLAST_report (self, 
@@ -1769,8 +2050,9 @@ class BlastUtil:
                             targets_name = None,
                             targets_type_name = None,
                             targets_feature_info = None,
-                            base_bulk_save_infos = None,
-                            extra_bulk_save_infos = None,
+                            base_upload_keys = None,
+                            extra_upload_keys = None,
+                            hit_table_upload_keys = None,
                             query_len = None,
                             all_parsed_BLAST_results = None,
                             objects_created = None):
@@ -1781,39 +2063,21 @@ class BlastUtil:
         invalid_msgs = []
         report = ''
         self.log(console,"BUILDING REPORT")  # DEBUG
+        if hit_table_upload_keys is None:
+            hit_table_upload_keys = dict()
 
         input_many_refs = params['input_many_refs']
 
         # check output before proceeding
-        all_hit_total = 0
-        all_hit_order = []
-        for input_many_ref in input_many_refs:
-
-            target_name = targets_name[input_many_ref]
-            
-            # pass args
-            accept_fids = all_parsed_BLAST_results[input_many_ref]['accept_fids']
-            filtering_fields = all_parsed_BLAST_results[input_many_ref]['filtering_fields']
-            seq_total = all_parsed_BLAST_results[input_many_ref]['seq_total']
-            hit_order = all_parsed_BLAST_results[input_many_ref]['hit_order']
-            hit_total = all_parsed_BLAST_results[input_many_ref]['hit_total']
-            hit_buf   = all_parsed_BLAST_results[input_many_ref]['hit_buf']
-
-            all_hit_total += hit_total
-            all_hit_order.extend(hit_order)
-            
-            # text report
-            report += 'TARGET: '+target_name+"\n"
-            report += 'sequences in search db: '+str(seq_total)+"\n"
-            report += 'sequences in hit set: '+str(len(hit_order))+"\n"
-            report += 'sequences in accepted hit set: '+str(hit_total)+"\n"
-            report += "\n"
-            for line in hit_buf:
-                report += line
-            self.log (console, report)
+        (report, all_hit_total, all_hit_order) = self._build_text_report (input_many_refs,
+                                                                           targets_name,
+                                                                           all_parsed_BLAST_results)
 
         # don't waste time if no hits
         if all_hit_total == 0 and len(all_hit_order) == 0:
+            # nothing links to the queued BLAST outputs; cleanup_scratch()
+            # waits for any already uploading
+            self.upload_queue.cancel_pending()
             report += "No hits were found\n"
             reportObj = {
                 'objects_created':[],
@@ -1843,23 +2107,24 @@ class BlastUtil:
             return report_info
 
         # build html report
-        (html_dir, html_file_names) = self._write_HTML_report (search_tool_name = search_tool_name,
-                                                input_many_refs = params['input_many_refs'],
-                                                targets_name = targets_name,
-                                                targets_type_name = targets_type_name,
-                                                targets_feature_info = targets_feature_info,
-                                                genome_disp_name_config = params['genome_disp_name_config'],
-                                                query_len = query_len,
-                                                all_parsed_BLAST_results = all_parsed_BLAST_results)
-
-        # upload html report
-        dfu = DFUClient(self.callbackURL)
-        try:
-            html_upload_ret = dfu.file_to_shock({'file_path': html_dir,
-                                                 'make_handle': 0,
-                                                 'pack': 'zip'})
-        except:
-            raise ValueError ('Logging exception loading html_report to shock')
+        with self.stage_timer.span('html'):
+            (html_dir, html_file_names) = self._write_HTML_report (search_tool_name = search_tool_name,
+                                                    input_many_refs = params['input_many_refs'],
+                                                    targets_name = targets_name,
+                                                    targets_type_name = targets_type_name,
+                                                    targets_feature_info = targets_feature_info,
+                                                    genome_disp_name_config = params['genome_disp_name_config'],
+                                                    query_len = query_len,
+                                                    all_parsed_BLAST_results = all_parsed_BLAST_results)
+
+        # queue html report upload behind the BLAST outputs
+        html_upload_key = self.upload_queue.submit(html_dir, pack='zip')
+
+        # time how long the report waits on outstanding uploads
+        with self.stage_timer.span('upload'):
+            for upload_key in [html_upload_key] + list(base_upload_keys.values()) + list(extra_upload_keys.values()) + \
+                    list(hit_table_upload_keys.values()):
+                self.upload_queue.wait(upload_key)
 
 
         # create report object
@@ -1880,23 +2145,28 @@ class BlastUtil:
         #else:
         #    reportObj['direct_html_link_index'] = 0
 
+        # only block on the upload queue now that we need the shock_ids
         reportObj['direct_html_link_index'] = 0
+        html_upload_ret = self.upload_queue.wait(html_upload_key)
         reportObj['html_links'] = [{'shock_id': html_upload_ret['shock_id'],
                                     #'name': search_tool_name+'_results.html',
                                     'name': html_file_names[0],
                                     'label': search_tool_name+' Results'}
         ]
         reportObj['file_links'] = []
+        compression_ext = ''
+        if self.compress_BLAST_output:
+            compression_ext = '.gz'
         for input_many_ref in input_many_refs:
             target_name = targets_name[input_many_ref]
-            base_bulk_save_info = base_bulk_save_infos[input_many_ref]
-            if input_many_ref in extra_bulk_save_infos:
-                extra_bulk_save_info = extra_bulk_save_infos[input_many_ref]
+            base_bulk_save_info = self.upload_queue.wait(base_upload_keys[input_many_ref])
+            if input_many_ref in extra_upload_keys:
+                extra_bulk_save_info = self.upload_queue.wait(extra_upload_keys[input_many_ref])
             else:
                 extra_bulk_save_info = None
                 
             reportObj['file_links'].append({'shock_id': base_bulk_save_info['shock_id'],
-                                            'name': target_name+'-'+search_tool_name+'_Search-m'+'7'+'.txt',
+                                            'name': target_name+'-'+search_tool_name+'_Search-m'+'7'+'.txt'+compression_ext,
                                             'label': target_name+'-'+search_tool_name+' Results: m'+'7'})
 
             if extra_bulk_save_info is not None:
@@ -1912,10 +2182,19 @@ class BlastUtil:
                 elif params['output_extra_format'] == '11':
                     extension = 'asn1arc'
                 reportObj['file_links'].append({'shock_id': extra_bulk_save_info['shock_id'],
-                                                'name': target_name+'-'+search_tool_name+'_Search-m'+str(params['output_extra_format'])+'.'+extension,
+                                                'name': target_name+'-'+search_tool_name+'_Search-m'+str(params['output_extra_format'])+'.'+extension+compression_ext,
                                                 'label': target_name+'-'+search_tool_name+' Results: m'+str(params['output_extra_format'])})
+
+            if input_many_ref in hit_table_upload_keys:
+                hit_table_save_info = self.upload_queue.wait(hit_table_upload_keys[input_many_ref])
+                reportObj['file_links'].append({'shock_id': hit_table_save_info['shock_id'],
+                                                'name': target_name+'-'+search_tool_name+'_Search-hits'+HIT_TABLE_EXT,
+                                                'label': target_name+'-'+search_tool_name+' hit table (for BLAST_Refilter)'})
                             
                             
+        # attach the job's own diagnostics (stage timeline)
+        reportObj['file_links'].extend(self._upload_job_files (search_tool_name))
+
         # complete report
         objects_created.reverse()  # want merged featureset at position 0
         reportObj['objects_created'] = objects_created
@@ -1923,14 +2202,101 @@ class BlastUtil:
         ##reportObj['message'] = report
 
         # save report object
-        report_info = self.reportClient.create_extended_report(reportObj)
+        with self.stage_timer.span('report'):
+            report_info = self.reportClient.create_extended_report(reportObj)
 
         return report_info
 
 
     #### run_BLAST_App(): top-level method
     ##
+    #   with params['profile'] or $KB_BLAST_PROFILE set to 'cprofile' or
+    #   'sample', the run is profiled (see Utils/JobProfiler.py)
+    #
+    #   makeblastdb or BLAST stopped by a time or memory limit, or by the
+    #   job being cancelled (SIGTERM), ends the job with an error report
+    #   (see Utils/ProcessLimits.py)
+    #
     def run_BLAST_App (self, search_tool_name, params):
+        console = []
+        self.profiler = JobProfiler(profile_mode(params), profile_memory(params)).start()
+        self.process_limits.install_signal_handlers()
+        try:
+            return self._run_BLAST_App (search_tool_name, params)
+        except ProcessLimitExceeded as e:
+            self.log(console, 'STOPPED: '+str(e))
+            return self._save_process_limit_error_report (search_tool_name, params, e)
+        finally:
+            self.process_limits.restore_signal_handlers()
+            self.checkpoint.release()
+            self.profiler.stop()
+            self.cleanup_scratch()
+
+
+    #### _save_process_limit_error_report()
+    ##
+    def _save_process_limit_error_report (self, search_tool_name, params, e):
+        invalid_msgs = [str(e)]
+        if e.reason != 'cancelled' and self.subprocess_log.get_tail():
+            invalid_msgs.append("Last output:\n"+"\n".join(self.subprocess_log.get_tail()))
+        error_report_info = self.save_error_report_with_invalid_msgs (invalid_msgs,
+                                                                      params.get('input_one_ref'),
+                                                                      params['input_many_refs'],
+                                                                      search_tool_name+'_Search()',
+                                                                      params['workspace_name'])
+        return { 'report_name': error_report_info['name'],
+                 'report_ref': error_report_info['ref']
+             }
+
+
+    #### _checkpoint_inputs_depends(): what the query and target FASTA are
+    ##  written from, for their checkpoints
+    #
+    #   the resolved version of each input object, so a ref that has moved on
+    #   to a new version (or a path to another object) isn't restored from
+    #   the old one's FASTA; a query given as text depends on the text.
+    #   None if checkpoints are off or the versions can't be looked up.
+    #
+    def _checkpoint_inputs_depends (self, params, input_many_refs):
+        console = []
+        if not self.checkpoint.enabled:
+            return None
+        query_sequence = params.get('input_one_sequence')
+        if query_sequence is not None and not query_sequence.startswith("Optionally enter"):
+            query_refs = []
+        else:
+            query_refs = [params['input_one_ref']]
+        refs = query_refs + list(input_many_refs)
+        try:
+            infos = self.wsClient.get_object_info3({'objects': [{'ref': ref} for ref in refs]})['infos']
+        except Exception as e:
+            self.log(console, 'unable to look up input object versions, not restoring inputs: '+str(e))
+            return None
+        upas = dict((ref, str(info[6])+'/'+str(info[0])+'/'+str(info[4])) for ref, info in zip(refs, infos))
+
+        inputs_depends = {'targets': dict((ref, {'object': upas[ref]}) for ref in input_many_refs)}
+        if query_refs:
+            inputs_depends['query'] = {'object': upas[query_refs[0]]}
+        else:
+            inputs_depends['query'] = {'input_one_sequence': hashlib.sha256(query_sequence.encode()).hexdigest()}
+        return inputs_depends
+
+
+    #### cleanup_scratch(): remove the job's scratch once its uploads are done
+    ##
+    def cleanup_scratch (self):
+        console = []
+        # the report is saved (or the job failed), so nothing waits on an
+        # upload that hasn't started; ones uploading finish first
+        self.upload_queue.cancel_pending()
+        self.upload_queue.shutdown()
+        self.subprocess_log.close()
+        peak_usage_bytes = self.scratch_manager.cleanup()
+        self.log(console, 'SCRATCH peak usage: '+'%.1f' % (peak_usage_bytes / 1048576.0)+' MB')
+        self.job_log.flush()
+
+
+    def _run_BLAST_App (self, search_tool_name, params):
         console = []
         invalid_msgs = []
         method_name = search_tool_name+'_Search()'
@@ -1946,28 +2312,63 @@ class BlastUtil:
         
         #### Validate App input params
         #
-        if not params.get('output_one_name'):
-            if not params.get('input_one_ref'):
-                params['output_one_name'] = 'query-'+params['output_filtered_name']+'.Seq'
+        with self.stage_timer.span('validate'):
+            if not params.get('output_one_name'):
+                if not params.get('input_one_ref'):
+                    params['output_one_name'] = 'query-'+params['output_filtered_name']+'.Seq'
                 
-        if not self.validate_BLAST_app_params (params, method_name):
-            raise ValueError('App input validation failed in CheckBlastParams() for App ' + method_name)
+            if not self.validate_BLAST_app_params (params, method_name):
+                raise ValueError('App input validation failed in CheckBlastParams() for App ' + method_name)
+
+        # Resume from an earlier try of this job, if it left a checkpoint
+        # (with 'checkpoint-dir' configured, see Utils/Checkpoint.py)
+        #
+        self.checkpoint = JobCheckpoint.for_job(self.config, search_tool_name+'_Search', params,
+                                                user_id=self.ctx.get('user_id'))
+        if self.checkpoint.resumed:
+            self.log(console, 'RESUMING FROM CHECKPOINT '+self.checkpoint.job_key)
+        elif self.checkpoint.in_use:
+            self.log(console, 'CHECKPOINT IN USE BY ANOTHER JOB '+self.checkpoint.job_key+', running without one')
 
         # Get input obj refs
         #
         input_many_refs = params['input_many_refs']
 
-        if params.get('input_one_sequence') is not None \
-                and not params['input_one_sequence'].startswith("Optionally enter"):
-            input_one_ref = self.objectify_text_query (params, q_seq_type, method_name)
+        # query and target FASTA are only restored if written from the same
+        # object versions (None: checkpoints off, or versions unknown)
+        inputs_depends = self._checkpoint_inputs_depends (params, input_many_refs)
+
+        restored_query = None
+        if inputs_depends is not None:
+            restored_query = self.checkpoint.restore('query', 'query', self.scratch_manager.stage_dir('query'),
+                                                     depends=inputs_depends['query'])
+        if restored_query is not None:
+            # including the query object saved from input_one_sequence
+            (query_file_paths, write_query_obj_to_file_result) = restored_query
+            write_query_obj_to_file_result['query_fasta_file_path'] = query_file_paths[0]
+            input_one_ref = write_query_obj_to_file_result['input_one_ref']
             params['input_one_ref'] = input_one_ref
         else:
-            input_one_ref = params['input_one_ref']
+            if params.get('input_one_sequence') is not None \
+                    and not params['input_one_sequence'].startswith("Optionally enter"):
+                with self.stage_timer.span('objectify'):
+                    input_one_ref = self.objectify_text_query (params, q_seq_type, method_name)
+                params['input_one_ref'] = input_one_ref
+            else:
+                input_one_ref = params['input_one_ref']
 
 
-        # Write query obj to fasta file (can be Feature, SequenceSet, or FeatureSet)
-        #
-        write_query_obj_to_file_result = self.write_query_obj_to_file (params, input_one_ref, q_seq_type)
+            # Write query obj to fasta file (can be Feature, SequenceSet, or FeatureSet)
+            #
+            with self.stage_timer.span('query_write'):
+                write_query_obj_to_file_result = self.write_query_obj_to_file (params, input_one_ref, q_seq_type)
+            write_query_obj_to_file_result['input_one_ref'] = input_one_ref
+            if inputs_depends is not None and len(write_query_obj_to_file_result['invalid_msgs']) == 0:
+                self.checkpoint.record('query', 'query',
+                                       files = [write_query_obj_to_file_result['query_fasta_file_path']],
+                                       data = dict((k, v) for k, v in write_query_obj_to_file_result.items()
+                                                   if k != 'query_fasta_file_path'),
+                                       depends = inputs_depends['query'])
         query_type_name = write_query_obj_to_file_result['query_type_name']
         query_fasta_file_path = write_query_obj_to_file_result['query_fasta_file_path']
         appropriate_sequence_found_in_one_input = write_query_obj_to_file_result['appropriate_sequence_found_in_one_input']
@@ -1981,8 +2382,30 @@ class BlastUtil:
         targets_fasta_file_path = dict()
         appropriate_sequence_found_in_many_inputs = dict()
         targets_feature_info = dict()
+        restored_target_results = dict()
         for input_many_ref in input_many_refs:
-            write_target_obj_to_file_result = self.write_target_obj_to_file (params, input_many_ref, t_seq_type)
+            if inputs_depends is None:
+                break
+            restored_target = self.checkpoint.restore('target', input_many_ref,
+                                                      self.scratch_manager.stage_dir('targets', input_many_ref),
+                                                      depends=inputs_depends['targets'][input_many_ref])
+            if restored_target is not None:
+                (target_file_paths, restored_target_results[input_many_ref]) = restored_target
+                restored_target_results[input_many_ref]['target_fasta_file_path'] = target_file_paths[0]
+        write_target_obj_to_file_results = self.write_target_objs_to_files (params,
+                                                                            [input_many_ref for input_many_ref in input_many_refs
+                                                                             if input_many_ref not in restored_target_results],
+                                                                            t_seq_type)
+        for input_many_ref, write_target_obj_to_file_result in write_target_obj_to_file_results.items():
+            if inputs_depends is not None and len(write_target_obj_to_file_result['invalid_msgs']) == 0:
+                self.checkpoint.record('target', input_many_ref,
+                                       files = [write_target_obj_to_file_result['target_fasta_file_path']],
+                                       data = dict((k, v) for k, v in write_target_obj_to_file_result.items()
+                                                   if k != 'target_fasta_file_path'),
+                                       depends = inputs_depends['targets'][input_many_ref])
+        write_target_obj_to_file_results.update(restored_target_results)
+        for input_many_ref in input_many_refs:
+            write_target_obj_to_file_result = write_target_obj_to_file_results[input_many_ref]
             targets_name[input_many_ref] = write_target_obj_to_file_result['target_name']
             targets_type_name[input_many_ref] = write_target_obj_to_file_result['target_type_name']
             targets_fasta_file_path[input_many_ref] = write_target_obj_to_file_result['target_fasta_file_path']
@@ -1990,64 +2413,134 @@ class BlastUtil:
             invalid_msgs.extend(write_target_obj_to_file_result['invalid_msgs'])
 
             targets_feature_info[input_many_ref] = write_target_obj_to_file_result['target_feature_info']
+        self.scratch_manager.check_quota('target_write')
         
 
         # check for failed input file creation
         #
         if not appropriate_sequence_found_in_one_input:
-            self.log(invalid_msgs,"no "+q_seq_type+" sequence found in '"+input_one_name+"'")
+            self.log(invalid_msgs,"no "+q_seq_type+" sequence found in '"+input_one_ref+"'")
         for input_many_ref in input_many_refs:
             if not appropriate_sequence_found_in_many_inputs[input_many_ref]:
-                self.log(invalid_msgs,"no "+t_seq_type+" sequences found in '"+input_many_name+"'")
+                self.log(invalid_msgs,"no "+t_seq_type+" sequences found in '"+targets_name[input_many_ref]+"'")
 
         if len(invalid_msgs) > 0:
-            error_report_info = self.save_error_report_with_invalid_msgs (invalid_msgs, input_one_ref, input_many_refs, method_name)
-            returnVal = { 'report_name': report_info['name'],
-                          'report_ref': report_info['ref']
+            error_report_info = self.save_error_report_with_invalid_msgs (invalid_msgs, input_one_ref, input_many_refs, method_name,
+                                                                          params['workspace_name'])
+            returnVal = { 'report_name': error_report_info['name'],
+                          'report_ref': error_report_info['ref']
                       }        
-            return [returnVal]
+            return returnVal
+
+
+        #### Reuse cached BLAST output
+        ##
+        BLAST_output_formats = [str(base_BLAST_output_format)]
+        if str(params.get('output_extra_format')) and str(params.get('output_extra_format')) != 'none':
+            BLAST_output_formats.append(str(params['output_extra_format']))
+        with self.stage_timer.span('cache_lookup'):
+            (cached_output_paths, cache_keys) = \
+                self._fetch_cached_BLAST_outputs (search_tool_name, params, query_fasta_file_path,
+                                                  input_many_refs, targets_fasta_file_path, BLAST_output_formats)
+
+        # or from an earlier try of this job
+        with self.stage_timer.span('checkpoint_lookup'):
+            query_depends = self.checkpoint.depends_on(query=query_fasta_file_path)
+            targets_depends = dict()
+            outputs_depends = dict()
+            for input_many_ref in input_many_refs:
+                targets_depends[input_many_ref] = self.checkpoint.depends_on(target=targets_fasta_file_path[input_many_ref])
+                outputs_depends[input_many_ref] = None
+                if query_depends is not None:
+                    outputs_depends[input_many_ref] = dict(query_depends, **targets_depends[input_many_ref])
+                if input_many_ref in cached_output_paths or not self.checkpoint.enabled:
+                    continue
+                output_dir = self.scratch_manager.new_dir('search')
+                target_output_paths = dict()
+                for BLAST_output_format_str in BLAST_output_formats:
+                    restored_output = self.checkpoint.restore('output', input_many_ref+' m'+BLAST_output_format_str, output_dir,
+                                                              depends=outputs_depends[input_many_ref])
+                    if restored_output is None:
+                        break
+                    target_output_paths[BLAST_output_format_str] = restored_output[0][0]
+                if len(target_output_paths) == len(BLAST_output_formats):
+                    self.log(console, 'REUSING CHECKPOINTED BLAST OUTPUT for '+input_many_ref)
+                    cached_output_paths[input_many_ref] = target_output_paths
 
 
         #### FORMAT DB
         ##
         for input_many_ref in input_many_refs:
-            if not self.format_BLAST_db (search_tool_name, targets_fasta_file_path[input_many_ref]):
-                raise ValueError ("failed to format BLAST db for "+input_many_ref)
+            if input_many_ref in cached_output_paths:
+                continue
+            if self.checkpoint.restore('db', input_many_ref, os.path.dirname(targets_fasta_file_path[input_many_ref]),
+                                       depends=targets_depends[input_many_ref]) is not None:
+                self.log(console, 'REUSING CHECKPOINTED BLAST DB for '+input_many_ref)
+                continue
+            with self.stage_timer.span('format_db', target=input_many_ref):
+                if not self.format_BLAST_db (search_tool_name, targets_fasta_file_path[input_many_ref]):
+                    raise ValueError ("failed to format BLAST db for "+input_many_ref)
+            self.scratch_manager.check_quota('format_db')
+            self.checkpoint.record('db', input_many_ref,
+                                   files = glob.glob(glob.escape(targets_fasta_file_path[input_many_ref])+'.*'),
+                                   depends = targets_depends[input_many_ref])
             
 
         #### Run BLAST for base format
         ##
         output_aln_file_paths = dict()
-        base_bulk_save_infos = dict()
+        base_upload_keys = dict()
         for input_many_ref in input_many_refs:
-            BLAST_output_results = self.run_BLAST (search_tool_name = search_tool_name, 
-                                                   query_fasta_file_path = query_fasta_file_path, 
-                                                   target_fasta_file_path = targets_fasta_file_path[input_many_ref], 
-                                                   e_value = str(params['e_value']),
-                                                   maxaccepts = str(params['maxaccepts']),
-                                                   BLAST_output_format_str = str(base_BLAST_output_format)
-            )
+            if input_many_ref in cached_output_paths:
+                output_aln_file_paths[input_many_ref] = cached_output_paths[input_many_ref][str(base_BLAST_output_format)]
+                base_upload_keys[input_many_ref] = self.upload_queue.submit(output_aln_file_paths[input_many_ref],
+                                                                            compress=self.compress_BLAST_output)
+                continue
+            with self.stage_timer.span('search', target=input_many_ref, outfmt=str(base_BLAST_output_format)):
+                BLAST_output_results = self.run_BLAST (search_tool_name = search_tool_name, 
+                                                       query_fasta_file_path = query_fasta_file_path, 
+                                                       target_fasta_file_path = targets_fasta_file_path[input_many_ref], 
+                                                       e_value = str(params['e_value']),
+                                                       maxaccepts = str(params['maxaccepts']),
+                                                       BLAST_output_format_str = str(base_BLAST_output_format)
+                )
             output_aln_file_paths[input_many_ref] = BLAST_output_results['output_aln_file_path']
-            base_bulk_save_infos[input_many_ref] = BLAST_output_results['bulk_save_info']
+            base_upload_keys[input_many_ref] = BLAST_output_results['upload_key']
+            self.scratch_manager.check_quota('search')
+            self._cache_BLAST_output (cache_keys, input_many_ref, str(base_BLAST_output_format), output_aln_file_paths[input_many_ref])
+            self.checkpoint.record('output', input_many_ref+' m'+str(base_BLAST_output_format),
+                                   files = [output_aln_file_paths[input_many_ref]],
+                                   depends = outputs_depends[input_many_ref])
 
 
         #### Run BLAST for extra format
         ##
         output_extra_aln_file_paths = dict()
-        extra_bulk_save_infos = dict()
+        extra_upload_keys = dict()
         for input_many_ref in input_many_refs:
             if str(params.get('output_extra_format')) and str(params.get('output_extra_format')) != 'none':
 
-                BLAST_extra_output_results = self.run_BLAST (search_tool_name = search_tool_name, 
-                                                             query_fasta_file_path = query_fasta_file_path, 
-                                                             target_fasta_file_path = targets_fasta_file_path[input_many_ref], 
-                                                             e_value = str(params['e_value']),
-                                                             maxaccepts = str(params['maxaccepts']),
-                                                             BLAST_output_format_str = str(params['output_extra_format'])
-                )
+                if input_many_ref in cached_output_paths:
+                    output_extra_aln_file_paths[input_many_ref] = cached_output_paths[input_many_ref][str(params['output_extra_format'])]
+                    extra_upload_keys[input_many_ref] = self.upload_queue.submit(output_extra_aln_file_paths[input_many_ref],
+                                                                                 compress=self.compress_BLAST_output)
+                    continue
+                with self.stage_timer.span('search', target=input_many_ref, outfmt=str(params['output_extra_format'])):
+                    BLAST_extra_output_results = self.run_BLAST (search_tool_name = search_tool_name, 
+                                                                 query_fasta_file_path = query_fasta_file_path, 
+                                                                 target_fasta_file_path = targets_fasta_file_path[input_many_ref], 
+                                                                 e_value = str(params['e_value']),
+                                                                 maxaccepts = str(params['maxaccepts']),
+                                                                 BLAST_output_format_str = str(params['output_extra_format'])
+                    )
 
                 output_extra_aln_file_paths[input_many_ref] = BLAST_extra_output_results['output_aln_file_path']
-                extra_bulk_save_infos[input_many_ref] = BLAST_extra_output_results['bulk_save_info']
+                extra_upload_keys[input_many_ref] = BLAST_extra_output_results['upload_key']
+                self.scratch_manager.check_quota('search')
+                self._cache_BLAST_output (cache_keys, input_many_ref, str(params['output_extra_format']), output_extra_aln_file_paths[input_many_ref])
+                self.checkpoint.record('output', input_many_ref+' m'+str(params['output_extra_format']),
+                                       files = [output_extra_aln_file_paths[input_many_ref]],
+                                       depends = outputs_depends[input_many_ref])
 
 
         # get query_len for filtering and reporting later
@@ -2055,64 +2548,312 @@ class BlastUtil:
         query_len = self.get_query_len (query_fasta_file_path)
 
 
+        # Filter hits, save FeatureSets and build the report
+        #
+        self.process_limits.check('parse')
+        returnVal = self._filter_hits_and_report (search_tool_name = search_tool_name,
+                                                  params = params,
+                                                  targets_name = targets_name,
+                                                  targets_type_name = targets_type_name,
+                                                  targets_feature_info = targets_feature_info,
+                                                  output_aln_file_paths = output_aln_file_paths,
+                                                  base_upload_keys = base_upload_keys,
+                                                  extra_upload_keys = extra_upload_keys,
+                                                  query_len = query_len)
+
+        # nothing left to resume
+        self.checkpoint.complete()
+        return returnVal
+
+
+    #### _write_hit_tables(): each target's raw hits, for BLAST_Refilter
+    ##
+    #   returns upload keys by target ref; a table that can't be written is
+    #   left out rather than failing the search
+    #
+    def _write_hit_tables (self,
+                           search_tool_name = None,
+                           params = None,
+                           targets_name = None,
+                           targets_type_name = None,
+                           targets_feature_info = None,
+                           output_aln_file_paths = None,
+                           query_len = None,
+                           all_parsed_BLAST_results = None):
+        console = []
+        input_many_refs = params['input_many_refs']
+        hit_table_upload_keys = dict()
+        for input_many_ref in input_many_refs:
+            try:
+                (header, columns) = read_outfmt7(output_aln_file_paths[input_many_ref])
+            except (IOError, OSError, ValueError) as e:
+                self.log(console, 'unable to write hit table for '+input_many_ref+': '+str(e))
+                continue
+            header['meta'] = {'search_tool_name': search_tool_name,
+                              'target_ref': input_many_ref,
+                              'target_name': targets_name[input_many_ref],
+                              'target_type_name': targets_type_name[input_many_ref],
+                              'params': params,
+                              'query_len': query_len,
+                              'seq_total': all_parsed_BLAST_results[input_many_ref]['seq_total'],
+                              'target_feature_info': trim_target_feature_info(targets_feature_info[input_many_ref],
+                                                                              header['subject_ids'],
+                                                                              self.genome_id_feature_id_delim)}
+            hit_table_path = os.path.join(self.scratch_manager.stage_dir('hit_table', input_many_ref), 'hits'+HIT_TABLE_EXT)
+            write_hit_table(hit_table_path, header, columns)
+            hit_table_upload_keys[input_many_ref] = self.upload_queue.submit(hit_table_path)
+        return hit_table_upload_keys
+
+
+    #### _filter_hits_and_report(): parse, save FeatureSets and report
+    ##
+    #   shared by run_BLAST_App() and run_BLAST_Refilter(); seq_totals, by
+    #   target ref, stand in for the counts parse_BLAST_tab_output() would
+    #   take from a trimmed target_feature_info
+    #
+    def _filter_hits_and_report (self,
+                                 search_tool_name = None,
+                                 params = None,
+                                 targets_name = None,
+                                 targets_type_name = None,
+                                 targets_feature_info = None,
+                                 output_aln_file_paths = None,
+                                 base_upload_keys = None,
+                                 extra_upload_keys = None,
+                                 query_len = None,
+                                 seq_totals = None):
+        console = []
+        method_name = search_tool_name+'_Search'
+        input_many_refs = params['input_many_refs']
+        if seq_totals is None:
+            seq_totals = dict()
+
         # Parse the BLAST tabular output and store ids to filter many set to make filtered object to save back to KBase
         #
         all_parsed_BLAST_results = dict()
         objects_created = []
         output_featureSet_refs = []
         num_targets = len(input_many_refs)
+        parse_depends = dict()
         for input_many_ref in input_many_refs:
-            this_parsed_BLAST_results = \
-                self.parse_BLAST_tab_output (output_aln_file_path = output_aln_file_paths[input_many_ref],
-                                             search_tool_name = search_tool_name,
-                                             params = params,
-                                             query_len = query_len,
-                                             num_targets = num_targets,
-                                             target_ref = input_many_ref,
-                                             target_name = targets_name[input_many_ref],
-                                             target_type_name = targets_type_name[input_many_ref],
-                                             target_feature_info = targets_feature_info[input_many_ref])
+            parse_depends[input_many_ref] = self.checkpoint.depends_on(output=output_aln_file_paths[input_many_ref])
+            restored_parse = self.checkpoint.restore('parse', input_many_ref, depends=parse_depends[input_many_ref])
+            if restored_parse is not None:
+                all_parsed_BLAST_results[input_many_ref] = restored_parse[1]
+                continue
+            with self.stage_timer.span('parse', target=input_many_ref):
+                this_parsed_BLAST_results = \
+                    self.parse_BLAST_tab_output (output_aln_file_path = output_aln_file_paths[input_many_ref],
+                                                 search_tool_name = search_tool_name,
+                                                 params = params,
+                                                 query_len = query_len,
+                                                 num_targets = num_targets,
+                                                 target_ref = input_many_ref,
+                                                 target_name = targets_name[input_many_ref],
+                                                 target_type_name = targets_type_name[input_many_ref],
+                                                 target_feature_info = targets_feature_info[input_many_ref],
+                                                 target_seq_total = seq_totals.get(input_many_ref))
 
             all_parsed_BLAST_results[input_many_ref] = this_parsed_BLAST_results
-            if this_parsed_BLAST_results.get('output_featureSet_ref'):
-                objects_created.append({'ref':this_parsed_BLAST_results['output_featureSet_ref'],'description':targets_name[input_many_ref]+" "+search_tool_name+' hits'})
-                output_featureSet_refs.append(this_parsed_BLAST_results['output_featureSet_ref'])
+            self.checkpoint.record('parse', input_many_ref, data=this_parsed_BLAST_results,
+                                   depends=parse_depends[input_many_ref])
+
+        # Keep the raw hits, so the report can be refiltered without BLAST
+        # (a report of no hits has no files to attach them to)
+        hit_table_upload_keys = dict()
+        if any(all_parsed_BLAST_results[input_many_ref]['hit_total'] > 0 or
+               len(all_parsed_BLAST_results[input_many_ref]['hit_order']) > 0
+               for input_many_ref in input_many_refs):
+            with self.stage_timer.span('hit_table'):
+                hit_table_upload_keys = self._write_hit_tables (search_tool_name = search_tool_name,
+                                                                params = params,
+                                                                targets_name = targets_name,
+                                                                targets_type_name = targets_type_name,
+                                                                targets_feature_info = targets_feature_info,
+                                                                output_aln_file_paths = output_aln_file_paths,
+                                                                query_len = query_len,
+                                                                all_parsed_BLAST_results = all_parsed_BLAST_results)
+
+        # Save per-target FeatureSets in bulk now that parsing is done
+        output_objs = []
+        output_obj_target_refs = []
+        for input_many_ref in input_many_refs:
+            if all_parsed_BLAST_results[input_many_ref].get('output_featureSet_obj'):
+                output_objs.append(all_parsed_BLAST_results[input_many_ref]['output_featureSet_obj'])
+                output_obj_target_refs.append(input_many_ref)
 
-        # Merge FeatureSets into one output
-        if len(output_featureSet_refs) > 1:
+        # Merge FeatureSets into one output, saved in the same bulk call
+        merged_featureSet_obj = None
+        if len(output_objs) > 1:
             self.log(console, "CREATING MERGED OUTPUT FEATURESET")
-            merge_featureSet_params = {'workspace_name': params['workspace_name'],
-                                       'input_refs': output_featureSet_refs,
-                                       'desc': 'Merged FeatureSets from '+search_tool_name+' Search',
-                                       'output_name': params['output_filtered_name']
-                                       }
-            merge_retVal = self.set_util_Client.KButil_Merge_FeatureSet_Collection(merge_featureSet_params)
-            merge_report_obj = self.wsClient.get_objects2({'objects':[{'ref':merge_retVal['report_ref']}]})['data'][0]['data']
-            merged_featureSet_ref = merge_report_obj['objects_created'][0]['ref']
-            objects_created.append({'ref': merged_featureSet_ref,'description':'ALL '+search_tool_name+' hits'})
+            with self.stage_timer.span('merge'):
+                merged_featureSet = self.merge_FeatureSets ([output_obj['data'] for output_obj in output_objs],
+                                                            'Merged FeatureSets from '+search_tool_name+' Search')
+            merged_featureSet_obj = {
+                'type': 'KBaseCollections.FeatureSet',
+                'data': merged_featureSet,
+                'name': params['output_filtered_name'],
+                'meta': {},
+                'provenance': self._instantiate_provenance (method_name=method_name,
+                                                            input_obj_refs=[params['input_one_ref']]+input_many_refs)
+            }
+
+        if len(output_objs) > 0:
+            self.process_limits.check('save')
+            # saved by an earlier try, so not saved again as new versions
+            restored_save = self.checkpoint.restore('save', 'output_objects', depends=parse_depends)
+            if restored_save is not None:
+                saved_refs = restored_save[1]['saved_refs']
+                merged_featureSet_ref = restored_save[1]['merged_featureSet_ref']
+            else:
+                with self.stage_timer.span('save', num_objects=len(output_objs)):
+                    merged_featureSet_ref = None
+                    if merged_featureSet_obj is not None:
+                        saved_refs_by_name = self.save_output_objects (params['workspace_name'], output_objs+[merged_featureSet_obj])
+                        merged_featureSet_ref = saved_refs_by_name[merged_featureSet_obj['name']]
+                    else:
+                        saved_refs_by_name = self.save_output_objects (params['workspace_name'], output_objs)
+                    saved_refs = [saved_refs_by_name[output_obj['name']] for output_obj in output_objs]
+                self.checkpoint.record('save', 'output_objects',
+                                       data={'saved_refs': saved_refs, 'merged_featureSet_ref': merged_featureSet_ref},
+                                       depends=parse_depends)
+            for input_many_ref, output_featureSet_ref in zip(output_obj_target_refs, saved_refs):
+                all_parsed_BLAST_results[input_many_ref]['output_featureSet_ref'] = output_featureSet_ref
+                objects_created.append({'ref':output_featureSet_ref,'description':targets_name[input_many_ref]+" "+search_tool_name+' hits'})
+                output_featureSet_refs.append(output_featureSet_ref)
+            if merged_featureSet_obj is not None:
+                objects_created.append({'ref': merged_featureSet_ref,'description':'ALL '+search_tool_name+' hits'})
 
             
         # build output report object
         #
-        if len(invalid_msgs) == 0:
-            report_info = self.build_BLAST_report (search_tool_name = search_tool_name,
-                                                   params = params,
-                                                   targets_name = targets_name,
-                                                   targets_type_name = targets_type_name,
-                                                   targets_feature_info = targets_feature_info,
-                                                   base_bulk_save_infos = base_bulk_save_infos,
-                                                   extra_bulk_save_infos = extra_bulk_save_infos,
-                                                   query_len = query_len, 
-                                                   all_parsed_BLAST_results = all_parsed_BLAST_results,
-                                                   objects_created = objects_created)
-        else:
-            report_info = error_report_info
+        self.process_limits.check('report')
+        report_info = self.build_BLAST_report (search_tool_name = search_tool_name,
+                                               params = params,
+                                               targets_name = targets_name,
+                                               targets_type_name = targets_type_name,
+                                               targets_feature_info = targets_feature_info,
+                                               base_upload_keys = base_upload_keys,
+                                               extra_upload_keys = extra_upload_keys,
+                                               hit_table_upload_keys = hit_table_upload_keys,
+                                               query_len = query_len, 
+                                               all_parsed_BLAST_results = all_parsed_BLAST_results,
+                                               objects_created = objects_created)
+
+
+        # stage summary
+        #
+        for (stage, wall_secs) in self.stage_timer.summary():
+            self.log(console, 'STAGE '+stage+': '+'%.3f' % wall_secs+' secs')
+        self.job_log.suppressed_summary()
 
 
         # return
         #
         self.log(console,search_tool_name+"_Search DONE")
+        self.job_log.flush()
         returnVal = { 'report_name': report_info['name'],
                       'report_ref': report_info['ref']
                       }
         return returnVal
+
+
+    #### run_BLAST_Refilter(): new thresholds on an earlier search's hits
+    ##
+    #   reads the hit tables attached to params['report_ref'] and rebuilds the
+    #   FeatureSets and report from them without running BLAST.  The new
+    #   report has hit tables too, so refilters can be chained.
+    #
+    def run_BLAST_Refilter (self, params):
+        self.profiler = JobProfiler(profile_mode(params), profile_memory(params)).start()
+        try:
+            return self._run_BLAST_Refilter (params)
+        finally:
+            self.profiler.stop()
+            self.cleanup_scratch()
+
+
+    def _run_BLAST_Refilter (self, params):
+        console = []
+        self.log(console,'Running BLAST_Refilter with params=')
+        self.log(console, "\n"+pformat(params))
+
+        #### Validate App input params
+        #
+        with self.stage_timer.span('validate'):
+            for arg in ['workspace_name', 'report_ref', 'output_filtered_name']:
+                if not params.get(arg):
+                    raise ValueError ("required parameter '"+arg+"' missing")
+
+        #### Get the hit tables from the earlier report
+        ##
+        with self.stage_timer.span('fetch_hits'):
+            try:
+                report_data = self.wsClient.get_objects2({'objects': [{'ref': params['report_ref']}]})['data'][0]['data']
+            except Exception as e:
+                raise ValueError ("unable to fetch report "+params['report_ref']+": "+str(e))
+            hit_table_links = [file_link for file_link in report_data.get('file_links', [])
+                               if file_link.get('name', '').endswith('-hits'+HIT_TABLE_EXT)]
+            if len(hit_table_links) == 0:
+                raise ValueError ("no hit tables in report "+params['report_ref']+
+                                  " (it predates them, or the search found no hits)")
+
+            dfu = get_client(DFUClient, self.callbackURL, token=self.ctx['token'])
+            hit_tables = []
+            for file_link in hit_table_links:
+                # saved reports have the Shock node URL, not the id
+                shock_id = file_link.get('shock_id') or file_link['URL'].rstrip('/').split('/')[-1]
+                hit_table_path = os.path.join(self.scratch_manager.new_dir('refilter'), 'hits'+HIT_TABLE_EXT)
+                try:
+                    dfu.shock_to_file({'shock_id': shock_id,
+                                       'file_path': hit_table_path})
+                except Exception as e:
+                    raise ValueError ("unable to download "+file_link['name']+": "+str(e))
+                hit_tables.append(read_hit_table(hit_table_path))
+
+        # same search settings, new thresholds and output
+        #
+        first_meta = hit_tables[0][0]['meta']
+        search_tool_name = first_meta['search_tool_name']
+        refilter_params = copy.deepcopy(first_meta['params'])
+        for arg in ['workspace_name', 'output_filtered_name', 'ident_thresh', 'bitscore',
+                    'overlap_fraction', 'genome_disp_name_config']:
+            if params.get(arg) is not None:
+                refilter_params[arg] = params[arg]
+        refilter_params['input_many_refs'] = [header['meta']['target_ref'] for (header, columns) in hit_tables]
+        refilter_params['output_extra_format'] = 'none'
+        query_len = first_meta['query_len']
+
+        #### Regenerate each target's outfmt 7 output
+        ##
+        targets_name = dict()
+        targets_type_name = dict()
+        targets_feature_info = dict()
+        seq_totals = dict()
+        output_aln_file_paths = dict()
+        base_upload_keys = dict()
+        output_dir = self.scratch_manager.new_dir('refilter')
+        for (target_i, (header, columns)) in enumerate(hit_tables):
+            meta = header['meta']
+            input_many_ref = meta['target_ref']
+            targets_name[input_many_ref] = meta['target_name']
+            targets_type_name[input_many_ref] = meta['target_type_name']
+            targets_feature_info[input_many_ref] = meta['target_feature_info']
+            seq_totals[input_many_ref] = meta['seq_total']
+            output_aln_file_paths[input_many_ref] = write_outfmt7(header, columns,
+                                                                  os.path.join(output_dir, 'alnout_m=7.'+str(target_i)+'.txt'))
+            base_upload_keys[input_many_ref] = self.upload_queue.submit(output_aln_file_paths[input_many_ref],
+                                                                        compress=self.compress_BLAST_output)
+
+        # Filter hits, save FeatureSets and build the report
+        #
+        return self._filter_hits_and_report (search_tool_name = search_tool_name,
+                                             params = refilter_params,
+                                             targets_name = targets_name,
+                                             targets_type_name = targets_type_name,
+                                             targets_feature_info = targets_feature_info,
+                                             output_aln_file_paths = output_aln_file_paths,
+                                             base_upload_keys = base_upload_keys,
+                                             extra_upload_keys = dict(),
+                                             query_len = query_len,
+                                             seq_totals = seq_totals)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+# BlastUtil helpers
+from kb_blast.Utils.ResultCache import ResultCache
+
+
+###############################################################################
+# JobCheckpoint: the finished stages of a job, kept so a retry of the same job
+# can pick up where the last try stopped
+###############################################################################
+#
+#   <checkpoint dir>/<job key>/manifest.json   stage -> key -> files, data, depends
+#                             /files/<sha256>  the stages' files, by content
+#                             /lock            flock()ed by the job using it
+#
+#   every file is hashed when it's recorded and checked against the hash
+#   when it's restored.  A stage is only restored if what it was made from
+#   (its depends, usually the hashes of its input files) is unchanged.
+#   A job that finishes removes its checkpoint.
+#
+#   only one job at a time uses a checkpoint: a second job with the same key
+#   (the same user running the same thing twice at once) runs without one
+#
+
+# deploy config key / environment variable for the checkpoint dir; no
+# checkpoints are kept if neither is set
+CHECKPOINT_DIR_CONFIG_KEY = 'checkpoint-dir'
+CHECKPOINT_DIR_ENV_VAR = 'KB_BLAST_CHECKPOINT_DIR'
+
+
+class JobCheckpoint:
+
+    # checkpoints not resumed for this long are removed
+    MAX_AGE_SECS = 7*24*3600
+
+
+    # checkpoint_dir None turns checkpoints off
+    #
+    def __init__(self, checkpoint_dir, job_key):
+        self.job_key = job_key
+        self.enabled = checkpoint_dir is not None and job_key is not None
+        self.manifest = {'job_key': job_key, 'stages': dict()}
+        self.resumed = False
+        self.in_use = False
+        self.lock = threading.Lock()
+        self.lock_fd = None
+        if self.enabled:
+            self.checkpoint_dir = checkpoint_dir
+            self.job_dir = os.path.join(checkpoint_dir, job_key)
+            self.files_dir = os.path.join(self.job_dir, 'files')
+            self.manifest_path = os.path.join(self.job_dir, 'manifest.json')
+            os.makedirs(self.files_dir, exist_ok=True)
+            self.lock_fd = self._lock_job_dir(self.job_dir)
+            if self.lock_fd is None:
+                self.in_use = True
+                self.enabled = False
+                return
+            self.evict_stale()
+            self._load()
+
+
+    # for_job(): checkpoint of method called by user_id with params, from the
+    # deploy config or the environment
+    #
+    #   the job key is the user and params['checkpoint_key'] if given, else
+    #   the user, method and params themselves, so a retry of the same job
+    #   resumes, but never from another user's
+    #
+    @classmethod
+    def for_job(cls, config, method_name, params, user_id=None):
+        checkpoint_dir = config.get(CHECKPOINT_DIR_CONFIG_KEY) or os.environ.get(CHECKPOINT_DIR_ENV_VAR)
+        if not checkpoint_dir:
+            return cls(None, None)
+        if params.get('checkpoint_key'):
+            key_fields = {'user': user_id, 'method': method_name, 'checkpoint_key': str(params['checkpoint_key'])}
+        else:
+            key_fields = {'user': user_id, 'method': method_name, 'params': params}
+        job_key = hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode()).hexdigest()
+        return cls(checkpoint_dir, job_key)
+
+
+    # _lock_job_dir(): fd holding job_dir's lock, or None if another job has it
+    #
+    @staticmethod
+    def _lock_job_dir(job_dir):
+        lock_path = os.path.join(job_dir, 'lock')
+        try:
+            lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # and job_dir wasn't removed (by its job finishing) meanwhile
+            if os.stat(lock_path).st_ino != os.fstat(lock_fd).st_ino:
+                raise OSError('checkpoint removed: '+job_dir)
+        except OSError:
+            os.close(lock_fd)
+            return None
+        return lock_fd
+
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r') as manifest_handle:
+                manifest = json.load(manifest_handle)
+        except (IOError, OSError, ValueError):
+            return
+        if manifest.get('job_key') == self.job_key:
+            self.manifest = manifest
+            self.resumed = len(manifest['stages']) > 0
+
+
+    # _write(): replaced atomically, so a job killed mid-write leaves the last one
+    #
+    def _write(self):
+        tmp_manifest_path = self.manifest_path+'.'+str(uuid.uuid4())
+        with open(tmp_manifest_path, 'w') as manifest_handle:
+            json.dump(self.manifest, manifest_handle)
+        os.rename(tmp_manifest_path, self.manifest_path)
+
+
+    @staticmethod
+    def _link_or_copy(src_path, dst_path):
+        if os.path.lexists(dst_path):
+            os.remove(dst_path)
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            # another filesystem
+            shutil.copyfile(src_path, dst_path)
+
+
+    # depends_on(): content hashes of file_paths by name, for record() and
+    # restore(); None when checkpoints are off, to skip the hashing
+    #
+    def depends_on(self, **file_paths):
+        if not self.enabled:
+            return None
+        return dict((name, ResultCache.file_sha256(file_path)) for name, file_path in file_paths.items())
+
+
+    # record(): stage (for key) is done, making files and data
+    #
+    #   never fails the job: a checkpoint that can't be written is skipped
+    #
+    def record(self, stage, key, files=(), data=None, depends=None):
+        if not self.enabled:
+            return False
+        try:
+            file_entries = []
+            for file_path in files:
+                file_sha256 = ResultCache.file_sha256(file_path)
+                stored_path = os.path.join(self.files_dir, file_sha256)
+                if not os.path.isfile(stored_path):
+                    tmp_stored_path = stored_path+'.'+str(uuid.uuid4())
+                    self._link_or_copy(file_path, tmp_stored_path)
+                    os.rename(tmp_stored_path, stored_path)
+                file_entries.append({'name': os.path.basename(file_path),
+                                     'sha256': file_sha256,
+                                     'size_bytes': os.path.getsize(stored_path)})
+            with self.lock:
+                self.manifest['stages'].setdefault(stage, dict())[key] = {'files': file_entries,
+                                                                          'data': data,
+                                                                          'depends': depends,
+                                                                          'time': time.time()}
+                self._write()
+        except (IOError, OSError, TypeError, ValueError):
+            return False
+        return True
+
+
+    # restore(): (file paths in dest_dir, data) of a recorded stage, or None
+    #
+    #   None if the stage wasn't recorded, was made from something else
+    #   (depends differ) or any of its files fail the hash check
+    #
+    def restore(self, stage, key, dest_dir=None, depends=None):
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.manifest['stages'].get(stage, dict()).get(key)
+        if entry is None or entry['depends'] != depends:
+            return None
+        file_paths = []
+        try:
+            for file_entry in entry['files']:
+                stored_path = os.path.join(self.files_dir, file_entry['sha256'])
+                if ResultCache.file_sha256(stored_path) != file_entry['sha256']:
+                    raise ValueError('checkpoint file '+stored_path+' is corrupt')
+                file_path = os.path.join(dest_dir, file_entry['name'])
+                self._link_or_copy(stored_path, file_path)
+                file_paths.append(file_path)
+        except (IOError, OSError, ValueError):
+            with self.lock:
+                self.manifest['stages'][stage].pop(key, None)
+            return None
+        return (file_paths, entry['data'])
+
+
+    # complete(): the job is done; its checkpoint is no longer needed
+    #
+    def complete(self):
+        if self.enabled:
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        self.release()
+
+
+    # release(): let the next try of the job use the checkpoint
+    #
+    def release(self):
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+        self.enabled = False
+
+
+    # evict_stale(): remove checkpoints of jobs nobody retried
+    #
+    def evict_stale(self):
+        now = time.time()
+        for job_key in os.listdir(self.checkpoint_dir):
+            if job_key == self.job_key:
+                continue
+            job_dir = os.path.join(self.checkpoint_dir, job_key)
+            try:
+                if os.path.isfile(os.path.join(job_dir, 'manifest.json')):
+                    last_used = os.path.getmtime(os.path.join(job_dir, 'manifest.json'))
+                else:
+                    last_used = os.path.getmtime(job_dir)
+            except OSError:
+                # removed by another job
+                continue
+            if now - last_used > self.MAX_AGE_SECS:
+                # unless a job is still using it
+                lock_fd = self._lock_job_dir(job_dir)
+                if lock_fd is None:
+                    continue
+                shutil.rmtree(job_dir, ignore_errors=True)
+                os.close(lock_fd)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+
+###############################################################################
+# ClientPool: process-wide registry of SDK clients
+###############################################################################
+
+class ClientPool:
+
+    # clients are rebuilt after this long, so a revoked or rotated token
+    # or a moved service url is picked up without restarting the server
+    DEFAULT_TTL_SECS = 3600
+
+
+    def __init__(self, ttl_secs=None):
+        if ttl_secs is None:
+            ttl_secs = self.DEFAULT_TTL_SECS
+        self.ttl_secs = ttl_secs
+        self.clients = dict()
+        self.lock = threading.Lock()
+
+
+    # _evict_expired(): caller must hold the lock
+    #
+    def _evict_expired(self, now):
+        expired_keys = [key for key, (created, client) in self.clients.items()
+                        if now - created >= self.ttl_secs]
+        for key in expired_keys:
+            del self.clients[key]
+
+
+    # get(): return the pooled client, building it on first use
+    #
+    #   service_ver is only passed to the constructor when given, since
+    #   core service clients (e.g. Workspace) do not accept it.  Any other
+    #   constructor options are part of the key.
+    #
+    def get(self, client_class, url, token=None, service_ver=None, **options):
+        key = (client_class, url, token, service_ver, tuple(sorted(options.items())))
+        now = time.time()
+        with self.lock:
+            self._evict_expired(now)
+            if key in self.clients:
+                return self.clients[key][1]
+
+            client_kwargs = dict(options)
+            client_kwargs['token'] = token
+            if service_ver is not None:
+                client_kwargs['service_ver'] = service_ver
+            client = self._build(client_class, url, **client_kwargs)
+            self.clients[key] = (now, client)
+        return client
+
+
+    # _build(): a new client, called with the lock held
+    #
+    @staticmethod
+    def _build(client_class, url, **client_kwargs):
+        return client_class(url, **client_kwargs)
+
+
+    # clear(): drop every pooled client
+    #
+    def clear(self):
+        with self.lock:
+            self.clients = dict()
+
+
+# shared by every BlastUtil in the server process
+CLIENT_POOL = ClientPool()
+
+
+def get_client(client_class, url, token=None, service_ver=None, **options):
+    return CLIENT_POOL.get(client_class, url, token=token, service_ver=service_ver, **options)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import re
+import struct
+import sys
+from array import array
+
+
+###############################################################################
+# HitTable: the raw outfmt 7 hits of one search in a compact binary file,
+# with what's needed to filter them again without rerunning BLAST
+###############################################################################
+#
+#   magic, then gzip of:
+#     header length (uint32 LE) and header JSON: meta, byte order, hit count,
+#       query and subject id tables, and the comment lines before and after
+#       the hits
+#     one array per integer column (query and subject id index, identity in
+#       thousandths of a percent, alignment length, mismatches, gap opens,
+#       q. start, q. end, s. start, s. end)
+#     evalue and bit score, each as a length-prefixed tab-joined string, so
+#       they come back exactly as BLAST printed them
+#
+HIT_TABLE_MAGIC = b'KBBLAST-HITS-1\n'
+HIT_TABLE_EXT = '.kbhits'
+
+INT_COLUMNS = ['query_i', 'subject_i', 'ident_milli', 'aln_len', 'mismatches', 'gap_opens',
+               'q_start', 'q_end', 's_start', 's_end']
+
+
+def _write_blob(out_handle, blob):
+    out_handle.write(struct.pack('<I', len(blob)))
+    out_handle.write(blob)
+
+
+def _read_blob(in_handle):
+    (blob_len,) = struct.unpack('<I', in_handle.read(4))
+    return in_handle.read(blob_len)
+
+
+# read_outfmt7(): (header, columns) of an outfmt 7 file, for write_hit_table()
+#
+#   raises ValueError on a line that isn't a 12 field outfmt 7 hit
+#
+def read_outfmt7(output_aln_file_path):
+    query_ids = []
+    query_index = dict()
+    subject_ids = []
+    subject_index = dict()
+    columns = dict((column, array('i')) for column in INT_COLUMNS)
+    evalues = []
+    bitscores = []
+    comment_lines = []
+    trailing_comment_lines = []
+
+    with open(output_aln_file_path, 'r') as aln_handle:
+        for line in aln_handle:
+            if line.startswith('#'):
+                # parse_BLAST_tab_output() only keeps the ones before the hits
+                if not evalues:
+                    comment_lines.append(line.rstrip("\n"))
+                else:
+                    trailing_comment_lines.append(line.rstrip("\n"))
+                continue
+            if line.strip() == '':
+                continue
+            hit_info = line.rstrip("\n").split("\t")
+            if len(hit_info) != 12:
+                raise ValueError('not an outfmt 7 hit line: '+line)
+            (query_id, subject_id) = (hit_info[0], hit_info[1])
+            if query_id not in query_index:
+                query_index[query_id] = len(query_ids)
+                query_ids.append(query_id)
+            if subject_id not in subject_index:
+                subject_index[subject_id] = len(subject_ids)
+                subject_ids.append(subject_id)
+            try:
+                columns['query_i'].append(query_index[query_id])
+                columns['subject_i'].append(subject_index[subject_id])
+                columns['ident_milli'].append(int(round(float(hit_info[2]) * 1000)))
+                for column, value in zip(INT_COLUMNS[3:], hit_info[3:10]):
+                    columns[column].append(int(value))
+            except ValueError:
+                raise ValueError('not an outfmt 7 hit line: '+line)
+            evalues.append(hit_info[10])
+            bitscores.append(hit_info[11])
+
+    columns['evalue'] = evalues
+    columns['bitscore'] = bitscores
+    header = {'meta': None,
+              'n_hits': len(evalues),
+              'query_ids': query_ids,
+              'subject_ids': subject_ids,
+              'comment_lines': comment_lines,
+              'trailing_comment_lines': trailing_comment_lines}
+    return (header, columns)
+
+
+# write_hit_table(): header (with its meta set) and columns to hit_table_path
+#
+def write_hit_table(hit_table_path, header, columns):
+    header = dict(header, byteorder=sys.byteorder)
+    with open(hit_table_path, 'wb') as raw_handle:
+        raw_handle.write(HIT_TABLE_MAGIC)
+        with gzip.GzipFile(fileobj=raw_handle, mode='wb', compresslevel=6) as out_handle:
+            _write_blob(out_handle, json.dumps(header).encode('utf-8'))
+            for column in INT_COLUMNS:
+                _write_blob(out_handle, columns[column].tobytes())
+            _write_blob(out_handle, "\t".join(columns['evalue']).encode('utf-8'))
+            _write_blob(out_handle, "\t".join(columns['bitscore']).encode('utf-8'))
+    return hit_table_path
+
+
+# read_hit_table(): (header, columns) as written by write_hit_table()
+#
+def read_hit_table(hit_table_path):
+    with open(hit_table_path, 'rb') as raw_handle:
+        if raw_handle.read(len(HIT_TABLE_MAGIC)) != HIT_TABLE_MAGIC:
+            raise ValueError('not a kb_blast hit table: '+hit_table_path)
+        with gzip.GzipFile(fileobj=raw_handle, mode='rb') as in_handle:
+            header = json.loads(_read_blob(in_handle).decode('utf-8'))
+            columns = dict()
+            for column in INT_COLUMNS:
+                columns[column] = array('i')
+                columns[column].frombytes(_read_blob(in_handle))
+                if header['byteorder'] != sys.byteorder:
+                    columns[column].byteswap()
+            evalues = _read_blob(in_handle).decode('utf-8')
+            bitscores = _read_blob(in_handle).decode('utf-8')
+    columns['evalue'] = evalues.split("\t") if header['n_hits'] else []
+    columns['bitscore'] = bitscores.split("\t") if header['n_hits'] else []
+    for column in columns:
+        if len(columns[column]) != header['n_hits']:
+            raise ValueError('truncated hit table: '+hit_table_path)
+    return (header, columns)
+
+
+# write_outfmt7(): the hits back as outfmt 7 text
+#
+def write_outfmt7(header, columns, output_aln_file_path):
+    query_ids = header['query_ids']
+    subject_ids = header['subject_ids']
+    with open(output_aln_file_path, 'w') as aln_handle:
+        for line in header['comment_lines']:
+            aln_handle.write(line+"\n")
+        for i in range(header['n_hits']):
+            aln_handle.write("\t".join([query_ids[columns['query_i'][i]],
+                                        subject_ids[columns['subject_i'][i]],
+                                        '%.3f' % (columns['ident_milli'][i] / 1000.0)] +
+                                       [str(columns[column][i]) for column in INT_COLUMNS[3:]] +
+                                       [columns['evalue'][i],
+                                        columns['bitscore'][i]])+"\n")
+        for line in header['trailing_comment_lines']:
+            aln_handle.write(line+"\n")
+    return output_aln_file_path
+
+
+# trim_target_feature_info(): just the parts of target_feature_info that
+# parse_BLAST_tab_output() and the HTML report use for these subject ids
+#
+#   subject_ids are as BLAST wrote them, so may be short ids
+#
+def trim_target_feature_info(target_feature_info, subject_ids, genome_id_feature_id_delim):
+    short_id_to_rec_id = target_feature_info.get('short_id_to_rec_id') or dict()
+    hit_ids = set(short_id_to_rec_id.get(subject_id, subject_id) for subject_id in subject_ids)
+
+    def is_hit(id_untrans):
+        # BLAST may have turned 'kb|blah' style ids into 'kb:blah'
+        return id_untrans in hit_ids or re.sub(r'\|', ':', id_untrans) in hit_ids
+
+    trimmed = dict()
+    for key, value in target_feature_info.items():
+        if value is None:
+            trimmed[key] = value
+        elif key == 'short_id_to_rec_id':
+            trimmed[key] = dict((subject_id, short_id_to_rec_id[subject_id])
+                                for subject_id in subject_ids if subject_id in short_id_to_rec_id)
+        elif key == 'feature_ids':
+            trimmed[key] = [fid for fid in value if is_hit(fid)]
+        elif key == 'feature_ids_by_genome_ref':
+            trimmed[key] = dict((genome_ref, [fid for fid in fids
+                                              if is_hit(genome_ref+genome_id_feature_id_delim+fid)])
+                                for genome_ref, fids in value.items())
+        elif key == 'feature_ids_by_genome_id':
+            genome_id_to_genome_ref = target_feature_info['genome_id_to_genome_ref']
+            trimmed[key] = dict((genome_id, [fid for fid in fids
+                                             if is_hit(genome_id_to_genome_ref[genome_id]+genome_id_feature_id_delim+fid)])
+                                for genome_id, fids in value.items())
+        elif key == 'feature_id_to_function':
+            trimmed[key] = dict((genome_ref, dict((fid, function) for fid, function in functions.items()
+                                                  if is_hit(fid) or is_hit(genome_ref+genome_id_feature_id_delim+fid)))
+                                for genome_ref, functions in value.items())
+        else:
+            trimmed[key] = value
+    return trimmed
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+
+try:
+    # optional: several times faster than the stdlib on large payloads
+    import orjson
+except ImportError:
+    orjson = None
+
+
+###############################################################################
+# JSONCodec: JSON encode/decode for the RPC server and the SDK clients
+# (baseclient), orjson when installed
+###############################################################################
+
+# default(): same handling as kb_blastServer.JSONObjectEncoder
+#
+def default(obj):
+    if isinstance(obj, set):
+        return list(obj)
+    if isinstance(obj, frozenset):
+        return list(obj)
+    if hasattr(obj, 'toJSONable'):
+        return obj.toJSONable()
+    raise TypeError('Object of type '+type(obj).__name__+' is not JSON serializable')
+
+
+class _JSONObjectEncoder(json.JSONEncoder):
+
+    def default(self, obj):
+        return default(obj)
+
+
+# dumps(): returns str, like json.dumps()
+#
+#   orjson's output is compact, leaves non-ASCII characters unescaped and
+#   writes NaN and infinities as null.  The stdlib, used without orjson and
+#   for anything orjson refuses (e.g. ints wider than 64 bits), is made to
+#   do the same, so the JSON is the same either way
+#
+def dumps(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default,
+                                option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            pass
+    return _stdlib_dumps(obj)
+
+
+# dumps_bytes(): the same, as UTF-8 bytes
+#
+def dumps_bytes(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default,
+                                option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return _stdlib_dumps(obj).encode('utf-8')
+
+
+def _stdlib_dumps(obj):
+    try:
+        return json.dumps(obj, cls=_JSONObjectEncoder, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    except ValueError as e:
+        if 'Out of range float' not in str(e):
+            raise
+    # NaN or an infinity somewhere (rare, so only then looked for)
+    return json.dumps(_finite(obj), cls=_JSONObjectEncoder, separators=(',', ':'), ensure_ascii=False)
+
+
+# _finite(): obj with NaN and infinities as None
+#
+def _finite(obj):
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return dict((key, _finite(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    if obj is None or isinstance(obj, (str, int)):
+        return obj
+    return _finite(default(obj))
+
+
+# loads(): accepts str or bytes
+#
+#   input orjson rejects is handed to the stdlib, which either accepts it
+#   (e.g. NaN) or raises the usual ValueError
+#
+def loads(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+    return json.loads(data)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+
+###############################################################################
+# JobLog: leveled, buffered logging for kb_blast jobs
+###############################################################################
+
+LOGGER_NAME = 'kb_blast'
+
+# KB_BLAST_LOG_LEVEL=DEBUG also lifts the cap on per-hit messages
+DEFAULT_LOG_LEVEL = os.environ.get('KB_BLAST_LOG_LEVEL', 'INFO').upper()
+
+# console output is written in batches: when this many records are waiting,
+# when FLUSH_SECS have passed since the last write, or on an error
+FLUSH_CAPACITY = 500
+FLUSH_SECS = 1.0
+
+# per-hit messages (e.g. every FILTERING/HIT line) are cut off after this many
+# per key and job, with a count of what was dropped
+DEFAULT_PER_KEY_LIMIT = 100
+
+
+class _BatchingHandler(logging.handlers.MemoryHandler):
+
+    def __init__(self, capacity, flush_secs, target):
+        logging.handlers.MemoryHandler.__init__(self, capacity,
+                                                flushLevel=logging.ERROR,
+                                                target=target)
+        self.flush_secs = flush_secs
+        self.last_flush = time.time()
+
+    def shouldFlush(self, record):
+        return (logging.handlers.MemoryHandler.shouldFlush(self, record) or
+                time.time() - self.last_flush >= self.flush_secs)
+
+    def flush(self):
+        logging.handlers.MemoryHandler.flush(self)
+        self.last_flush = time.time()
+
+
+_logger_lock = threading.Lock()
+
+
+# get_logger(): the shared 'kb_blast' logger, set up on first use
+#
+def get_logger():
+    logger = logging.getLogger(LOGGER_NAME)
+    with _logger_lock:
+        if not logger.handlers:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s',
+                                                           datefmt='%Y-%m-%d_%H:%M:%S'))
+            logger.addHandler(_BatchingHandler(FLUSH_CAPACITY, FLUSH_SECS, console_handler))
+            logger.setLevel(DEFAULT_LOG_LEVEL)
+            logger.propagate = False
+    return logger
+
+
+class JobLog:
+
+    def __init__(self, per_key_limit=None):
+        if per_key_limit is None:
+            per_key_limit = DEFAULT_PER_KEY_LIMIT
+        self.per_key_limit = per_key_limit
+        self.logger = get_logger()
+        self.key_counts = dict()
+        self.lock = threading.Lock()
+        self.timestamp_secs = None
+        self.timestamp_str = None
+
+
+    # _timestamp(): formatted once per second rather than once per line
+    #
+    def _timestamp(self):
+        now_secs = int(time.time())
+        if now_secs != self.timestamp_secs:
+            self.timestamp_str = time.strftime('%Y-%m-%d_%H:%M:%S', time.localtime(now_secs))
+            self.timestamp_secs = now_secs
+        return self.timestamp_str
+
+
+    # log(): same contract as the old BlastUtil.log()
+    #
+    #   target, if given, is a list (console, invalid_msgs) that gets the
+    #   timestamped message whatever the log level, since callers build
+    #   error messages and reports from it
+    #
+    def log(self, target, message, level=logging.INFO):
+        if target is not None:
+            target.append('['+self._timestamp()+'] '+message)
+        self.logger.log(level, message)
+
+
+    def debug(self, target, message):
+        self.log(target, message, level=logging.DEBUG)
+
+
+    # limited(): per-hit messages, capped at per_key_limit per key
+    #
+    #   messages past the limit go nowhere, not even to target, unless the
+    #   logger is at DEBUG
+    #
+    def limited(self, target, key, message, level=logging.INFO):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.log(target, message, level=level)
+            return
+        with self.lock:
+            count = self.key_counts.get(key, 0) + 1
+            self.key_counts[key] = count
+        if count <= self.per_key_limit:
+            self.log(target, message, level=level)
+        elif count == self.per_key_limit + 1:
+            self.log(None, 'further '+key+' messages suppressed', level=level)
+
+
+    # suppressed_summary(): how many messages limited() dropped, per key
+    #
+    def suppressed_summary(self):
+        with self.lock:
+            key_counts = dict(self.key_counts)
+        for key in sorted(key_counts):
+            if key_counts[key] > self.per_key_limit:
+                self.log(None, key+': '+str(key_counts[key] - self.per_key_limit)+' of '+
+                         str(key_counts[key])+' messages suppressed')
+
+
+    def flush(self):
+        for handler in self.logger.handlers:
+            handler.flush()
+
+
+###############################################################################
+# SubprocessLog: full subprocess output to a file, a short tail in memory
+###############################################################################
+
+class SubprocessLog:
+
+    # lines kept for error messages when a subprocess fails
+    TAIL_LINES = 50
+
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.log_handle = None
+        self.lock = threading.Lock()
+        self.tail = deque(maxlen=self.TAIL_LINES)
+        self.line_count = 0
+
+
+    # start(): header for one subprocess run; returns its line handler
+    #
+    def start(self, cmd):
+        with self.lock:
+            if self.log_handle is None:
+                self.log_handle = open(self.log_path, 'a')
+            self.tail.clear()
+            self.log_handle.write('### '+' '.join(cmd)+"\n")
+        return self.write_line
+
+
+    def write_line(self, line):
+        with self.lock:
+            self.tail.append(line.rstrip("\n"))
+            self.line_count += 1
+            self.log_handle.write(line)
+
+
+    def get_tail(self):
+        with self.lock:
+            return list(self.tail)
+
+
+    # close(): flush to disk before the file is uploaded
+    #
+    def close(self):
+        with self.lock:
+            if self.log_handle is not None:
+                self.log_handle.close()
+                self.log_handle = None
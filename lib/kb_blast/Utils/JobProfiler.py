@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import tracemalloc
+import uuid
+
+
+###############################################################################
+# JobProfiler: opt-in cProfile or stack-sampling profile of a job, with its
+# tracemalloc peak and top allocations, written out to attach to the report
+###############################################################################
+
+# set to 'cprofile' (or 1/true/yes) or 'sample' to profile every job; a job's
+# own 'profile' param wins
+PROFILE_ENV_VAR = 'KB_BLAST_PROFILE'
+
+# tracemalloc is on with the profile unless this (or a job's 'profile_memory'
+# param) is 0: it can slow allocation-heavy code 10x or more, which swamps
+# the sampling profiler's own low overhead
+PROFILE_MEMORY_ENV_VAR = 'KB_BLAST_PROFILE_MEMORY'
+
+# seconds of wall time between stack samples
+SAMPLE_INTERVAL = 0.01
+
+TOP_N = 40
+
+# frames kept per allocation; more gives call paths for the top sites, at a
+# large cost in speed
+TRACEMALLOC_FRAMES = 1
+
+
+FALSE_VALUES = ('0', 'false', 'no', 'off', 'none')
+
+
+# profile_mode(): 'cprofile', 'sample' or None, from params or the environment
+#
+def profile_mode(params):
+    value = _setting(params, 'profile', PROFILE_ENV_VAR)
+    if value is None or value in FALSE_VALUES:
+        return None
+    if value in ('sample', 'sampling'):
+        return 'sample'
+    if value in ('1', 'true', 'yes', 'on', 'cprofile', 'deterministic'):
+        return 'cprofile'
+    raise ValueError("profile must be 'cprofile' or 'sample', not '"+value+"'")
+
+
+# profile_memory(): whether to run tracemalloc with the profile
+#
+def profile_memory(params):
+    return _setting(params, 'profile_memory', PROFILE_MEMORY_ENV_VAR) not in FALSE_VALUES
+
+
+# _setting(): the param if set, else the environment variable, lowercased
+#
+def _setting(params, param_name, env_var):
+    value = None
+    if params is not None:
+        value = params.get(param_name)
+    if value is None or str(value).strip() == '':
+        value = os.environ.get(env_var)
+    if value is None or str(value).strip() == '':
+        return None
+    return str(value).strip().lower()
+
+
+class JobProfiler:
+
+    # only one job in a process can be profiled at a time; one left running
+    # by a job that raised is stopped when the next starts
+    _running = None
+    _running_lock = threading.RLock()
+
+    def __init__(self, mode, memory=True):
+        self.mode = mode
+        self.memory = memory
+        self.active = False
+        self.profile = None
+        self.samples = dict()
+        self.n_samples = 0
+        self.code_labels = dict()
+        self.in_sample = False
+        self.prev_alarm_handler = None
+        self.started_tracemalloc = False
+        self.memory_snapshot = None
+        self.memory_peak_bytes = None
+        self.memory_current_bytes = None
+        self.stopped = False
+
+
+    def start(self):
+        if self.mode is None or self.active:
+            return self
+        with JobProfiler._running_lock:
+            if JobProfiler._running is not None:
+                JobProfiler._running.stop()
+            JobProfiler._running = self
+
+        if self.memory:
+            # either way the peak starts from zero (clear_traces() zeroes it
+            # too; tracemalloc.reset_peak() is Python 3.9+)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self.started_tracemalloc = True
+            else:
+                tracemalloc.clear_traces()
+
+        if self.mode == 'sample' and threading.current_thread() is not threading.main_thread():
+            # signals only reach the main thread
+            self.mode = 'cprofile'
+        if self.mode == 'sample':
+            self.prev_alarm_handler = signal.signal(signal.SIGALRM, self._sample)
+            signal.setitimer(signal.ITIMER_REAL, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+        else:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.active = True
+        return self
+
+
+    def stop(self):
+        if not self.active:
+            return self
+        self.active = False
+        if self.mode == 'sample':
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.prev_alarm_handler or signal.SIG_DFL)
+        else:
+            self.profile.disable()
+
+        if self.memory and tracemalloc.is_tracing():
+            (self.memory_current_bytes, self.memory_peak_bytes) = tracemalloc.get_traced_memory()
+            self.memory_snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__),
+                 tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                 tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')])
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+        self.stopped = True
+
+        with JobProfiler._running_lock:
+            if JobProfiler._running is self:
+                JobProfiler._running = None
+        return self
+
+
+    # _sample(): SIGALRM handler, counting the stack of every thread
+    #
+    #   a tick that lands while the last one is still being counted (easy
+    #   with tracemalloc on) is dropped rather than nested
+    #
+    def _sample(self, signum, frame):
+        if self.in_sample:
+            return
+        self.in_sample = True
+        try:
+            self.n_samples += 1
+            main_thread_id = threading.main_thread().ident
+            for thread_id, thread_frame in sys._current_frames().items():
+                if thread_id == main_thread_id:
+                    thread_frame = frame  # not this handler's own frame
+                stack = []
+                while thread_frame is not None:
+                    code = thread_frame.f_code
+                    label = self.code_labels.get(code)
+                    if label is None:
+                        label = os.path.basename(code.co_filename)+':'+code.co_name+':'+str(code.co_firstlineno)
+                        self.code_labels[code] = label
+                    stack.append(label)
+                    thread_frame = thread_frame.f_back
+                stack.reverse()
+                key = ';'.join(stack)
+                self.samples[key] = self.samples.get(key, 0) + 1
+        finally:
+            self.in_sample = False
+
+
+    # _sample_summary(): top functions by samples on top of the stack and anywhere in it
+    #
+    def _sample_summary(self):
+        self_counts = dict()
+        total_counts = dict()
+        for stack, count in self.samples.items():
+            funcs = stack.split(';')
+            self_counts[funcs[-1]] = self_counts.get(funcs[-1], 0) + count
+            for func in set(funcs):
+                total_counts[func] = total_counts.get(func, 0) + count
+        lines = [str(self.n_samples)+' samples every '+str(SAMPLE_INTERVAL)+' s of wall time, all threads', '']
+        for (title, counts) in [('self', self_counts), ('inclusive', total_counts)]:
+            lines.append('top '+str(TOP_N)+' functions by '+title+' samples:')
+            for func, count in sorted(counts.items(), key=lambda item: -item[1])[:TOP_N]:
+                lines.append('{:>8}  {}'.format(count, func))
+            lines.append('')
+        return lines
+
+
+    def _memory_summary(self):
+        lines = ['tracemalloc peak: {:.1f} MB, at stop: {:.1f} MB'.format(self.memory_peak_bytes / 1048576.0,
+                                                                          self.memory_current_bytes / 1048576.0),
+                 '',
+                 'top '+str(TOP_N)+' allocation sites still live at stop:']
+        for stat in self.memory_snapshot.statistics('lineno')[:TOP_N]:
+            lines.append('{:>12.1f} KB {:>9} blocks  {}'.format(stat.size / 1024.0, stat.count, str(stat.traceback)))
+        return lines
+
+
+    # write_files(): the profile and memory snapshot in out_dir, as
+    # (file_path, name, label) for the report's file links
+    #
+    def write_files(self, out_dir, method_name):
+        self.stop()
+        if self.mode is None or not self.stopped:
+            return []
+        file_id = str(uuid.uuid4())
+        job_files = []
+
+        summary_lines = [method_name+' profile ('+self.mode+')', '']
+        if self.mode == 'sample':
+            stacks_path = os.path.join(out_dir, 'profile_stacks_'+file_id+'.txt')
+            with open(stacks_path, 'w') as stacks_handle:
+                for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+                    stacks_handle.write(stack+' '+str(count)+"\n")
+            job_files.append((stacks_path, method_name+'-profile_stacks.txt',
+                              method_name+' sampled stacks (flame graph input)'))
+            summary_lines.extend(self._sample_summary())
+        else:
+            pstats_path = os.path.join(out_dir, 'profile_'+file_id+'.pstats')
+            self.profile.dump_stats(pstats_path)
+            job_files.append((pstats_path, method_name+'-profile.pstats',
+                              method_name+' cProfile stats'))
+            stats_buf = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stats_buf)
+            stats.sort_stats('cumulative').print_stats(TOP_N)
+            stats.sort_stats('tottime').print_stats(TOP_N)
+            summary_lines.append(stats_buf.getvalue())
+        if self.memory_snapshot is not None:
+            summary_lines.extend(self._memory_summary())
+
+        summary_path = os.path.join(out_dir, 'profile_summary_'+file_id+'.txt')
+        with open(summary_path, 'w') as summary_handle:
+            summary_handle.write("\n".join(summary_lines)+"\n")
+        job_files.append((summary_path, method_name+'-profile_summary.txt',
+                          method_name+' profile and memory summary'))
+
+        if self.memory_snapshot is not None:
+            snapshot_path = os.path.join(out_dir, 'memory_'+file_id+'.tracemalloc')
+            self.memory_snapshot.dump(snapshot_path)
+            job_files.append((snapshot_path, method_name+'-memory.tracemalloc',
+                              method_name+' tracemalloc snapshot'))
+        return job_files
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+
+
+###############################################################################
+# MSAPrep: psiBLAST query and MSA files from a KBaseTrees.MSA object
+###############################################################################
+
+PROT_MSA_pattern = re.compile(r"^[\.\-_acdefghiklmnpqrstvwyACDEFGHIKLMNPQRSTVWYxX ]+$")
+DNA_MSA_pattern = re.compile(r"^[\.\-_ACGTUXNRYSWKMBDHVacgtuxnryswkmbdhv \t\n]+$")
+
+
+# msa_row_order(): row_order if given, else the sorted row ids
+#
+def msa_row_order(MSA_in):
+    if 'row_order' in MSA_in:
+        return MSA_in['row_order']
+    return sorted(MSA_in['alignment'].keys())
+
+
+# write_psiBLAST_msa_files()
+#
+#   the longest ungapped row is the query (and psiBLAST's master row, counted
+#   from 1); the MSA goes to a Clustal-esque file of padded row ids, one row
+#   per line, which psiBLAST reads with -in_msa
+#
+def write_psiBLAST_msa_files(MSA_in, out_dir, input_msa_name):
+    row_order = msa_row_order(MSA_in)
+
+    master_row_idx = -1
+    longest_seq_len = 0
+    longest_seq = ''
+    for i,row_id in enumerate(row_order):
+        msa_seq = MSA_in['alignment'][row_id].replace('-','')
+        if len(msa_seq) > longest_seq_len:
+            master_row_idx = i
+            longest_seq_len = len(msa_seq)
+            longest_seq = msa_seq
+    if longest_seq == '' or master_row_idx == -1:
+        raise ValueError ("unable to find longest seq in MSA")
+
+    query_fasta_file_path = os.path.join(out_dir, input_msa_name+"-query.fasta")
+    with open (query_fasta_file_path, 'w') as query_fasta_file_handle:
+        query_fasta_file_handle.write('>query'+"\n")
+        query_fasta_file_handle.write(longest_seq+"\n")
+
+    longest_row_id_len = max([len(row_id) for row_id in row_order])
+    msa_file_path = os.path.join(out_dir, input_msa_name+".fasta")
+    with open(msa_file_path, 'w') as msa_file_handle:
+        for row_id in row_order:
+            msa_file_handle.write(row_id.ljust(longest_row_id_len) + "\t" +
+                                  MSA_in['alignment'][row_id] + "\n")
+
+    return { 'row_order': row_order,
+             'query_fasta_file_path': query_fasta_file_path,
+             'msa_file_path': msa_file_path,
+             'master_row_idx': master_row_idx + 1
+         }
+
+
+# check_protein_MSA(): (ok, invalid messages), stopping at the first bad row
+#
+#   an MSA declared as DNA is not ok, but is not reported row by row
+#
+def check_protein_MSA(MSA_in, row_order):
+    if 'sequence_type' in MSA_in and (MSA_in['sequence_type'] == 'dna' or MSA_in['sequence_type'] == 'DNA'):
+        return (False, [])
+
+    for row_id in row_order:
+        if DNA_MSA_pattern.match(MSA_in['alignment'][row_id]):
+            return (False, ["Need protein sequences in MSA. "+
+                            "BAD nucleotide record for MSA row_id: "+row_id+"\n"+MSA_in['alignment'][row_id]+"\n"])
+        elif not PROT_MSA_pattern.match(MSA_in['alignment'][row_id]):
+            return (False, ["BAD record for MSA row_id: "+row_id+"\n"+MSA_in['alignment'][row_id]+"\n"])
+    return (True, [])
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+
+###############################################################################
+# ObjectFetch: get only the parts of a workspace object a caller reads
+###############################################################################
+
+# get_obj_subset()
+#
+#   fetches only what the caller needs of the object's type:
+#
+#   included_by_type: type name (e.g. 'GenomeSet') -> list of included paths
+#                     (e.g. ['/elements/*/ref']), or None to skip the data
+#                     entirely.  Types not listed are fetched whole.
+#
+#   the first fetch is of every listed path at once (paths an object doesn't
+#   have are left out by the workspace), which also says what type it is, so
+#   a listed type takes one call and only an unlisted one needs a second to
+#   fetch it whole.  If no type has paths, only the object info is fetched.
+#   A listed type's data can include other types' paths it also has.
+#
+#   returns { 'info': object_info, 'data': object data or None }
+#
+def get_obj_subset(wsClient, ref, included_by_type):
+    included = []
+    for type_included in included_by_type.values():
+        for path in type_included or []:
+            if path not in included:
+                included.append(path)
+
+    if len(included) == 0:
+        info = wsClient.get_object_info3({'objects': [{'ref': ref}]})['infos'][0]
+        obj = {'info': info, 'data': None}
+    else:
+        obj = wsClient.get_objects2({'objects': [{'ref': ref, 'included': included}]})['data'][0]
+    type_name = obj['info'][2].split('.')[1].split('-')[0]
+
+    if type_name in included_by_type:
+        if included_by_type[type_name] is None:
+            return {'info': obj['info'], 'data': None}
+        return {'info': obj['info'], 'data': obj['data']}
+
+    obj = wsClient.get_objects2({'objects': [{'ref': ref}]})['data'][0]
+    return {'info': obj['info'], 'data': obj['data']}
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+import collections
+import os
+import re
+import resource
+import shutil
+import signal
+import threading
+import time
+import uuid
+
+
+###############################################################################
+# ProcessLimits: wall time budgets, cancellation and memory caps for the
+# BLAST+ subprocesses of a job
+###############################################################################
+#
+#   each subprocess runs in its own process group; once it's over its
+#   stage's time budget (or what's left of the job's), or the job is
+#   cancelled, the group gets SIGTERM and, after a grace period, SIGKILL.
+#
+#   memory is capped with RLIMIT_AS, and, if a cgroup v2 directory we can
+#   write to is configured, with a memory.max cgroup per subprocess (which
+#   also counts memory that RLIMIT_AS doesn't, e.g. page cache).  Both are
+#   applied from here as soon as the subprocess has started, not in the
+#   child before exec (preexec_fn isn't safe with the upload threads
+#   running); BLAST+ is still starting up by then
+#
+#   a subprocess stopped by any of these raises ProcessLimitExceeded, as
+#   does a SIGTERM / SIGINT between subprocesses
+#
+# deploy config keys / environment variables, all off if not set
+STAGE_TIMEOUT_CONFIG_KEYS = {'format_db': 'format-db-timeout-secs',
+                             'search':    'search-timeout-secs'}
+STAGE_TIMEOUT_ENV_VARS = {'format_db': 'KB_BLAST_FORMAT_DB_TIMEOUT_SECS',
+                          'search':    'KB_BLAST_SEARCH_TIMEOUT_SECS'}
+JOB_TIMEOUT_CONFIG_KEY = 'job-timeout-secs'
+JOB_TIMEOUT_ENV_VAR = 'KB_BLAST_JOB_TIMEOUT_SECS'
+MEMORY_LIMIT_CONFIG_KEY = 'blast-memory-limit-bytes'
+MEMORY_LIMIT_ENV_VAR = 'KB_BLAST_MEMORY_LIMIT_BYTES'
+CGROUP_DIR_CONFIG_KEY = 'blast-cgroup-dir'
+CGROUP_DIR_ENV_VAR = 'KB_BLAST_CGROUP_DIR'
+
+# seconds between SIGTERM and SIGKILL
+KILL_GRACE_SECS = 10
+
+# how BLAST+ says an allocation failed
+OUT_OF_MEMORY_PATTERN = re.compile(r'bad_alloc|out of memory|cannot allocate|memory allocation', re.IGNORECASE)
+
+
+class ProcessLimitExceeded(ValueError):
+
+    # reason is 'timeout', 'cancelled' or 'memory'
+    #
+    def __init__(self, reason, message):
+        ValueError.__init__(self, message)
+        self.reason = reason
+
+
+class ProcessLimits:
+
+    def __init__(self, stage_timeouts=None, job_timeout_secs=None, memory_limit_bytes=None,
+                 cgroup_dir=None, kill_grace_secs=KILL_GRACE_SECS):
+        self.stage_timeouts = stage_timeouts or dict()
+        self.job_timeout_secs = job_timeout_secs
+        self.memory_limit_bytes = memory_limit_bytes
+        self.cgroup_dir = cgroup_dir
+        self.kill_grace_secs = kill_grace_secs
+        self.start_time = time.time()
+        self.cancel_event = threading.Event()
+        self.cancel_reason = None
+        self.prev_signal_handlers = dict()
+        # subprocesses started and not yet finished or abandoned
+        self.n_running = 0
+        self.running_lock = threading.Lock()
+
+
+    # for_job(): limits from the deploy config or the environment
+    #
+    @classmethod
+    def for_job(cls, config):
+        def setting(config_key, env_var):
+            value = config.get(config_key) or os.environ.get(env_var)
+            return value if value else None
+
+        stage_timeouts = dict()
+        for stage in STAGE_TIMEOUT_CONFIG_KEYS:
+            timeout_secs = setting(STAGE_TIMEOUT_CONFIG_KEYS[stage], STAGE_TIMEOUT_ENV_VARS[stage])
+            if timeout_secs is not None:
+                stage_timeouts[stage] = float(timeout_secs)
+        job_timeout_secs = setting(JOB_TIMEOUT_CONFIG_KEY, JOB_TIMEOUT_ENV_VAR)
+        memory_limit_bytes = setting(MEMORY_LIMIT_CONFIG_KEY, MEMORY_LIMIT_ENV_VAR)
+        return cls(stage_timeouts = stage_timeouts,
+                   job_timeout_secs = float(job_timeout_secs) if job_timeout_secs is not None else None,
+                   memory_limit_bytes = int(memory_limit_bytes) if memory_limit_bytes is not None else None,
+                   cgroup_dir = setting(CGROUP_DIR_CONFIG_KEY, CGROUP_DIR_ENV_VAR))
+
+
+    # cancel(): stop the running subprocesses and don't start more
+    #
+    def cancel(self, reason):
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+        self.cancel_event.set()
+
+
+    # install_signal_handlers(): SIGTERM / SIGINT cancel the job instead of
+    # killing it outright, so it can still save an error report
+    #
+    #   only possible from the main thread; elsewhere this does nothing
+    #
+    def install_signal_handlers(self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.prev_signal_handlers[signum] = signal.signal(signum, self._on_signal)
+
+
+    # _on_signal(): a running subprocess is stopped by its watch, which
+    # raises ProcessLimitExceeded in the thread that ran it; with none
+    # running (fetching, saving, uploading) it's raised here, in the main
+    # thread.  Signals after the first leave the job to finish stopping
+    #
+    def _on_signal(self, signum, frame):
+        if self.cancel_event.is_set():
+            return
+        reason = signal.Signals(signum).name+' received'
+        self.cancel(reason)
+        if self.n_running == 0:
+            raise ProcessLimitExceeded('cancelled', 'job cancelled ('+reason+')')
+
+
+    def restore_signal_handlers(self):
+        for signum, handler in self.prev_signal_handlers.items():
+            signal.signal(signum, handler)
+        self.prev_signal_handlers = dict()
+
+
+    # timeout_secs(): (seconds stage may still run, what set it), or
+    # (None, None) if it has no limit
+    #
+    def timeout_secs(self, stage):
+        limits = []
+        if stage in self.stage_timeouts:
+            limits.append((self.stage_timeouts[stage],
+                           'its '+'%g' % self.stage_timeouts[stage]+' s '+stage+' time limit'))
+        if self.job_timeout_secs is not None:
+            limits.append((self.job_timeout_secs - (time.time() - self.start_time),
+                           "the job's "+'%g' % self.job_timeout_secs+' s time limit'))
+        if not limits:
+            return (None, None)
+        return min(limits, key=lambda limit: limit[0])
+
+
+    # check(): raises ProcessLimitExceeded if stage shouldn't start
+    #
+    def check(self, stage):
+        if self.cancel_event.is_set():
+            raise ProcessLimitExceeded('cancelled', 'job cancelled ('+str(self.cancel_reason)+') before '+stage)
+        (timeout_secs, limit_desc) = self.timeout_secs(stage)
+        if timeout_secs is not None and timeout_secs <= 0:
+            raise ProcessLimitExceeded('timeout', stage+' not started: past '+limit_desc)
+
+
+    # start(): a ProcessWatch for a subprocess of stage, to be started with
+    # its popen_kwargs
+    #
+    def start(self, stage, program):
+        self.check(stage)
+        with self.running_lock:
+            self.n_running += 1
+        return ProcessWatch(self, stage, program)
+
+
+    def _stopped(self):
+        with self.running_lock:
+            self.n_running -= 1
+
+
+class ProcessWatch:
+
+    def __init__(self, limits, stage, program):
+        self.limits = limits
+        self.stage = stage
+        self.program = program
+        (self.timeout_secs, self.limit_desc) = limits.timeout_secs(stage)
+        self.reason = None
+        self.running = True
+        self.done = threading.Event()
+        self.thread = None
+        self.tail = collections.deque(maxlen=20)
+        self.cgroup_path = self._make_cgroup()
+        self.popen_kwargs = {'start_new_session': True}
+
+
+    # _make_cgroup(): a child cgroup with memory.max set, or None if there's
+    # no memory limit or cgroup dir, or the cgroup can't be made
+    #
+    def _make_cgroup(self):
+        if self.limits.cgroup_dir is None or self.limits.memory_limit_bytes is None:
+            return None
+        cgroup_path = os.path.join(self.limits.cgroup_dir, 'kb_blast_'+str(uuid.uuid4()))
+        try:
+            os.mkdir(cgroup_path)
+            # the kernel fills a new cgroup dir in; a plain dir stays empty
+            if not os.path.isfile(os.path.join(cgroup_path, 'cgroup.procs')):
+                raise OSError('not a cgroup v2 dir: '+self.limits.cgroup_dir)
+            with open(os.path.join(cgroup_path, 'memory.max'), 'w') as max_handle:
+                max_handle.write(str(self.limits.memory_limit_bytes))
+        except (IOError, OSError):
+            # no cgroup v2 (or no delegation to us): RLIMIT_AS alone
+            if os.path.isdir(cgroup_path):
+                self._remove_cgroup(cgroup_path)
+            return None
+        try:
+            # or it just swaps instead of hitting the limit
+            with open(os.path.join(cgroup_path, 'memory.swap.max'), 'w') as swap_max_handle:
+                swap_max_handle.write('0')
+        except (IOError, OSError):
+            # no swap accounting
+            pass
+        return cgroup_path
+
+
+    @staticmethod
+    def _remove_cgroup(cgroup_path):
+        try:
+            os.rmdir(cgroup_path)
+        except OSError:
+            # not a real cgroup fs (files of its own) or still has processes
+            shutil.rmtree(cgroup_path, ignore_errors=True)
+
+
+    def _oom_killed(self):
+        if self.cgroup_path is None:
+            return False
+        try:
+            with open(os.path.join(self.cgroup_path, 'memory.events'), 'r') as events_handle:
+                for line in events_handle:
+                    (event, count) = line.split()
+                    if event == 'oom_kill' and int(count) > 0:
+                        return True
+        except (IOError, OSError, ValueError):
+            pass
+        return False
+
+
+    # _limit_memory(): cap the memory of the subprocess with pid
+    #
+    def _limit_memory(self, pid):
+        memory_limit_bytes = self.limits.memory_limit_bytes
+        if memory_limit_bytes is None:
+            return
+        try:
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+        except OSError:
+            # already exited
+            pass
+        if self.cgroup_path is not None:
+            try:
+                with open(os.path.join(self.cgroup_path, 'cgroup.procs'), 'w') as procs_handle:
+                    procs_handle.write(str(pid))
+            except (IOError, OSError):
+                # can't move it there: RLIMIT_AS alone
+                pass
+
+
+    # attach(): limit and watch p (started with popen_kwargs) until finish()
+    #
+    def attach(self, p):
+        self.p = p
+        self._limit_memory(p.pid)
+        self.deadline = time.time() + self.timeout_secs if self.timeout_secs is not None else None
+        self.thread = threading.Thread(target=self._watch, name='kb_blast-watch-'+self.program, daemon=True)
+        self.thread.start()
+
+
+    # line_handler(): keeps the last lines of output, for telling an
+    # allocation failure from other errors, and passes them on
+    #
+    def line_handler(self, line_handler):
+        def handle_line(line):
+            self.tail.append(line)
+            if line_handler is not None:
+                line_handler(line)
+        return handle_line
+
+
+    def _watch(self):
+        while not self.done.is_set():
+            if self.limits.cancel_event.is_set():
+                self.reason = 'cancelled'
+                break
+            if self.deadline is not None and time.time() >= self.deadline:
+                self.reason = 'timeout'
+                break
+            self.done.wait(1.0)
+        else:
+            return
+
+        # the whole group, so anything BLAST started goes too
+        for (signum, wait_secs) in [(signal.SIGTERM, self.limits.kill_grace_secs), (signal.SIGKILL, None)]:
+            try:
+                os.killpg(self.p.pid, signum)
+            except (ProcessLookupError, PermissionError):
+                return
+            if wait_secs is not None and self.done.wait(wait_secs):
+                return
+
+
+    def _stopped(self):
+        if self.running:
+            self.running = False
+            self.limits._stopped()
+
+
+    # abandon(): the subprocess never started, or was killed and reaped
+    # without a record
+    #
+    def abandon(self):
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+        self._stopped()
+        if self.cgroup_path is not None:
+            self._remove_cgroup(self.cgroup_path)
+
+
+    # finish(): after the subprocess is reaped; record gets the limit it hit
+    # (if any) and ProcessLimitExceeded is raised for it
+    #
+    def finish(self, record):
+        self.done.set()
+        self.thread.join()
+        self._stopped()
+        if self.reason is None and record.get('returncode') != 0:
+            if self._oom_killed() or \
+               (self.limits.memory_limit_bytes is not None and
+                any(OUT_OF_MEMORY_PATTERN.search(line) for line in self.tail)):
+                self.reason = 'memory'
+        if self.cgroup_path is not None:
+            self._remove_cgroup(self.cgroup_path)
+        if self.reason is None:
+            return
+
+        record['limit'] = self.reason
+        if self.reason == 'timeout':
+            message = self.program+' exceeded '+self.limit_desc+' and was stopped after '+ \
+                      '%.0f' % record['wall_secs']+' s'
+        elif self.reason == 'cancelled':
+            message = self.program+' was stopped: job cancelled ('+str(self.limits.cancel_reason)+')'
+        else:
+            message = self.program+' ran out of memory (limit '+ \
+                      '%.1f' % (self.limits.memory_limit_bytes / 1048576.0)+' MB)'
+        raise ProcessLimitExceeded(self.reason, message)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import glob
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+
+
+###############################################################################
+# ProcessMetrics: run BLAST+ subprocesses and keep their resource usage
+###############################################################################
+
+class ProcessMetrics:
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+
+    # run(): Popen + os.wait4() so the child's own rusage is captured
+    #
+    #   line_handler is called with each line of combined stdout/stderr.
+    #   attrs (e.g. target, db_size_bytes, query_residues) are stored with
+    #   the record; the record is returned so callers can add to it after.
+    #
+    #   with limits (a ProcessLimits), the run is held to stage's limits and
+    #   raises ProcessLimitExceeded if it's stopped by one; the record is
+    #   kept either way
+    #
+    def run(self, cmd, cwd=None, line_handler=None, limits=None, stage=None, **attrs):
+        record = {'program': os.path.basename(cmd[0]),
+                  'cmd': cmd}
+        record.update(attrs)
+
+        watch = None
+        popen_kwargs = dict()
+        if limits is not None:
+            watch = limits.start(stage, record['program'])
+            popen_kwargs = watch.popen_kwargs
+            line_handler = watch.line_handler(line_handler)
+
+        start_time = time.time()
+        try:
+            p = subprocess.Popen(cmd,
+                                 cwd = cwd,
+                                 stdout = subprocess.PIPE,
+                                 stderr = subprocess.STDOUT,
+                                 shell = False,
+                                 **popen_kwargs)
+        except:
+            if watch is not None:
+                watch.abandon()
+            raise
+        if watch is not None:
+            watch.attach(p)
+        try:
+            while True:
+                line = p.stdout.readline().decode()
+                if not line: break
+                if line_handler is not None:
+                    line_handler(line)
+        except:
+            # the line handler (or decoding) failed: don't leave the
+            # subprocess running, or unreaped
+            try:
+                if watch is not None:
+                    os.killpg(p.pid, signal.SIGKILL)
+                else:
+                    p.kill()
+            except OSError:
+                pass
+            p.stdout.close()
+            p.wait()
+            if watch is not None:
+                watch.abandon()
+            raise
+        p.stdout.close()
+
+        try:
+            (pid, status, rusage) = os.wait4(p.pid, 0)
+            # as Popen sets it: -signal if killed by one
+            if os.WIFSIGNALED(status):
+                p.returncode = -os.WTERMSIG(status)
+            else:
+                p.returncode = os.WEXITSTATUS(status)
+        except ChildProcessError:
+            # already reaped elsewhere; the return code is all we can get
+            p.wait()
+            rusage = None
+
+        record['returncode'] = p.returncode
+        record['wall_secs'] = round(time.time() - start_time, 6)
+        if rusage is not None:
+            record['user_cpu_secs'] = round(rusage.ru_utime, 6)
+            record['sys_cpu_secs'] = round(rusage.ru_stime, 6)
+            record['max_rss_kb'] = rusage.ru_maxrss
+            record['block_in'] = rusage.ru_inblock
+            record['block_out'] = rusage.ru_oublock
+
+        with self.lock:
+            self.records.append(record)
+        if watch is not None:
+            watch.finish(record)
+        return record
+
+
+    # write(): every record so far, as JSON
+    #
+    def write(self, metrics_path, job_info=None):
+        with self.lock:
+            records = list(self.records)
+        with open(metrics_path, 'w') as metrics_handle:
+            json.dump({'job': job_info or {},
+                       'processes': records},
+                      metrics_handle, indent=1)
+        return metrics_path
+
+
+# db_size_bytes(): total size of the makeblastdb files for a db basename
+#
+def db_size_bytes(db_path):
+    db_size = 0
+    for db_file_path in glob.glob(glob.escape(db_path)+'.*'):
+        if os.path.isfile(db_file_path):
+            db_size += os.path.getsize(db_file_path)
+    return db_size
+
+
+# fasta_residues(): number of residues in a FASTA file
+#
+def fasta_residues(fasta_file_path):
+    residues = 0
+    with open(fasta_file_path, 'r') as fasta_handle:
+        for line in fasta_handle:
+            if line.startswith('>'):
+                continue
+            residues += len(line.strip().replace(' ', ''))
+    return residues
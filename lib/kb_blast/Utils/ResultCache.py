@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+
+###############################################################################
+# ResultCache: BLAST output files kept across jobs, keyed by everything that
+# determines them, with size-bounded LRU eviction
+###############################################################################
+
+class ResultCache:
+
+    HASH_CHUNK_SIZE = 1024*1024
+
+    # BLAST -version output by program path, for the life of the process
+    _BLAST_versions = dict()
+    _BLAST_versions_lock = threading.Lock()
+
+
+    # cache_dir is shared by every job (and process) that uses the cache;
+    # None turns the cache off
+    #
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = cache_dir is not None
+        if self.enabled:
+            self.entries_dir = os.path.join(cache_dir, 'entries')
+            self.tmp_dir = os.path.join(cache_dir, 'tmp')
+            for dir_path in [self.entries_dir, self.tmp_dir]:
+                if not os.path.exists(dir_path):
+                    os.makedirs(dir_path, exist_ok=True)
+
+
+    # file_sha256(): streaming, never holds the whole file
+    #
+    @classmethod
+    def file_sha256(cls, file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file_handle:
+            while True:
+                chunk = file_handle.read(cls.HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+    # BLAST_version(): first line of `<program> -version`
+    #
+    #   if the program can't say, its size and mtime stand in, so a changed
+    #   binary still misses
+    #
+    @classmethod
+    def BLAST_version(cls, blast_bin):
+        with cls._BLAST_versions_lock:
+            if blast_bin in cls._BLAST_versions:
+                return cls._BLAST_versions[blast_bin]
+        version = None
+        try:
+            version_out = subprocess.run([blast_bin, '-version'],
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         timeout=60).stdout.decode().strip()
+            if version_out:
+                version = version_out.splitlines()[0]
+        except (OSError, subprocess.SubprocessError):
+            pass
+        if version is None:
+            bin_stat = os.stat(blast_bin)
+            version = blast_bin+' '+str(bin_stat.st_size)+' '+str(int(bin_stat.st_mtime))
+        with cls._BLAST_versions_lock:
+            cls._BLAST_versions[blast_bin] = version
+        return version
+
+
+    # key(): sha256 of the key fields, as canonical JSON
+    #
+    @staticmethod
+    def key(**fields):
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+    def _entry_dir(self, key):
+        return os.path.join(self.entries_dir, key[0:2], key)
+
+
+    # _entry_ok(): the entry has its meta and all of its output
+    #
+    #   entries are renamed into place whole, but a full disk or a crash
+    #   while the file system syncs can still leave a short or missing file
+    #
+    @staticmethod
+    def _entry_ok(entry_dir):
+        try:
+            with open(os.path.join(entry_dir, 'meta.json'), 'r') as meta_handle:
+                meta = json.load(meta_handle)
+            return os.path.getsize(os.path.join(entry_dir, 'output')) == meta['size_bytes']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return False
+
+
+    # get(): copy of the cached file at out_path, or None on a miss
+    #
+    #   a broken entry is a miss, and is removed so the next put() replaces it
+    #
+    def get(self, key, out_path):
+        if not self.enabled:
+            return None
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return None
+        if not self._entry_ok(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        try:
+            shutil.copyfile(os.path.join(entry_dir, 'output'), out_path)
+            # the meta file's mtime is the entry's last use, for eviction
+            os.utime(os.path.join(entry_dir, 'meta.json'))
+        except (IOError, OSError):
+            # not there, or evicted under us
+            return None
+        return out_path
+
+
+    # put(): store file_path under key, then evict down to max_bytes
+    #
+    #   the entry is built aside and renamed into place, so readers in other
+    #   jobs never see part of one
+    #
+    def put(self, key, file_path, **meta):
+        if not self.enabled:
+            return False
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            if self._entry_ok(entry_dir):
+                return True
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        tmp_entry_dir = os.path.join(self.tmp_dir, key+'.'+str(uuid.uuid4()))
+        try:
+            os.makedirs(tmp_entry_dir)
+            shutil.copyfile(file_path, os.path.join(tmp_entry_dir, 'output'))
+            meta['size_bytes'] = os.path.getsize(file_path)
+            meta['created'] = time.time()
+            with open(os.path.join(tmp_entry_dir, 'meta.json'), 'w') as meta_handle:
+                json.dump(meta, meta_handle)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            os.rename(tmp_entry_dir, entry_dir)
+        except (IOError, OSError):
+            # another job stored it first, or the cache disk is full
+            shutil.rmtree(tmp_entry_dir, ignore_errors=True)
+            return os.path.isdir(entry_dir)
+        self.evict()
+        return True
+
+
+    # evict(): drop least recently used entries until under max_bytes
+    #
+    def evict(self):
+        if not self.enabled:
+            return []
+        entries = []
+        total_bytes = 0
+        for prefix in os.listdir(self.entries_dir):
+            prefix_dir = os.path.join(self.entries_dir, prefix)
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, 'meta.json'))
+                    size_bytes = os.path.getsize(os.path.join(entry_dir, 'output'))
+                except (IOError, OSError):
+                    continue
+                entries.append((last_used, size_bytes, entry_dir))
+                total_bytes += size_bytes
+
+        evicted = []
+        for (last_used, size_bytes, entry_dir) in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size_bytes
+            evicted.append(os.path.basename(entry_dir))
+        return evicted
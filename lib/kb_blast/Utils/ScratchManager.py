@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import atexit
+import itertools
+import os
+import re
+import shutil
+import threading
+import uuid
+
+
+###############################################################################
+# ScratchManager: a scratch directory of its own for each job, with a
+# directory per stage, a disk quota, and removal when the job is done
+###############################################################################
+#
+#   <scratch>/job_<uuid>/<stage>[/<name>]
+#
+#   anything meant to outlive the job (the result cache, the local stage
+#   timeline) goes outside the job directory
+#
+# deploy config key / environment variable for the per-job quota, in bytes
+QUOTA_CONFIG_KEY = 'scratch-quota-bytes'
+QUOTA_ENV_VAR = 'KB_BLAST_SCRATCH_QUOTA_BYTES'
+
+# leave job directories in place, for debugging
+KEEP_CONFIG_KEY = 'keep-scratch'
+KEEP_ENV_VAR = 'KB_BLAST_KEEP_SCRATCH'
+
+FALSE_VALUES = ('', '0', 'false', 'no', 'off', 'none')
+
+
+class ScratchManager:
+
+    # job directories not yet cleaned up, removed at interpreter exit if a
+    # job died before its own cleanup ran
+    _live = set()
+    _live_lock = threading.Lock()
+    _atexit_registered = False
+
+
+    # quota_bytes None means no quota; keep leaves the job directory in
+    # place after cleanup(), for debugging
+    #
+    def __init__(self, scratch, quota_bytes=None, keep=False):
+        self.scratch = scratch
+        self.quota_bytes = quota_bytes
+        self.keep = keep
+        self.job_dir = os.path.join(scratch, 'job_'+str(uuid.uuid4()))
+        os.makedirs(self.job_dir)
+        self.peak_usage_bytes = 0
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        if not self.keep:
+            with ScratchManager._live_lock:
+                ScratchManager._live.add(self.job_dir)
+                if not ScratchManager._atexit_registered:
+                    atexit.register(ScratchManager._cleanup_live)
+                    ScratchManager._atexit_registered = True
+
+
+    # for_job(): a manager under scratch, set up from the deploy config or
+    # the environment
+    #
+    @classmethod
+    def for_job(cls, scratch, config):
+        quota_bytes = config.get(QUOTA_CONFIG_KEY) or os.environ.get(QUOTA_ENV_VAR)
+        keep = config.get(KEEP_CONFIG_KEY) or os.environ.get(KEEP_ENV_VAR)
+        return cls(scratch,
+                   quota_bytes = int(quota_bytes) if quota_bytes else None,
+                   keep = str(keep).strip().lower() not in FALSE_VALUES if keep is not None else False)
+
+
+    # stage_dir(): job_dir/stage[/name], created if need be
+    #
+    #   name may be an object ref; characters that don't belong in a file
+    #   name are replaced
+    #
+    def stage_dir(self, stage, name=None):
+        dir_path = os.path.join(self.job_dir, stage)
+        if name is not None:
+            dir_path = os.path.join(dir_path, re.sub(r'[^\w.\-]', '_', str(name)))
+        os.makedirs(dir_path, exist_ok=True)
+        return dir_path
+
+
+    # new_dir(): a fresh directory under job_dir/stage, for outputs that
+    # share file names
+    #
+    def new_dir(self, stage):
+        with self.lock:
+            dir_i = next(self.seq)
+        return self.stage_dir(stage, str(dir_i))
+
+
+    # usage_bytes(): disk used by the job directory
+    #
+    def usage_bytes(self):
+        total_bytes = 0
+        for (dir_path, dir_names, file_names) in os.walk(self.job_dir):
+            for file_name in file_names:
+                try:
+                    total_bytes += os.lstat(os.path.join(dir_path, file_name)).st_size
+                except OSError:
+                    # removed under us
+                    continue
+        with self.lock:
+            self.peak_usage_bytes = max(self.peak_usage_bytes, total_bytes)
+        return total_bytes
+
+
+    # check_quota(): raises ValueError once stage has taken the job past its quota
+    #
+    def check_quota(self, stage):
+        usage_bytes = self.usage_bytes()
+        if self.quota_bytes is not None and usage_bytes > self.quota_bytes:
+            raise ValueError ("scratch quota exceeded after "+stage+": "+
+                              '%.1f' % (usage_bytes / 1048576.0)+" MB used of "+
+                              '%.1f' % (self.quota_bytes / 1048576.0)+" MB")
+        return usage_bytes
+
+
+    # cleanup(): remove the job directory (unless keep)
+    #
+    #   only call once nothing is still reading from it (uploads included)
+    #
+    def cleanup(self):
+        self.usage_bytes()
+        with ScratchManager._live_lock:
+            ScratchManager._live.discard(self.job_dir)
+        if not self.keep:
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+        return self.peak_usage_bytes
+
+
+    @classmethod
+    def _cleanup_live(cls):
+        with cls._live_lock:
+            job_dirs = list(cls._live)
+            cls._live.clear()
+        for job_dir in job_dirs:
+            shutil.rmtree(job_dir, ignore_errors=True)
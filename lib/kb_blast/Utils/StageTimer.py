@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import json
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+
+###############################################################################
+# StageTimer: wall time, cpu time and peak RSS spans for the stages of a job
+###############################################################################
+
+class StageTimer:
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # stages are the outermost spans of the thread that runs the job;
+        # spans from worker threads overlap them and only go in the timeline
+        self.owner_thread = threading.current_thread().name
+
+
+    # _peak_rss_kb(): the process's RSS high-water mark
+    #
+    #   never reset (/proc/self/clear_refs), as that would reset it for
+    #   every job running in the process
+    #
+    def _peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+    # _rss_kb(): RSS now (linux only; None elsewhere)
+    #
+    def _rss_kb(self):
+        try:
+            with open('/proc/self/status', 'r') as status_handle:
+                for line in status_handle:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1])
+        except (IOError, OSError, ValueError):
+            pass
+        return None
+
+
+    # span(): time the enclosed block
+    #
+    #   rss_kb is sampled as the span starts and ends; peak_rss_kb is the
+    #   process's high-water mark at the end, and peak_rss_growth_kb how far
+    #   the span raised it.  All are for the whole process, so overlapping
+    #   spans (and other jobs in it) show in each other's.  cpu_secs is for
+    #   the whole process too, child_cpu_secs for the subprocesses
+    #   (makeblastdb, BLAST) waited on during the span.
+    #
+    @contextmanager
+    def span(self, stage, **attrs):
+        began = self._begin(stage, attrs)
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            self._end(began, status)
+
+
+    # start_stage(): end the stage the last start_stage() began (if any) and
+    # begin another; for long straight-line code that a with block per stage
+    # doesn't suit.  end_stage() ends the last one
+    #
+    def start_stage(self, stage, **attrs):
+        self.end_stage()
+        self.local.open_stage = self._begin(stage, attrs)
+
+
+    def end_stage(self, status='ok'):
+        began = getattr(self.local, 'open_stage', None)
+        if began is not None:
+            self.local.open_stage = None
+            self._end(began, status)
+
+
+    def _begin(self, stage, attrs):
+        depth = getattr(self.local, 'depth', 0)
+        self.local.depth = depth + 1
+        return {'stage':         stage,
+                'attrs':         attrs,
+                'depth':         depth,
+                'rss_kb':        self._rss_kb(),
+                'peak_rss_kb':   self._peak_rss_kb(),
+                'wall':          time.time(),
+                'cpu':           time.process_time(),
+                'children':      resource.getrusage(resource.RUSAGE_CHILDREN)}
+
+
+    def _end(self, began, status):
+        self.local.depth = began['depth']
+        end_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        end_peak_rss_kb = self._peak_rss_kb()
+        span = {'stage': began['stage'],
+                'depth': began['depth'],
+                'thread': threading.current_thread().name,
+                'start_secs': round(began['wall'] - self.start_time, 6),
+                'wall_secs': round(time.time() - began['wall'], 6),
+                'cpu_secs': round(time.process_time() - began['cpu'], 6),
+                'child_cpu_secs': round((end_children.ru_utime - began['children'].ru_utime) +
+                                        (end_children.ru_stime - began['children'].ru_stime), 6),
+                'begin_rss_kb': began['rss_kb'],
+                'rss_kb': self._rss_kb(),
+                'peak_rss_kb': end_peak_rss_kb,
+                'peak_rss_growth_kb': end_peak_rss_kb - began['peak_rss_kb'],
+                'status': status}
+        if began['attrs']:
+            span['attrs'] = began['attrs']
+        with self.lock:
+            self.spans.append(span)
+
+
+    # summary(): total wall time per stage, in order of first appearance
+    #
+    def summary(self):
+        totals = dict()
+        order = []
+        with self.lock:
+            for span in self.spans:
+                if span['depth'] != 0 or span['thread'] != self.owner_thread:
+                    continue
+                if span['stage'] not in totals:
+                    totals[span['stage']] = 0.0
+                    order.append(span['stage'])
+                totals[span['stage']] += span['wall_secs']
+        return [(stage, totals[stage]) for stage in order]
+
+
+    # write_timeline(): spans sorted by start time, as JSON
+    #
+    def write_timeline(self, timeline_path, job_info=None):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span['start_secs'])
+        timeline = {'job': job_info or {},
+                    'start_time': self.start_time,
+                    'spans': spans}
+        with open(timeline_path, 'w') as timeline_handle:
+            json.dump(timeline, timeline_handle, indent=1)
+        return timeline_path
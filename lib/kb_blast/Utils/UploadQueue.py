@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import gzip
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# SDK Utils
+from installed_clients.DataFileUtilClient import DataFileUtil as DFUClient
+
+# BlastUtil helpers
+from kb_blast.Utils.ClientPool import get_client
+
+
+###############################################################################
+# UploadQueue: background uploads of finished output files to Shock
+###############################################################################
+
+class UploadQueue:
+
+    # uploads are I/O bound on the callback server, so a handful of threads
+    # is enough to keep them off the critical path without flooding it
+    DEFAULT_MAX_WORKERS = 4
+
+    # gzip level 6 gets nearly all of the size reduction of level 9 on BLAST
+    # text output at a fraction of the cpu cost
+    GZIP_COMPRESSLEVEL = 6
+    GZIP_CHUNK_SIZE = 1024*1024
+
+
+    def __init__(self, callbackURL, token=None, max_workers=None):
+        if max_workers is None:
+            max_workers = self.DEFAULT_MAX_WORKERS
+
+        # one DataFileUtil client shared by all upload threads (and queues)
+        self.dfu = get_client(DFUClient, callbackURL, token=token)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='kb_blast_upload')
+        self.uploads = dict()
+        self.lock = threading.Lock()
+
+
+    # _gzip_file(): streaming compression, never holds the whole file
+    #
+    def _gzip_file(self, file_path):
+        gz_file_path = file_path+'.gz'
+        with open(file_path, 'rb') as in_handle, \
+             gzip.open(gz_file_path, 'wb', compresslevel=self.GZIP_COMPRESSLEVEL) as out_handle:
+            shutil.copyfileobj(in_handle, out_handle, self.GZIP_CHUNK_SIZE)
+        return gz_file_path
+
+
+    # _upload(): runs in a worker thread
+    #
+    def _upload(self, file_path, pack, compress):
+        if compress:
+            try:
+                file_path = self._gzip_file(file_path)
+            except Exception as e:
+                raise ValueError('error compressing '+file_path+' file: '+str(e))
+
+        upload_params = {'file_path': file_path,
+                         'make_handle': 0}
+        if pack is not None:
+            upload_params['pack'] = pack
+        try:
+            return self.dfu.file_to_shock(upload_params)
+        except Exception as e:
+            raise ValueError('error uploading '+file_path+' file: '+str(e))
+
+
+    # submit(): start the upload as soon as the file is final
+    #
+    #   compress: gzip the file to file_path.gz first (in the worker thread)
+    #   returns the key to wait() on for the file_to_shock() output
+    #
+    def submit(self, file_path, pack=None, compress=False):
+        with self.lock:
+            if file_path in self.uploads:
+                raise ValueError('upload already queued for '+file_path)
+            self.uploads[file_path] = self.executor.submit(self._upload, file_path, pack, compress)
+        return file_path
+
+
+    # wait(): block until the upload is done
+    #
+    def wait(self, upload_key):
+        with self.lock:
+            if upload_key not in self.uploads:
+                raise ValueError('no upload queued for '+str(upload_key))
+            future = self.uploads[upload_key]
+        return future.result()
+
+
+    # cancel_pending(): drop the uploads that haven't started, e.g. of files
+    # a report won't link to after all; ones already running still finish
+    # (shutdown() waits for them).  Returns how many were dropped
+    #
+    def cancel_pending(self):
+        with self.lock:
+            futures = list(self.uploads.values())
+        return len([future for future in futures if future.cancel()])
+
+
+    # shutdown(): wait for outstanding uploads and release threads
+    #
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
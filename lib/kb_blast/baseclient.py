@@ -7,14 +7,26 @@
 
 from __future__ import print_function
 
+import gzip as _gzip
 import json as _json
 import requests as _requests
 import random as _random
 import os as _os
+import tempfile as _tempfile
+try:
+    import fcntl as _fcntl
+except ImportError:
+    _fcntl = None
+import threading as _threading
 import traceback as _traceback
+from requests.adapters import HTTPAdapter as _HTTPAdapter
 from requests.exceptions import ConnectionError
 from urllib3.exceptions import ProtocolError
 
+# JSON encoding shared with the kb_blast server (orjson when installed)
+from kb_blast.Utils.JSONCodec import dumps_bytes as _json_dumps
+from kb_blast.Utils.JSONCodec import loads as _json_loads
+
 try:
     from configparser import ConfigParser as _ConfigParser  # py 3
 except ImportError:
@@ -24,13 +36,248 @@ try:
     from urllib.parse import urlparse as _urlparse  # py3
 except ImportError:
     from urlparse import urlparse as _urlparse  # py2
+
+try:
+    from http.cookiejar import DefaultCookiePolicy as _DefaultCookiePolicy  # py3
+except ImportError:
+    from cookielib import DefaultCookiePolicy as _DefaultCookiePolicy  # py2
 import time
 
+try:
+    # optional: lets stream=True decode responses without buffering them
+    import ijson as _ijson
+except ImportError:
+    _ijson = None
+
 _CT = 'content-type'
 _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
 _CHECK_JOB_RETRYS = 3
 
+# Keep-alive sessions shared by every client talking to the same host, so
+# repeated RPCs reuse TCP/TLS connections. One per scheme://host:port, so
+# there are only as many as there are services; the token is a header of
+# each request and sessions keep no cookies, so clients with different
+# tokens can share one.
+_SESSION_POOL_CONNECTIONS = int(_os.environ.get(
+    'KB_CLIENT_POOL_CONNECTIONS', 10))
+_SESSION_POOL_MAXSIZE = int(_os.environ.get('KB_CLIENT_POOL_MAXSIZE', 20))
+_SESSIONS = dict()
+_SESSION_REQUESTS = dict()
+_SESSIONS_LOCK = _threading.Lock()
+
+
+def configure_session_pool(pool_connections=None, pool_maxsize=None):
+    '''
+    Set the connection pool sizes used for sessions created after this call.
+    pool_connections - the number of hosts to keep connection pools for.
+    pool_maxsize - the number of connections to keep open per host; this
+        should be at least the number of threads making concurrent calls.
+    The defaults can also be set with the KB_CLIENT_POOL_CONNECTIONS and
+    KB_CLIENT_POOL_MAXSIZE environment variables.
+    '''
+    global _SESSION_POOL_CONNECTIONS, _SESSION_POOL_MAXSIZE
+    with _SESSIONS_LOCK:
+        if pool_connections is not None:
+            _SESSION_POOL_CONNECTIONS = int(pool_connections)
+        if pool_maxsize is not None:
+            _SESSION_POOL_MAXSIZE = int(pool_maxsize)
+
+
+def _session_key(url):
+    parsed = _urlparse(url)
+    return parsed.scheme + '://' + parsed.netloc
+
+
+def _get_session(url):
+    key = _session_key(url)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _requests.Session()
+            session.cookies.set_policy(_DefaultCookiePolicy(allowed_domains=[]))
+            adapter = _HTTPAdapter(pool_connections=_SESSION_POOL_CONNECTIONS,
+                                   pool_maxsize=_SESSION_POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSIONS[key] = session
+            _SESSION_REQUESTS[key] = 0
+        _SESSION_REQUESTS[key] += 1
+    return session
+
+
+def session_pool_stats():
+    '''
+    Return a list with one dict per pooled session for metrics reporting:
+    url (scheme://host:port), requests (RPCs sent through the session),
+    connections (TCP connections opened), pool_connections and
+    pool_maxsize.
+    '''
+    stats = []
+    with _SESSIONS_LOCK:
+        for url, session in _SESSIONS.items():
+            adapter = session.get_adapter(url)
+            connections = 0
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                connections += pools[pool_key].num_connections
+            stats.append({'url': url,
+                          'requests': _SESSION_REQUESTS[url],
+                          'connections': connections,
+                          'pool_connections': adapter._pool_connections,
+                          'pool_maxsize': adapter._pool_maxsize})
+    return stats
+
+
+# Opt-in gzip request bodies, for services known to accept them: a client
+# made with compress_requests=True gzips every body of at least
+# _COMPRESS_MIN_BYTES. A 415 reply to a compressed body (RFC 7694) is retried
+# uncompressed, and compression stays off for that url from then on.
+_COMPRESS_MIN_BYTES = int(_os.environ.get(
+    'KB_CLIENT_COMPRESS_MIN_BYTES', 256 * 1024))
+_COMPRESS_LEVEL = 6
+_GZIP_REJECTED_URLS = set()
+_GZIP_REJECTED_URLS_LOCK = _threading.Lock()
+
+
+def _gzip_rejected(url):
+    with _GZIP_REJECTED_URLS_LOCK:
+        return url in _GZIP_REJECTED_URLS
+
+
+def _reject_gzip(url):
+    with _GZIP_REJECTED_URLS_LOCK:
+        _GZIP_REJECTED_URLS.add(url)
+
+
+# Durations of recent asynchronous jobs per service method, persisted to a
+# small local file so run_job can poll close to when a job is expected to end.
+_JOB_STATS_FILE = _os.environ.get(
+    'KB_CLIENT_JOB_STATS_FILE',
+    _os.path.join(_tempfile.gettempdir(), 'kb_client_job_stats.json'))
+_JOB_STATS_HISTORY = 20
+_JOB_STATS = None
+_JOB_STATS_LOCK = _threading.Lock()
+
+
+def _read_job_stats_file():
+    try:
+        with open(_JOB_STATS_FILE) as stats_file:
+            stats = _json.load(stats_file)
+    except (IOError, OSError, ValueError):
+        return dict()
+    return stats if isinstance(stats, dict) else dict()
+
+
+def _load_job_stats():
+    global _JOB_STATS
+    if _JOB_STATS is None:
+        _JOB_STATS = _read_job_stats_file()
+    return _JOB_STATS
+
+
+def _expected_job_duration(service_method):
+    with _JOB_STATS_LOCK:
+        durations = sorted(_load_job_stats().get(service_method, []))
+    if not durations:
+        return None
+    return durations[len(durations) // 2]
+
+
+def _record_job_duration(service_method, duration):
+    global _JOB_STATS
+    with _JOB_STATS_LOCK:
+        # stats are only a polling hint, so never fail a job over them
+        try:
+            # other processes write the file too: add to what's on disk now,
+            # holding a lock file so two writers don't drop each other's
+            # durations, and replace the file atomically so readers never
+            # see a partial one
+            with open(_JOB_STATS_FILE + '.lock', 'a') as lock_file:
+                if _fcntl is not None:
+                    _fcntl.flock(lock_file, _fcntl.LOCK_EX)
+                stats = _read_job_stats_file()
+                durations = stats.get(service_method, [])
+                durations.append(round(duration, 3))
+                stats[service_method] = durations[-_JOB_STATS_HISTORY:]
+                _JOB_STATS = stats
+                fd, tmp_file = _tempfile.mkstemp(
+                    dir=_os.path.dirname(_JOB_STATS_FILE) or '.',
+                    prefix=_os.path.basename(_JOB_STATS_FILE) + '.',
+                    suffix='.tmp')
+                try:
+                    with _os.fdopen(fd, 'w') as stats_file:
+                        _json.dump(stats, stats_file)
+                    _os.replace(tmp_file, _JOB_STATS_FILE)
+                except BaseException:
+                    _os.remove(tmp_file)
+                    raise
+        except (IOError, OSError):
+            pass
+
+
+# Dynamic service urls resolved through the Service Wizard, shared by all
+# clients so each (module, version) is looked up once per TTL rather than
+# once per call.
+_SERVICE_URL_TTL = float(_os.environ.get('KB_CLIENT_SERVICE_URL_TTL', 300))
+_SERVICE_URLS = dict()
+_SERVICE_URLS_LOCK = _threading.Lock()
+
+
+def _get_cached_service_url(key):
+    with _SERVICE_URLS_LOCK:
+        entry = _SERVICE_URLS.get(key)
+        if entry is None:
+            return None
+        url, resolved = entry
+        if time.time() - resolved >= _SERVICE_URL_TTL:
+            del _SERVICE_URLS[key]
+            return None
+        return url
+
+
+def _cache_service_url(key, url):
+    with _SERVICE_URLS_LOCK:
+        _SERVICE_URLS[key] = (url, time.time())
+
+
+def _invalidate_service_url(key):
+    with _SERVICE_URLS_LOCK:
+        _SERVICE_URLS.pop(key, None)
+
+
+def clear_service_url_cache():
+    '''
+    Forget all dynamic service urls resolved through the Service Wizard.
+    '''
+    with _SERVICE_URLS_LOCK:
+        _SERVICE_URLS.clear()
+
+
+def close_sessions():
+    '''
+    Close all pooled sessions and their open connections.
+    '''
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+        _SESSION_REQUESTS.clear()
+
+
+def _decode_stream(raw):
+    '''
+    Decode a JSON-RPC response straight from the socket. With ijson the
+    object tree is built a buffer at a time, so the raw body and its decoded
+    text are never held in memory alongside it.
+    '''
+    raw.decode_content = True
+    if _ijson is not None:
+        for resp in _ijson.items(raw, '', use_float=True):
+            return resp
+        return None
+    return _json_loads(raw.read())
+
 
 def _get_token(user_id, password, auth_svc):
     # This is bandaid helper function until we get a full
@@ -87,16 +334,6 @@ class ServerError(Exception):
             '\n' + self.data
 
 
-class _JSONObjectEncoder(_json.JSONEncoder):
-
-    def default(self, obj):
-        if isinstance(obj, set):
-            return list(obj)
-        if isinstance(obj, frozenset):
-            return list(obj)
-        return _json.JSONEncoder.default(self, obj)
-
-
 class BaseClient(object):
     '''
     The KBase base client.
@@ -120,6 +357,10 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    compress_requests - set to true to gzip request bodies larger than
+        KB_CLIENT_COMPRESS_MIN_BYTES (default 256KB). Only for servers that
+        accept gzip request bodies; one that answers 415 is sent plain
+        bodies from then on.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -129,7 +370,8 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            compress_requests=False):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -144,6 +386,7 @@ class BaseClient(object):
         self.async_job_check_time_scale_percent = (
             async_job_check_time_scale_percent)
         self.async_job_check_max_time = async_job_check_max_time_ms / 1000.0
+        self.compress_requests = compress_requests
         # token overrides user_id and password
         if token is not None:
             self._headers['AUTHORIZATION'] = token
@@ -164,7 +407,7 @@ class BaseClient(object):
         if self.timeout < 1:
             raise ValueError('Timeout value must be at least 1 second')
 
-    def _call(self, url, method, params, context=None):
+    def _call(self, url, method, params, context=None, stream=False):
         arg_hash = {'method': method,
                     'params': params,
                     'version': '1.1',
@@ -175,14 +418,30 @@ class BaseClient(object):
                 raise ValueError('context is not type dict as required.')
             arg_hash['context'] = context
 
-        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        body = _json_dumps(arg_hash)
+        session = _get_session(url)
+        ret = None
+        if (self.compress_requests and len(body) >= _COMPRESS_MIN_BYTES and
+                not _gzip_rejected(url)):
+            headers = dict(self._headers)
+            headers['Content-Encoding'] = 'gzip'
+            ret = session.post(url, data=_gzip.compress(body, _COMPRESS_LEVEL),
+                               headers=headers, timeout=self.timeout,
+                               verify=not self.trust_all_ssl_certificates,
+                               stream=stream)
+            if ret.status_code == 415:
+                _reject_gzip(url)
+                ret.close()
+                ret = None
+        if ret is None:
+            ret = session.post(url, data=body, headers=self._headers,
+                               timeout=self.timeout,
+                               verify=not self.trust_all_ssl_certificates,
+                               stream=stream)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
-                err = ret.json()
+                err = _json_loads(ret.content)
                 if 'error' in err:
                     raise ServerError(**err['error'])
                 else:
@@ -191,7 +450,13 @@ class BaseClient(object):
                 raise ServerError('Unknown', 0, ret.text)
         if not ret.ok:
             ret.raise_for_status()
-        resp = ret.json()
+        if stream:
+            try:
+                resp = _decode_stream(ret.raw)
+            finally:
+                ret.close()
+        else:
+            resp = _json_loads(ret.content)
         if 'result' not in resp:
             raise ServerError('Unknown', 0, 'An unknown server error occurred')
         if not resp['result']:
@@ -200,14 +465,32 @@ class BaseClient(object):
             return resp['result'][0]
         return resp['result']
 
+    def _service_url_key(self, service_method, service_version):
+        service, _ = service_method.split('.')
+        # the wizard url is part of the key so clients pointed at different
+        # deployments never share entries
+        return (self.url, service, service_version)
+
+    def _forget_service_url(self, service_method, service_version):
+        # the service may have moved; resolve it again on the next call
+        if self.lookup_url:
+            _invalidate_service_url(
+                self._service_url_key(service_method, service_version))
+
     def _get_service_url(self, service_method, service_version):
         if not self.lookup_url:
             return self.url
+        key = self._service_url_key(service_method, service_version)
+        url = _get_cached_service_url(key)
+        if url is not None:
+            return url
         service, _ = service_method.split('.')
         service_status_ret = self._call(
             self.url, 'ServiceWizard.get_service_status',
             [{'module_name': service, 'version': service_version}])
-        return service_status_ret['url']
+        url = service_status_ret['url']
+        _cache_service_url(key, url)
+        return url
 
     def _set_up_context(self, service_ver=None, context=None):
         if service_ver:
@@ -219,6 +502,20 @@ class BaseClient(object):
     def _check_job(self, service, job_id):
         return self._call(self.url, service + '._check_job', [job_id])
 
+    def _next_job_check_time(self, elapsed, expected, last_check_time):
+        if expected is None:
+            # no history: multiplicative backoff
+            check_time = (last_check_time *
+                          self.async_job_check_time_scale_percent / 100.0)
+        elif elapsed < expected * 0.8:
+            # sleep through most of the expected run time in one go
+            check_time = expected * 0.8 - elapsed
+        else:
+            # then poll often enough to notice the end within ~5%
+            check_time = max(self.async_job_check_time,
+                             0.05 * max(elapsed, expected))
+        return min(check_time, self.async_job_check_max_time)
+
     def _submit_job(self, service_method, args, service_ver=None,
                     context=None):
         context = self._set_up_context(service_ver, context)
@@ -238,25 +535,34 @@ class BaseClient(object):
         context - the rpc context dict.
         '''
         mod, _ = service_method.split('.')
-        job_id = self._submit_job(service_method, args, service_ver, context)
-        async_job_check_time = self.async_job_check_time
+        expected = _expected_job_duration(service_method)
+        try:
+            job_id = self._submit_job(service_method, args, service_ver,
+                                      context)
+        except (ConnectionError, ProtocolError):
+            self._forget_service_url(service_method, service_ver)
+            raise
+        start = time.time()
+        async_job_check_time = min(self.async_job_check_time,
+                                   self.async_job_check_max_time)
+        if expected is not None:
+            async_job_check_time = self._next_job_check_time(0, expected, 0)
         check_job_failures = 0
         while check_job_failures < _CHECK_JOB_RETRYS:
-            time.sleep(async_job_check_time)
-            async_job_check_time = (async_job_check_time *
-                                    self.async_job_check_time_scale_percent /
-                                    100.0)
-            if async_job_check_time > self.async_job_check_max_time:
-                async_job_check_time = self.async_job_check_max_time
-
             try:
+                time.sleep(async_job_check_time)
                 job_state = self._check_job(mod, job_id)
             except (ConnectionError, ProtocolError):
                 _traceback.print_exc()
+                self._forget_service_url(service_method, service_ver)
                 check_job_failures += 1
                 continue
+            finally:
+                async_job_check_time = self._next_job_check_time(
+                    time.time() - start, expected, async_job_check_time)
 
             if job_state['finished']:
+                _record_job_duration(service_method, time.time() - start)
                 if not job_state['result']:
                     return
                 if len(job_state['result']) == 1:
@@ -266,7 +572,7 @@ class BaseClient(object):
             check_job_failures))
 
     def call_method(self, service_method, args, service_ver=None,
-                    context=None):
+                    context=None, stream=False):
         '''
         Call a standard or dynamic service synchronously.
         Required arguments:
@@ -276,7 +582,13 @@ class BaseClient(object):
         service_ver - the version of the service to run, e.g. a git hash
             or dev/beta/release.
         context - the rpc context dict.
+        stream - decode the response as it arrives rather than buffering it
+            first; use for large results such as get_objects2 data.
         '''
         url = self._get_service_url(service_method, service_ver)
         context = self._set_up_context(service_ver, context)
-        return self._call(url, service_method, args, context)
+        try:
+            return self._call(url, service_method, args, context, stream)
+        except ConnectionError:
+            self._forget_service_url(service_method, service_ver)
+            raise
@@ -207,6 +207,33 @@ class kb_blast(object):
         return self._client.call_method('kb_blast.psiBLAST_msa_start_Search',
                                         [params], self._service_ver, context)
 
+    def BLAST_Refilter(self, params, context=None):
+        """
+        Method to filter the hits of an earlier search again, with new thresholds,
+        **  without running BLAST
+        :param params: instance of type "BLAST_Refilter_Params" (BLAST
+           Refilter Input Params ** **    report_ref: report of an earlier
+           search, which keeps its raw hits **    thresholds not given are
+           those of the earlier search) -> structure: parameter
+           "workspace_name" of type "workspace_name" (** The workspace object
+           refs are of form: ** **    objects = ws.get_objects([{'ref':
+           params['workspace_id']+'/'+params['obj_name']}]) ** ** "ref" means
+           the entire name combining the workspace id and the object name **
+           "id" is a numerical identifier of the workspace or object, and
+           should just be used for workspace ** "name" is a string identifier
+           of a workspace or object.  This is received from Narrative.),
+           parameter "report_ref" of type "data_obj_ref", parameter
+           "output_filtered_name" of type "data_obj_name", parameter
+           "genome_disp_name_config" of String, parameter "ident_thresh" of
+           Double, parameter "bitscore" of Double, parameter
+           "overlap_fraction" of Double
+        :returns: instance of type "BLAST_Output" (BLAST Output) ->
+           structure: parameter "report_name" of type "data_obj_name",
+           parameter "report_ref" of type "data_obj_ref"
+        """
+        return self._client.call_method('kb_blast.BLAST_Refilter',
+                                        [params], self._service_ver, context)
+
     def status(self, context=None):
         return self._client.call_method('kb_blast.status',
                                         [], self._service_ver, context)
@@ -2,8 +2,6 @@
 #BEGIN_HEADER
 import os
 import re
-import subprocess
-import sys
 import traceback
 import uuid
 from datetime import datetime
@@ -18,6 +16,15 @@ from installed_clients.WorkspaceClient import Workspace as workspaceService
 
 # BlastUtil
 from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.ClientPool import get_client
+from kb_blast.Utils.JobLog import JobLog, SubprocessLog
+from kb_blast.Utils.JobProfiler import JobProfiler, profile_memory, profile_mode
+from kb_blast.Utils.MSAPrep import check_protein_MSA, write_psiBLAST_msa_files
+from kb_blast.Utils.ObjectFetch import get_obj_subset
+from kb_blast.Utils.ProcessLimits import ProcessLimitExceeded, ProcessLimits
+from kb_blast.Utils.ProcessMetrics import ProcessMetrics, db_size_bytes
+from kb_blast.Utils.ScratchManager import ScratchManager
+from kb_blast.Utils.StageTimer import StageTimer
 
 #END_HEADER
 
@@ -66,13 +73,58 @@ class kb_blast:
         now_timestamp_in_iso = datetime.fromtimestamp(int(now_secs_from_epoch)).strftime('%Y-%m-%d_%T')
         return now_timestamp_in_iso
 
-    # message logging
+    # message logging (leveled and buffered, see Utils/JobLog.py)
     def log(self, target, message):
-        message = '['+self.now_ISO()+'] '+message
-        if target is not None:
-            target.append(message)
-        print(message)
-        sys.stdout.flush()
+        self.job_log.log(target, message)
+
+    # psiBLAST FAILURE report, for invalid input or a run stopped by a limit
+    # (the other searches' are made by BlastUtil)
+    def save_psiBLAST_error_report(self, ctx, params, invalid_msgs, report=''):
+        console = []
+        search_tool_name = 'psiBLAST_msa_start'
+
+        # load the method provenance from the context object
+        #
+        self.log(console,"SETTING PROVENANCE")  # DEBUG
+        provenance = [{}]
+        if 'provenance' in ctx:
+            provenance = ctx['provenance']
+        # add additional info to provenance here, in this case the input data object reference
+        provenance[0]['input_ws_objects'] = []
+        provenance[0]['input_ws_objects'].append(params['input_msa_ref'])
+        provenance[0]['input_ws_objects'].append(params['input_many_ref'])
+        provenance[0]['service'] = 'kb_blast'
+        provenance[0]['method'] = search_tool_name+'_Search'
+
+        # build output report object
+        #
+        self.log(console,"BUILDING REPORT")  # DEBUG
+        report += "FAILURE:\n\n"+"\n".join(invalid_msgs)+"\n"
+        reportObj = {
+            'objects_created':[],
+            'text_message':report
+            }
+
+        reportName = 'blast_report_'+str(uuid.uuid4())
+        ws = get_client(workspaceService, self.workspaceURL, token=ctx['token'])
+        report_obj_info = ws.save_objects({
+                'workspace':params['workspace_name'],
+                'objects':[
+                    {
+                    'type':'KBaseReport.Report',
+                    'data':reportObj,
+                    'name':reportName,
+                    'meta':{},
+                    'hidden':1,
+                    'provenance':provenance
+                    }
+                    ]
+                })[0]
+
+        self.log(console,"BUILDING RETURN OBJECT")
+        return { 'report_name': reportName,
+                 'report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]),
+                 }
 
 
     #END_CLASS_HEADER
@@ -82,6 +134,7 @@ class kb_blast:
     def __init__(self, config):
         #BEGIN_CONSTRUCTOR
         self.config = config
+        self.job_log = JobLog()
         self.workspaceURL = config['workspace-url']
         self.shockURL = config['shock-url']
         self.handleURL = config['handle-service-url']
@@ -344,1158 +397,1132 @@ class kb_blast:
         #BEGIN psiBLAST_msa_start_Search
         console = []
         invalid_msgs = []
-        search_tool_name = 'psiBLAST_msa_start'
-        self.log(console,'Running '+search_tool_name+'_Search with params=')
-        self.log(console, "\n"+pformat(params))
-        report = ''
-#        report = 'Running '+search_tool_name+'_Search with params='
-#        report += "\n"+pformat(params)
-        #appropriate_sequence_found_in_one_input = False
-        appropriate_sequence_found_in_MSA_input = False
-        appropriate_sequence_found_in_many_input = False
-        genome_id_feature_id_delim = '.f:'
-
-
-        #### do some basic checks
-        #
-        if 'workspace_name' not in params:
-            raise ValueError('workspace_name parameter is required')
-        #if 'input_one_ref' not in params:
-        #    raise ValueError('input_one_ref parameter is required')
-        if 'input_msa_ref' not in params:
-            raise ValueError('input_msa_ref parameter is required')
-        if 'input_many_ref' not in params:
-            raise ValueError('input_many_ref parameter is required')
-        if 'output_filtered_name' not in params:
-            raise ValueError('output_filtered_name parameter is required')
-
-
-        # set local names
-        #input_one_ref = params['input_one_ref']
-        input_msa_ref = params['input_msa_ref']
-        input_many_ref = params['input_many_ref']
+        hit_log = JobLog()  # per-job counts for the HIT lines
+        # opt-in profile (params['profile'] or $KB_BLAST_PROFILE), stopped
+        # however the job ends
+        profiler = JobProfiler(profile_mode(params), profile_memory(params)).start()
+        # this job's own scratch dirs, removed however the job ends
+        scratch_manager = ScratchManager.for_job(self.scratch, self.config)
+        # time budgets and memory caps (a run that hits one, or SIGTERM,
+        # ends the job with an error report)
+        process_limits = ProcessLimits.for_job(self.config)
+        process_limits.install_signal_handlers()
+        # full makeblastdb and psiblast output, attached to the report
+        subprocess_log = SubprocessLog(os.path.join(scratch_manager.stage_dir('logs'), 'subprocess_output.txt'))
+        # stage timings, logged and attached to the report
+        stage_timer = StageTimer()
+        try:
+            search_tool_name = 'psiBLAST_msa_start'
+            self.log(console,'Running '+search_tool_name+'_Search with params=')
+            self.log(console, "\n"+pformat(params))
+            report = ''
+    #        report = 'Running '+search_tool_name+'_Search with params='
+    #        report += "\n"+pformat(params)
+            #appropriate_sequence_found_in_one_input = False
+            appropriate_sequence_found_in_MSA_input = False
+            appropriate_sequence_found_in_many_input = False
+            genome_id_feature_id_delim = '.f:'
+
+
+            #### do some basic checks
+            #
+            stage_timer.start_stage('validate')
+            if 'workspace_name' not in params:
+                raise ValueError('workspace_name parameter is required')
+            #if 'input_one_ref' not in params:
+            #    raise ValueError('input_one_ref parameter is required')
+            if 'input_msa_ref' not in params:
+                raise ValueError('input_msa_ref parameter is required')
+            if 'input_many_ref' not in params:
+                raise ValueError('input_many_ref parameter is required')
+            if 'output_filtered_name' not in params:
+                raise ValueError('output_filtered_name parameter is required')
+
+
+            # set local names
+            #input_one_ref = params['input_one_ref']
+            input_msa_ref = params['input_msa_ref']
+            input_many_ref = params['input_many_ref']
         
 
-        #### Get the input_msa object
-        ##
-#        if input_one_feature_id == None:
-#            self.log(invalid_msgs,"input_one_feature_id was not obtained from Query Object: "+input_one_name)
-#       master_row_idx = 0
-        try:
-            ws = workspaceService(self.workspaceURL, token=ctx['token'])
-            #objects = ws.get_objects([{'ref': input_msa_ref}])
-            objects = ws.get_objects2({'objects':[{'ref': input_msa_ref}]})['data']
-            input_msa_data = objects[0]['data']
-            info = objects[0]['info']
-            input_msa_name = str(info[1])
-            msa_type_name = info[2].split('.')[1].split('-')[0]
-
-        except Exception as e:
-            raise ValueError('Unable to fetch input_msa_name object from workspace: ' + str(e))
-            #to get the full stack trace: traceback.format_exc()
-
-        if msa_type_name != 'MSA':
-            raise ValueError('Cannot yet handle input_msa type of: '+msa_type_name)
-        else:
-            MSA_in = input_msa_data
-            row_order = []
-            default_row_labels = dict()
-            if 'row_order' in list(MSA_in.keys()):
-                row_order = MSA_in['row_order']
-            else:
-                row_order = sorted(MSA_in['alignment'].keys())
+            #### Get the input_msa object
+            ##
+            stage_timer.start_stage('query_write')
+    #        if input_one_feature_id == None:
+    #            self.log(invalid_msgs,"input_one_feature_id was not obtained from Query Object: "+input_one_name)
+    #       master_row_idx = 0
+            try:
+                ws = get_client(workspaceService, self.workspaceURL, token=ctx['token'])
+                #objects = ws.get_objects([{'ref': input_msa_ref}])
+                objects = ws.get_objects2({'objects':[{'ref': input_msa_ref}]})['data']
+                input_msa_data = objects[0]['data']
+                info = objects[0]['info']
+                input_msa_name = str(info[1])
+                msa_type_name = info[2].split('.')[1].split('-')[0]
 
-            if 'default_row_labels' in list(MSA_in.keys()):
-                default_row_labels = MSA_in['default_row_labels']
-            else:
-                for row_id in row_order:
-                    default_row_labels[row_id] = row_id
-
-            """
-            # determine row index of query sequence
-            for row_id in row_order:
-                master_row_idx += 1
-                if row_id == input_one_feature_id:
-                    break
-            if master_row_idx == 0:
-                self.log(invalid_msgs,"Failed to find query id "+input_one_feature_id+" from Query Object "+input_one_name+" within MSA: "+input_msa_name)
-            """
-
-            # use longest sequence in MSA to use as the query sequence
-            master_row_idx = -1
-            longest_seq_len = 0
-            longest_seq = ''
-            for i,row_id in enumerate(row_order):
-                msa_seq = MSA_in['alignment'][row_id].replace('-','')
-                if len(msa_seq) > longest_seq_len:
-                    master_row_idx = i
-                    longest_seq_len = len(msa_seq)
-                    longest_seq = msa_seq
-            if longest_seq == '':
-                raise ValueError ("unable to find longest seq in MSA")
-            one_forward_reads_file_path = os.path.join(self.scratch, input_msa_name+"-query.fasta")
-            with open (one_forward_reads_file_path, 'w') as input_one_fh:
-                input_one_fh.write('>query'+"\n")
-                input_one_fh.write(longest_seq+"\n")
-            if master_row_idx == -1:
-                raise ValueError ("unable to find longest sequence in MSA")
-            else:
-                master_row_idx += 1  # psiBLAST counts rows starting from 1 instead of 0
+            except Exception as e:
+                raise ValueError('Unable to fetch input_msa_name object from workspace: ' + str(e))
+                #to get the full stack trace: traceback.format_exc()
 
-            
-            # export features to Clustal-esque file that PSI-BLAST likes
-            input_MSA_file_path = os.path.join(self.scratch, input_msa_name+".fasta")
-            self.log(console, 'writing MSA file: '+input_MSA_file_path)
-            records = []
-            longest_row_id_len = 0
-            for row_id in row_order:
-                if len(row_id) > longest_row_id_len:
-                    longest_row_id_len = len(row_id)
-            for row_id in row_order:
-                #self.log(console,"row_id: '"+row_id+"'")  # DEBUG
-                #self.log(console,"alignment: '"+MSA_in['alignment'][row_id]+"'")  # DEBUG
-                # using SeqIO makes multiline sequences.  We want Clustal-esque, but we'll not break them up and hope PSI-BLAST is happy
-                #record = SeqRecord(Seq(MSA_in['alignment'][row_id]), id=row_id, description=default_row_labels[row_id])
-                #records.append(record)
-                #SeqIO.write(records, input_MSA_file_path, "fasta")
-                padding = ''
-                for i in range(0,longest_row_id_len-len(row_id)):
-                    padding += ' '
-                records.append(row_id + padding + "\t" +
-                               MSA_in['alignment'][row_id]
-                               )
-            with open(input_MSA_file_path, 'w') as input_MSA_file_handle:
-                input_MSA_file_handle.write("\n".join(records)+"\n")
-
-
-            # Determine whether nuc or protein sequences
-            #
-            self.log (console, "CHECKING MSA for PROTEIN seqs...")  # DEBUG                                  
-            PROT_MSA_pattern = re.compile("^[\.\-_acdefghiklmnpqrstvwyACDEFGHIKLMNPQRSTVWYxX ]+$")
-            DNA_MSA_pattern = re.compile("^[\.\-_ACGTUXNRYSWKMBDHVacgtuxnryswkmbdhv \t\n]+$")               
-            appropriate_sequence_found_in_MSA_input = True
-            if 'sequence_type' in MSA_in and (MSA_in['sequence_type'] == 'dna' or MSA_in['sequence_type'] == 'DNA'):
-                appropriate_sequence_found_in_MSA_input = False
+            if msa_type_name != 'MSA':
+                raise ValueError('Cannot yet handle input_msa type of: '+msa_type_name)
             else:
+                MSA_in = input_msa_data
+
+                """
+                # determine row index of query sequence
                 for row_id in row_order:
-                    #self.log(console, row_id+": '"+MSA_in['alignment'][row_id]+"'")    # DEBUG                   
-                    #if not PROT_MSA_pattern.match(MSA_in['alignment'][row_id]):
-                    if DNA_MSA_pattern.match(MSA_in['alignment'][row_id]):
-                        self.log(invalid_msgs,
-                                 "Need protein sequences in MSA. "+
-                                 "BAD nucleotide record for MSA row_id: "+row_id+"\n"+MSA_in['alignment'][row_id]+"\n")
-                        appropriate_sequence_found_in_MSA_input = False
-                        break
-                    elif not PROT_MSA_pattern.match(MSA_in['alignment'][row_id]):
-                        self.log(invalid_msgs,"BAD record for MSA row_id: "+row_id+"\n"+MSA_in['alignment'][row_id]+"\n")
-                        appropriate_sequence_found_in_MSA_input = False
+                    master_row_idx += 1
+                    if row_id == input_one_feature_id:
                         break
-
-
-        #### Get the input_many object
-        ##
-        try:
-            ws = workspaceService(self.workspaceURL, token=ctx['token'])
-            #objects = ws.get_objects([{'ref': input_many_ref}])
-            objects = ws.get_objects2({'objects':[{'ref': input_many_ref}]})['data']
-            input_many_data = objects[0]['data']
-            info = objects[0]['info']
-            input_many_name = str(info[1])
-            many_type_name = info[2].split('.')[1].split('-')[0]
-
-        except Exception as e:
-            raise ValueError('Unable to fetch input_many_name object from workspace: ' + str(e))
-            #to get the full stack trace: traceback.format_exc()
-
-
-        # Handle overloading (input_many can be SequenceSet, FeatureSet, Genome, or GenomeSet)
-        #
-        if many_type_name == 'SequenceSet':
+                if master_row_idx == 0:
+                    self.log(invalid_msgs,"Failed to find query id "+input_one_feature_id+" from Query Object "+input_one_name+" within MSA: "+input_msa_name)
+                """
+
+                # use longest sequence in MSA to use as the query sequence, and
+                # export the MSA to a Clustal-esque file that PSI-BLAST likes
+                msa_files = write_psiBLAST_msa_files(MSA_in, scratch_manager.stage_dir('query'), input_msa_name)
+                row_order = msa_files['row_order']
+                one_forward_reads_file_path = msa_files['query_fasta_file_path']
+                input_MSA_file_path = msa_files['msa_file_path']
+                master_row_idx = msa_files['master_row_idx']  # psiBLAST counts rows starting from 1
+                self.log(console, 'writing MSA file: '+input_MSA_file_path)
+
+
+                # Determine whether nuc or protein sequences
+                #
+                self.log (console, "CHECKING MSA for PROTEIN seqs...")  # DEBUG                                  
+                (appropriate_sequence_found_in_MSA_input, MSA_invalid_msgs) = check_protein_MSA(MSA_in, row_order)
+                for MSA_invalid_msg in MSA_invalid_msgs:
+                    self.log(invalid_msgs, MSA_invalid_msg)
+
+
+            #### Get the input_many object
+            ##
+            stage_timer.start_stage('target_write')
             try:
-                input_many_sequenceSet = input_many_data
+                ws = get_client(workspaceService, self.workspaceURL, token=ctx['token'])
+                #objects = ws.get_objects([{'ref': input_many_ref}])
+                # DOTFU reads the objects itself, so only fetch what the output
+                # FeatureSet is built from
+                obj = get_obj_subset(ws, input_many_ref,
+                                     {'Genome': None,
+                                      'FeatureSet': ['/elements', '/description'],
+                                      'GenomeSet': ['/elements', '/description']})
+                input_many_data = obj['data']
+                info = obj['info']
+                input_many_name = str(info[1])
+                many_type_name = info[2].split('.')[1].split('-')[0]
+
             except Exception as e:
-                print((traceback.format_exc()))
-                raise ValueError('Unable to get SequenceSet: ' + str(e))
-
-            header_id = input_many_sequenceSet['sequences'][0]['sequence_id']
-            many_forward_reads_file_path = os.path.join(self.scratch, header_id+'.fasta')
-            many_forward_reads_file_handle = open(many_forward_reads_file_path, 'w')
-            self.log(console, 'writing reads file: '+str(many_forward_reads_file_path))
-
-            for seq_obj in input_many_sequenceSet['sequences']:
-                header_id = seq_obj['sequence_id']
-                sequence_str = seq_obj['sequence']
-
-                PROT_pattern = re.compile("^[acdefghiklmnpqrstvwyACDEFGHIKLMNPQRSTVWYxX ]+$")
-                #DNA_pattern = re.compile("^[acgtuACGTUnryNRY ]+$")
-                if not PROT_pattern.match(sequence_str):
-                    self.log(invalid_msgs,"BAD record for sequence_id: "+header_id+"\n"+sequence_str+"\n")
-                    continue
-                appropriate_sequence_found_in_many_input = True
-                many_forward_reads_file_handle.write('>'+header_id+"\n")
-                many_forward_reads_file_handle.write(sequence_str+"\n")
-            many_forward_reads_file_handle.close();
-            self.log(console, 'done')
+                raise ValueError('Unable to fetch input_many_name object from workspace: ' + str(e))
+                #to get the full stack trace: traceback.format_exc()
 
 
-        # FeatureSet
-        #
-        if many_type_name == 'FeatureSet':
-            # retrieve sequences for features
-            input_many_featureSet = input_many_data
-            many_forward_reads_file_dir = self.scratch
-            many_forward_reads_file = input_many_name+".fasta"
-
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            FeatureSetToFASTA_params = {
-                'featureSet_ref':      input_many_ref,
-                'file':                many_forward_reads_file,
-                'dir':                 many_forward_reads_file_dir,
-                'console':             console,
-                'invalid_msgs':        invalid_msgs,
-                'residue_type':        'protein',
-                'feature_type':        'CDS',
-                'record_id_pattern':   '%%genome_ref%%'+genome_id_feature_id_delim+'%%feature_id%%',
-                'record_desc_pattern': '[%%genome_ref%%]',
-                'case':                'upper',
-                'linewrap':            50,
-                'merge_fasta_files':   'TRUE'
-                }
-
-            #self.log(console,"callbackURL='"+self.callbackURL+"'")  # DEBUG
-            DOTFU = KBaseDataObjectToFileUtils (url=self.callbackURL, token=ctx['token'])
-            FeatureSetToFASTA_retVal = DOTFU.FeatureSetToFASTA (FeatureSetToFASTA_params)
-            many_forward_reads_file_path = FeatureSetToFASTA_retVal['fasta_file_path']
-            feature_ids_by_genome_ref = FeatureSetToFASTA_retVal['feature_ids_by_genome_ref']
-            if len(list(feature_ids_by_genome_ref.keys())) > 0:
-                appropriate_sequence_found_in_many_input = True
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "FeatureSetToFasta() took "+str(end_time-beg_time)+" secs")
-
-
-        # Genome
-        #
-        elif many_type_name == 'Genome':
-            many_forward_reads_file_dir = self.scratch
-            many_forward_reads_file = input_many_name+".fasta"
-
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            GenomeToFASTA_params = {
-                'genome_ref':          input_many_ref,
-                'file':                many_forward_reads_file,
-                'dir':                 many_forward_reads_file_dir,
-                'console':             console,
-                'invalid_msgs':        invalid_msgs,
-                'residue_type':        'protein',
-                'feature_type':        'CDS',
-                'record_id_pattern':   '%%feature_id%%',
-                'record_desc_pattern': '[%%genome_id%%]',
-                'case':                'upper',
-                'linewrap':            50
-                }
-
-            #self.log(console,"callbackURL='"+self.callbackURL+"'")  # DEBUG
-            DOTFU = KBaseDataObjectToFileUtils (url=self.callbackURL, token=ctx['token'])
-            GenomeToFASTA_retVal = DOTFU.GenomeToFASTA (GenomeToFASTA_params)
-            many_forward_reads_file_path = GenomeToFASTA_retVal['fasta_file_path']
-            feature_ids = GenomeToFASTA_retVal['feature_ids']
-            if len(feature_ids) > 0:
-                appropriate_sequence_found_in_many_input = True
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "Genome2Fasta() took "+str(end_time-beg_time)+" secs")
+            # Handle overloading (input_many can be SequenceSet, FeatureSet, Genome, or GenomeSet)
+            #
+            if many_type_name == 'SequenceSet':
+                try:
+                    input_many_sequenceSet = input_many_data
+                except Exception as e:
+                    print((traceback.format_exc()))
+                    raise ValueError('Unable to get SequenceSet: ' + str(e))
+
+                header_id = input_many_sequenceSet['sequences'][0]['sequence_id']
+                many_forward_reads_file_path = os.path.join(scratch_manager.stage_dir('targets'), header_id+'.fasta')
+                many_forward_reads_file_handle = open(many_forward_reads_file_path, 'w')
+                self.log(console, 'writing reads file: '+str(many_forward_reads_file_path))
+
+                for seq_obj in input_many_sequenceSet['sequences']:
+                    header_id = seq_obj['sequence_id']
+                    sequence_str = seq_obj['sequence']
+
+                    PROT_pattern = re.compile("^[acdefghiklmnpqrstvwyACDEFGHIKLMNPQRSTVWYxX ]+$")
+                    #DNA_pattern = re.compile("^[acgtuACGTUnryNRY ]+$")
+                    if not PROT_pattern.match(sequence_str):
+                        self.log(invalid_msgs,"BAD record for sequence_id: "+header_id+"\n"+sequence_str+"\n")
+                        continue
+                    appropriate_sequence_found_in_many_input = True
+                    many_forward_reads_file_handle.write('>'+header_id+"\n")
+                    many_forward_reads_file_handle.write(sequence_str+"\n")
+                many_forward_reads_file_handle.close();
+                self.log(console, 'done')
+
+
+            # FeatureSet
+            #
+            if many_type_name == 'FeatureSet':
+                # retrieve sequences for features
+                input_many_featureSet = input_many_data
+                many_forward_reads_file_dir = scratch_manager.stage_dir('targets')
+                many_forward_reads_file = input_many_name+".fasta"
+
+                # DEBUG
+                #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
+                FeatureSetToFASTA_params = {
+                    'featureSet_ref':      input_many_ref,
+                    'file':                many_forward_reads_file,
+                    'dir':                 many_forward_reads_file_dir,
+                    'console':             console,
+                    'invalid_msgs':        invalid_msgs,
+                    'residue_type':        'protein',
+                    'feature_type':        'CDS',
+                    'record_id_pattern':   '%%genome_ref%%'+genome_id_feature_id_delim+'%%feature_id%%',
+                    'record_desc_pattern': '[%%genome_ref%%]',
+                    'case':                'upper',
+                    'linewrap':            50,
+                    'merge_fasta_files':   'TRUE'
+                    }
+
+                #self.log(console,"callbackURL='"+self.callbackURL+"'")  # DEBUG
+                DOTFU = get_client(KBaseDataObjectToFileUtils, self.callbackURL, token=ctx['token'])
+                FeatureSetToFASTA_retVal = DOTFU.FeatureSetToFASTA (FeatureSetToFASTA_params)
+                many_forward_reads_file_path = FeatureSetToFASTA_retVal['fasta_file_path']
+                feature_ids_by_genome_ref = FeatureSetToFASTA_retVal['feature_ids_by_genome_ref']
+                if len(list(feature_ids_by_genome_ref.keys())) > 0:
+                    appropriate_sequence_found_in_many_input = True
+
+                # DEBUG
+                #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
+                #self.log(console, "FeatureSetToFasta() took "+str(end_time-beg_time)+" secs")
+
+
+            # Genome
+            #
+            elif many_type_name == 'Genome':
+                many_forward_reads_file_dir = scratch_manager.stage_dir('targets')
+                many_forward_reads_file = input_many_name+".fasta"
+
+                # DEBUG
+                #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
+                GenomeToFASTA_params = {
+                    'genome_ref':          input_many_ref,
+                    'file':                many_forward_reads_file,
+                    'dir':                 many_forward_reads_file_dir,
+                    'console':             console,
+                    'invalid_msgs':        invalid_msgs,
+                    'residue_type':        'protein',
+                    'feature_type':        'CDS',
+                    'record_id_pattern':   '%%feature_id%%',
+                    'record_desc_pattern': '[%%genome_id%%]',
+                    'case':                'upper',
+                    'linewrap':            50
+                    }
+
+                #self.log(console,"callbackURL='"+self.callbackURL+"'")  # DEBUG
+                DOTFU = get_client(KBaseDataObjectToFileUtils, self.callbackURL, token=ctx['token'])
+                GenomeToFASTA_retVal = DOTFU.GenomeToFASTA (GenomeToFASTA_params)
+                many_forward_reads_file_path = GenomeToFASTA_retVal['fasta_file_path']
+                feature_ids = GenomeToFASTA_retVal['feature_ids']
+                if len(feature_ids) > 0:
+                    appropriate_sequence_found_in_many_input = True
+
+                # DEBUG
+                #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
+                #self.log(console, "Genome2Fasta() took "+str(end_time-beg_time)+" secs")
             
 
-        # GenomeSet
-        #
-        elif many_type_name == 'GenomeSet':
-            input_many_genomeSet = input_many_data
-            many_forward_reads_file_dir = self.scratch
-            many_forward_reads_file = input_many_name+".fasta"
-
-            # DEBUG
-            #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            GenomeSetToFASTA_params = {
-                'genomeSet_ref':       input_many_ref,
-                'file':                many_forward_reads_file,
-                'dir':                 many_forward_reads_file_dir,
-                'console':             console,
-                'invalid_msgs':        invalid_msgs,
-                'residue_type':        'protein',
-                'feature_type':        'CDS',
-                'record_id_pattern':   '%%genome_ref%%'+genome_id_feature_id_delim+'%%feature_id%%',
-                'record_desc_pattern': '[%%genome_ref%%]',
-                'case':                'upper',
-                'linewrap':            50,
-                'merge_fasta_files':   'TRUE'
-                }
-
-            #self.log(console,"callbackURL='"+self.callbackURL+"'")  # DEBUG
-            DOTFU = KBaseDataObjectToFileUtils (url=self.callbackURL, token=ctx['token'])
-            GenomeSetToFASTA_retVal = DOTFU.GenomeSetToFASTA (GenomeSetToFASTA_params)
-            many_forward_reads_file_path = GenomeSetToFASTA_retVal['fasta_file_path_list'][0]
-            feature_ids_by_genome_id = GenomeSetToFASTA_retVal['feature_ids_by_genome_id']
-            if len(list(feature_ids_by_genome_id.keys())) > 0:
-                appropriate_sequence_found_in_many_input = True
-
-            # DEBUG
-            #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
-            #self.log(console, "FeatureSetToFasta() took "+str(end_time-beg_time)+" secs")
-
-
-        # Missing proper input_many_type
-        #
-        else:
-            raise ValueError('Cannot yet handle input_many type of: '+many_type_name)            
-
-
-        # check for failed input file creation
-        #
-        if not appropriate_sequence_found_in_MSA_input or \
-           not os.path.isfile(one_forward_reads_file_path) or \
-           not os.path.getsize(one_forward_reads_file_path) > 0 or \
-           not os.path.isfile(input_MSA_file_path) or \
-           not os.path.getsize(input_MSA_file_path):
-            self.log(invalid_msgs,"no protein sequences found in MSA'"+input_msa_ref+"'")
-        if not appropriate_sequence_found_in_many_input or \
-           not os.path.isfile(many_forward_reads_file_path) or \
-           not os.path.getsize(many_forward_reads_file_path) > 0:
-            self.log(invalid_msgs,"no protein sequences found in '"+input_many_name+"'")
-
-
-        # input data failed validation.  Need to return
-        #
-        if len(invalid_msgs) > 0:
-
-            # load the method provenance from the context object
+            # GenomeSet
             #
-            self.log(console,"SETTING PROVENANCE")  # DEBUG
-            provenance = [{}]
-            if 'provenance' in ctx:
-                provenance = ctx['provenance']
-            # add additional info to provenance here, in this case the input data object reference
-            provenance[0]['input_ws_objects'] = []
-            #provenance[0]['input_ws_objects'].append(input_one_ref)
-            provenance[0]['input_ws_objects'].append(input_msa_ref)
-            provenance[0]['input_ws_objects'].append(input_many_ref)
-            provenance[0]['service'] = 'kb_blast'
-            provenance[0]['method'] = search_tool_name+'_Search'
-
-
-            # build output report object
+            elif many_type_name == 'GenomeSet':
+                input_many_genomeSet = input_many_data
+                many_forward_reads_file_dir = scratch_manager.stage_dir('targets')
+                many_forward_reads_file = input_many_name+".fasta"
+
+                # DEBUG
+                #beg_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
+                GenomeSetToFASTA_params = {
+                    'genomeSet_ref':       input_many_ref,
+                    'file':                many_forward_reads_file,
+                    'dir':                 many_forward_reads_file_dir,
+                    'console':             console,
+                    'invalid_msgs':        invalid_msgs,
+                    'residue_type':        'protein',
+                    'feature_type':        'CDS',
+                    'record_id_pattern':   '%%genome_ref%%'+genome_id_feature_id_delim+'%%feature_id%%',
+                    'record_desc_pattern': '[%%genome_ref%%]',
+                    'case':                'upper',
+                    'linewrap':            50,
+                    'merge_fasta_files':   'TRUE'
+                    }
+
+                #self.log(console,"callbackURL='"+self.callbackURL+"'")  # DEBUG
+                DOTFU = get_client(KBaseDataObjectToFileUtils, self.callbackURL, token=ctx['token'])
+                GenomeSetToFASTA_retVal = DOTFU.GenomeSetToFASTA (GenomeSetToFASTA_params)
+                many_forward_reads_file_path = GenomeSetToFASTA_retVal['fasta_file_path_list'][0]
+                feature_ids_by_genome_id = GenomeSetToFASTA_retVal['feature_ids_by_genome_id']
+                if len(list(feature_ids_by_genome_id.keys())) > 0:
+                    appropriate_sequence_found_in_many_input = True
+
+                # DEBUG
+                #end_time = (datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()
+                #self.log(console, "FeatureSetToFasta() took "+str(end_time-beg_time)+" secs")
+
+
+            # Missing proper input_many_type
             #
-            self.log(console,"BUILDING REPORT")  # DEBUG
-            report += "FAILURE:\n\n"+"\n".join(invalid_msgs)+"\n"
-            reportObj = {
-                'objects_created':[],
-                'text_message':report
-                }
-
-            reportName = 'blast_report_'+str(uuid.uuid4())
-            ws = workspaceService(self.workspaceURL, token=ctx['token'])
-            report_obj_info = ws.save_objects({
-                    #'id':info[6],
-                    'workspace':params['workspace_name'],
-                    'objects':[
-                        {
-                        'type':'KBaseReport.Report',
-                        'data':reportObj,
-                        'name':reportName,
-                        'meta':{},
-                        'hidden':1,
-                        'provenance':provenance  # DEBUG
-                        }
-                        ]
-                    })[0]
+            else:
+                raise ValueError('Cannot yet handle input_many type of: '+many_type_name)            
 
-            self.log(console,"BUILDING RETURN OBJECT")
-            returnVal = { 'report_name': reportName,
-                      'report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]),
-                      }
-            self.log(console,search_tool_name+"_Search DONE")
-            return [returnVal]
 
+            # check for failed input file creation
+            #
+            if not appropriate_sequence_found_in_MSA_input or \
+               not os.path.isfile(one_forward_reads_file_path) or \
+               not os.path.getsize(one_forward_reads_file_path) > 0 or \
+               not os.path.isfile(input_MSA_file_path) or \
+               not os.path.getsize(input_MSA_file_path):
+                self.log(invalid_msgs,"no protein sequences found in MSA'"+input_msa_ref+"'")
+            if not appropriate_sequence_found_in_many_input or \
+               not os.path.isfile(many_forward_reads_file_path) or \
+               not os.path.getsize(many_forward_reads_file_path) > 0:
+                self.log(invalid_msgs,"no protein sequences found in '"+input_many_name+"'")
+
+
+            # input data failed validation.  Need to return
+            #
+            if len(invalid_msgs) > 0:
+                returnVal = self.save_psiBLAST_error_report(ctx, params, invalid_msgs, report)
+                self.log(console,search_tool_name+"_Search DONE")
+                return [returnVal]
 
-        # FORMAT DB
-        #
-        # OLD SYNTAX: formatdb -i $database -o T -p F -> $database.nsq or $database.00.nsq
-        # NEW SYNTAX: makeblastdb -in $database -parse_seqids -dbtype prot/nucl -out <basename>
-        makeblastdb_cmd = [self.Make_BLAST_DB]
-
-        # check for necessary files
-        if not os.path.isfile(self.Make_BLAST_DB):
-            raise ValueError("no such file '"+self.Make_BLAST_DB+"'")
-        if not os.path.isfile(many_forward_reads_file_path):
-            raise ValueError("no such file '"+many_forward_reads_file_path+"'")
-        elif not os.path.getsize(many_forward_reads_file_path) > 0:
-            raise ValueError("empty file '"+many_forward_reads_file_path+"'")
-
-        makeblastdb_cmd.append('-in')
-        makeblastdb_cmd.append(many_forward_reads_file_path)
-        makeblastdb_cmd.append('-parse_seqids')
-        makeblastdb_cmd.append('-dbtype')
-        makeblastdb_cmd.append('prot')
-        makeblastdb_cmd.append('-out')
-        makeblastdb_cmd.append(many_forward_reads_file_path)
-
-        # Run Make_BLAST_DB, capture output as it happens
-        #
-        self.log(console, 'RUNNING Make_BLAST_DB:')
-        self.log(console, '    '+' '.join(makeblastdb_cmd))
-#        report += "\n"+'running Make_BLAST_DB:'+"\n"
-#        report += '    '+' '.join(makeblastdb_cmd)+"\n"
-
-        p = subprocess.Popen(makeblastdb_cmd, \
-                             cwd = self.scratch, \
-                             stdout = subprocess.PIPE, \
-                             stderr = subprocess.STDOUT, \
-                             shell = False)
-
-        while True:
-            line = p.stdout.readline().decode()
-            if not line: break
-            self.log(console, line.replace('\n', ''))
-
-        p.stdout.close()
-        p.wait()
-        self.log(console, 'return code: ' + str(p.returncode))
-        if p.returncode != 0:
-            raise ValueError('Error running makeblastdb, return code: '+str(p.returncode) + 
-                '\n\n'+ '\n'.join(console))
-
-        # Check for db output
-        if not os.path.isfile(many_forward_reads_file_path+".psq") and not os.path.isfile(many_forward_reads_file_path+".00.psq"):
-            raise ValueError("makeblastdb failed to create DB file '"+many_forward_reads_file_path+".psq'")
-        elif not os.path.getsize(many_forward_reads_file_path+".psq") > 0 and not os.path.getsize(many_forward_reads_file_path+".00.psq") > 0:
-            raise ValueError("makeblastdb created empty DB file '"+many_forward_reads_file_path+".psq'")
-
-
-        ### Construct the psiBLAST command
-        #
-        # OLD SYNTAX: blastpgp -j <rounds> -h <e_value_matrix> -z <database_size:e.g. 1e8> -q $q -G $G -E $E -m $m -e $e_value -v $limit -b $limit -K $limit -i $fasta_file -B <msa_file> -d $database -o $out_file
-        # NEW SYNTAX: psiblast -in_msa <msa_queryfile> -msa_master_idx <row_n> -db <basename> -out <out_aln_file> -outfmt 0/7 (8 became 7) -evalue <e_value> -dust no (DNA) -seg no (AA) -num_threads <num_cores>
-        #
-        blast_bin = self.psiBLAST
-
-        # check for necessary files
-        if not os.path.isfile(blast_bin):
-            raise ValueError("no such file '"+blast_bin+"'")
-        if not os.path.isfile(one_forward_reads_file_path):
-            raise ValueError("no such file '"+one_forward_reads_file_path+"'")
-        elif not os.path.getsize(one_forward_reads_file_path) > 0:
-            raise ValueError("empty file '"+one_forward_reads_file_path+"'")
-        if not os.path.isfile(input_MSA_file_path):
-            raise ValueError("no such file '"+input_MSA_file_path+"'")
-        elif not os.path.getsize(input_MSA_file_path) > 0:
-            raise ValueError("empty file '"+input_MSA_file_path+"'")
-        if not os.path.isfile(many_forward_reads_file_path):
-            raise ValueError("no such file '"+many_forward_reads_file_path+"'")
-        elif not os.path.getsize(many_forward_reads_file_path) > 0:
-            raise ValueError("empty file '"+many_forward_reads_file_path+"'")
-
-        # set the output path
-        timestamp = int((datetime.utcnow() - datetime.utcfromtimestamp(0)).total_seconds()*1000)
-        output_dir = os.path.join(self.scratch,'output.'+str(timestamp))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_aln_file_path = os.path.join(output_dir, 'alnout.txt');
-        output_extra_file_path = os.path.join(output_dir, 'alnout_extra.txt');
-        output_filtered_fasta_file_path = os.path.join(output_dir, 'output_filtered.faa');
-
-        # this is command for extra output
-        extra_output = False
-        if 'output_extra_format' in params and params['output_extra_format'] != None and params['output_extra_format'] != '' and params['output_extra_format'] != 'none':
-            extra_output = True
 
+            # FORMAT DB
+            #
+            stage_timer.start_stage('format_db')
+            # OLD SYNTAX: formatdb -i $database -o T -p F -> $database.nsq or $database.00.nsq
+            # NEW SYNTAX: makeblastdb -in $database -parse_seqids -dbtype prot/nucl -out <basename>
+            makeblastdb_cmd = [self.Make_BLAST_DB]
+
+            # check for necessary files
+            if not os.path.isfile(self.Make_BLAST_DB):
+                raise ValueError("no such file '"+self.Make_BLAST_DB+"'")
+            if not os.path.isfile(many_forward_reads_file_path):
+                raise ValueError("no such file '"+many_forward_reads_file_path+"'")
+            elif not os.path.getsize(many_forward_reads_file_path) > 0:
+                raise ValueError("empty file '"+many_forward_reads_file_path+"'")
+
+            makeblastdb_cmd.append('-in')
+            makeblastdb_cmd.append(many_forward_reads_file_path)
+            makeblastdb_cmd.append('-parse_seqids')
+            makeblastdb_cmd.append('-dbtype')
+            makeblastdb_cmd.append('prot')
+            makeblastdb_cmd.append('-out')
+            makeblastdb_cmd.append(many_forward_reads_file_path)
+
+            # Run Make_BLAST_DB, capture output as it happens
+            #
+            self.log(console, 'RUNNING Make_BLAST_DB:')
+            self.log(console, '    '+' '.join(makeblastdb_cmd))
+    #        report += "\n"+'running Make_BLAST_DB:'+"\n"
+    #        report += '    '+' '.join(makeblastdb_cmd)+"\n"
+
+            process_metrics = ProcessMetrics()
+            makeblastdb_metrics = process_metrics.run(makeblastdb_cmd,
+                                                      cwd = scratch_manager.job_dir,
+                                                      line_handler = subprocess_log.start(makeblastdb_cmd),
+                                                      limits = process_limits,
+                                                      stage = 'format_db',
+                                                      fasta_bytes = os.path.getsize(many_forward_reads_file_path))
+            makeblastdb_metrics['db_size_bytes'] = db_size_bytes(many_forward_reads_file_path)
+            returncode = makeblastdb_metrics['returncode']
+
+            self.log(console, 'return code: ' + str(returncode))
+            if returncode != 0:
+                raise ValueError('Error running makeblastdb, return code: '+str(returncode) + 
+                    '\n\n'+ '\n'.join(subprocess_log.get_tail()))
+
+            # Check for db output
+            if not os.path.isfile(many_forward_reads_file_path+".psq") and not os.path.isfile(many_forward_reads_file_path+".00.psq"):
+                raise ValueError("makeblastdb failed to create DB file '"+many_forward_reads_file_path+".psq'")
+            elif not os.path.getsize(many_forward_reads_file_path+".psq") > 0 and not os.path.getsize(many_forward_reads_file_path+".00.psq") > 0:
+                raise ValueError("makeblastdb created empty DB file '"+many_forward_reads_file_path+".psq'")
+
+
+            ### Construct the psiBLAST command
+            #
+            # OLD SYNTAX: blastpgp -j <rounds> -h <e_value_matrix> -z <database_size:e.g. 1e8> -q $q -G $G -E $E -m $m -e $e_value -v $limit -b $limit -K $limit -i $fasta_file -B <msa_file> -d $database -o $out_file
+            # NEW SYNTAX: psiblast -in_msa <msa_queryfile> -msa_master_idx <row_n> -db <basename> -out <out_aln_file> -outfmt 0/7 (8 became 7) -evalue <e_value> -dust no (DNA) -seg no (AA) -num_threads <num_cores>
+            #
+            stage_timer.start_stage('search')
+            blast_bin = self.psiBLAST
+
+            # check for necessary files
+            if not os.path.isfile(blast_bin):
+                raise ValueError("no such file '"+blast_bin+"'")
+            if not os.path.isfile(one_forward_reads_file_path):
+                raise ValueError("no such file '"+one_forward_reads_file_path+"'")
+            elif not os.path.getsize(one_forward_reads_file_path) > 0:
+                raise ValueError("empty file '"+one_forward_reads_file_path+"'")
+            if not os.path.isfile(input_MSA_file_path):
+                raise ValueError("no such file '"+input_MSA_file_path+"'")
+            elif not os.path.getsize(input_MSA_file_path) > 0:
+                raise ValueError("empty file '"+input_MSA_file_path+"'")
+            if not os.path.isfile(many_forward_reads_file_path):
+                raise ValueError("no such file '"+many_forward_reads_file_path+"'")
+            elif not os.path.getsize(many_forward_reads_file_path) > 0:
+                raise ValueError("empty file '"+many_forward_reads_file_path+"'")
+
+            # set the output path
+            output_dir = scratch_manager.stage_dir('search')
+            output_aln_file_path = os.path.join(output_dir, 'alnout.txt');
+            output_extra_file_path = os.path.join(output_dir, 'alnout_extra.txt');
+            output_filtered_fasta_file_path = os.path.join(output_dir, 'output_filtered.faa');
+
+            # this is command for extra output
+            extra_output = False
+            if 'output_extra_format' in params and params['output_extra_format'] != None and params['output_extra_format'] != '' and params['output_extra_format'] != 'none':
+                extra_output = True
+
+                blast_cmd = [blast_bin]
+                blast_cmd.append('-query')
+                blast_cmd.append(one_forward_reads_file_path)
+                blast_cmd.append('-db')
+                blast_cmd.append(many_forward_reads_file_path)
+                blast_cmd.append('-out')
+                blast_cmd.append(output_extra_file_path)
+                #blast_cmd.append('-html')  # HTML is a flag so doesn't get an arg val
+                blast_cmd.append('-outfmt')
+                blast_cmd.append(str(params['output_extra_format']))
+                blast_cmd.append('-evalue')
+                blast_cmd.append(str(params['e_value']))
+
+                # options (not allowed for format 0)
+                #if 'maxaccepts' in params:
+                #    if params['maxaccepts']:
+                #        blast_cmd.append('-max_target_seqs')
+                #        blast_cmd.append(str(params['maxaccepts']))
+
+                # Run BLAST, capture output as it happens
+                #
+                self.log(console, 'RUNNING BLAST (FOR EXTRA OUTPUT):')
+                self.log(console, '    '+' '.join(blast_cmd))
+                #        report += "\n"+'running BLAST:'+"\n"
+                #        report += '    '+' '.join(blast_cmd)+"\n"
+
+                BLAST_metrics = process_metrics.run(blast_cmd,
+                                                    cwd = scratch_manager.job_dir,
+                                                    line_handler = subprocess_log.start(blast_cmd),
+                                                    limits = process_limits,
+                                                    stage = 'search',
+                                                    outfmt = str(params['output_extra_format']),
+                                                    db_size_bytes = db_size_bytes(many_forward_reads_file_path))
+                returncode = BLAST_metrics['returncode']
+
+                self.log(console, 'return code: ' + str(returncode))
+                if returncode != 0:
+                    raise ValueError('Error running BLAST, return code: '+str(returncode) + 
+                    '\n\n'+ '\n'.join(subprocess_log.get_tail()))
+
+                # upload BLAST output
+                dfu = get_client(DFUClient, self.callbackURL)
+                try:
+                    extra_upload_ret = dfu.file_to_shock({'file_path': output_extra_file_path,
+    # DEBUG
+    #                                                      'make_handle': 0,
+    #                                                      'pack': 'zip'})
+                                                          'make_handle': 0})
+                except:
+                    raise ValueError ('error loading output_extra file to shock')
+
+
+            # this is command for basic search mode (with TAB TXT output)
             blast_cmd = [blast_bin]
-            blast_cmd.append('-query')
-            blast_cmd.append(one_forward_reads_file_path)
+    #        blast_cmd.append('-query')
+    #        blast_cmd.append(one_forward_reads_file_path)
+            blast_cmd.append('-in_msa')
+            blast_cmd.append(input_MSA_file_path)
+            blast_cmd.append('-msa_master_idx')
+            blast_cmd.append(str(master_row_idx))
             blast_cmd.append('-db')
             blast_cmd.append(many_forward_reads_file_path)
             blast_cmd.append('-out')
-            blast_cmd.append(output_extra_file_path)
-            #blast_cmd.append('-html')  # HTML is a flag so doesn't get an arg val
+            blast_cmd.append(output_aln_file_path)
             blast_cmd.append('-outfmt')
-            blast_cmd.append(str(params['output_extra_format']))
+            blast_cmd.append('7')
             blast_cmd.append('-evalue')
             blast_cmd.append(str(params['e_value']))
 
-            # options (not allowed for format 0)
-            #if 'maxaccepts' in params:
-            #    if params['maxaccepts']:
-            #        blast_cmd.append('-max_target_seqs')
-            #        blast_cmd.append(str(params['maxaccepts']))
+            # options
+            if 'maxaccepts' in params:
+                if params['maxaccepts']:
+                    blast_cmd.append('-max_target_seqs')
+                    blast_cmd.append(str(params['maxaccepts']))
 
             # Run BLAST, capture output as it happens
             #
-            self.log(console, 'RUNNING BLAST (FOR EXTRA OUTPUT):')
+            self.log(console, 'RUNNING BLAST:')
             self.log(console, '    '+' '.join(blast_cmd))
-            #        report += "\n"+'running BLAST:'+"\n"
-            #        report += '    '+' '.join(blast_cmd)+"\n"
-
-            p = subprocess.Popen(blast_cmd, \
-                             cwd = self.scratch, \
-                             stdout = subprocess.PIPE, \
-                             stderr = subprocess.STDOUT, \
-                             shell = False)
-
-            while True:
-                line = p.stdout.readline().decode()
-                if not line: break
-                self.log(console, line.replace('\n', ''))
-
-            p.stdout.close()
-            p.wait()
-            self.log(console, 'return code: ' + str(p.returncode))
-            if p.returncode != 0:
-                raise ValueError('Error running BLAST, return code: '+str(p.returncode) + 
-                '\n\n'+ '\n'.join(console))
+    #        report += "\n"+'running BLAST:'+"\n"
+    #        report += '    '+' '.join(blast_cmd)+"\n"
+
+            BLAST_metrics = process_metrics.run(blast_cmd,
+                                                cwd = scratch_manager.job_dir,
+                                                line_handler = subprocess_log.start(blast_cmd),
+                                                limits = process_limits,
+                                                stage = 'search',
+                                                outfmt = '7',
+                                                db_size_bytes = db_size_bytes(many_forward_reads_file_path))
+            returncode = BLAST_metrics['returncode']
+
+            self.log(console, 'return code: ' + str(returncode))
+            if returncode != 0:
+                raise ValueError('Error running BLAST, return code: '+str(returncode) + 
+                    '\n\n'+ '\n'.join(subprocess_log.get_tail()))
+            process_limits.check('parse')
 
             # upload BLAST output
-            dfu = DFUClient(self.callbackURL)
+            stage_timer.start_stage('upload')
+            dfu = get_client(DFUClient, self.callbackURL)
             try:
-                extra_upload_ret = dfu.file_to_shock({'file_path': output_extra_file_path,
-# DEBUG
-#                                                      'make_handle': 0,
-#                                                      'pack': 'zip'})
-                                                      'make_handle': 0})
+                base_upload_ret = dfu.file_to_shock({'file_path': output_aln_file_path,
+    # DEBUG
+    #                                                 'make_handle': 0,
+    #                                                 'pack': 'zip'})
+                                                     'make_handle': 0})
             except:
-                raise ValueError ('error loading output_extra file to shock')
-
-
-        # this is command for basic search mode (with TAB TXT output)
-        blast_cmd = [blast_bin]
-#        blast_cmd.append('-query')
-#        blast_cmd.append(one_forward_reads_file_path)
-        blast_cmd.append('-in_msa')
-        blast_cmd.append(input_MSA_file_path)
-        blast_cmd.append('-msa_master_idx')
-        blast_cmd.append(str(master_row_idx))
-        blast_cmd.append('-db')
-        blast_cmd.append(many_forward_reads_file_path)
-        blast_cmd.append('-out')
-        blast_cmd.append(output_aln_file_path)
-        blast_cmd.append('-outfmt')
-        blast_cmd.append('7')
-        blast_cmd.append('-evalue')
-        blast_cmd.append(str(params['e_value']))
-
-        # options
-        if 'maxaccepts' in params:
-            if params['maxaccepts']:
-                blast_cmd.append('-max_target_seqs')
-                blast_cmd.append(str(params['maxaccepts']))
-
-        # Run BLAST, capture output as it happens
-        #
-        self.log(console, 'RUNNING BLAST:')
-        self.log(console, '    '+' '.join(blast_cmd))
-#        report += "\n"+'running BLAST:'+"\n"
-#        report += '    '+' '.join(blast_cmd)+"\n"
-
-        p = subprocess.Popen(blast_cmd, \
-                             cwd = self.scratch, \
-                             stdout = subprocess.PIPE, \
-                             stderr = subprocess.STDOUT, \
-                             shell = False)
-
-        while True:
-            line = p.stdout.readline().decode()
-            if not line: break
-            self.log(console, line.replace('\n', ''))
-
-        p.stdout.close()
-        p.wait()
-        self.log(console, 'return code: ' + str(p.returncode))
-        if p.returncode != 0:
-            raise ValueError('Error running BLAST, return code: '+str(p.returncode) + 
-                '\n\n'+ '\n'.join(console))
-
-        # upload BLAST output
-        dfu = DFUClient(self.callbackURL)
-        try:
-            base_upload_ret = dfu.file_to_shock({'file_path': output_aln_file_path,
-# DEBUG
-#                                                 'make_handle': 0,
-#                                                 'pack': 'zip'})
-                                                 'make_handle': 0})
-        except:
-            raise ValueError ('error loading aln_out file to shock')
+                raise ValueError ('error loading aln_out file to shock')
 
 
-        # get query_len for filtering later
-        #
-        query_len = 0
-        with open(one_forward_reads_file_path, 'r') as query_file_handle:
-            for line in query_file_handle:
-                if line.startswith('>'):
-                    continue
-                query_len += len(re.sub(r" ","", line.rstrip())) 
+            # get query_len for filtering later
+            #
+            stage_timer.start_stage('parse')
+            query_len = 0
+            with open(one_forward_reads_file_path, 'r') as query_file_handle:
+                for line in query_file_handle:
+                    if line.startswith('>'):
+                        continue
+                    query_len += len(re.sub(r" ","", line.rstrip())) 
         
 
-        # Parse the BLAST tabular output and store ids to filter many set to make filtered object to save back to KBase
-        #
-        self.log(console, 'PARSING BLAST ALIGNMENT OUTPUT')
-        if not os.path.isfile(output_aln_file_path):
-            raise ValueError("failed to create BLAST output: "+output_aln_file_path)
-        elif not os.path.getsize(output_aln_file_path) > 0:
-            raise ValueError("created empty file for BLAST output: "+output_aln_file_path)
-        hit_seq_ids = dict()
-        accept_fids = dict()
-        output_aln_file_handle = open (output_aln_file_path, 'r')
-        output_aln_buf = output_aln_file_handle.readlines()
-        output_aln_file_handle.close()
-        hit_total = 0
-        high_bitscore_line = dict()
-        high_bitscore_score = dict()
-        high_bitscore_ident = dict()
-        high_bitscore_alnlen = dict()
-        hit_order = []
-        hit_buf = []
-        header_done = False
-        for line in output_aln_buf:
-            if line.startswith('#'):
-                if not header_done:
-                    hit_buf.append(line)
-                continue
-            header_done = True
-            #self.log(console,'HIT LINE: '+line)  # DEBUG
-            hit_info = line.split("\t")
-            hit_seq_id     = hit_info[1]
-            hit_ident      = float(hit_info[2]) / 100.0
-            hit_aln_len    = hit_info[3]
-            hit_mismatches = hit_info[4]
-            hit_gaps       = hit_info[5]
-            hit_q_beg      = hit_info[6]
-            hit_q_end      = hit_info[7]
-            hit_t_beg      = hit_info[8]
-            hit_t_end      = hit_info[9]
-            hit_e_value    = hit_info[10]
-            hit_bitscore   = hit_info[11]
-
-            # BLAST SOMETIMES ADDS THIS TO IDs.  NO IDEA WHY, BUT GET RID OF IT!
-            if hit_seq_id.startswith('gnl|'):
-                hit_seq_id = hit_seq_id[4:]
-
-            try:
-                if float(hit_bitscore) > float(high_bitscore_score[hit_seq_id]):
+            # Parse the BLAST tabular output and store ids to filter many set to make filtered object to save back to KBase
+            #
+            self.log(console, 'PARSING BLAST ALIGNMENT OUTPUT')
+            if not os.path.isfile(output_aln_file_path):
+                raise ValueError("failed to create BLAST output: "+output_aln_file_path)
+            elif not os.path.getsize(output_aln_file_path) > 0:
+                raise ValueError("created empty file for BLAST output: "+output_aln_file_path)
+            hit_seq_ids = dict()
+            accept_fids = dict()
+            output_aln_file_handle = open (output_aln_file_path, 'r')
+            output_aln_buf = output_aln_file_handle.readlines()
+            output_aln_file_handle.close()
+            hit_total = 0
+            high_bitscore_line = dict()
+            high_bitscore_score = dict()
+            high_bitscore_ident = dict()
+            high_bitscore_alnlen = dict()
+            hit_order = []
+            hit_buf = []
+            header_done = False
+            for line in output_aln_buf:
+                if line.startswith('#'):
+                    if not header_done:
+                        hit_buf.append(line)
+                    continue
+                header_done = True
+                #self.log(console,'HIT LINE: '+line)  # DEBUG
+                hit_info = line.split("\t")
+                hit_seq_id     = hit_info[1]
+                hit_ident      = float(hit_info[2]) / 100.0
+                hit_aln_len    = hit_info[3]
+                hit_mismatches = hit_info[4]
+                hit_gaps       = hit_info[5]
+                hit_q_beg      = hit_info[6]
+                hit_q_end      = hit_info[7]
+                hit_t_beg      = hit_info[8]
+                hit_t_end      = hit_info[9]
+                hit_e_value    = hit_info[10]
+                hit_bitscore   = hit_info[11]
+
+                # BLAST SOMETIMES ADDS THIS TO IDs.  NO IDEA WHY, BUT GET RID OF IT!
+                if hit_seq_id.startswith('gnl|'):
+                    hit_seq_id = hit_seq_id[4:]
+
+                try:
+                    if float(hit_bitscore) > float(high_bitscore_score[hit_seq_id]):
+                        high_bitscore_score[hit_seq_id] = hit_bitscore
+                        high_bitscore_ident[hit_seq_id] = hit_ident
+                        high_bitscore_alnlen[hit_seq_id] = hit_aln_len
+                        high_bitscore_line[hit_seq_id] = line
+                except:
+                    hit_order.append(hit_seq_id)
                     high_bitscore_score[hit_seq_id] = hit_bitscore
                     high_bitscore_ident[hit_seq_id] = hit_ident
                     high_bitscore_alnlen[hit_seq_id] = hit_aln_len
                     high_bitscore_line[hit_seq_id] = line
-            except:
-                hit_order.append(hit_seq_id)
-                high_bitscore_score[hit_seq_id] = hit_bitscore
-                high_bitscore_ident[hit_seq_id] = hit_ident
-                high_bitscore_alnlen[hit_seq_id] = hit_aln_len
-                high_bitscore_line[hit_seq_id] = line
-
-        filtering_fields = dict()
-        for hit_seq_id in hit_order:
-            hit_buf.append(high_bitscore_line[hit_seq_id])
-            filtering_fields[hit_seq_id] = dict()
-
-            #self.log(console,"HIT_SEQ_ID: '"+hit_seq_id+"'")
-            filter = False
-            #if 'ident_thresh' in params and float(params['ident_thresh']) > float(high_bit#score_ident[hit_seq_id]):
-            #    filter = True
-            #    filtering_fields[hit_seq_id]['ident_thresh'] = True
-            if 'bitscore' in params and float(params['bitscore']) > float(high_bitscore_score[hit_seq_id]):
-                filter = True
-                filtering_fields[hit_seq_id]['bitscore'] = True
-            if 'overlap_fraction' in params and float(params['overlap_fraction']) > 100*float(high_bitscore_alnlen[hit_seq_id])/float(query_len):
-                filter = True
-                filtering_fields[hit_seq_id]['overlap_fraction'] = True
-
-            if filter:
-                continue
+
+            filtering_fields = dict()
+            for hit_seq_id in hit_order:
+                hit_buf.append(high_bitscore_line[hit_seq_id])
+                filtering_fields[hit_seq_id] = dict()
+
+                #self.log(console,"HIT_SEQ_ID: '"+hit_seq_id+"'")
+                filter = False
+                #if 'ident_thresh' in params and float(params['ident_thresh']) > float(high_bit#score_ident[hit_seq_id]):
+                #    filter = True
+                #    filtering_fields[hit_seq_id]['ident_thresh'] = True
+                if 'bitscore' in params and float(params['bitscore']) > float(high_bitscore_score[hit_seq_id]):
+                    filter = True
+                    filtering_fields[hit_seq_id]['bitscore'] = True
+                if 'overlap_fraction' in params and float(params['overlap_fraction']) > 100*float(high_bitscore_alnlen[hit_seq_id])/float(query_len):
+                    filter = True
+                    filtering_fields[hit_seq_id]['overlap_fraction'] = True
+
+                if filter:
+                    continue
             
-            hit_total += 1
-            hit_seq_ids[hit_seq_id] = True
-            self.log(console, "HIT: '"+hit_seq_id+"'")  # DEBUG
+                hit_total += 1
+                hit_seq_ids[hit_seq_id] = True
+                hit_log.limited(console, 'HIT', "HIT: '"+hit_seq_id+"'")
         
 
-        self.log(console, 'EXTRACTING HITS FROM INPUT')
-        self.log(console, 'MANY_TYPE_NAME: '+many_type_name)  # DEBUG
-
-
-        # SequenceSet input -> SequenceSet output
-        #
-        if many_type_name == 'SequenceSet':
-            seq_total = len(input_many_sequenceSet['sequences'])
+            self.log(console, 'EXTRACTING HITS FROM INPUT')
+            self.log(console, 'MANY_TYPE_NAME: '+many_type_name)  # DEBUG
 
-            output_sequenceSet = dict()
-
-            if 'sequence_set_id' in input_many_sequenceSet and input_many_sequenceSet['sequence_set_id'] != None:
-                output_sequenceSet['sequence_set_id'] = input_many_sequenceSet['sequence_set_id'] + "."+search_tool_name+"_Search_filtered"
-            else:
-                output_sequenceSet['sequence_set_id'] = search_tool_name+"_Search_filtered"
-            if 'description' in input_many_sequenceSet and input_many_sequenceSet['description'] != None:
-                output_sequenceSet['description'] = input_many_sequenceSet['description'] + " - "+search_tool_name+"_Search filtered"
-            else:
-                output_sequenceSet['description'] = search_tool_name+"_Search filtered"
 
-            self.log(console,"ADDING SEQUENCES TO SEQUENCESET")
-            output_sequenceSet['sequences'] = []
+            # SequenceSet input -> SequenceSet output
+            #
+            if many_type_name == 'SequenceSet':
+                seq_total = len(input_many_sequenceSet['sequences'])
 
-            for seq_obj in input_many_sequenceSet['sequences']:
-                header_id = seq_obj['sequence_id']
-                #header_desc = seq_obj['description']
-                #sequence_str = seq_obj['sequence']
+                output_sequenceSet = dict()
 
-                id_untrans = header_id
-                id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
-                if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
-                    #self.log(console, 'FOUND HIT '+header_id)  # DEBUG
-                    accept_fids[id_untrans] = True
-                    output_sequenceSet['sequences'].append(seq_obj)
+                if 'sequence_set_id' in input_many_sequenceSet and input_many_sequenceSet['sequence_set_id'] != None:
+                    output_sequenceSet['sequence_set_id'] = input_many_sequenceSet['sequence_set_id'] + "."+search_tool_name+"_Search_filtered"
+                else:
+                    output_sequenceSet['sequence_set_id'] = search_tool_name+"_Search_filtered"
+                if 'description' in input_many_sequenceSet and input_many_sequenceSet['description'] != None:
+                    output_sequenceSet['description'] = input_many_sequenceSet['description'] + " - "+search_tool_name+"_Search filtered"
+                else:
+                    output_sequenceSet['description'] = search_tool_name+"_Search filtered"
 
+                self.log(console,"ADDING SEQUENCES TO SEQUENCESET")
+                output_sequenceSet['sequences'] = []
 
-        # FeatureSet input -> FeatureSet output
-        #
-        elif many_type_name == 'FeatureSet':
-            seq_total = len(list(input_many_featureSet['elements'].keys()))
+                for seq_obj in input_many_sequenceSet['sequences']:
+                    header_id = seq_obj['sequence_id']
+                    #header_desc = seq_obj['description']
+                    #sequence_str = seq_obj['sequence']
 
-            output_featureSet = dict()
-            if 'description' in input_many_featureSet and input_many_featureSet['description'] != None:
-                output_featureSet['description'] = input_many_featureSet['description'] + " - "+search_tool_name+"_Search filtered"
-            else:
-                output_featureSet['description'] = search_tool_name+"_Search filtered"
-            output_featureSet['element_ordering'] = []
-            output_featureSet['elements'] = dict()
-
-            fId_list = list(input_many_featureSet['elements'].keys())
-            self.log(console,"ADDING FEATURES TO FEATURESET")
-            for fId in sorted(fId_list):
-                for genome_ref in input_many_featureSet['elements'][fId]:
-                    id_untrans = genome_ref+genome_id_feature_id_delim+fId
+                    id_untrans = header_id
                     id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
                     if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
-                        #self.log(console, 'FOUND HIT '+fId)  # DEBUG
+                        #self.log(console, 'FOUND HIT '+header_id)  # DEBUG
                         accept_fids[id_untrans] = True
-                        #fId = id_untrans  # don't change fId for output FeatureSet
-                        try:
-                            this_genome_ref_list = output_featureSet['elements'][fId]
-                        except:
-                            output_featureSet['elements'][fId] = []
-                            output_featureSet['element_ordering'].append(fId)
-                        output_featureSet['elements'][fId].append(genome_ref)
-
-        # Parse Genome hits into FeatureSet
-        #
-        elif many_type_name == 'Genome':
-            seq_total = 0
-            output_featureSet = dict()
-#            if 'scientific_name' in input_many_genome and input_many_genome['scientific_name'] != None:
-#                output_featureSet['description'] = input_many_genome['scientific_name'] + " - "+search_tool_name+"_Search filtered"
-#            else:
-#                output_featureSet['description'] = search_tool_name+"_Search filtered"
-            output_featureSet['description'] = search_tool_name+"_Search filtered"
-            output_featureSet['element_ordering'] = []
-            output_featureSet['elements'] = dict()
-            for fid in feature_ids:
-                seq_total += 1
-                id_untrans = fid
-                id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
-                if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
-                    #self.log(console, 'FOUND HIT '+fid)  # DEBUG
-                    #output_featureSet['element_ordering'].append(fid)
-                    accept_fids[id_untrans] = True
-                    #fid = input_many_ref+genome_id_feature_id_delim+id_untrans  # don't change fId for output FeatureSet
-                    output_featureSet['element_ordering'].append(fid)
-                    output_featureSet['elements'][fid] = [input_many_ref]
-
-        # Parse GenomeSet hits into FeatureSet
-        #
-        elif many_type_name == 'GenomeSet':
-            seq_total = 0
+                        output_sequenceSet['sequences'].append(seq_obj)
 
-            output_featureSet = dict()
-            if 'description' in input_many_genomeSet and input_many_genomeSet['description'] != None:
-                output_featureSet['description'] = input_many_genomeSet['description'] + " - "+search_tool_name+"_Search filtered"
-            else:
+
+            # FeatureSet input -> FeatureSet output
+            #
+            elif many_type_name == 'FeatureSet':
+                seq_total = len(list(input_many_featureSet['elements'].keys()))
+
+                output_featureSet = dict()
+                if 'description' in input_many_featureSet and input_many_featureSet['description'] != None:
+                    output_featureSet['description'] = input_many_featureSet['description'] + " - "+search_tool_name+"_Search filtered"
+                else:
+                    output_featureSet['description'] = search_tool_name+"_Search filtered"
+                output_featureSet['element_ordering'] = []
+                output_featureSet['elements'] = dict()
+
+                fId_list = list(input_many_featureSet['elements'].keys())
+                self.log(console,"ADDING FEATURES TO FEATURESET")
+                for fId in sorted(fId_list):
+                    for genome_ref in input_many_featureSet['elements'][fId]:
+                        id_untrans = genome_ref+genome_id_feature_id_delim+fId
+                        id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
+                        if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
+                            #self.log(console, 'FOUND HIT '+fId)  # DEBUG
+                            accept_fids[id_untrans] = True
+                            #fId = id_untrans  # don't change fId for output FeatureSet
+                            try:
+                                this_genome_ref_list = output_featureSet['elements'][fId]
+                            except:
+                                output_featureSet['elements'][fId] = []
+                                output_featureSet['element_ordering'].append(fId)
+                            output_featureSet['elements'][fId].append(genome_ref)
+
+            # Parse Genome hits into FeatureSet
+            #
+            elif many_type_name == 'Genome':
+                seq_total = 0
+                output_featureSet = dict()
+    #            if 'scientific_name' in input_many_genome and input_many_genome['scientific_name'] != None:
+    #                output_featureSet['description'] = input_many_genome['scientific_name'] + " - "+search_tool_name+"_Search filtered"
+    #            else:
+    #                output_featureSet['description'] = search_tool_name+"_Search filtered"
                 output_featureSet['description'] = search_tool_name+"_Search filtered"
-            output_featureSet['element_ordering'] = []
-            output_featureSet['elements'] = dict()
-
-            self.log(console,"READING HITS FOR GENOMES")  # DEBUG
-            for genome_id in list(feature_ids_by_genome_id.keys()):
-                self.log(console,"READING HITS FOR GENOME "+genome_id)  # DEBUG
-                genome_ref = input_many_genomeSet['elements'][genome_id]['ref']
-                for feature_id in feature_ids_by_genome_id[genome_id]:
+                output_featureSet['element_ordering'] = []
+                output_featureSet['elements'] = dict()
+                for fid in feature_ids:
                     seq_total += 1
-                    id_untrans = genome_ref+genome_id_feature_id_delim+feature_id
+                    id_untrans = fid
                     id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
                     if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
-                        #self.log(console, 'FOUND HIT: '+feature['id'])  # DEBUG
-                        #output_featureSet['element_ordering'].append(feature['id'])
+                        #self.log(console, 'FOUND HIT '+fid)  # DEBUG
+                        #output_featureSet['element_ordering'].append(fid)
                         accept_fids[id_untrans] = True
-                        #feature_id = id_untrans  # don't change fId for output FeatureSet
-                        try:
-                            this_genome_ref_list = output_featureSet['elements'][feature_id]
-                        except:
-                            output_featureSet['elements'][feature_id] = []
-                            output_featureSet['element_ordering'].append(feature_id)
-                        output_featureSet['elements'][feature_id].append(genome_ref)
+                        #fid = input_many_ref+genome_id_feature_id_delim+id_untrans  # don't change fId for output FeatureSet
+                        output_featureSet['element_ordering'].append(fid)
+                        output_featureSet['elements'][fid] = [input_many_ref]
 
+            # Parse GenomeSet hits into FeatureSet
+            #
+            elif many_type_name == 'GenomeSet':
+                seq_total = 0
+
+                output_featureSet = dict()
+                if 'description' in input_many_genomeSet and input_many_genomeSet['description'] != None:
+                    output_featureSet['description'] = input_many_genomeSet['description'] + " - "+search_tool_name+"_Search filtered"
+                else:
+                    output_featureSet['description'] = search_tool_name+"_Search filtered"
+                output_featureSet['element_ordering'] = []
+                output_featureSet['elements'] = dict()
+
+                self.log(console,"READING HITS FOR GENOMES")  # DEBUG
+                for genome_id in list(feature_ids_by_genome_id.keys()):
+                    self.log(console,"READING HITS FOR GENOME "+genome_id)  # DEBUG
+                    genome_ref = input_many_genomeSet['elements'][genome_id]['ref']
+                    for feature_id in feature_ids_by_genome_id[genome_id]:
+                        seq_total += 1
+                        id_untrans = genome_ref+genome_id_feature_id_delim+feature_id
+                        id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
+                        if id_trans in hit_seq_ids or id_untrans in hit_seq_ids:
+                            #self.log(console, 'FOUND HIT: '+feature['id'])  # DEBUG
+                            #output_featureSet['element_ordering'].append(feature['id'])
+                            accept_fids[id_untrans] = True
+                            #feature_id = id_untrans  # don't change fId for output FeatureSet
+                            try:
+                                this_genome_ref_list = output_featureSet['elements'][feature_id]
+                            except:
+                                output_featureSet['elements'][feature_id] = []
+                                output_featureSet['element_ordering'].append(feature_id)
+                            output_featureSet['elements'][feature_id].append(genome_ref)
 
-        # load the method provenance from the context object
-        #
-        self.log(console,"SETTING PROVENANCE")  # DEBUG
-        provenance = [{}]
-        if 'provenance' in ctx:
-            provenance = ctx['provenance']
-        # add additional info to provenance here, in this case the input data object reference
-        provenance[0]['input_ws_objects'] = []
-        #provenance[0]['input_ws_objects'].append(input_one_ref)
-        provenance[0]['input_ws_objects'].append(input_msa_ref)
-        provenance[0]['input_ws_objects'].append(input_many_ref)
-        provenance[0]['service'] = 'kb_blast'
-        provenance[0]['method'] = search_tool_name+'_Search'
 
+            # load the method provenance from the context object
+            #
+            stage_timer.start_stage('save')
+            self.log(console,"SETTING PROVENANCE")  # DEBUG
+            provenance = [{}]
+            if 'provenance' in ctx:
+                provenance = ctx['provenance']
+            # add additional info to provenance here, in this case the input data object reference
+            provenance[0]['input_ws_objects'] = []
+            #provenance[0]['input_ws_objects'].append(input_one_ref)
+            provenance[0]['input_ws_objects'].append(input_msa_ref)
+            provenance[0]['input_ws_objects'].append(input_many_ref)
+            provenance[0]['service'] = 'kb_blast'
+            provenance[0]['method'] = search_tool_name+'_Search'
 
-        # Upload results
-        #
-        if len(invalid_msgs) == 0 and len(list(hit_seq_ids.keys())) > 0:
-            self.log(console,"UPLOADING RESULTS")  # DEBUG
 
-            # input many SequenceSet -> save SequenceSet
+            # Upload results
             #
-            if many_type_name == 'SequenceSet':
-                new_obj_info = ws.save_objects({
-                            'workspace': params['workspace_name'],
-                            'objects':[{
-                                    'type': 'KBaseSequences.SequenceSet',
-                                    'data': output_sequenceSet,
-                                    'name': params['output_filtered_name'],
-                                    'meta': {},
-                                    'provenance': provenance
-                                }]
-                        })[0]
+            process_limits.check('save')
+            if len(invalid_msgs) == 0 and len(list(hit_seq_ids.keys())) > 0:
+                self.log(console,"UPLOADING RESULTS")  # DEBUG
 
-            else:  # input FeatureSet, Genome, and GenomeSet -> upload FeatureSet output
-                new_obj_info = ws.save_objects({
-                            'workspace': params['workspace_name'],
-                            'objects':[{
-                                    'type': 'KBaseCollections.FeatureSet',
-                                    'data': output_featureSet,
-                                    'name': params['output_filtered_name'],
-                                    'meta': {},
-                                    'provenance': provenance
-                                }]
-                        })[0]
+                # input many SequenceSet -> save SequenceSet
+                #
+                if many_type_name == 'SequenceSet':
+                    new_obj_info = ws.save_objects({
+                                'workspace': params['workspace_name'],
+                                'objects':[{
+                                        'type': 'KBaseSequences.SequenceSet',
+                                        'data': output_sequenceSet,
+                                        'name': params['output_filtered_name'],
+                                        'meta': {},
+                                        'provenance': provenance
+                                    }]
+                            })[0]
+
+                else:  # input FeatureSet, Genome, and GenomeSet -> upload FeatureSet output
+                    new_obj_info = ws.save_objects({
+                                'workspace': params['workspace_name'],
+                                'objects':[{
+                                        'type': 'KBaseCollections.FeatureSet',
+                                        'data': output_featureSet,
+                                        'name': params['output_filtered_name'],
+                                        'meta': {},
+                                        'provenance': provenance
+                                    }]
+                            })[0]
 
 
-        # build output report object
-        #
-        self.log(console,"BUILDING REPORT")  # DEBUG
-        if len(invalid_msgs) == 0 and len(hit_order) > 0:
-
-            # text report
+            # build output report object
             #
-            report += 'sequences in search db: '+str(seq_total)+"\n"
-            report += 'sequences in hit set: '+str(len(hit_order))+"\n"
-            report += 'sequences in accepted hit set: '+str(hit_total)+"\n"
-            report += "\n"
-            for line in hit_buf:
-                report += line
-            self.log (console, report)
-
-
-            # build html report
-            if many_type_name == 'Genome':
-                feature_id_to_function = GenomeToFASTA_retVal['feature_id_to_function']
-                genome_ref_to_sci_name = GenomeToFASTA_retVal['genome_ref_to_sci_name']
-            elif many_type_name == 'GenomeSet':
-                feature_id_to_function = GenomeSetToFASTA_retVal['feature_id_to_function']
-                genome_ref_to_sci_name = GenomeSetToFASTA_retVal['genome_ref_to_sci_name']
-            elif many_type_name == 'FeatureSet':
-                feature_id_to_function = FeatureSetToFASTA_retVal['feature_id_to_function']
-                genome_ref_to_sci_name = FeatureSetToFASTA_retVal['genome_ref_to_sci_name']
+            self.log(console,"BUILDING REPORT")  # DEBUG
+            process_limits.check('report')
+            stage_timer.start_stage('report')
+            if len(invalid_msgs) == 0 and len(hit_order) > 0:
+
+                # text report
+                #
+                report += 'sequences in search db: '+str(seq_total)+"\n"
+                report += 'sequences in hit set: '+str(len(hit_order))+"\n"
+                report += 'sequences in accepted hit set: '+str(hit_total)+"\n"
+                report += "\n"
+                for line in hit_buf:
+                    report += line
+                self.log (console, report)
+
+
+                # build html report
+                if many_type_name == 'Genome':
+                    feature_id_to_function = GenomeToFASTA_retVal['feature_id_to_function']
+                    genome_ref_to_sci_name = GenomeToFASTA_retVal['genome_ref_to_sci_name']
+                elif many_type_name == 'GenomeSet':
+                    feature_id_to_function = GenomeSetToFASTA_retVal['feature_id_to_function']
+                    genome_ref_to_sci_name = GenomeSetToFASTA_retVal['genome_ref_to_sci_name']
+                elif many_type_name == 'FeatureSet':
+                    feature_id_to_function = FeatureSetToFASTA_retVal['feature_id_to_function']
+                    genome_ref_to_sci_name = FeatureSetToFASTA_retVal['genome_ref_to_sci_name']
                 
-            head_color = "#eeeeff"
-            border_head_color = "#ffccff"
-            accept_row_color = 'white'
-            #reject_row_color = '#ffeeee'
-            reject_row_color = '#eeeeee'
-            reject_cell_color = '#ffcccc'
-            text_fontsize = "2"
-            text_color = '#606060'
-            border_body_color = "#cccccc"
-            bar_width = 100
-            bar_height = 15
-            bar_color = "lightblue"
-            bar_line_color = "#cccccc"
-            bar_fontsize = "1"
-            bar_char = "."
-            cellpadding = "3"
-            cellspacing = "2"
-            border = "0"
-
-            html_report_lines = []
-            html_report_lines += ['<html>']
-            html_report_lines += ['<body bgcolor="white">']
-            html_report_lines += ['<table cellpadding='+cellpadding+' cellspacing = '+cellspacing+' border='+border+'>']
-            html_report_lines += ['<tr bgcolor="'+head_color+'">']
-            html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'ALIGNMENT COVERAGE'+'</font></td>']
-            html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'GENE ID'+'</font></td>']
-            html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'FUNCTION'+'</font></td>']
-            html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'GENOME'+'</font></td>']
-            html_report_lines += ['<td align=center style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'IDENT'+'%</font></td>']
-            html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'ALN_LEN'+'</font></td>']
-            html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'E-VALUE'+'</font></td>']
-            html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'BIT SCORE'+'</font></td>']
-            html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'<nobr>Q_BEG-Q_END:</nobr> <nobr>H_BEG-H_END</nobr>'+'</font></td>']
-            html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'MIS MATCH'+'</font></td>']
-            html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'GAP OPEN'+'</font></td>']
-            html_report_lines += ['</tr>']
-
-            for line in hit_buf:
-                line = line.strip()
-                if line == '' or line.startswith('#'):
-                    continue
-
-                [query_id, hit_id, identity, aln_len, mismatches, gap_openings, q_beg, q_end, h_beg, h_end, e_value, bit_score] = line.split("\t")[0:12]
-
-                aln_len_perc = round (100.0*float(aln_len)/float(query_len), 1)
-                identity = str(round(float(identity), 1))
-                if identity == '100.0':  identity = '100'
-
-                #if many_type_name == 'SingleEndLibrary':
-                #    pass
-                #elif many_type_name == 'SequenceSet':
-                if many_type_name == 'SequenceSet':
-                    pass
-                elif many_type_name == 'Genome' or \
-                        many_type_name == 'GenomeSet' or \
-                        many_type_name == 'FeatureSet':
-
-                    if many_type_name != 'Genome':
-                        [genome_ref, hit_fid] = hit_id.split(genome_id_feature_id_delim)
-                    else:
-                        genome_ref = input_many_ref
-                        hit_fid = hit_id
-
-                    # can't just use hit_fid because may have pipes translated and can't translate back
-                    fid_lookup = None
-                    for fid in list(feature_id_to_function[genome_ref].keys()):
-                        id_untrans = fid
-                        id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
-
-                        #self.log (console, "SCANNING FIDS.  HIT_FID: '"+str(hit_fid)+"' FID: '"+str(fid)+"' TRANS: '"+str(id_trans)+"'")  # DEBUG
-
-                        if id_untrans == hit_fid or id_trans == hit_fid:
-                            #self.log (console, "GOT ONE!")  # DEBUG
-                            if many_type_name == 'Genome':
-                                accept_id = fid
-                            elif many_type_name == 'GenomeSet' or many_type_name == 'FeatureSet':
-                                accept_id = genome_ref+genome_id_feature_id_delim+fid
-                            if accept_id in accept_fids:
-                                row_color = accept_row_color
-                            else:
-                                row_color = reject_row_color
-                            fid_lookup = fid
-                            break
-                    #self.log (console, "HIT_FID: '"+str(hit_fid)+"' FID_LOOKUP: '"+str(fid_lookup)+"'")  # DEBUG
-                    if fid_lookup == None:
-                        raise ValueError ("unable to find fid for hit_fid: '"+str(hit_fid))
-                    elif fid_lookup not in feature_id_to_function[genome_ref]:
-                        raise ValueError ("unable to find function for fid: '"+str(fid_lookup))
-                    fid_disp = re.sub (r"^.*\.([^\.]+)\.([^\.]+)$", r"\1.\2", fid_lookup)
-
-                    func_disp = feature_id_to_function[genome_ref][fid_lookup]
-                    genome_sci_name = genome_ref_to_sci_name[genome_ref]
-
-                    #if 'overlap_fraction' in params and float(params['overlap_fraction']) > float(high_bitscore_alnlen[hit_seq_id])/float(query_len):
-
-                    html_report_lines += ['<tr bgcolor="'+row_color+'">']
-                    #html_report_lines += ['<tr bgcolor="'+'white'+'">']  # DEBUG
-                    # add overlap bar
-
-                    # coverage graphic
-                    html_report_lines += ['<td valign=middle align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'">']
-                    html_report_lines += ['<table style="height:'+str(bar_height)+'px; width:'+str(bar_width)+'px" border=0 cellpadding=0 cellspacing=0>']
-                    full_len_pos = bar_width
-                    aln_beg_pos = int (float(bar_width) * float(int(q_beg)-1)/float(int(query_len)-1))
-                    aln_end_pos = int (float(bar_width) * float(int(q_end)-1)/float(int(query_len)-1))
-                    cell_pix_height = str(int(round(float(bar_height)/3.0, 0)))
-
-                    cell_color = ['','','']
-                    cell_width = []
-                    cell_width.append(aln_beg_pos)
-                    cell_width.append(aln_end_pos-aln_beg_pos)
-                    cell_width.append(bar_width-aln_end_pos)
-
-                    for row_i in range(3):
-                        html_report_lines += ['<tr style="height:'+cell_pix_height+'px">']
-                        unalign_color = row_color
-                        if row_i == 1:
-                            unalign_color = bar_line_color
-                        cell_color[0] = unalign_color
-                        cell_color[1] = bar_color
-                        cell_color[2] = unalign_color
-
-                        for col_i in range(3):
-                            cell_pix_width = str(cell_width[col_i])
-                            cell_pix_color = cell_color[col_i]
-                            html_report_lines += ['<td style="height:'+cell_pix_height+'px; width:'+cell_pix_width+'px" bgcolor="'+cell_pix_color+'"></td>']
+                head_color = "#eeeeff"
+                border_head_color = "#ffccff"
+                accept_row_color = 'white'
+                #reject_row_color = '#ffeeee'
+                reject_row_color = '#eeeeee'
+                reject_cell_color = '#ffcccc'
+                text_fontsize = "2"
+                text_color = '#606060'
+                border_body_color = "#cccccc"
+                bar_width = 100
+                bar_height = 15
+                bar_color = "lightblue"
+                bar_line_color = "#cccccc"
+                bar_fontsize = "1"
+                bar_char = "."
+                cellpadding = "3"
+                cellspacing = "2"
+                border = "0"
+
+                html_report_lines = []
+                html_report_lines += ['<html>']
+                html_report_lines += ['<body bgcolor="white">']
+                html_report_lines += ['<table cellpadding='+cellpadding+' cellspacing = '+cellspacing+' border='+border+'>']
+                html_report_lines += ['<tr bgcolor="'+head_color+'">']
+                html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'ALIGNMENT COVERAGE'+'</font></td>']
+                html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'GENE ID'+'</font></td>']
+                html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'FUNCTION'+'</font></td>']
+                html_report_lines += ['<td style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'GENOME'+'</font></td>']
+                html_report_lines += ['<td align=center style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'IDENT'+'%</font></td>']
+                html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'ALN_LEN'+'</font></td>']
+                html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'E-VALUE'+'</font></td>']
+                html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'BIT SCORE'+'</font></td>']
+                html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'<nobr>Q_BEG-Q_END:</nobr> <nobr>H_BEG-H_END</nobr>'+'</font></td>']
+                html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'MIS MATCH'+'</font></td>']
+                html_report_lines += ['<td align=center  style="border-right:solid 2px '+border_head_color+'; border-bottom:solid 2px '+border_head_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+'GAP OPEN'+'</font></td>']
+                html_report_lines += ['</tr>']
+
+                for line in hit_buf:
+                    line = line.strip()
+                    if line == '' or line.startswith('#'):
+                        continue
+
+                    [query_id, hit_id, identity, aln_len, mismatches, gap_openings, q_beg, q_end, h_beg, h_end, e_value, bit_score] = line.split("\t")[0:12]
+
+                    aln_len_perc = round (100.0*float(aln_len)/float(query_len), 1)
+                    identity = str(round(float(identity), 1))
+                    if identity == '100.0':  identity = '100'
+
+                    #if many_type_name == 'SingleEndLibrary':
+                    #    pass
+                    #elif many_type_name == 'SequenceSet':
+                    if many_type_name == 'SequenceSet':
+                        pass
+                    elif many_type_name == 'Genome' or \
+                            many_type_name == 'GenomeSet' or \
+                            many_type_name == 'FeatureSet':
+
+                        if many_type_name != 'Genome':
+                            [genome_ref, hit_fid] = hit_id.split(genome_id_feature_id_delim)
+                        else:
+                            genome_ref = input_many_ref
+                            hit_fid = hit_id
+
+                        # can't just use hit_fid because may have pipes translated and can't translate back
+                        fid_lookup = None
+                        for fid in list(feature_id_to_function[genome_ref].keys()):
+                            id_untrans = fid
+                            id_trans = re.sub ('\|',':',id_untrans)  # BLAST seems to make this translation now when id format has simple 'kb|blah' format
+
+                            #self.log (console, "SCANNING FIDS.  HIT_FID: '"+str(hit_fid)+"' FID: '"+str(fid)+"' TRANS: '"+str(id_trans)+"'")  # DEBUG
+
+                            if id_untrans == hit_fid or id_trans == hit_fid:
+                                #self.log (console, "GOT ONE!")  # DEBUG
+                                if many_type_name == 'Genome':
+                                    accept_id = fid
+                                elif many_type_name == 'GenomeSet' or many_type_name == 'FeatureSet':
+                                    accept_id = genome_ref+genome_id_feature_id_delim+fid
+                                if accept_id in accept_fids:
+                                    row_color = accept_row_color
+                                else:
+                                    row_color = reject_row_color
+                                fid_lookup = fid
+                                break
+                        #self.log (console, "HIT_FID: '"+str(hit_fid)+"' FID_LOOKUP: '"+str(fid_lookup)+"'")  # DEBUG
+                        if fid_lookup == None:
+                            raise ValueError ("unable to find fid for hit_fid: '"+str(hit_fid))
+                        elif fid_lookup not in feature_id_to_function[genome_ref]:
+                            raise ValueError ("unable to find function for fid: '"+str(fid_lookup))
+                        fid_disp = re.sub (r"^.*\.([^\.]+)\.([^\.]+)$", r"\1.\2", fid_lookup)
+
+                        func_disp = feature_id_to_function[genome_ref][fid_lookup]
+                        genome_sci_name = genome_ref_to_sci_name[genome_ref]
+
+                        #if 'overlap_fraction' in params and float(params['overlap_fraction']) > float(high_bitscore_alnlen[hit_seq_id])/float(query_len):
+
+                        html_report_lines += ['<tr bgcolor="'+row_color+'">']
+                        #html_report_lines += ['<tr bgcolor="'+'white'+'">']  # DEBUG
+                        # add overlap bar
+
+                        # coverage graphic
+                        html_report_lines += ['<td valign=middle align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'">']
+                        html_report_lines += ['<table style="height:'+str(bar_height)+'px; width:'+str(bar_width)+'px" border=0 cellpadding=0 cellspacing=0>']
+                        full_len_pos = bar_width
+                        aln_beg_pos = int (float(bar_width) * float(int(q_beg)-1)/float(int(query_len)-1))
+                        aln_end_pos = int (float(bar_width) * float(int(q_end)-1)/float(int(query_len)-1))
+                        cell_pix_height = str(int(round(float(bar_height)/3.0, 0)))
+
+                        cell_color = ['','','']
+                        cell_width = []
+                        cell_width.append(aln_beg_pos)
+                        cell_width.append(aln_end_pos-aln_beg_pos)
+                        cell_width.append(bar_width-aln_end_pos)
+
+                        for row_i in range(3):
+                            html_report_lines += ['<tr style="height:'+cell_pix_height+'px">']
+                            unalign_color = row_color
+                            if row_i == 1:
+                                unalign_color = bar_line_color
+                            cell_color[0] = unalign_color
+                            cell_color[1] = bar_color
+                            cell_color[2] = unalign_color
+
+                            for col_i in range(3):
+                                cell_pix_width = str(cell_width[col_i])
+                                cell_pix_color = cell_color[col_i]
+                                html_report_lines += ['<td style="height:'+cell_pix_height+'px; width:'+cell_pix_width+'px" bgcolor="'+cell_pix_color+'"></td>']
+                            html_report_lines += ['</tr>']
+                        html_report_lines += ['</table>']
+                        html_report_lines += ['</td>']
+
+                        # add other cells
+                        # fid
+                        html_report_lines += ['<td style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(fid_disp)+'</font></td>']
+                        # func
+                        html_report_lines += ['<td style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+func_disp+'</font></td>']
+                        # sci name
+                        html_report_lines += ['<td style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+genome_sci_name+'</font></td>']
+                        # ident
+                        if 'ident_thresh' in filtering_fields[hit_id]:
+                            this_cell_color = reject_cell_color
+                        else:
+                            this_cell_color = row_color
+                        html_report_lines += ['<td align=center bgcolor="'+this_cell_color+'" style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(identity)+'%</font></td>']
+                        # aln len
+                        if 'overlap_fraction' in filtering_fields[hit_id]:
+                            this_cell_color = reject_cell_color
+                        else:
+                            this_cell_color = row_color
+                        html_report_lines += ['<td align=center bgcolor="'+this_cell_color+'" style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(aln_len)+' ('+str(aln_len_perc)+'%)</font></td>']
+                        # evalue
+                        html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'><nobr>'+str(e_value)+'</nobr></font></td>']
+                        # bit score
+                        if 'bitscore' in filtering_fields[hit_id]:
+                            this_cell_color = reject_cell_color
+                        else:
+                            this_cell_color = row_color
+                        html_report_lines += ['<td align=center bgcolor="'+this_cell_color+'" style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(bit_score)+'</font></td>']
+                        # aln coords
+                        html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'><nobr>'+str(q_beg)+'-'+str(q_end)+':</nobr> <nobr>'+str(h_beg)+'-'+str(h_end)+'</nobr></font></td>']
+                        # mismatches
+                        html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(mismatches)+'</font></td>']
+                        # gaps
+                        html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(gap_openings)+'</font></td>']
                         html_report_lines += ['</tr>']
-                    html_report_lines += ['</table>']
-                    html_report_lines += ['</td>']
-
-                    # add other cells
-                    # fid
-                    html_report_lines += ['<td style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(fid_disp)+'</font></td>']
-                    # func
-                    html_report_lines += ['<td style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+func_disp+'</font></td>']
-                    # sci name
-                    html_report_lines += ['<td style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+genome_sci_name+'</font></td>']
-                    # ident
-                    if 'ident_thresh' in filtering_fields[hit_id]:
-                        this_cell_color = reject_cell_color
-                    else:
-                        this_cell_color = row_color
-                    html_report_lines += ['<td align=center bgcolor="'+this_cell_color+'" style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(identity)+'%</font></td>']
-                    # aln len
-                    if 'overlap_fraction' in filtering_fields[hit_id]:
-                        this_cell_color = reject_cell_color
-                    else:
-                        this_cell_color = row_color
-                    html_report_lines += ['<td align=center bgcolor="'+this_cell_color+'" style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(aln_len)+' ('+str(aln_len_perc)+'%)</font></td>']
-                    # evalue
-                    html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'><nobr>'+str(e_value)+'</nobr></font></td>']
-                    # bit score
-                    if 'bitscore' in filtering_fields[hit_id]:
-                        this_cell_color = reject_cell_color
-                    else:
-                        this_cell_color = row_color
-                    html_report_lines += ['<td align=center bgcolor="'+this_cell_color+'" style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(bit_score)+'</font></td>']
-                    # aln coords
-                    html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'><nobr>'+str(q_beg)+'-'+str(q_end)+':</nobr> <nobr>'+str(h_beg)+'-'+str(h_end)+'</nobr></font></td>']
-                    # mismatches
-                    html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(mismatches)+'</font></td>']
-                    # gaps
-                    html_report_lines += ['<td align=center style="border-right:solid 1px '+border_body_color+'; border-bottom:solid 1px '+border_body_color+'"><font color="'+text_color+'" size='+text_fontsize+'>'+str(gap_openings)+'</font></td>']
-                    html_report_lines += ['</tr>']
-
-            html_report_lines += ['</table>']
-            html_report_lines += ['</body>']
-            html_report_lines += ['</html>']
-
-            # write html to file and upload
-            html_report_str = "\n".join(html_report_lines)
-            html_file = search_tool_name+'_Search.html'
-            html_path = os.path.join (output_dir, html_file)
-            with open (html_path, 'w') as html_handle:
-                html_handle.write(html_report_str)
-
-            dfu = DFUClient(self.callbackURL)
-            try:
-                upload_ret = dfu.file_to_shock({'file_path': html_path,
-                                                'make_handle': 0,
-                                                'pack': 'zip'})
-            except:
-                raise ValueError ('Logging exception loading html_report to shock')
-
-
-            # create report object
-            reportName = 'blast_report_'+str(uuid.uuid4())
-            reportObj = {'objects_created': [],
-                         #'text_message': '',  # or is it 'message'?
-                         'message': '',  # or is it 'text_message'?
-                         'direct_html': '',
-                         'direct_html_link_index': None,
-                         'file_links': [],
-                         'html_links': [],
-                         'workspace_name': params['workspace_name'],
-                         'report_object_name': reportName
-                         }
-            html_buf_lim = 16000  # really 16KB, but whatever
-            if len(html_report_str) <= html_buf_lim:
-                reportObj['direct_html'] = html_report_str
-            else:
-                reportObj['direct_html_link_index'] = 0
-
-            reportObj['html_links'] = [{'shock_id': upload_ret['shock_id'],
-                                        'name': html_file,
-                                        'label': search_tool_name+' Results'}
-                                       ]
-            reportObj['file_links'] = [{'shock_id': base_upload_ret['shock_id'],
-                                        'name': search_tool_name+'_Search-m'+'7'+'.txt',
-                                        'label': search_tool_name+' Results: m'+'7'}
-                                       ]
-            if extra_output:
-                extension = 'txt'
-                if params['output_extra_format'] == '5':
-                    extension = 'xml'
-                elif params['output_extra_format'] == '8':
-                    extension = 'asn1txt'
-                elif params['output_extra_format'] == '9':
-                    extension = 'asn1bin'
-                elif params['output_extra_format'] == '10':
-                    extension = 'csv'
-                elif params['output_extra_format'] == '11':
-                    extension = 'asn1arc'
-                reportObj['file_links'].append({'shock_id': extra_upload_ret['shock_id'],
-                                                'name': search_tool_name+'_Search-m'+str(params['output_extra_format'])+'.'+extension,
-                                                'label': search_tool_name+' Results: m'+str(params['output_extra_format'])})
+
+                html_report_lines += ['</table>']
+                html_report_lines += ['</body>']
+                html_report_lines += ['</html>']
+
+                # write html to file and upload
+                html_report_str = "\n".join(html_report_lines)
+                html_file = search_tool_name+'_Search.html'
+                html_path = os.path.join (output_dir, html_file)
+                with open (html_path, 'w') as html_handle:
+                    html_handle.write(html_report_str)
+
+                dfu = get_client(DFUClient, self.callbackURL)
+                try:
+                    upload_ret = dfu.file_to_shock({'file_path': html_path,
+                                                    'make_handle': 0,
+                                                    'pack': 'zip'})
+                except:
+                    raise ValueError ('Logging exception loading html_report to shock')
+
+
+                # create report object
+                reportName = 'blast_report_'+str(uuid.uuid4())
+                reportObj = {'objects_created': [],
+                             #'text_message': '',  # or is it 'message'?
+                             'message': '',  # or is it 'text_message'?
+                             'direct_html': '',
+                             'direct_html_link_index': None,
+                             'file_links': [],
+                             'html_links': [],
+                             'workspace_name': params['workspace_name'],
+                             'report_object_name': reportName
+                             }
+                html_buf_lim = 16000  # really 16KB, but whatever
+                if len(html_report_str) <= html_buf_lim:
+                    reportObj['direct_html'] = html_report_str
+                else:
+                    reportObj['direct_html_link_index'] = 0
+
+                reportObj['html_links'] = [{'shock_id': upload_ret['shock_id'],
+                                            'name': html_file,
+                                            'label': search_tool_name+' Results'}
+                                           ]
+                reportObj['file_links'] = [{'shock_id': base_upload_ret['shock_id'],
+                                            'name': search_tool_name+'_Search-m'+'7'+'.txt',
+                                            'label': search_tool_name+' Results: m'+'7'}
+                                           ]
+                if extra_output:
+                    extension = 'txt'
+                    if params['output_extra_format'] == '5':
+                        extension = 'xml'
+                    elif params['output_extra_format'] == '8':
+                        extension = 'asn1txt'
+                    elif params['output_extra_format'] == '9':
+                        extension = 'asn1bin'
+                    elif params['output_extra_format'] == '10':
+                        extension = 'csv'
+                    elif params['output_extra_format'] == '11':
+                        extension = 'asn1arc'
+                    reportObj['file_links'].append({'shock_id': extra_upload_ret['shock_id'],
+                                                    'name': search_tool_name+'_Search-m'+str(params['output_extra_format'])+'.'+extension,
+                                                    'label': search_tool_name+' Results: m'+str(params['output_extra_format'])})
                             
-            if hit_total > 0:
-                reportObj['objects_created'].append({'ref':str(params['workspace_name'])+'/'+params['output_filtered_name'],'description':search_tool_name+' hits'})
-            #reportObj['message'] = report
+                # attach makeblastdb/psiblast resource usage
+                process_metrics_path = os.path.join(scratch_manager.stage_dir('logs'), 'process_metrics.json')
+                process_metrics.write(process_metrics_path, job_info={'method': search_tool_name+'_Search'})
+                try:
+                    metrics_upload_ret = dfu.file_to_shock({'file_path': process_metrics_path,
+                                                            'make_handle': 0})
+                    reportObj['file_links'].append({'shock_id': metrics_upload_ret['shock_id'],
+                                                    'name': search_tool_name+'_Search-process_metrics.json',
+                                                    'label': search_tool_name+' makeblastdb/BLAST resource usage'})
+                except:
+                    self.log(console, 'unable to attach process metrics')
+
+                # attach the stage timings, all but the report save
+                stage_timeline_path = stage_timer.write_timeline(os.path.join(scratch_manager.stage_dir('logs'), 'stage_timeline.json'),
+                                                                 job_info={'method': search_tool_name+'_Search'})
+                try:
+                    timeline_upload_ret = dfu.file_to_shock({'file_path': stage_timeline_path,
+                                                             'make_handle': 0})
+                    reportObj['file_links'].append({'shock_id': timeline_upload_ret['shock_id'],
+                                                    'name': search_tool_name+'_Search-stage_timeline.json',
+                                                    'label': search_tool_name+' stage timings'})
+                except:
+                    self.log(console, 'unable to attach stage timeline')
+
+                # attach the full makeblastdb/psiblast output
+                subprocess_log.close()
+                if os.path.isfile(subprocess_log.log_path):
+                    try:
+                        subprocess_output_upload_ret = dfu.file_to_shock({'file_path': subprocess_log.log_path,
+                                                                          'make_handle': 0})
+                        reportObj['file_links'].append({'shock_id': subprocess_output_upload_ret['shock_id'],
+                                                        'name': search_tool_name+'_Search-subprocess_output.txt',
+                                                        'label': search_tool_name+' makeblastdb/BLAST output'})
+                    except:
+                        self.log(console, 'unable to attach subprocess output')
+
+                # attach the profile, if any
+                for (file_path, name, label) in profiler.write_files(scratch_manager.stage_dir('logs'), search_tool_name+'_Search'):
+                    try:
+                        profile_upload_ret = dfu.file_to_shock({'file_path': file_path,
+                                                                'make_handle': 0})
+                        reportObj['file_links'].append({'shock_id': profile_upload_ret['shock_id'],
+                                                        'name': name,
+                                                        'label': label})
+                    except:
+                        self.log(console, 'unable to attach '+name)
+
+                if hit_total > 0:
+                    reportObj['objects_created'].append({'ref':str(params['workspace_name'])+'/'+params['output_filtered_name'],'description':search_tool_name+' hits'})
+                #reportObj['message'] = report
+
+
+                # save report object
+                #
+                SERVICE_VER = 'release'
+                reportClient = get_client(KBaseReport, self.callbackURL, token=ctx['token'], service_ver=SERVICE_VER)
+                #report_info = report.create({'report':reportObj, 'workspace_name':params['workspace_name']})
+                report_info = reportClient.create_extended_report(reportObj)
 
+            else:
+                if len(hit_order) == 0:  # no hits
+                    report += "No hits were found\n"
+                else:  # data validation error
+                    report += "FAILURE\n\n"+"\n".join(invalid_msgs)+"\n"
+
+                reportObj = {
+                    'objects_created':[],
+                    'text_message':report
+                    }
+
+                reportName = 'blast_report_'+str(uuid.uuid4())
+                report_obj_info = ws.save_objects({
+                        #                'id':info[6],
+                        'workspace':params['workspace_name'],
+                        'objects':[
+                            {
+                                'type':'KBaseReport.Report',
+                                'data':reportObj,
+                                'name':reportName,
+                                'meta':{},
+                                'hidden':1,
+                                'provenance':provenance
+                                }
+                            ]
+                        })[0]
+                report_info = dict()
+                report_info['name'] = report_obj_info[1]
+                report_info['ref'] = str(report_obj_info[6])+'/'+str(report_obj_info[0])+'/'+str(report_obj_info[4])
 
-            # save report object
-            #
-            SERVICE_VER = 'release'
-            reportClient = KBaseReport(self.callbackURL, token=ctx['token'], service_ver=SERVICE_VER)
-            #report_info = report.create({'report':reportObj, 'workspace_name':params['workspace_name']})
-            report_info = reportClient.create_extended_report(reportObj)
-
-        else:
-            if len(hit_order) == 0:  # no hits
-                report += "No hits were found\n"
-            else:  # data validation error
-                report += "FAILURE\n\n"+"\n".join(invalid_msgs)+"\n"
-
-            reportObj = {
-                'objects_created':[],
-                'text_message':report
-                }
-
-            reportName = 'blast_report_'+str(uuid.uuid4())
-            report_obj_info = ws.save_objects({
-                    #                'id':info[6],
-                    'workspace':params['workspace_name'],
-                    'objects':[
-                        {
-                            'type':'KBaseReport.Report',
-                            'data':reportObj,
-                            'name':reportName,
-                            'meta':{},
-                            'hidden':1,
-                            'provenance':provenance
-                            }
-                        ]
-                    })[0]
-            report_info = dict()
-            report_info['name'] = report_obj_info[1]
-            report_info['ref'] = str(report_obj_info[6])+'/'+str(report_obj_info[0])+'/'+str(report_obj_info[4])
+            stage_timer.end_stage()
+            for (stage, wall_secs) in stage_timer.summary():
+                self.log(console, 'STAGE '+stage+': '+'%.3f' % wall_secs+' secs')
 
-        self.log(console,"BUILDING RETURN OBJECT")
-#        returnVal = { 'output_report_name': reportName,
-#                      'output_report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]),
-#                      'output_filtered_ref': params['workspace_name']+'/'+params['output_filtered_name']
-#                      }
-        returnVal = { 'report_name': report_info['name'],
-                      'report_ref': report_info['ref']
-                      }
-        self.log(console,search_tool_name+"_Search DONE")
+            self.log(console,"BUILDING RETURN OBJECT")
+    #        returnVal = { 'output_report_name': reportName,
+    #                      'output_report_ref': str(report_obj_info[6]) + '/' + str(report_obj_info[0]) + '/' + str(report_obj_info[4]),
+    #                      'output_filtered_ref': params['workspace_name']+'/'+params['output_filtered_name']
+    #                      }
+            returnVal = { 'report_name': report_info['name'],
+                          'report_ref': report_info['ref']
+                          }
+            hit_log.suppressed_summary()
+            self.log(console,search_tool_name+"_Search DONE")
+            self.job_log.flush()
+        except ProcessLimitExceeded as e:
+            self.log(console, 'STOPPED: '+str(e))
+            invalid_msgs = [str(e)]
+            if e.reason != 'cancelled' and subprocess_log.get_tail():
+                invalid_msgs.append("Last output:\n"+"\n".join(subprocess_log.get_tail()))
+            return [self.save_psiBLAST_error_report(ctx, params, invalid_msgs)]
+        finally:
+            # still running if the job didn't get to the end
+            stage_timer.end_stage('error')
+            process_limits.restore_signal_handlers()
+            subprocess_log.close()
+            profiler.stop()
+            scratch_manager.cleanup()
         #END psiBLAST_msa_start_Search
 
         # At some point might do deeper type checking...
@@ -1504,6 +1531,44 @@ class kb_blast:
                              'returnVal is not type dict as required.')
         # return the results
         return [returnVal]
+
+    def BLAST_Refilter(self, ctx, params):
+        """
+        Method to filter the hits of an earlier search again, with new thresholds,
+        **  without running BLAST
+        :param params: instance of type "BLAST_Refilter_Params" (BLAST
+           Refilter Input Params ** **    report_ref: report of an earlier
+           search, which keeps its raw hits **    thresholds not given are
+           those of the earlier search) -> structure: parameter
+           "workspace_name" of type "workspace_name" (** The workspace object
+           refs are of form: ** **    objects = ws.get_objects([{'ref':
+           params['workspace_id']+'/'+params['obj_name']}]) ** ** "ref" means
+           the entire name combining the workspace id and the object name **
+           "id" is a numerical identifier of the workspace or object, and
+           should just be used for workspace ** "name" is a string identifier
+           of a workspace or object.  This is received from Narrative.),
+           parameter "report_ref" of type "data_obj_ref", parameter
+           "output_filtered_name" of type "data_obj_name", parameter
+           "genome_disp_name_config" of String, parameter "ident_thresh" of
+           Double, parameter "bitscore" of Double, parameter
+           "overlap_fraction" of Double
+        :returns: instance of type "BLAST_Output" (BLAST Output) ->
+           structure: parameter "report_name" of type "data_obj_name",
+           parameter "report_ref" of type "data_obj_ref"
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN BLAST_Refilter
+        bu = BlastUtil(self.config, ctx)
+        returnVal = bu.run_BLAST_Refilter (params)
+        #END BLAST_Refilter
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method BLAST_Refilter return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK", 'message': "", 'version': self.VERSION, 
@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import datetime
+import gzip
 import json
 import os
 import random as _random
 import sys
 import traceback
+import zlib
 from getopt import getopt, GetoptError
 from multiprocessing import Process
 from os import environ
@@ -18,6 +20,7 @@ from jsonrpcbase import ServerError as JSONServerError
 
 from biokbase import log
 from kb_blast.authclient import KBaseAuth as _KBaseAuth
+from kb_blast.Utils import JSONCodec
 
 try:
     from ConfigParser import ConfigParser
@@ -28,6 +31,9 @@ DEPLOY = 'KB_DEPLOYMENT_CONFIG'
 SERVICE = 'KB_SERVICE_NAME'
 AUTH = 'auth-service-url'
 
+# request body encodings Application accepts (gzip is opt-in on the client)
+REQUEST_CONTENT_ENCODINGS = frozenset(['identity', 'gzip'])
+
 # Note that the error fields do not match the 2.0 JSONRPC spec
 
 
@@ -79,7 +85,7 @@ class JSONRPCServiceCustom(JSONRPCService):
         """
         result = self.call_py(ctx, jsondata)
         if result is not None:
-            return json.dumps(result, cls=JSONObjectEncoder)
+            return JSONCodec.dumps(result)
 
         return None
 
@@ -362,12 +368,24 @@ class Application(object):
                              name='kb_blast.psiBLAST_msa_start_Search',
                              types=[dict])
         self.method_authentication['kb_blast.psiBLAST_msa_start_Search'] = 'required'  # noqa
+        self.rpc_service.add(impl_kb_blast.BLAST_Refilter,
+                             name='kb_blast.BLAST_Refilter',
+                             types=[dict])
+        self.method_authentication['kb_blast.BLAST_Refilter'] = 'required'  # noqa
         self.rpc_service.add(impl_kb_blast.status,
                              name='kb_blast.status',
                              types=[dict])
         authurl = config.get(AUTH) if config else None
         self.auth_client = _KBaseAuth(authurl)
 
+    def _decode_request_body(self, request_body, content_encoding):
+        if content_encoding == 'gzip':
+            try:
+                return gzip.decompress(request_body)
+            except (OSError, EOFError, zlib.error) as e:
+                raise ValueError('Invalid gzip request body: ' + str(e))
+        return request_body
+
     def __call__(self, environ, start_response):
         # Context object, equivalent to the perl impl CallContext
         ctx = MethodContext(self.userlog)
@@ -378,14 +396,21 @@ class Application(object):
             body_size = int(environ.get('CONTENT_LENGTH', 0))
         except (ValueError):
             body_size = 0
+        content_encoding = environ.get(
+            'HTTP_CONTENT_ENCODING', 'identity').strip().lower()
         if environ['REQUEST_METHOD'] == 'OPTIONS':
             # we basically do nothing and just return headers
             status = '200 OK'
             rpc_result = ""
+        elif content_encoding not in REQUEST_CONTENT_ENCODINGS:
+            # RFC 7694: refuse, and list what we accept in Accept-Encoding
+            status = '415 Unsupported Media Type'
+            rpc_result = ""
         else:
             request_body = environ['wsgi.input'].read(body_size)
             try:
-                req = json.loads(request_body)
+                req = JSONCodec.loads(self._decode_request_body(
+                    request_body, content_encoding))
             except ValueError as ve:
                 err = {'error': {'code': -32700,
                                  'name': "Parse error",
@@ -470,15 +495,19 @@ class Application(object):
             response_body = rpc_result
         else:
             response_body = ''
+        # encoded once: content-length counts bytes, and non-ASCII text
+        # (left unescaped by orjson) takes more than one byte per character
+        response_body = response_body.encode('utf8')
 
         response_headers = [
             ('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Headers', environ.get(
                 'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
             ('content-type', 'application/json'),
+            ('Accept-Encoding', 'gzip'),
             ('content-length', str(len(response_body)))]
         start_response(status, response_headers)
-        return [response_body.encode('utf8')]
+        return [response_body]
 
     def process_error(self, error, context, request, trace=None):
         if trace:
@@ -496,7 +525,7 @@ class Application(object):
         else:
             error['version'] = '1.0'
             error['error']['error'] = trace
-        return json.dumps(error)
+        return JSONCodec.dumps(error)
 
     def now_in_utc(self):
         # noqa Taken from http://stackoverflow.com/questions/3401428/how-to-get-an-isoformat-datetime-string-including-the-default-timezone @IgnorePep8
@@ -573,7 +602,7 @@ def stop_server():
 def process_async_cli(input_file_path, output_file_path, token):
     exit_code = 0
     with open(input_file_path) as data_file:
-        req = json.load(data_file)
+        req = JSONCodec.loads(data_file.read())
     if 'version' not in req:
         req['version'] = '1.1'
     if 'id' not in req:
@@ -615,7 +644,7 @@ def process_async_cli(input_file_path, output_file_path, token):
     if 'error' in resp:
         exit_code = 500
     with open(output_file_path, "w") as f:
-        f.write(json.dumps(resp, cls=JSONObjectEncoder))
+        f.write(JSONCodec.dumps(resp))
     return exit_code
 
 if __name__ == "__main__":
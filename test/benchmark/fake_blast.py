@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# Stand-in for the BLAST+ programs kb_blast runs (makeblastdb, blastn, blastp,
+# blastx, tblastn, tblastx, psiblast), for timing the Python side of a search
+# without the cost of the search itself.
+#
+# The fake makeblastdb writes the subject ids and lengths into the .psq/.nsq
+# file; the fake searches read them back and write outfmt 7 (or 6/10) hits for
+# them with deterministic, varied scores, so the hit filters have something to
+# do.  As with BLAST, hits worse than -evalue are left out.  Other -outfmt
+# values get a short placeholder.
+#
+# make_bin_dir(bin_dir) writes one executable per program into bin_dir, to be
+# used as the Make_BLAST_DB, BLASTn, ..., psiBLAST class attributes (see
+# offline_benchmark.set_blast_bin_dir()).  Size and latency are set with
+# environment variables, read by each fake process:
+#
+#   FAKE_BLAST_HITS         subjects hit per query (default: every subject, up
+#                           to -max_target_seqs)
+#   FAKE_BLAST_HSPS         lines per subject hit (default 1)
+#   FAKE_BLAST_LATENCY      seconds each search sleeps (default 0)
+#   FAKE_BLAST_SECS_PER_MB  more seconds per MB of database (default 0)
+#   FAKE_MAKEBLASTDB_LATENCY  seconds makeblastdb sleeps (default 0)
+#
+#   python test/benchmark/fake_blast.py BIN_DIR    # just write the programs
+#
+import math
+import os
+import random
+import stat
+import sys
+import time
+import zlib
+
+PROGRAMS = ['makeblastdb', 'blastn', 'blastp', 'blastx', 'tblastn', 'tblastx', 'psiblast']
+
+FIELDS = ['query acc.ver', 'subject acc.ver', '% identity', 'alignment length', 'mismatches',
+          'gap opens', 'q. start', 'q. end', 's. start', 's. end', 'evalue', 'bit score']
+
+# max_target_seqs when not given, as in BLAST+
+DEFAULT_MAX_TARGET_SEQS = 500
+
+
+###############################################################################
+# setup
+###############################################################################
+
+# make_bin_dir(): an executable per program in bin_dir, running this file
+#
+def make_bin_dir(bin_dir):
+    if not os.path.exists(bin_dir):
+        os.makedirs(bin_dir)
+    fake_blast_path = os.path.abspath(__file__)
+    for program in PROGRAMS:
+        program_path = os.path.join(bin_dir, program)
+        with open(program_path, 'w') as program_handle:
+            program_handle.write('#!/bin/sh\n'+
+                                 'exec "'+sys.executable+'" "'+fake_blast_path+'" --program '+program+' "$@"\n')
+        os.chmod(program_path, os.stat(program_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+###############################################################################
+# sequences
+###############################################################################
+
+# read_fasta(): [(id, length)], the id being the first word of the header
+#
+def read_fasta(fasta_path):
+    records = []
+    seq_id = None
+    seq_len = 0
+    with open(fasta_path, 'r') as fasta_handle:
+        for line in fasta_handle:
+            if line.startswith('>'):
+                if seq_id is not None:
+                    records.append((seq_id, seq_len))
+                seq_id = line[1:].split()[0] if line[1:].strip() else 'unnamed'
+                seq_len = 0
+            else:
+                seq_len += len(line.strip())
+    if seq_id is not None:
+        records.append((seq_id, seq_len))
+    return records
+
+
+# read_msa(): [(row_id, ungapped length)] from a psiblast -in_msa file
+#
+def read_msa(msa_path):
+    rows = []
+    with open(msa_path, 'r') as msa_handle:
+        for line in msa_handle:
+            fields = line.split()
+            if len(fields) >= 2:
+                rows.append((fields[0], len(''.join(fields[1:]).replace('-', ''))))
+    return rows
+
+
+def db_seq_file(db_path):
+    for ext in ['psq', 'nsq', '00.psq', '00.nsq']:
+        if os.path.isfile(db_path+'.'+ext):
+            return db_path+'.'+ext
+    return None
+
+
+###############################################################################
+# programs
+###############################################################################
+
+def makeblastdb(opts):
+    begin = time.time()
+    print('\n\nBuilding a new DB, current time: '+time.strftime('%m/%d/%Y %H:%M:%S'))
+    print('New DB name:   '+opts['-out'])
+    print('New DB title:  '+opts['-in'])
+    print('Sequence type: '+('Nucleotide' if opts['-dbtype'] == 'nucl' else 'Protein'))
+    records = read_fasta(opts['-in'])
+    time.sleep(env_float('FAKE_MAKEBLASTDB_LATENCY', 0))
+
+    ext = 'nsq' if opts['-dbtype'] == 'nucl' else 'psq'
+    with open(opts['-out']+'.'+ext, 'w') as seq_handle:
+        for seq_id, seq_len in records:
+            seq_handle.write(seq_id+"\t"+str(seq_len)+"\n")
+    print('Adding sequences from FASTA; added '+str(len(records))+' sequences in '+
+          '%.5g' % (time.time() - begin)+' seconds.\n')
+    return 0
+
+
+# hsp(): a deterministic, varied hit of query against subject, as
+# (outfmt 7 fields from '% identity' on, evalue)
+#
+def hsp(rng, query_len, subject_len, db_residues):
+    aln_len = max(1, int(min(query_len, subject_len or query_len) * rng.uniform(0.2, 1.0)))
+    identity = rng.uniform(20.0, 100.0)
+    mismatches = int(round(aln_len * (100.0 - identity) / 100.0))
+    gap_opens = rng.randint(0, max(0, aln_len // 50))
+    q_start = rng.randint(1, max(1, query_len - aln_len + 1))
+    s_start = rng.randint(1, max(1, (subject_len or aln_len) - aln_len + 1))
+    bitscore = max(10.0, aln_len * identity / 100.0 * 1.9 - 10.0 * gap_opens)
+    evalue = query_len * max(db_residues, 1) * math.pow(2.0, -bitscore)
+    return (['%.3f' % identity, str(aln_len), str(mismatches), str(gap_opens),
+             str(q_start), str(q_start + aln_len - 1), str(s_start), str(s_start + aln_len - 1),
+             '%.2e' % evalue if evalue > 0 else '0.0', '%.1f' % bitscore],
+            evalue)
+
+
+def search(program, opts):
+    db_path = opts['-db']
+    seq_file = db_seq_file(db_path)
+    if seq_file is None:
+        sys.stderr.write('BLAST Database error: No alias or index file found for '+db_path+'\n')
+        return 2
+    subjects = []
+    with open(seq_file, 'r') as seq_handle:
+        for line in seq_handle:
+            (seq_id, seq_len) = line.rstrip("\n").split("\t")
+            subjects.append((seq_id, int(seq_len)))
+    db_residues = sum(seq_len for seq_id, seq_len in subjects)
+
+    if '-in_msa' in opts:
+        rows = read_msa(opts['-in_msa'])
+        master_idx = int(opts.get('-msa_master_idx', 1)) - 1
+        queries = [rows[master_idx]] if rows else []
+    else:
+        queries = read_fasta(opts['-query'])
+
+    db_bytes = os.path.getsize(db_path) if os.path.isfile(db_path) else os.path.getsize(seq_file)
+    latency = env_float('FAKE_BLAST_LATENCY', 0) + \
+        env_float('FAKE_BLAST_SECS_PER_MB', 0) * db_bytes / 1048576.0
+    time.sleep(latency)
+
+    max_target_seqs = int(opts.get('-max_target_seqs', DEFAULT_MAX_TARGET_SEQS))
+    n_hits = int(os.environ.get('FAKE_BLAST_HITS', len(subjects)))
+    n_hsps = int(os.environ.get('FAKE_BLAST_HSPS', 1))
+    max_evalue = float(opts.get('-evalue', 10))
+    outfmt = opts.get('-outfmt', '0').split()[0]
+
+    with open(opts['-out'], 'w') as out_handle:
+        for query_id, query_len in queries:
+            lines = []
+            for subject_id, subject_len in subjects[:min(n_hits, max_target_seqs)]:
+                rng = random.Random(zlib.crc32((query_id+'\t'+subject_id).encode()))
+                hsps = sorted([hsp(rng, query_len, subject_len, db_residues) for i in range(n_hsps)],
+                              key=lambda h: h[1])
+                for (fields, evalue) in hsps:
+                    if evalue <= max_evalue:
+                        lines.append([query_id, subject_id] + fields)
+
+            if outfmt == '7':
+                out_handle.write('# '+program.upper()+' 2.13.0+\n')
+                if program == 'psiblast':
+                    out_handle.write('# Iteration: 1\n')
+                out_handle.write('# Query: '+query_id+'\n# Database: '+db_path+'\n')
+                if lines:
+                    out_handle.write('# Fields: '+', '.join(FIELDS)+'\n')
+                out_handle.write('# '+str(len(lines))+' hits found\n')
+            if outfmt in ('6', '7', '10'):
+                sep = ',' if outfmt == '10' else "\t"
+                for line in lines:
+                    out_handle.write(sep.join(line)+"\n")
+            else:
+                out_handle.write(program.upper()+' 2.13.0+ (fake, -outfmt '+outfmt+')\n\n'+
+                                 'Query= '+query_id+'\nLength='+str(query_len)+'\n\n')
+                for line in lines:
+                    out_handle.write('> '+line[1]+'\n Score = '+line[11]+' bits, Expect = '+line[10]+
+                                     '\n Identities = '+line[2]+'%\n\n')
+        if outfmt == '7':
+            out_handle.write('# BLAST processed '+str(len(queries))+' queries\n')
+    return 0
+
+
+# parse_args(): BLAST+ style "-name value" options, and bare flags as True
+#
+def parse_args(args):
+    opts = dict()
+    i = 0
+    while i < len(args):
+        if i + 1 < len(args) and not args[i+1].startswith('-'):
+            opts[args[i]] = args[i+1]
+            i += 2
+        else:
+            opts[args[i]] = True
+            i += 1
+    return opts
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == '--program':
+        program = args[1]
+        opts = parse_args(args[2:])
+        if '-version' in opts:
+            print(program+': 2.13.0+ (fake_blast)')
+            sys.exit(0)
+        if program == 'makeblastdb':
+            sys.exit(makeblastdb(opts))
+        sys.exit(search(program, opts))
+
+    if len(args) != 1:
+        sys.stderr.write('usage: '+sys.argv[0]+' BIN_DIR\n')
+        sys.exit(2)
+    print('fake BLAST+ programs in '+make_bin_dir(args[0]))
+
+
+if __name__ == '__main__':
+    main()
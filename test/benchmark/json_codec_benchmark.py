@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Micro-benchmark of kb_blast.Utils.JSONCodec against the stdlib encoder used
+# before, on payloads shaped like the ones kb_blast actually sends and receives.
+#
+#   PYTHONPATH=lib python test/benchmark/json_codec_benchmark.py [--repeat N]
+#
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from kb_blast.Utils import JSONCodec
+
+# the stdlib encoder with the server's set/frozenset handling
+JSONObjectEncoder = JSONCodec._JSONObjectEncoder
+
+
+# save_objects() params for a filtered FeatureSet over many genomes
+def featureSet_save_payload(n_genomes=200, n_features_per_genome=250):
+    elements = dict()
+    element_ordering = []
+    for g in range(n_genomes):
+        genome_ref = '12345/'+str(g+1)+'/1'
+        for f in range(n_features_per_genome):
+            fid = 'GCF_000'+str(g).zfill(6)+'.1_CDS_'+str(f).zfill(5)
+            element_ordering.append(fid)
+            elements[fid] = [genome_ref]
+    provenance = [{'service': 'kb_blast',
+                   'method': 'BLASTp_Search',
+                   'input_ws_objects': ['12345/'+str(g+1)+'/1' for g in range(n_genomes)],
+                   'method_params': {'ident_thresh': 40.0, 'e_value': '.001',
+                                     'bitscore': 50, 'overlap_fraction': 50.0,
+                                     'maxaccepts': 1000},
+                   'description': 'BLASTp_Search'}]
+    return {'workspace': 'blast_bench',
+            'objects': [{'type': 'KBaseCollections.FeatureSet',
+                         'data': {'description': 'BLASTp_Search filtered',
+                                  'element_ordering': element_ordering,
+                                  'elements': elements},
+                         'name': 'blastp_hits.FeatureSet',
+                         'meta': {},
+                         'provenance': provenance}]}
+
+
+# parsed outfmt 7 hit rows, as carried in report and refilter payloads
+def hit_table_payload(n_hits=100000):
+    hits = []
+    for i in range(n_hits):
+        hits.append({'query_id': 'query_1',
+                     'hit_id': '12345/'+str(i % 200 + 1)+'/1.f:CDS_'+str(i).zfill(6),
+                     'identity': 35.0 + (i % 650) / 10.0,
+                     'aln_len': 120 + i % 300,
+                     'mismatches': i % 40,
+                     'gap_openings': i % 5,
+                     'q_beg': 1 + i % 10, 'q_end': 300 - i % 10,
+                     'h_beg': 1 + i % 20, 'h_end': 320 - i % 20,
+                     'e_value': '1e-'+str(5 + i % 150),
+                     'bit_score': 40.0 + (i % 900) / 3.0})
+    return {'hits': hits, 'genome_refs': set('12345/'+str(g+1)+'/1' for g in range(200))}
+
+
+def time_call(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('fast encoder: '+('orjson '+JSONCodec.orjson.__version__ if JSONCodec.orjson else 'none (stdlib fallback)'))
+    print('{:<22} {:>10} {:>12} {:>12} {:>8}'.format('payload', 'op', 'stdlib (s)', 'codec (s)', 'speedup'))
+
+    payloads = [('FeatureSet save', featureSet_save_payload()),
+                ('BLAST hit table', hit_table_payload())]
+    for name, payload in payloads:
+        encoded = json.dumps(payload, cls=JSONObjectEncoder)
+
+        # same content from either encoder, including sets
+        if JSONCodec.loads(JSONCodec.dumps(payload)) != json.loads(encoded):
+            raise ValueError('codec output differs from stdlib for '+name)
+
+        t_std = time_call(lambda: json.dumps(payload, cls=JSONObjectEncoder), args.repeat)
+        t_codec = time_call(lambda: JSONCodec.dumps(payload), args.repeat)
+        print('{:<22} {:>10} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(name, 'dumps', t_std, t_codec, t_std / t_codec))
+
+        t_std = time_call(lambda: json.loads(encoded), args.repeat)
+        t_codec = time_call(lambda: JSONCodec.loads(encoded), args.repeat)
+        print('{:<22} {:>10} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(name, 'loads', t_std, t_codec, t_std / t_codec))
+
+
+if __name__ == '__main__':
+    main()
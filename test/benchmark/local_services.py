@@ -0,0 +1,606 @@
+# -*- coding: utf-8 -*-
+#
+# Local stand-ins for the KBase services kb_blast calls, backed by a
+# filesystem object store, so the *_Search methods can run end to end
+# without a workspace or callback server.
+#
+#   store = LocalObjectStore('/tmp/kb_blast_store')
+#   install_local_services(store)   # every get_client() now returns stand-ins
+#
+# Only the calls and object shapes kb_blast actually uses are modelled.
+#
+import copy
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+
+from installed_clients.DataFileUtilClient import DataFileUtil as DFUClient
+from installed_clients.KBaseDataObjectToFileUtilsClient import KBaseDataObjectToFileUtils
+from installed_clients.KBaseReportClient import KBaseReport
+from installed_clients.WorkspaceClient import Workspace as workspaceService
+
+from kb_blast.Utils.ClientPool import CLIENT_POOL
+
+[OBJID_I, NAME_I, TYPE_I, SAVE_DATE_I, VERSION_I, SAVED_BY_I, WSID_I, WORKSPACE_I, CHSUM_I, SIZE_I, META_I] = list(range(11))  # object_info tuple
+
+SAVED_BY = 'kb_blast_benchmark'
+
+
+###############################################################################
+# LocalObjectStore: workspace objects and shock files under one directory
+###############################################################################
+
+class LocalObjectStore:
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.objects_dir = os.path.join(self.root_dir, 'objects')
+        self.shock_dir = os.path.join(self.root_dir, 'shock')
+        self.index_path = os.path.join(self.root_dir, 'index.json')
+        for dir_path in [self.objects_dir, self.shock_dir]:
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+        self.lock = threading.RLock()
+
+        # workspace name -> id, and per workspace: object name -> id, and
+        # object id -> list of infos (one per version)
+        self.workspaces = dict()
+        self.object_ids = dict()
+        self.object_infos = dict()
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as index_handle:
+                index = json.load(index_handle)
+            self.workspaces = index['workspaces']
+            self.object_ids = index['object_ids']
+            self.object_infos = index['object_infos']
+
+
+    def _write_index(self):
+        tmp_index_path = self.index_path+'.tmp'
+        with open(tmp_index_path, 'w') as index_handle:
+            json.dump({'workspaces': self.workspaces,
+                       'object_ids': self.object_ids,
+                       'object_infos': self.object_infos},
+                      index_handle)
+        os.replace(tmp_index_path, self.index_path)
+
+
+    def _object_path(self, wsid, objid, version):
+        return os.path.join(self.objects_dir, str(wsid), str(objid), str(version)+'.json')
+
+
+    # workspace_id(): create the workspace on first use
+    #
+    def workspace_id(self, workspace):
+        with self.lock:
+            if str(workspace).isdigit():
+                if int(workspace) not in self.workspaces.values():
+                    raise ValueError('No workspace with id '+str(workspace)+' exists')
+                return int(workspace)
+            if workspace not in self.workspaces:
+                self.workspaces[workspace] = len(self.workspaces) + 1
+                self.object_ids[str(self.workspaces[workspace])] = dict()
+                self.object_infos[str(self.workspaces[workspace])] = dict()
+                self._write_index()
+            return self.workspaces[workspace]
+
+
+    def workspace_name(self, wsid):
+        for name, this_wsid in self.workspaces.items():
+            if this_wsid == wsid:
+                return name
+        raise ValueError('No workspace with id '+str(wsid)+' exists')
+
+
+    # save(): one object, as a new version if the name is taken
+    #
+    def save(self, workspace, obj_type, data, name=None, meta=None, provenance=None):
+        if '-' not in obj_type:
+            obj_type += '-1.0'
+        data_json = json.dumps(data)
+        with self.lock:
+            wsid = self.workspace_id(workspace)
+            ws_object_ids = self.object_ids[str(wsid)]
+            ws_object_infos = self.object_infos[str(wsid)]
+            if name is None:
+                name = 'auto'+str(len(ws_object_ids) + 1)
+            if name in ws_object_ids:
+                objid = ws_object_ids[name]
+            else:
+                objid = len(ws_object_ids) + 1
+                ws_object_ids[name] = objid
+                ws_object_infos[str(objid)] = []
+            version = len(ws_object_infos[str(objid)]) + 1
+            info = [objid, name, obj_type,
+                    time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime()),
+                    version, SAVED_BY, wsid, self.workspace_name(wsid),
+                    uuid.uuid4().hex, len(data_json), meta or {}]
+
+            obj_path = self._object_path(wsid, objid, version)
+            if not os.path.exists(os.path.dirname(obj_path)):
+                os.makedirs(os.path.dirname(obj_path))
+            with open(obj_path, 'w') as obj_handle:
+                obj_handle.write('{"provenance": '+json.dumps(provenance or [])+', "data": '+data_json+'}')
+            ws_object_infos[str(objid)].append(info)
+            self._write_index()
+        return info
+
+
+    # get_info(): resolve 'ws/obj[/ver]' (ids or names) or a ref path 'a;b'
+    #
+    def get_info(self, ref):
+        ref = ref.split(';')[-1]
+        ref_parts = ref.split('/')
+        if len(ref_parts) not in (2, 3):
+            raise ValueError('Illegal number of separators / in object reference '+ref)
+        with self.lock:
+            wsid = self.workspace_id(ref_parts[0])
+            ws_object_ids = self.object_ids[str(wsid)]
+            if ref_parts[1].isdigit():
+                objid = int(ref_parts[1])
+            elif ref_parts[1] in ws_object_ids:
+                objid = ws_object_ids[ref_parts[1]]
+            else:
+                raise ValueError('No object with name '+ref_parts[1]+' exists in workspace '+str(wsid))
+            infos = self.object_infos[str(wsid)].get(str(objid))
+            if not infos:
+                raise ValueError('No object with id '+str(objid)+' exists in workspace '+str(wsid))
+            if len(ref_parts) == 3:
+                version = int(ref_parts[2])
+                if version < 1 or version > len(infos):
+                    raise ValueError('No object with version '+str(version)+' for '+ref)
+                return infos[version-1]
+            return infos[-1]
+
+
+    def get(self, ref):
+        info = self.get_info(ref)
+        with open(self._object_path(info[WSID_I], info[OBJID_I], info[VERSION_I]), 'r') as obj_handle:
+            obj = json.load(obj_handle)
+        obj['info'] = info
+        return obj
+
+
+    # put_file(): copy a file (or zip a file or directory) into the shock dir
+    #
+    def put_file(self, file_path, pack=None):
+        shock_id = str(uuid.uuid4())
+        node_dir = os.path.join(self.shock_dir, shock_id)
+        os.makedirs(node_dir)
+        file_path = file_path.rstrip('/')
+        if pack == 'zip':
+            node_file_path = os.path.join(node_dir, os.path.basename(file_path)+'.zip')
+            with zipfile.ZipFile(node_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_handle:
+                if os.path.isdir(file_path):
+                    for dir_path, dir_names, file_names in os.walk(file_path):
+                        for file_name in file_names:
+                            this_path = os.path.join(dir_path, file_name)
+                            zip_handle.write(this_path, os.path.relpath(this_path, file_path))
+                else:
+                    zip_handle.write(file_path, os.path.basename(file_path))
+        elif pack is not None:
+            raise ValueError('pack '+str(pack)+' is not supported by the local store')
+        else:
+            node_file_path = os.path.join(node_dir, os.path.basename(file_path))
+            shutil.copyfile(file_path, node_file_path)
+        return (shock_id, node_file_path)
+
+
+    def get_file_path(self, shock_id):
+        node_dir = os.path.join(self.shock_dir, shock_id)
+        if not os.path.isdir(node_dir) or len(os.listdir(node_dir)) == 0:
+            raise ValueError('No shock node '+shock_id)
+        return os.path.join(node_dir, os.listdir(node_dir)[0])
+
+
+    # put_json_gz(): gzipped JSON in the shock dir, as AMA features are kept
+    #
+    def put_json_gz(self, obj, file_name):
+        shock_id = str(uuid.uuid4())
+        node_dir = os.path.join(self.shock_dir, shock_id)
+        os.makedirs(node_dir)
+        with gzip.open(os.path.join(node_dir, file_name), 'wt') as json_handle:
+            json.dump(obj, json_handle)
+        return shock_id
+
+
+###############################################################################
+# included paths, as get_objects2() applies them
+###############################################################################
+
+def _select_path(data, path_parts):
+    if not path_parts:
+        return copy.deepcopy(data)
+    (key, rest) = (path_parts[0], path_parts[1:])
+    if isinstance(data, list):
+        indexes = list(range(len(data))) if key == '*' else [int(key)]
+        return [_select_path(data[i], rest) for i in indexes if i < len(data)]
+    if isinstance(data, dict):
+        keys = list(data.keys()) if key == '*' else [key]
+        return {k: _select_path(data[k], rest) for k in keys if k in data}
+    return None
+
+
+def _merge_selected(into, selected):
+    for key, value in selected.items():
+        if key in into and isinstance(into[key], dict) and isinstance(value, dict):
+            _merge_selected(into[key], value)
+        else:
+            into[key] = value
+    return into
+
+
+def subset_data(data, included):
+    subset = dict()
+    for path in included:
+        selected = _select_path(data, [part for part in path.split('/') if part != ''])
+        if isinstance(selected, dict):
+            _merge_selected(subset, selected)
+    return subset
+
+
+###############################################################################
+# Workspace
+###############################################################################
+
+class LocalWorkspace:
+
+    def __init__(self, store, url=None, **kwargs):
+        self.store = store
+
+
+    def create_workspace(self, params):
+        wsid = self.store.workspace_id(params['workspace'])
+        return self.get_workspace_info({'id': wsid})
+
+
+    def get_workspace_info(self, params):
+        wsid = self.store.workspace_id(params.get('id', params.get('workspace')))
+        return [wsid, self.store.workspace_name(wsid), SAVED_BY, '', 0, 'a', 'a', 'unlocked', {}]
+
+
+    def save_objects(self, params):
+        workspace = params.get('workspace', params.get('id'))
+        infos = []
+        for obj_spec in params['objects']:
+            infos.append(self.store.save(workspace, obj_spec['type'], obj_spec['data'],
+                                         name=obj_spec.get('name'),
+                                         meta=obj_spec.get('meta'),
+                                         provenance=obj_spec.get('provenance')))
+        return infos
+
+
+    def _obj_data(self, obj_spec):
+        obj = self.store.get(obj_spec['ref'])
+        data = obj['data']
+        if obj_spec.get('included'):
+            data = subset_data(data, obj_spec['included'])
+        return {'data': data,
+                'info': obj['info'],
+                'provenance': obj['provenance'],
+                'creator': SAVED_BY,
+                'created': obj['info'][SAVE_DATE_I],
+                'refs': [],
+                'path': [obj_spec['ref']]}
+
+
+    def get_objects2(self, params, context=None, stream=True):
+        return {'data': [self._obj_data(obj_spec) for obj_spec in params['objects']]}
+
+
+    def get_objects(self, obj_specs):
+        return [self._obj_data(obj_spec) for obj_spec in obj_specs]
+
+
+    def get_object_info3(self, params):
+        infos = [self.store.get_info(obj_spec['ref']) for obj_spec in params['objects']]
+        return {'infos': infos,
+                'paths': [[obj_spec['ref']] for obj_spec in params['objects']]}
+
+
+    def get_object_info_new(self, params):
+        return self.get_object_info3(params)['infos']
+
+
+###############################################################################
+# DataFileUtil
+###############################################################################
+
+class LocalDataFileUtil:
+
+    def __init__(self, store, url=None, **kwargs):
+        self.store = store
+
+
+    def file_to_shock(self, params):
+        (shock_id, node_file_path) = self.store.put_file(params['file_path'], pack=params.get('pack'))
+        upload_ret = {'shock_id': shock_id,
+                      'node_file_name': os.path.basename(node_file_path),
+                      'size': os.path.getsize(node_file_path)}
+        if params.get('make_handle'):
+            upload_ret['handle'] = {'hid': 'KBH_'+shock_id, 'id': shock_id,
+                                    'file_name': upload_ret['node_file_name'],
+                                    'type': 'shock', 'url': 'file://'+self.store.shock_dir}
+        return upload_ret
+
+
+    def shock_to_file(self, params):
+        node_file_path = self.store.get_file_path(params['shock_id'])
+        file_path = params['file_path']
+        if os.path.isdir(file_path):
+            file_path = os.path.join(file_path, os.path.basename(node_file_path))
+        shutil.copyfile(node_file_path, file_path)
+        return {'file_path': file_path,
+                'node_file_name': os.path.basename(node_file_path),
+                'size': os.path.getsize(file_path)}
+
+
+###############################################################################
+# KBaseReport
+###############################################################################
+
+class LocalKBaseReport:
+
+    def __init__(self, store, url=None, **kwargs):
+        self.store = store
+
+
+    def create_extended_report(self, params):
+        report_name = params.get('report_object_name') or 'report_'+str(uuid.uuid4())
+        report_data = {'text_message': params.get('message', ''),
+                       'objects_created': params.get('objects_created', []),
+                       'file_links': params.get('file_links', []),
+                       'html_links': params.get('html_links', []),
+                       'direct_html': params.get('direct_html', ''),
+                       'direct_html_link_index': params.get('direct_html_link_index')}
+        info = self.store.save(params['workspace_name'], 'KBaseReport.Report', report_data,
+                               name=report_name)
+        return {'name': report_name,
+                'ref': str(info[WSID_I])+'/'+str(info[OBJID_I])+'/'+str(info[VERSION_I])}
+
+
+    def create(self, params):
+        return self.create_extended_report(dict(params['report'],
+                                                workspace_name=params['workspace_name']))
+
+
+###############################################################################
+# KBaseDataObjectToFileUtils
+###############################################################################
+
+class LocalDataObjectToFileUtils:
+
+    def __init__(self, store, url=None, **kwargs):
+        self.store = store
+
+
+    # _feature_seq(): the sequence of residue_type ('PRO'/'protein' or nucleotide)
+    #
+    def _feature_seq(self, feature, params):
+        if params['residue_type'].upper().startswith('P'):
+            seq = feature.get('protein_translation')
+        else:
+            seq = feature.get('dna_sequence')
+        if not seq:
+            return None
+        if params.get('feature_type', 'ALL') != 'ALL' and feature.get('type', 'CDS') != params['feature_type']:
+            return None
+        if params.get('case', 'upper').lower() == 'upper':
+            return seq.upper()
+        return seq.lower()
+
+
+    def _feature_function(self, feature):
+        if feature.get('function'):
+            return feature['function']
+        return '; '.join(feature.get('functions', []))
+
+
+    def _genome_features(self, genome_data):
+        if genome_data.get('features') is not None:
+            return genome_data['features']
+        if genome_data.get('features_handle_ref'):
+            with gzip.open(self.store.get_file_path(genome_data['features_handle_ref']), 'rt') as features_handle:
+                return json.load(features_handle)
+        return []
+
+
+    # _writer(): writes records, shortening ids past id_len_limit
+    #
+    def _writer(self, params):
+        fasta_file_path = os.path.join(params['dir'], params['file'])
+        fasta_handle = open(fasta_file_path, 'w')
+        short_id_to_rec_id = dict()
+        linewrap = int(params.get('linewrap') or 0)
+        id_len_limit = params.get('id_len_limit')
+
+        def write_record(substitutions, seq):
+            rec_id = params['record_id_pattern']
+            rec_desc = params.get('record_desc_pattern', '')
+            for key, value in substitutions.items():
+                rec_id = rec_id.replace('%%'+key+'%%', value)
+                rec_desc = rec_desc.replace('%%'+key+'%%', value)
+            if id_len_limit is not None and len(rec_id) > int(id_len_limit):
+                short_id = 'id_'+str(len(short_id_to_rec_id) + 1)
+                short_id_to_rec_id[short_id] = rec_id
+                rec_id = short_id
+            fasta_handle.write('>'+rec_id+' '+rec_desc+"\n")
+            if linewrap > 0:
+                for i in range(0, len(seq), linewrap):
+                    fasta_handle.write(seq[i:i+linewrap]+"\n")
+            else:
+                fasta_handle.write(seq+"\n")
+
+        return (fasta_file_path, fasta_handle, short_id_to_rec_id, write_record)
+
+
+    # _write_genome(): records for one genome; returns its feature ids
+    #
+    def _write_genome(self, write_record, params, genome_ref, feature_id_to_function,
+                      only_feature_ids=None):
+        genome = self.store.get(genome_ref)
+        genome_data = genome['data']
+        genome_id = genome_data.get('id', genome['info'][NAME_I])
+        feature_ids = []
+        feature_id_to_function[genome_ref] = dict()
+        for feature in self._genome_features(genome_data):
+            if only_feature_ids is not None and feature['id'] not in only_feature_ids:
+                continue
+            seq = self._feature_seq(feature, params)
+            if seq is None:
+                continue
+            feature_ids.append(feature['id'])
+            feature_id_to_function[genome_ref][feature['id']] = self._feature_function(feature)
+            write_record({'genome_ref': genome_ref,
+                          'genome_id': genome_id,
+                          'feature_id': feature['id']}, seq)
+        return (genome, feature_ids)
+
+
+    def GenomeToFASTA(self, params):
+        (fasta_file_path, fasta_handle, short_id_to_rec_id, write_record) = self._writer(params)
+        feature_id_to_function = dict()
+        with fasta_handle:
+            (genome, feature_ids) = self._write_genome(write_record, params, params['genome_ref'],
+                                                       feature_id_to_function)
+        return {'fasta_file_path': fasta_file_path,
+                'feature_ids': feature_ids,
+                'short_id_to_rec_id': short_id_to_rec_id,
+                'feature_id_to_function': feature_id_to_function,
+                'genome_ref_to_sci_name': {params['genome_ref']: genome['data'].get('scientific_name', '')},
+                'genome_ref_to_obj_name': {params['genome_ref']: genome['info'][NAME_I]}}
+
+
+    # _genomes_to_fasta(): GenomeSet and SpeciesTree, merged into one file
+    #
+    def _genomes_to_fasta(self, params, genome_ref_by_id):
+        (fasta_file_path, fasta_handle, short_id_to_rec_id, write_record) = self._writer(params)
+        feature_id_to_function = dict()
+        feature_ids_by_genome_id = dict()
+        feature_ids_by_genome_ref = dict()
+        genome_ref_to_sci_name = dict()
+        genome_ref_to_obj_name = dict()
+        with fasta_handle:
+            for genome_id in sorted(genome_ref_by_id.keys()):
+                genome_ref = genome_ref_by_id[genome_id]
+                (genome, feature_ids) = self._write_genome(write_record, params, genome_ref,
+                                                           feature_id_to_function)
+                feature_ids_by_genome_id[genome_id] = feature_ids
+                feature_ids_by_genome_ref[genome_ref] = feature_ids
+                genome_ref_to_sci_name[genome_ref] = genome['data'].get('scientific_name', '')
+                genome_ref_to_obj_name[genome_ref] = genome['info'][NAME_I]
+        return {'fasta_file_path_list': [fasta_file_path],
+                'feature_ids_by_genome_id': feature_ids_by_genome_id,
+                'feature_ids_by_genome_ref': feature_ids_by_genome_ref,
+                'short_id_to_rec_id': short_id_to_rec_id,
+                'feature_id_to_function': feature_id_to_function,
+                'genome_ref_to_sci_name': genome_ref_to_sci_name,
+                'genome_ref_to_obj_name': genome_ref_to_obj_name}
+
+
+    def GenomeSetToFASTA(self, params):
+        elements = self.store.get(params['genomeSet_ref'])['data']['elements']
+        return self._genomes_to_fasta(params, {genome_id: element['ref']
+                                               for genome_id, element in elements.items()})
+
+
+    def SpeciesTreeToFASTA(self, params):
+        ws_refs = self.store.get(params['tree_ref'])['data']['ws_refs']
+        return self._genomes_to_fasta(params, {genome_id: ws_ref['g'][0]
+                                               for genome_id, ws_ref in ws_refs.items()})
+
+
+    def FeatureSetToFASTA(self, params):
+        elements = self.store.get(params['featureSet_ref'])['data']['elements']
+        feature_ids_by_genome_ref = dict()
+        for feature_id, genome_refs in elements.items():
+            for genome_ref in genome_refs:
+                feature_ids_by_genome_ref.setdefault(genome_ref, set()).add(feature_id)
+
+        (fasta_file_path, fasta_handle, short_id_to_rec_id, write_record) = self._writer(params)
+        feature_id_to_function = dict()
+        genome_ref_to_sci_name = dict()
+        genome_ref_to_obj_name = dict()
+        with fasta_handle:
+            for genome_ref in sorted(feature_ids_by_genome_ref.keys()):
+                (genome, feature_ids) = self._write_genome(write_record, params, genome_ref,
+                                                           feature_id_to_function,
+                                                           only_feature_ids=feature_ids_by_genome_ref[genome_ref])
+                feature_ids_by_genome_ref[genome_ref] = feature_ids
+                genome_ref_to_sci_name[genome_ref] = genome['data'].get('scientific_name', '')
+                genome_ref_to_obj_name[genome_ref] = genome['info'][NAME_I]
+        return {'fasta_file_path': fasta_file_path,
+                'feature_ids_by_genome_ref': feature_ids_by_genome_ref,
+                'short_id_to_rec_id': short_id_to_rec_id,
+                'feature_id_to_function': feature_id_to_function,
+                'genome_ref_to_sci_name': genome_ref_to_sci_name,
+                'genome_ref_to_obj_name': genome_ref_to_obj_name}
+
+
+    def AnnotatedMetagenomeAssemblyToFASTA(self, params):
+        (fasta_file_path, fasta_handle, short_id_to_rec_id, write_record) = self._writer(params)
+        feature_id_to_function = dict()
+        with fasta_handle:
+            (ama, feature_ids) = self._write_genome(write_record, params, params['ama_ref'],
+                                                    feature_id_to_function)
+        return {'fasta_file_path': fasta_file_path,
+                'feature_ids': feature_ids,
+                'short_id_to_rec_id': short_id_to_rec_id,
+                'feature_id_to_function': feature_id_to_function,
+                'ama_ref_to_obj_name': {params['ama_ref']: ama['info'][NAME_I]}}
+
+
+    def ParseFastaStr(self, params):
+        header_id = 'query'
+        header_desc = ''
+        seq_lines = []
+        for line in params['fasta_str'].splitlines():
+            line = line.strip()
+            if line.startswith('>'):
+                header_parts = line[1:].split(None, 1)
+                if header_parts:
+                    header_id = header_parts[0]
+                if len(header_parts) > 1:
+                    header_desc = header_parts[1]
+            elif line != '':
+                seq_lines.append(line.replace(' ', ''))
+        seq = ''.join(seq_lines)
+        if params.get('case', 'UPPER').upper() == 'UPPER':
+            seq = seq.upper()
+        return {'id': header_id, 'desc': header_desc, 'seq': seq}
+
+
+###############################################################################
+# install_local_services(): route every get_client() to the stand-ins
+###############################################################################
+#
+#   patches the shared pool's client factory; the pool is emptied both ways
+#   so no real client outlives the install, and no stand-in the uninstall
+#
+STAND_IN_CLASSES = {workspaceService:           LocalWorkspace,
+                    DFUClient:                  LocalDataFileUtil,
+                    KBaseReport:                LocalKBaseReport,
+                    KBaseDataObjectToFileUtils: LocalDataObjectToFileUtils}
+
+
+def install_local_services(store):
+    def build_stand_in(client_class, url, **client_kwargs):
+        if client_class in STAND_IN_CLASSES:
+            return STAND_IN_CLASSES[client_class](store, url, **client_kwargs)
+        return client_class(url, **client_kwargs)
+
+    with CLIENT_POOL.lock:
+        CLIENT_POOL._build = build_stand_in
+        CLIENT_POOL.clients = dict()
+
+
+def uninstall_local_services():
+    with CLIENT_POOL.lock:
+        # back to the class's own _build()
+        CLIENT_POOL.__dict__.pop('_build', None)
+        CLIENT_POOL.clients = dict()
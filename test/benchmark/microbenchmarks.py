@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+#
+# Microbenchmarks of the Python hot paths of kb_blast, on synthetic BLAST
+# outfmt 7 output of 1k, 100k and 1M lines (and sequences / MSAs of
+# comparable size), with JSON baselines and a regression check.
+#
+#   PYTHONPATH=lib python test/benchmark/microbenchmarks.py [--sizes 1000,100000]
+#       [--only parse_BLAST_tab_output,...] [--save NAME] [--compare NAME]
+#       [--threshold 0.25]
+#
+# --save writes baselines/NAME.json next to this file; --compare reads it and
+# exits 1 if any benchmark's best time is more than threshold slower (and by
+# at least MIN_REGRESSION_SECS).
+# Baselines are only comparable on the same machine.
+#
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.JobLog import get_logger
+from kb_blast.Utils.MSAPrep import check_protein_MSA, write_psiBLAST_msa_files
+
+from local_services import LocalObjectStore, install_local_services, uninstall_local_services
+from synthetic_data import AMINO_ACIDS, random_protein
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+DEFAULT_SIZES = '1000,100000,1000000'
+DEFAULT_THRESHOLD = 0.25
+
+# slowdowns smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_SECS = 0.001
+
+# _write_HTML_report() looks each hit up among its genome's features, so keep
+# genomes small enough that the largest sizes finish
+FEATURES_PER_GENOME = 100
+QUERY_LEN = 300
+
+# HTML output above this many hits is skipped unless --all-sizes is given
+HTML_MAX_LINES = 100000
+
+
+###############################################################################
+# synthetic BLAST output
+###############################################################################
+
+# hit_table(): outfmt 7 for n_lines hits of one query against a GenomeSet,
+# and the target_feature_info the GenomeSet conversion would have returned
+#
+def hit_table(out_dir, n_lines, delim, seed=1):
+    rng = random.Random(seed)
+    n_genomes = max(1, n_lines // FEATURES_PER_GENOME)
+    target_feature_info = {'short_id_to_rec_id': dict(),
+                           'feature_ids_by_genome_id': dict(),
+                           'genome_id_to_genome_ref': dict(),
+                           'feature_id_to_function': dict(),
+                           'genome_ref_to_sci_name': dict(),
+                           'genome_ref_to_obj_name': dict()}
+    for g in range(n_genomes):
+        genome_id = 'genome_'+str(g+1)
+        genome_ref = '1/'+str(g+1)+'/1'
+        fids = ['g'+str(g+1)+'_'+str(f+1).zfill(5) for f in range(FEATURES_PER_GENOME)]
+        target_feature_info['feature_ids_by_genome_id'][genome_id] = fids
+        target_feature_info['genome_id_to_genome_ref'][genome_id] = genome_ref
+        target_feature_info['feature_id_to_function'][genome_ref] = {fid: 'hypothetical protein' for fid in fids}
+        target_feature_info['genome_ref_to_sci_name'][genome_ref] = 'Synthetica benchmarkii '+str(g+1)
+        target_feature_info['genome_ref_to_obj_name'][genome_ref] = genome_id+'.Genome'
+
+    aln_file_path = os.path.join(out_dir, 'alnout_'+str(n_lines)+'.txt')
+    with open(aln_file_path, 'w') as aln_handle:
+        aln_handle.write('# BLASTP 2.13.0+\n# Query: query_prot\n# Database: genomes.fasta\n'
+                         '# Fields: query id, subject id, % identity, alignment length, mismatches, '
+                         'gap opens, q. start, q. end, s. start, s. end, evalue, bit score\n'
+                         '# '+str(n_lines)+' hits found\n')
+        for i in range(n_lines):
+            g = (i // FEATURES_PER_GENOME) % n_genomes
+            f = i % FEATURES_PER_GENOME
+            aln_len = rng.randint(QUERY_LEN // 4, QUERY_LEN)
+            aln_handle.write("\t".join(['query_prot',
+                                        '1/'+str(g+1)+'/1'+delim+'g'+str(g+1)+'_'+str(f+1).zfill(5),
+                                        '%.3f' % rng.uniform(20.0, 100.0),
+                                        str(aln_len),
+                                        str(rng.randint(0, aln_len // 2)),
+                                        str(rng.randint(0, 5)),
+                                        '1', str(aln_len), '1', str(aln_len),
+                                        '%.2e' % (10 ** -rng.uniform(1, 150)),
+                                        '%.1f' % rng.uniform(20.0, 600.0)])+"\n")
+        aln_handle.write('# BLAST processed 1 queries\n')
+    return (aln_file_path, target_feature_info)
+
+
+def fasta_file(out_dir, n_lines, seed=1):
+    rng = random.Random(seed)
+    fasta_file_path = os.path.join(out_dir, 'query_'+str(n_lines)+'.fasta')
+    with open(fasta_file_path, 'w') as fasta_handle:
+        fasta_handle.write('>query\n')
+        for i in range(n_lines):
+            fasta_handle.write(''.join(rng.choice(AMINO_ACIDS) for j in range(60))+"\n")
+    return fasta_file_path
+
+
+# msa(): n_residues spread over rows of QUERY_LEN columns
+#
+def msa(n_residues, seed=1):
+    rng = random.Random(seed)
+    n_rows = max(2, n_residues // QUERY_LEN)
+    alignment = dict()
+    for r in range(n_rows):
+        row = list(random_protein(rng, QUERY_LEN))
+        for i in rng.sample(range(QUERY_LEN), QUERY_LEN // 10):
+            row[i] = '-'
+        alignment['row_'+str(r+1)] = ''.join(row)
+    return {'alignment_length': QUERY_LEN,
+            'sequence_type': 'protein',
+            'alignment': alignment}
+
+
+###############################################################################
+# benchmarks: name -> setup(bench, n) returning the function to time
+###############################################################################
+
+PARSE_PARAMS = {'output_filtered_name': 'bench.hits',
+                'input_one_ref': '1/1/1',
+                'ident_thresh': '40.0',
+                'bitscore': '50',
+                'overlap_fraction': '50.0'}
+
+
+def parsed_results(bench, n):
+    key = ('parsed', n)
+    if key not in bench.cache:
+        (aln_file_path, target_feature_info) = hit_table(bench.work_dir, n, bench.blastUtil.genome_id_feature_id_delim)
+        parsed = bench.blastUtil.parse_BLAST_tab_output(output_aln_file_path = aln_file_path,
+                                                         search_tool_name = 'BLASTp',
+                                                         params = PARSE_PARAMS,
+                                                         query_len = QUERY_LEN,
+                                                         target_ref = '1/1000000/1',
+                                                         target_name = 'genomes',
+                                                         target_type_name = 'GenomeSet',
+                                                         target_feature_info = target_feature_info)
+        bench.cache[key] = (aln_file_path, target_feature_info, parsed)
+    return bench.cache[key]
+
+
+def setup_parse_BLAST_tab_output(bench, n):
+    (aln_file_path, target_feature_info, parsed) = parsed_results(bench, n)
+    return lambda: bench.blastUtil.parse_BLAST_tab_output(output_aln_file_path = aln_file_path,
+                                                           search_tool_name = 'BLASTp',
+                                                           params = PARSE_PARAMS,
+                                                           query_len = QUERY_LEN,
+                                                           target_ref = '1/1000000/1',
+                                                           target_name = 'genomes',
+                                                           target_type_name = 'GenomeSet',
+                                                           target_feature_info = target_feature_info)
+
+
+def setup_write_HTML_report(bench, n):
+    if n > HTML_MAX_LINES and not bench.all_sizes:
+        return None
+    (aln_file_path, target_feature_info, parsed) = parsed_results(bench, n)
+    target_ref = '1/1000000/1'
+    return lambda: bench.blastUtil._write_HTML_report(search_tool_name = 'BLASTp',
+                                                      input_many_refs = [target_ref],
+                                                      targets_name = {target_ref: 'genomes'},
+                                                      targets_type_name = {target_ref: 'GenomeSet'},
+                                                      targets_feature_info = {target_ref: target_feature_info},
+                                                      genome_disp_name_config = 'obj_name_ver_sci_name',
+                                                      query_len = QUERY_LEN,
+                                                      all_parsed_BLAST_results = {target_ref: parsed})
+
+
+def setup_build_text_report(bench, n):
+    (aln_file_path, target_feature_info, parsed) = parsed_results(bench, n)
+    target_ref = '1/1000000/1'
+    return lambda: bench.blastUtil._build_text_report([target_ref],
+                                                      {target_ref: 'genomes'},
+                                                      {target_ref: parsed})
+
+
+def setup_validateSeq(bench, n):
+    rng = random.Random(n)
+    sequence_str = ''.join(rng.choice(AMINO_ACIDS) for i in range(n))
+    return lambda: bench.blastUtil.validateSeq('PROT', sequence_str, 'query')
+
+
+def setup_get_query_len(bench, n):
+    fasta_file_path = fasta_file(bench.work_dir, n)
+    return lambda: bench.blastUtil.get_query_len(fasta_file_path)
+
+
+def setup_psiBLAST_msa_prep(bench, n):
+    MSA_in = msa(n)
+    out_dir = tempfile.mkdtemp(dir=bench.work_dir)
+
+    def prep():
+        msa_files = write_psiBLAST_msa_files(MSA_in, out_dir, 'bench')
+        return check_protein_MSA(MSA_in, msa_files['row_order'])
+    return prep
+
+
+BENCHMARKS = [('parse_BLAST_tab_output', setup_parse_BLAST_tab_output),
+              ('write_HTML_report',      setup_write_HTML_report),
+              ('build_text_report',      setup_build_text_report),
+              ('validateSeq',            setup_validateSeq),
+              ('get_query_len',          setup_get_query_len),
+              ('psiBLAST_msa_prep',      setup_psiBLAST_msa_prep)]
+
+
+###############################################################################
+# runner
+###############################################################################
+
+class Bench:
+
+    def __init__(self, work_dir, all_sizes=False):
+        self.work_dir = work_dir
+        self.all_sizes = all_sizes
+        self.cache = dict()
+
+        # BlastUtil needs its clients; give it the local stand-ins
+        install_local_services(LocalObjectStore(os.path.join(work_dir, 'store')))
+        os.environ.setdefault('SDK_CALLBACK_URL', 'http://localhost:9/offline')
+        self.blastUtil = BlastUtil({'workspace-url': 'http://localhost:9/ws',
+                                    'shock-url': 'http://localhost:9/shock',
+                                    'handle-service-url': 'http://localhost:9/handle',
+                                    'service-wizard-url': 'http://localhost:9/wizard',
+                                    'scratch': os.path.join(work_dir, 'scratch')},
+                                   {'token': 'offline', 'provenance': [{}]})
+
+
+def time_it(fn, rounds):
+    times = []
+    for i in range(rounds):
+        begin = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - begin)
+    return times
+
+
+def rounds_for(n):
+    if n >= 1000000:
+        return 1
+    if n >= 100000:
+        return 3
+    return 10
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print('{:<40} {:>12} {:>12} {:>8}'.format('benchmark', 'baseline (s)', 'now (s)', 'ratio'))
+    for name in sorted(results):
+        if name not in baseline['results']:
+            print('{:<40} {:>12} {:>12.6f} {:>8}'.format(name, '-', results[name]['min_secs'], 'new'))
+            continue
+        base_secs = baseline['results'][name]['min_secs']
+        now_secs = results[name]['min_secs']
+        ratio = now_secs / base_secs if base_secs > 0 else float('inf')
+        flag = ''
+        if ratio > 1.0 + threshold and now_secs - base_secs >= MIN_REGRESSION_SECS:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<40} {:>12.6f} {:>12.6f} {:>7.2f}x{}'.format(name, base_secs, now_secs, ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default=DEFAULT_SIZES)
+    parser.add_argument('--only', default=None)
+    parser.add_argument('--all-sizes', action='store_true',
+                        help='also run the HTML report past '+str(HTML_MAX_LINES)+' lines')
+    parser.add_argument('--save', default=None, metavar='NAME')
+    parser.add_argument('--compare', default=None, metavar='NAME')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    get_logger().setLevel(logging.WARNING)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    only = args.only.split(',') if args.only else None
+
+    work_dir = tempfile.mkdtemp(prefix='kb_blast_micro_')
+    results = dict()
+    try:
+        bench = Bench(work_dir, all_sizes=args.all_sizes)
+        for (name, setup) in BENCHMARKS:
+            if only is not None and name not in only:
+                continue
+            for n in sizes:
+                fn = setup(bench, n)
+                if fn is None:
+                    continue
+                times = time_it(fn, rounds_for(n))
+                result_name = name+'['+str(n)+']'
+                results[result_name] = {'min_secs': round(min(times), 6),
+                                        'median_secs': round(statistics.median(times), 6),
+                                        'rounds': len(times)}
+                print('{:<40} {:>12.6f} s  (median {:.6f} s, {} rounds)'.format(
+                    result_name, min(times), statistics.median(times), len(times)))
+    finally:
+        uninstall_local_services()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save:
+        if not os.path.exists(BASELINE_DIR):
+            os.makedirs(BASELINE_DIR)
+        baseline_path = os.path.join(BASELINE_DIR, args.save+'.json')
+        with open(baseline_path, 'w') as baseline_handle:
+            json.dump({'machine': {'node': platform.node(),
+                                   'processor': platform.processor() or platform.machine(),
+                                   'python': platform.python_version()},
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'results': results},
+                      baseline_handle, indent=1, sort_keys=True)
+        print('saved baseline '+baseline_path)
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, args.compare+'.json'), 'r') as baseline_handle:
+            baseline = json.load(baseline_handle)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(str(len(regressions))+' benchmark(s) more than '+str(int(args.threshold*100))+'% slower than '+args.compare)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# End-to-end benchmark of the six *_Search methods against the local service
+# stand-ins in local_services.py, on synthetic inputs from synthetic_data.py.
+# Prints total and per-stage wall time for each method (stages from the
+# report's stage timeline).
+#
+#   PYTHONPATH=lib python test/benchmark/offline_benchmark.py \
+#       [--blast-bin-dir /kb/module/blast/bin | --fake-blast] [--methods BLASTp_Search,...] \
+#       [--genomes 2] [--features 200] [--repeat 1] [--json-out results.json]
+#
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from kb_blast.kb_blastImpl import kb_blast
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.JobLog import get_logger
+
+from fake_blast import make_bin_dir
+from local_services import install_local_services, uninstall_local_services
+from synthetic_data import WORKSPACE, load_or_generate
+
+ALL_METHODS = ['BLASTn_Search', 'BLASTp_Search', 'BLASTx_Search',
+               'tBLASTn_Search', 'tBLASTx_Search', 'psiBLAST_msa_start_Search']
+
+# class attribute -> BLAST+ program, on both the Impl and BlastUtil
+BLAST_PROGRAMS = {'Make_BLAST_DB': 'makeblastdb',
+                  'BLASTn':        'blastn',
+                  'BLASTp':        'blastp',
+                  'BLASTx':        'blastx',
+                  'tBLASTn':       'tblastn',
+                  'tBLASTx':       'tblastx',
+                  'psiBLAST':      'psiblast'}
+
+
+###############################################################################
+# setup
+###############################################################################
+
+def set_blast_bin_dir(blast_bin_dir):
+    for attr, program in BLAST_PROGRAMS.items():
+        program_path = os.path.join(blast_bin_dir, program)
+        if not os.access(program_path, os.X_OK):
+            raise ValueError('no '+program+' in '+blast_bin_dir)
+        setattr(BlastUtil, attr, program_path)
+        setattr(kb_blast, attr, program_path)
+
+
+# offline_impl(): a kb_blast Impl whose clients all go to store
+#
+def offline_impl(store, scratch):
+    install_local_services(store)
+    os.environ.setdefault('SDK_CALLBACK_URL', 'http://localhost:9/offline')
+    config = {'workspace-url': 'http://localhost:9/ws',
+              'shock-url': 'http://localhost:9/shock',
+              'handle-service-url': 'http://localhost:9/handle',
+              'service-wizard-url': 'http://localhost:9/wizard',
+              'scratch': scratch}
+    return kb_blast(config)
+
+
+###############################################################################
+# runs
+###############################################################################
+
+# method_params(): every target type at once, or only target_names if given
+#
+def method_params(method, refs, run_i, target_names=None):
+    params = {'workspace_name': WORKSPACE,
+              'output_filtered_name': method+'.run'+str(run_i)+'.hits',
+              'genome_disp_name_config': 'obj_name_ver_sci_name',
+              'e_value': '.001',
+              'bitscore': '50',
+              'ident_thresh': '40.0',
+              'overlap_fraction': '50.0',
+              'maxaccepts': '1000',
+              'write_off_code_prot_seq': '1',
+              'output_extra_format': 'none'}
+    if target_names is None:
+        target_names = ['genome', 'genomeSet', 'featureSet', 'tree', 'ama']
+
+    if method == 'psiBLAST_msa_start_Search':
+        params['input_msa_ref'] = refs['msa']
+        # psiBLAST takes a single Genome, GenomeSet or FeatureSet
+        if target_names[0] in ('genome', 'genomeSet', 'featureSet'):
+            params['input_many_ref'] = refs[target_names[0]]
+        else:
+            params['input_many_ref'] = refs['genomeSet']
+        return params
+
+    if method in ('BLASTn_Search', 'BLASTx_Search', 'tBLASTx_Search'):
+        params['input_one_sequence'] = refs['query_nuc_str']
+        params['output_one_name'] = method+'.run'+str(run_i)+'.query'
+    else:
+        params['input_one_ref'] = refs['query_prot']
+    params['input_many_refs'] = [refs[target_name] for target_name in target_names]
+    return params
+
+
+# job_files(): report file links by name -> local path in the store
+#
+def job_files(store, report_ref):
+    report = store.get(report_ref)['data']
+    return {file_link['name']: store.get_file_path(file_link['shock_id'])
+            for file_link in report.get('file_links', [])}
+
+
+# stage_totals(): the report's stage timeline, summed like StageTimer.summary()
+#
+def stage_totals(files, thread_name):
+    totals = dict()
+    peak_rss_kb = 0
+    for name, file_path in files.items():
+        if not name.endswith('-stage_timeline.json'):
+            continue
+        with open(file_path, 'r') as timeline_handle:
+            timeline = json.load(timeline_handle)
+        for span in timeline['spans']:
+            peak_rss_kb = max(peak_rss_kb, span['peak_rss_kb'])
+            if span['depth'] == 0 and span['thread'] == thread_name:
+                totals[span['stage']] = totals.get(span['stage'], 0.0) + span['wall_secs']
+    return (totals, peak_rss_kb)
+
+
+def child_max_rss_kb(files):
+    max_rss_kb = 0
+    for name, file_path in files.items():
+        if not name.endswith('-process_metrics.json'):
+            continue
+        with open(file_path, 'r') as metrics_handle:
+            for process in json.load(metrics_handle)['processes']:
+                max_rss_kb = max(max_rss_kb, process.get('max_rss_kb', 0))
+    return max_rss_kb
+
+
+# hit_features(): (genome_ref, feature_id) of every FeatureSet the report made
+#
+def hit_features(store, report_ref):
+    hits = set()
+    for obj in store.get(report_ref)['data'].get('objects_created', []):
+        obj_data = store.get(obj['ref'])['data']
+        for fid, genome_refs in obj_data.get('elements', {}).items():
+            for genome_ref in genome_refs:
+                hits.add((genome_ref, fid))
+    return hits
+
+
+# run_method(): one call, with its timings and resource use
+#
+def run_method(impl, store, method, params):
+    ctx = {'token': 'offline',
+           'provenance': [{'service': 'kb_blast', 'method': method,
+                           'method_params': [params]}]}
+    begin = time.time()
+    ret = getattr(impl, method)(ctx, params)[0]
+    wall_secs = time.time() - begin
+
+    files = job_files(store, ret['report_ref'])
+    (stages, python_peak_rss_kb) = stage_totals(files, threading.current_thread().name)
+    return {'method': method,
+            'report_ref': ret['report_ref'],
+            'wall_secs': round(wall_secs, 6),
+            'stages': stages,
+            'python_peak_rss_kb': python_peak_rss_kb,
+            'child_max_rss_kb': child_max_rss_kb(files)}
+
+
+def print_results(results):
+    stages = []
+    for result in results:
+        stages.extend(stage for stage in result['stages'] if stage not in stages)
+    widths = [max(len(stage), 8) for stage in stages]
+    print('{:<28} {:>4} {:>9}'.format('method', 'run', 'total') +
+          ''.join(' '+stage.rjust(width) for stage, width in zip(stages, widths)))
+    for result in results:
+        print('{:<28} {:>4} {:>9.3f}'.format(result['method'], result['run'], result['wall_secs']) +
+              ''.join(' '+('%.3f' % result['stages'][stage] if stage in result['stages'] else '-').rjust(width)
+                      for stage, width in zip(stages, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blast-bin-dir', default=os.path.dirname(BlastUtil.BLASTp))
+    parser.add_argument('--fake-blast', action='store_true',
+                        help='use the stand-ins in fake_blast.py instead of BLAST+')
+    parser.add_argument('--methods', default=','.join(ALL_METHODS))
+    parser.add_argument('--genomes', type=int, default=2)
+    parser.add_argument('--features', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--keep', action='store_true')
+    parser.add_argument('--json-out', default=None)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        get_logger().setLevel(logging.WARNING)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='kb_blast_bench_')
+    if args.fake_blast:
+        set_blast_bin_dir(make_bin_dir(os.path.join(work_dir, 'fake_blast_bin')))
+    else:
+        set_blast_bin_dir(args.blast_bin_dir)
+    try:
+        (store, dataset) = load_or_generate(os.path.join(work_dir, 'store'), args.genomes,
+                                            features_per_genome=args.features)
+        impl = offline_impl(store, os.path.join(work_dir, 'scratch'))
+        results = []
+        for method in args.methods.split(','):
+            for run_i in range(args.repeat):
+                result = run_method(impl, store, method, method_params(method, dataset['refs'], run_i))
+                result['run'] = run_i
+                results.append(result)
+    finally:
+        uninstall_local_services()
+        if not args.keep and args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.json_out:
+        with open(args.json_out, 'w') as json_handle:
+            json.dump({'genomes': args.genomes, 'features': args.features, 'results': results},
+                      json_handle, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Scaling benchmark: each BLAST flavor against GenomeSets of 1, 10, 100 and
+# 1,000 synthetic genomes (synthetic_data.py), run through the local service
+# stand-ins.  Records wall time, peak RSS of the Python side and of the
+# makeblastdb/BLAST children, and how many of the planted homologs were found
+# at each identity level.
+#
+#   PYTHONPATH=lib python test/benchmark/scaling_benchmark.py WORK_DIR \
+#       [--sizes 1,10,100,1000] [--methods BLASTp_Search,...] \
+#       [--blast-bin-dir /kb/module/blast/bin | --fake-blast]
+#
+# Writes WORK_DIR/scaling.csv and, if matplotlib is installed, WORK_DIR/scaling.png.
+# Generated datasets are kept in WORK_DIR/store and reused by later runs.
+#
+import argparse
+import csv
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.JobLog import get_logger
+
+from fake_blast import make_bin_dir
+from local_services import uninstall_local_services
+from offline_benchmark import ALL_METHODS, hit_features, method_params, offline_impl, run_method, set_blast_bin_dir
+from synthetic_data import DEFAULT_FEATURES_PER_GENOME, load_or_generate
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+
+# found_by_identity(): planted homologs found, per identity level
+#
+def found_by_identity(expected_hits, hits):
+    found = dict()
+    for expected_hit in expected_hits:
+        identity = expected_hit['identity']
+        (n_found, n_expected) = found.get(identity, (0, 0))
+        if (expected_hit['genome_ref'], expected_hit['feature_id']) in hits:
+            n_found += 1
+        found[identity] = (n_found, n_expected + 1)
+    return found
+
+
+def plot(rows, methods, png_path):
+    (fig, (wall_ax, rss_ax)) = plt.subplots(1, 2, figsize=(12, 5))
+    for method in methods:
+        method_rows = [row for row in rows if row['method'] == method]
+        if not method_rows:
+            continue
+        sizes = [row['n_genomes'] for row in method_rows]
+        wall_ax.plot(sizes, [row['wall_secs'] for row in method_rows], marker='o', label=method)
+        rss_ax.plot(sizes, [row['python_peak_rss_kb'] / 1024.0 for row in method_rows], marker='o',
+                    label=method+' (python)')
+        rss_ax.plot(sizes, [row['child_max_rss_kb'] / 1024.0 for row in method_rows], marker='x',
+                    linestyle='--', label=method+' (BLAST)')
+    for (ax, ylabel) in [(wall_ax, 'wall time (s)'), (rss_ax, 'peak RSS (MB)')]:
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('genomes in target')
+        ax.set_ylabel(ylabel)
+        ax.grid(True, which='both', alpha=0.3)
+    wall_ax.legend(fontsize='small')
+    rss_ax.legend(fontsize='x-small')
+    fig.tight_layout()
+    fig.savefig(png_path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('work_dir')
+    parser.add_argument('--sizes', default='1,10,100,1000')
+    parser.add_argument('--methods', default=','.join(ALL_METHODS))
+    parser.add_argument('--features', type=int, default=DEFAULT_FEATURES_PER_GENOME)
+    parser.add_argument('--blast-bin-dir', default=os.path.dirname(BlastUtil.BLASTp))
+    parser.add_argument('--fake-blast', action='store_true',
+                        help='use the stand-ins in fake_blast.py instead of BLAST+')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        get_logger().setLevel(logging.WARNING)
+    if args.fake_blast:
+        set_blast_bin_dir(make_bin_dir(os.path.join(args.work_dir, 'fake_blast_bin')))
+    else:
+        set_blast_bin_dir(args.blast_bin_dir)
+    methods = args.methods.split(',')
+    store_dir = os.path.join(args.work_dir, 'store')
+
+    rows = []
+    identity_levels = set()
+    try:
+        for n_genomes in [int(size) for size in args.sizes.split(',')]:
+            (store, dataset) = load_or_generate(store_dir, n_genomes, features_per_genome=args.features)
+            impl = offline_impl(store, os.path.join(args.work_dir, 'scratch'))
+            for method in methods:
+                params = method_params(method, dataset['refs'], 0, target_names=['genomeSet'])
+                params['output_filtered_name'] += '.'+str(n_genomes)
+                result = run_method(impl, store, method, params)
+                found = found_by_identity(dataset['expected_hits'], hit_features(store, result['report_ref']))
+                identity_levels.update(found.keys())
+                row = {'method': method,
+                       'n_genomes': n_genomes,
+                       'n_features': n_genomes * dataset['features_per_genome'],
+                       'wall_secs': result['wall_secs'],
+                       'python_peak_rss_kb': result['python_peak_rss_kb'],
+                       'child_max_rss_kb': result['child_max_rss_kb']}
+                for identity, (n_found, n_expected) in found.items():
+                    row['found_'+str(identity)] = str(n_found)+'/'+str(n_expected)
+                rows.append(row)
+                print('{:<28} {:>6} genomes {:>9.3f} s {:>8} KB python {:>8} KB BLAST'.format(
+                    method, n_genomes, row['wall_secs'], row['python_peak_rss_kb'], row['child_max_rss_kb']))
+    finally:
+        uninstall_local_services()
+
+    fieldnames = ['method', 'n_genomes', 'n_features', 'wall_secs', 'python_peak_rss_kb', 'child_max_rss_kb']
+    fieldnames += ['found_'+str(identity) for identity in sorted(identity_levels, reverse=True)]
+    csv_path = os.path.join(args.work_dir, 'scaling.csv')
+    with open(csv_path, 'w') as csv_handle:
+        writer = csv.DictWriter(csv_handle, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    print('wrote '+csv_path)
+
+    if plt is None:
+        print('matplotlib not installed, no plot')
+    else:
+        png_path = os.path.join(args.work_dir, 'scaling.png')
+        plot(rows, methods, png_path)
+        print('wrote '+png_path)
+
+
+if __name__ == '__main__':
+    main()
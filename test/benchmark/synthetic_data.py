@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# Reproducible synthetic inputs for the kb_blast benchmarks: genomes of random
+# proteins with homologs of one query planted at controlled identity levels,
+# and the GenomeSet, FeatureSet, Tree, AnnotatedMetagenomeAssembly, MSA and
+# SequenceSet objects built over them, saved to a LocalObjectStore.
+#
+# The planted homologs are the expected hits.  Identity is controlled at the
+# protein level; the DNA is a back-translation with random synonymous codons,
+# so nucleotide searches see lower identity for the same homolog.
+#
+#   PYTHONPATH=lib python test/benchmark/synthetic_data.py STORE_DIR --genomes 10
+#
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib'))
+
+from local_services import LocalObjectStore
+
+WORKSPACE = 'kb_blast_benchmark'
+
+DEFAULT_FEATURES_PER_GENOME = 200
+DEFAULT_IDENTITY_LEVELS = (0.95, 0.8, 0.6, 0.4, 0.25)
+DEFAULT_QUERY_LEN = 300
+
+# features per genome that go in the FeatureSet, besides the planted homologs
+FEATURESET_DECOYS_PER_GENOME = 10
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+CODONS = {'A': ['GCT', 'GCC', 'GCA', 'GCG'],
+          'C': ['TGT', 'TGC'],
+          'D': ['GAT', 'GAC'],
+          'E': ['GAA', 'GAG'],
+          'F': ['TTT', 'TTC'],
+          'G': ['GGT', 'GGC', 'GGA', 'GGG'],
+          'H': ['CAT', 'CAC'],
+          'I': ['ATT', 'ATC', 'ATA'],
+          'K': ['AAA', 'AAG'],
+          'L': ['TTA', 'TTG', 'CTT', 'CTC', 'CTA', 'CTG'],
+          'M': ['ATG'],
+          'N': ['AAT', 'AAC'],
+          'P': ['CCT', 'CCC', 'CCA', 'CCG'],
+          'Q': ['CAA', 'CAG'],
+          'R': ['CGT', 'CGC', 'CGA', 'CGG', 'AGA', 'AGG'],
+          'S': ['TCT', 'TCC', 'TCA', 'TCG', 'AGT', 'AGC'],
+          'T': ['ACT', 'ACC', 'ACA', 'ACG'],
+          'V': ['GTT', 'GTC', 'GTA', 'GTG'],
+          'W': ['TGG'],
+          'Y': ['TAT', 'TAC']}
+STOP_CODONS = ['TAA', 'TAG', 'TGA']
+
+
+###############################################################################
+# sequences
+###############################################################################
+
+def random_protein(rng, length):
+    return 'M'+''.join(rng.choice(AMINO_ACIDS) for i in range(length-1))
+
+
+# mutate_protein(): exactly round(identity * length) residues kept
+#
+def mutate_protein(rng, protein, identity):
+    residues = list(protein)
+    n_changes = len(residues) - int(round(identity * len(residues)))
+    for i in rng.sample(range(1, len(residues)), min(n_changes, len(residues)-1)):
+        residues[i] = rng.choice([aa for aa in AMINO_ACIDS if aa != residues[i]])
+    return ''.join(residues)
+
+
+def back_translate(rng, protein):
+    return ''.join(rng.choice(CODONS[aa]) for aa in protein)+rng.choice(STOP_CODONS)
+
+
+def info_to_ref(info):
+    return str(info[6])+'/'+str(info[0])+'/'+str(info[4])
+
+
+def feature_id(genome_i, feature_i):
+    return 'g'+str(genome_i+1).zfill(4)+'_'+str(feature_i+1).zfill(5)
+
+
+###############################################################################
+# generate_dataset()
+###############################################################################
+
+# generate_dataset(): save a dataset of n_genomes to store
+#
+#   every genome gets one homolog of the query per identity level, at random
+#   positions among features_per_genome features.  Returns refs to the saved
+#   objects and expected_hits, one per planted homolog:
+#
+#     { 'genome_ref', 'feature_id', 'identity' }
+#
+def generate_dataset(store, n_genomes, features_per_genome=None, identity_levels=None,
+                     query_len=None, seed=1):
+    if features_per_genome is None:
+        features_per_genome = DEFAULT_FEATURES_PER_GENOME
+    if identity_levels is None:
+        identity_levels = DEFAULT_IDENTITY_LEVELS
+    if query_len is None:
+        query_len = DEFAULT_QUERY_LEN
+    if features_per_genome < len(identity_levels):
+        raise ValueError('need at least '+str(len(identity_levels))+' features per genome')
+
+    rng = random.Random(seed)
+    query_prot = random_protein(rng, query_len)
+    query_nuc = back_translate(rng, query_prot)
+
+    genome_refs = []
+    genome_ids = []
+    expected_hits = []
+    featureSet_elements = dict()
+    msa_rows = {'query': query_prot}
+    ama_features = None
+    for g in range(n_genomes):
+        homolog_positions = rng.sample(range(features_per_genome), len(identity_levels))
+        homolog_identity = dict(zip(homolog_positions, identity_levels))
+        decoy_positions = [f for f in range(features_per_genome) if f not in homolog_identity]
+        decoy_positions = rng.sample(decoy_positions, min(FEATURESET_DECOYS_PER_GENOME, len(decoy_positions)))
+
+        features = []
+        genome_featureSet_fids = []
+        for f in range(features_per_genome):
+            fid = feature_id(g, f)
+            if f in homolog_identity:
+                protein = mutate_protein(rng, query_prot, homolog_identity[f])
+                function = 'planted homolog, identity '+str(homolog_identity[f])
+                if homolog_identity[f] == max(identity_levels) and len(msa_rows) < 50:
+                    msa_rows['homolog_'+str(g+1)] = protein
+            else:
+                protein = random_protein(rng, rng.randint(query_len // 3, query_len * 2))
+                function = 'hypothetical protein'
+            features.append({'id': fid,
+                             'type': 'CDS',
+                             'function': function,
+                             'protein_translation': protein,
+                             'dna_sequence': back_translate(rng, protein)})
+            if f in homolog_identity or f in decoy_positions:
+                genome_featureSet_fids.append(fid)
+
+        genome_id = 'genome_'+str(g+1).zfill(4)
+        genome_ref = info_to_ref(store.save(WORKSPACE, 'KBaseGenomes.Genome',
+                                            {'id': genome_id,
+                                             'scientific_name': 'Synthetica benchmarkii '+str(g+1),
+                                             'domain': 'Bacteria',
+                                             'features': features},
+                                            name=genome_id+'.Genome'))
+        genome_refs.append(genome_ref)
+        genome_ids.append(genome_id)
+        for f in sorted(homolog_identity.keys()):
+            expected_hits.append({'genome_ref': genome_ref,
+                                  'feature_id': feature_id(g, f),
+                                  'identity': homolog_identity[f]})
+        for fid in genome_featureSet_fids:
+            featureSet_elements.setdefault(fid, []).append(genome_ref)
+        if ama_features is None:
+            ama_features = features
+
+    refs = {'genomes': genome_refs,
+            'genome': genome_refs[0]}
+    refs['genomeSet'] = info_to_ref(store.save(WORKSPACE, 'KBaseSearch.GenomeSet',
+                                               {'description': str(n_genomes)+' synthetic genomes',
+                                                'elements': {genome_id: {'ref': genome_ref}
+                                                             for genome_id, genome_ref in zip(genome_ids, genome_refs)}},
+                                               name='genomes_'+str(n_genomes)+'.GenomeSet'))
+    refs['featureSet'] = info_to_ref(store.save(WORKSPACE, 'KBaseCollections.FeatureSet',
+                                                {'description': 'planted homologs and decoys',
+                                                 'element_ordering': sorted(featureSet_elements.keys()),
+                                                 'elements': featureSet_elements},
+                                                name='features_'+str(n_genomes)+'.FeatureSet'))
+    refs['tree'] = info_to_ref(store.save(WORKSPACE, 'KBaseTrees.Tree',
+                                          {'tree': '('+','.join(genome_ids)+');',
+                                           'type': 'SpeciesTree',
+                                           'ws_refs': {genome_id: {'g': [genome_ref]}
+                                                       for genome_id, genome_ref in zip(genome_ids, genome_refs)}},
+                                          name='genomes_'+str(n_genomes)+'.Tree'))
+    # AMA features are kept in a gzipped JSON file, as in the real type
+    refs['ama'] = info_to_ref(store.save(WORKSPACE, 'KBaseMetagenomes.AnnotatedMetagenomeAssembly',
+                                         {'num_features': len(ama_features),
+                                          'features_handle_ref': store.put_json_gz(ama_features, 'features.json.gz')},
+                                         name='metagenome_'+str(n_genomes)+'.AMA'))
+
+    refs['query_prot'] = info_to_ref(store.save(WORKSPACE, 'KBaseSequences.SequenceSet',
+                                                {'sequence_set_id': 'query_prot',
+                                                 'sequences': [{'sequence_id': 'query_prot',
+                                                                'sequence': query_prot}]},
+                                                name='query_prot.SequenceSet'))
+    refs['query_nuc'] = info_to_ref(store.save(WORKSPACE, 'KBaseSequences.SequenceSet',
+                                               {'sequence_set_id': 'query_nuc',
+                                                'sequences': [{'sequence_id': 'query_nuc',
+                                                               'sequence': query_nuc}]},
+                                               name='query_nuc.SequenceSet'))
+    refs['query_nuc_str'] = '>query_nuc\n'+query_nuc
+    refs['msa'] = info_to_ref(store.save(WORKSPACE, 'KBaseTrees.MSA',
+                                         {'alignment_length': len(query_prot),
+                                          'sequence_type': 'protein',
+                                          'row_order': sorted(msa_rows.keys()),
+                                          'alignment': msa_rows},
+                                         name='homologs.MSA'))
+
+    return {'n_genomes': n_genomes,
+            'features_per_genome': features_per_genome,
+            'identity_levels': list(identity_levels),
+            'seed': seed,
+            'refs': refs,
+            'expected_hits': expected_hits}
+
+
+# load_or_generate(): reuse a dataset already in store_dir if it matches
+#
+def load_or_generate(store_dir, n_genomes, features_per_genome=None, identity_levels=None, seed=1):
+    store = LocalObjectStore(store_dir)
+    dataset_path = os.path.join(store_dir, 'dataset_'+str(n_genomes)+'.json')
+    if os.path.isfile(dataset_path):
+        with open(dataset_path, 'r') as dataset_handle:
+            dataset = json.load(dataset_handle)
+        if dataset['features_per_genome'] == (features_per_genome or DEFAULT_FEATURES_PER_GENOME) and \
+           dataset['identity_levels'] == list(identity_levels or DEFAULT_IDENTITY_LEVELS) and \
+           dataset['seed'] == seed:
+            return (store, dataset)
+
+    dataset = generate_dataset(store, n_genomes, features_per_genome=features_per_genome,
+                               identity_levels=identity_levels, seed=seed)
+    with open(dataset_path, 'w') as dataset_handle:
+        json.dump(dataset, dataset_handle, indent=1)
+    return (store, dataset)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store_dir')
+    parser.add_argument('--genomes', type=int, default=10)
+    parser.add_argument('--features', type=int, default=DEFAULT_FEATURES_PER_GENOME)
+    parser.add_argument('--identity-levels', default=','.join(str(i) for i in DEFAULT_IDENTITY_LEVELS))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    identity_levels = [float(i) for i in args.identity_levels.split(',')]
+    (store, dataset) = load_or_generate(args.store_dir, args.genomes, features_per_genome=args.features,
+                                        identity_levels=identity_levels, seed=args.seed)
+    print(str(dataset['n_genomes'])+' genomes, '+str(len(dataset['expected_hits']))+' planted homologs')
+    for name in ['genomeSet', 'featureSet', 'tree', 'ama', 'query_prot', 'query_nuc', 'msa']:
+        print('{:<12} {}'.format(name, dataset['refs'][name]))
+
+
+if __name__ == '__main__':
+    main()
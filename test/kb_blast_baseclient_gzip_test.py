@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import threading
+import unittest
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from installed_clients import baseclient
+
+
+# a JSON-RPC server that answers each call with the size of its params, and
+# either takes gzip request bodies or refuses them with a 415
+class _RPCHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        content_encoding = self.headers.get('Content-Encoding', 'identity')
+        self.server.requests.append(content_encoding)
+        if content_encoding == 'gzip':
+            if not self.server.accept_gzip:
+                self.send_response(415)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = gzip.decompress(body)
+        request = json.loads(body.decode('utf-8'))
+        response_body = json.dumps({'version': '1.1',
+                                    'id': request['id'],
+                                    'result': [len(request['params'][0])]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class kb_blastBaseClientGzipTest(unittest.TestCase):
+
+    def start_server(self, accept_gzip):
+        server = HTTPServer(('127.0.0.1', 0), _RPCHandler)
+        server.accept_gzip = accept_gzip
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        # a url of its own, so no test sees another's rejected urls
+        url = 'http://127.0.0.1:'+str(server.server_address[1])+'/'+str(uuid.uuid4())
+        return (server, url)
+
+    def big_param(self):
+        return 'ACGT' * (baseclient._COMPRESS_MIN_BYTES // 4 + 1)
+
+    def test_gzip_sent_when_opted_in(self):
+        (server, url) = self.start_server(accept_gzip=True)
+        client = baseclient.BaseClient(url, token='token', compress_requests=True)
+        self.assertEqual(client.call_method('Svc.method', [self.big_param()]), len(self.big_param()))
+        self.assertEqual(server.requests, ['gzip'])
+
+    def test_plain_when_not_opted_in(self):
+        (server, url) = self.start_server(accept_gzip=True)
+        client = baseclient.BaseClient(url, token='token')
+        self.assertEqual(client.call_method('Svc.method', [self.big_param()]), len(self.big_param()))
+        self.assertEqual(server.requests, ['identity'])
+
+    def test_plain_below_min_size(self):
+        (server, url) = self.start_server(accept_gzip=True)
+        client = baseclient.BaseClient(url, token='token', compress_requests=True)
+        self.assertEqual(client.call_method('Svc.method', ['ACGT']), 4)
+        self.assertEqual(server.requests, ['identity'])
+
+    def test_415_falls_back_to_plain_and_stays_off(self):
+        (server, url) = self.start_server(accept_gzip=False)
+        client = baseclient.BaseClient(url, token='token', compress_requests=True)
+        self.assertEqual(client.call_method('Svc.method', [self.big_param()]), len(self.big_param()))
+        self.assertEqual(server.requests, ['gzip', 'identity'])
+        # another client for the same url doesn't try gzip again
+        other_client = baseclient.BaseClient(url, token='token', compress_requests=True)
+        self.assertEqual(other_client.call_method('Svc.method', [self.big_param()]), len(self.big_param()))
+        self.assertEqual(server.requests, ['gzip', 'identity', 'identity'])
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import json
+import socket
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from installed_clients import baseclient
+
+
+# a JSON-RPC server that answers each call with the token it was sent, and
+# tries to set a cookie
+class _RPCHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        request = json.loads(body.decode('utf-8'))
+        self.server.requests.append({'method': request['method'],
+                                     'token': self.headers.get('Authorization'),
+                                     'cookie': self.headers.get('Cookie')})
+        response_body = json.dumps({'version': '1.1',
+                                    'id': request['id'],
+                                    'result': [self.headers.get('Authorization')]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.send_header('Set-Cookie', 'session=' + str(self.headers.get('Authorization')))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class kb_blastBaseClientSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        baseclient.close_sessions()
+        self.addCleanup(baseclient.close_sessions)
+
+    def start_server(self):
+        server = HTTPServer(('127.0.0.1', 0), _RPCHandler)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return (server, 'http://127.0.0.1:'+str(server.server_address[1]))
+
+    def test_one_session_per_host_whatever_the_token(self):
+        (server, url) = self.start_server()
+        for n in range(3):
+            client = baseclient.BaseClient(url+'/path_'+str(n), token='token_'+str(n))
+            self.assertEqual(client.call_method('Svc.method', []), 'token_'+str(n))
+        self.assertEqual([request['token'] for request in server.requests], ['token_0', 'token_1', 'token_2'])
+
+        stats = baseclient.session_pool_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['url'], url)
+        self.assertEqual(stats[0]['requests'], 3)
+        self.assertNotIn('token', json.dumps(stats))
+
+    def test_cookies_are_not_shared(self):
+        (server, url) = self.start_server()
+        baseclient.BaseClient(url, token='token_a').call_method('Svc.method', [])
+        baseclient.BaseClient(url, token='token_b').call_method('Svc.method', [])
+        self.assertEqual([request['cookie'] for request in server.requests], [None, None])
+
+
+# a Service Wizard that is also the service it points to, and whose
+# _check_job can be made to drop the connection
+class _WizardHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        request = json.loads(body.decode('utf-8'))
+        self.server.requests.append(request['method'])
+        if request['method'] == 'ServiceWizard.get_service_status':
+            result = [{'url': self.server.service_url}]
+        elif request['method'] == 'Svc._method_submit':
+            result = ['job_1']
+        elif request['method'] == 'Svc._check_job':
+            if self.server.drop_checks:
+                self.close_connection = True
+                return
+            result = [{'finished': 1, 'result': ['done']}]
+        else:
+            result = ['ok']
+        response_body = json.dumps({'version': '1.1', 'id': request['id'], 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class kb_blastBaseClientServiceURLTest(unittest.TestCase):
+
+    def setUp(self):
+        baseclient.clear_service_url_cache()
+        self.addCleanup(baseclient.clear_service_url_cache)
+        self.server = HTTPServer(('127.0.0.1', 0), _WizardHandler)
+        self.server.requests = []
+        self.server.drop_checks = False
+        self.url = 'http://127.0.0.1:'+str(self.server.server_address[1])
+        self.server.service_url = self.url
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.client = baseclient.BaseClient(self.url, token='token', lookup_url=True,
+                                            async_job_check_time_ms=10, async_job_check_max_time_ms=10)
+
+    def stop_server(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def dead_url(self):
+        dead_socket = socket.socket()
+        dead_socket.bind(('127.0.0.1', 0))
+        dead_url = 'http://127.0.0.1:'+str(dead_socket.getsockname()[1])
+        dead_socket.close()
+        return dead_url
+
+    def cached(self):
+        return self.client._service_url_key('Svc.method', 'release') in baseclient._SERVICE_URLS
+
+    def test_resolved_once(self):
+        for _ in range(3):
+            self.assertEqual(self.client.call_method('Svc.method', [], service_ver='release'), 'ok')
+        self.assertEqual(self.server.requests.count('ServiceWizard.get_service_status'), 1)
+        self.stop_server()
+
+    def test_call_method_connection_error_forgets_url(self):
+        self.server.service_url = self.dead_url()
+        with self.assertRaises(baseclient.ConnectionError):
+            self.client.call_method('Svc.method', [], service_ver='release')
+        self.assertFalse(self.cached())
+        self.server.service_url = self.url
+        self.assertEqual(self.client.call_method('Svc.method', [], service_ver='release'), 'ok')
+        self.assertEqual(self.server.requests.count('ServiceWizard.get_service_status'), 2)
+        self.stop_server()
+
+    def test_submit_connection_error_forgets_url(self):
+        self.client.call_method('Svc.method', [], service_ver='release')
+        self.assertTrue(self.cached())
+        self.stop_server()
+        with self.assertRaises(baseclient.ConnectionError):
+            self.client.run_job('Svc.method', [], service_ver='release')
+        self.assertFalse(self.cached())
+
+    def test_check_job_connection_error_forgets_url(self):
+        self.client.call_method('Svc.method', [], service_ver='release')
+        self.assertTrue(self.cached())
+        self.server.drop_checks = True
+        with mock.patch.object(baseclient._traceback, 'print_exc'):
+            with self.assertRaises(RuntimeError):
+                self.client.run_job('Svc.method', [], service_ver='release')
+        self.assertEqual(self.server.requests.count('Svc._check_job'), 3)
+        self.assertFalse(self.cached())
+        self.stop_server()
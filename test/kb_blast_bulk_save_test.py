@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+
+from kb_blast.kb_blastImpl import kb_blast
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.JobLog import get_logger
+
+from offline_benchmark import BLAST_PROGRAMS, method_params, offline_impl, run_method, set_blast_bin_dir
+from fake_blast import make_bin_dir
+from local_services import uninstall_local_services
+from synthetic_data import load_or_generate
+
+
+# a Workspace client that saves in the order given, and numbers each call
+class _Workspace:
+
+    def __init__(self):
+        self.calls = []
+
+    def save_objects(self, params):
+        self.calls.append([obj['name'] for obj in params['objects']])
+        return [[len(self.calls) * 10 + n, obj['name'], obj['type'], None, 1, 'user', 7, params['workspace'], None, 0, {}]
+                for n, obj in enumerate(params['objects'])]
+
+
+class kb_blastBulkSaveTest(unittest.TestCase):
+
+    def blast_util(self, max_payload):
+        blast_util = BlastUtil.__new__(BlastUtil)
+        blast_util.job_log = mock.Mock()
+        blast_util.wsClient = _Workspace()
+        blast_util.max_save_objects_payload = max_payload
+        return blast_util
+
+    def test_merge_keeps_first_order_and_drops_repeats(self):
+        merged = self.blast_util(0).merge_FeatureSets(
+            [{'element_ordering': ['f1', 'f2'], 'elements': {'f1': ['1/2/3'], 'f2': ['1/2/3']}},
+             {'element_ordering': ['f3', 'f1'], 'elements': {'f3': ['1/4/1'], 'f1': ['1/2/3', '1/5/1']}}],
+            'Merged')
+        self.assertEqual(merged, {'description': 'Merged',
+                                  'element_ordering': ['f1', 'f2', 'f3'],
+                                  'elements': {'f1': ['1/2/3', '1/5/1'], 'f2': ['1/2/3'], 'f3': ['1/4/1']}})
+
+    def test_save_chunks_by_payload_and_returns_refs_by_name(self):
+        output_objs = [{'type': 'KBaseCollections.FeatureSet', 'name': 'hits-'+str(n),
+                        'data': {'description': 'x' * 100}} for n in range(5)]
+        blast_util = self.blast_util(250)
+        saved_refs = blast_util.save_output_objects('ws', output_objs)
+        self.assertEqual(blast_util.wsClient.calls, [['hits-0', 'hits-1'], ['hits-2', 'hits-3'], ['hits-4']])
+        self.assertEqual(saved_refs, {'hits-0': '7/10/1', 'hits-1': '7/11/1', 'hits-2': '7/20/1',
+                                      'hits-3': '7/21/1', 'hits-4': '7/30/1'})
+
+        # one too big for a call on its own still gets saved
+        blast_util = self.blast_util(10)
+        self.assertEqual(len(blast_util.save_output_objects('ws', output_objs[:2])), 2)
+        self.assertEqual(blast_util.wsClient.calls, [['hits-0'], ['hits-1']])
+
+
+# a search of two targets against the local service stand-ins and fake
+# BLAST+ of test/benchmark
+class kb_blastBulkSaveSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix='kb_blast_bulk_save_')
+        cls.BLAST_programs = dict((attr, (getattr(BlastUtil, attr), getattr(kb_blast, attr)))
+                                  for attr in BLAST_PROGRAMS)
+        set_blast_bin_dir(make_bin_dir(os.path.join(cls.work_dir, 'bin')))
+        (cls.store, cls.dataset) = load_or_generate(os.path.join(cls.work_dir, 'store'), 2, features_per_genome=100)
+        cls.impl = offline_impl(cls.store, os.path.join(cls.work_dir, 'scratch'))
+        cls.log_level = get_logger().level
+        get_logger().setLevel(logging.WARNING)
+
+    @classmethod
+    def tearDownClass(cls):
+        uninstall_local_services()
+        get_logger().setLevel(cls.log_level)
+        for attr, (util_path, impl_path) in cls.BLAST_programs.items():
+            setattr(BlastUtil, attr, util_path)
+            setattr(kb_blast, attr, impl_path)
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def test_merged_featureSet(self):
+        params = method_params('BLASTp_Search', self.dataset['refs'], 0, target_names=['genome', 'featureSet'])
+        report_ref = run_method(self.impl, self.store, 'BLASTp_Search', params)['report_ref']
+        objects_created = self.store.get(report_ref)['data']['objects_created']
+        self.assertEqual(len(objects_created), 3)
+
+        # the report lists the merged one first
+        merged = self.store.get(objects_created[0]['ref'])
+        self.assertEqual(merged['info'][1], params['output_filtered_name'])
+        self.assertEqual(objects_created[0]['description'], 'ALL BLASTp hits')
+
+        per_target = [self.store.get(obj['ref']) for obj in objects_created[1:]]
+        self.assertEqual(sorted(obj['info'][1] for obj in per_target),
+                         sorted(params['output_filtered_name']+'-'+name for name in ('features_2.FeatureSet', 'genome_0001.Genome')))
+        for obj in per_target + [merged]:
+            self.assertEqual(obj['provenance'][0]['method'], 'BLASTp_Search')
+        self.assertEqual(sorted(merged['provenance'][0]['input_ws_objects']),
+                         sorted([params['input_one_ref']]+params['input_many_refs']))
+
+        merged_hits = set((fid, genome_ref) for fid, genome_refs in merged['data']['elements'].items()
+                          for genome_ref in genome_refs)
+        self.assertEqual(merged_hits, set((fid, genome_ref) for obj in per_target
+                                          for fid, genome_refs in obj['data']['elements'].items()
+                                          for genome_ref in genome_refs))
+        self.assertEqual(len(merged['data']['element_ordering']), len(merged['data']['elements']))
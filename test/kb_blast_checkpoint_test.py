@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import copy
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+
+from kb_blast.kb_blastImpl import kb_blast
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.Checkpoint import CHECKPOINT_DIR_CONFIG_KEY, JobCheckpoint
+from kb_blast.Utils.JobLog import get_logger
+
+from offline_benchmark import BLAST_PROGRAMS, hit_features, method_params, offline_impl, run_method, \
+                              set_blast_bin_dir
+from fake_blast import make_bin_dir
+from local_services import uninstall_local_services
+from synthetic_data import WORKSPACE, load_or_generate
+
+
+class kb_blastCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='kb_blast_checkpoint_')
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        self.checkpoint_dir = os.path.join(self.work_dir, 'checkpoints')
+        self.config = {CHECKPOINT_DIR_CONFIG_KEY: self.checkpoint_dir}
+
+    def checkpoint(self, params=None, user_id='user_a'):
+        checkpoint = JobCheckpoint.for_job(self.config, 'BLASTp_Search', params or {'e_value': '.001'},
+                                           user_id=user_id)
+        self.addCleanup(checkpoint.release)
+        return checkpoint
+
+    def write_file(self, name, contents):
+        file_path = os.path.join(self.work_dir, name)
+        with open(file_path, 'w') as file_handle:
+            file_handle.write(contents)
+        return file_path
+
+    def test_key_covers_user_method_and_params(self):
+        params = {'e_value': '.001'}
+        key = self.checkpoint(params, user_id='user_a').job_key
+        self.assertEqual(key, self.checkpoint(dict(params), user_id='user_a').job_key)
+        for (method_name, other_params, user_id) in [('BLASTp_Search', params, 'user_b'),
+                                                     ('BLASTx_Search', params, 'user_a'),
+                                                     ('BLASTp_Search', {'e_value': '10'}, 'user_a')]:
+            other = JobCheckpoint.for_job(self.config, method_name, other_params, user_id=user_id)
+            other.release()
+            self.assertNotEqual(key, other.job_key)
+
+    def test_resume_after_release(self):
+        output_path = self.write_file('alnout_m=7.txt', "q1\tt1\t100.000\n")
+        checkpoint = self.checkpoint()
+        self.assertFalse(checkpoint.resumed)
+        depends = checkpoint.depends_on(output=output_path)
+        self.assertTrue(checkpoint.record('output', '1/2/3 m7', files=[output_path], data={'n': 1}, depends=depends))
+        checkpoint.release()
+
+        retry = self.checkpoint()
+        self.assertTrue(retry.resumed)
+        dest_dir = os.path.join(self.work_dir, 'restored')
+        os.makedirs(dest_dir)
+        (file_paths, data) = retry.restore('output', '1/2/3 m7', dest_dir, depends=depends)
+        self.assertEqual(data, {'n': 1})
+        with open(file_paths[0], 'r') as restored_handle:
+            self.assertEqual(restored_handle.read(), "q1\tt1\t100.000\n")
+
+    def test_other_user_does_not_resume(self):
+        checkpoint = self.checkpoint(user_id='user_a')
+        checkpoint.record('parse', '1/2/3', data={'hit_total': 1}, depends={'object': '1/2/3'})
+        checkpoint.release()
+        other = self.checkpoint(user_id='user_b')
+        self.assertFalse(other.resumed)
+        self.assertIsNone(other.restore('parse', '1/2/3', depends={'object': '1/2/3'}))
+
+    def test_changed_depends_invalidate(self):
+        checkpoint = self.checkpoint()
+        checkpoint.record('target', '1/2', data={'target_name': 'genome'}, depends={'object': '1/2/3'})
+        self.assertIsNotNone(checkpoint.restore('target', '1/2', depends={'object': '1/2/3'}))
+        # a new version of the object behind the ref
+        self.assertIsNone(checkpoint.restore('target', '1/2', depends={'object': '1/2/4'}))
+
+    def test_corrupt_file_invalidates(self):
+        output_path = self.write_file('alnout_m=7.txt', "q1\tt1\t100.000\n")
+        checkpoint = self.checkpoint()
+        checkpoint.record('output', '1/2/3 m7', files=[output_path])
+        for file_name in os.listdir(checkpoint.files_dir):
+            with open(os.path.join(checkpoint.files_dir, file_name), 'w') as stored_handle:
+                stored_handle.write('q1')
+        self.assertIsNone(checkpoint.restore('output', '1/2/3 m7', self.work_dir))
+
+    def test_concurrent_job_runs_without_checkpoint(self):
+        checkpoint = self.checkpoint()
+        checkpoint.record('parse', '1/2/3', data={'hit_total': 1})
+
+        concurrent = self.checkpoint()
+        self.assertTrue(concurrent.in_use)
+        self.assertFalse(concurrent.enabled)
+        self.assertFalse(concurrent.record('parse', '1/2/3', data={'hit_total': 2}))
+        self.assertIsNone(concurrent.restore('parse', '1/2/3'))
+        # and finishing doesn't remove the other job's checkpoint
+        concurrent.complete()
+        self.assertTrue(os.path.isdir(checkpoint.job_dir))
+
+        checkpoint.release()
+        retry = self.checkpoint()
+        self.assertTrue(retry.enabled)
+        self.assertEqual(retry.restore('parse', '1/2/3')[1], {'hit_total': 1})
+
+    def test_complete_removes_checkpoint(self):
+        checkpoint = self.checkpoint()
+        checkpoint.record('parse', '1/2/3', data={'hit_total': 1})
+        checkpoint.complete()
+        self.assertFalse(os.path.exists(checkpoint.job_dir))
+        self.assertFalse(self.checkpoint().resumed)
+
+    def test_evicts_stale_unless_in_use(self):
+        old = time.time() - JobCheckpoint.MAX_AGE_SECS - 3600
+        stale = self.checkpoint(params={'e_value': '1'})
+        stale.record('parse', '1/2/3', data={'hit_total': 1})
+        stale.release()
+        in_use = self.checkpoint(params={'e_value': '2'})
+        in_use.record('parse', '1/2/3', data={'hit_total': 1})
+        for job_dir in [stale.job_dir, in_use.job_dir]:
+            os.utime(os.path.join(job_dir, 'manifest.json'), (old, old))
+
+        self.checkpoint(params={'e_value': '3'})
+        self.assertFalse(os.path.exists(stale.job_dir))
+        self.assertTrue(os.path.isdir(in_use.job_dir))
+
+
+# a job that fails after its searches, tried again against the local service
+# stand-ins and fake BLAST+ of test/benchmark
+class kb_blastCheckpointResumeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix='kb_blast_checkpoint_resume_')
+        cls.BLAST_programs = dict((attr, (getattr(BlastUtil, attr), getattr(kb_blast, attr)))
+                                  for attr in BLAST_PROGRAMS)
+        set_blast_bin_dir(make_bin_dir(os.path.join(cls.work_dir, 'bin')))
+        (cls.store, cls.dataset) = load_or_generate(os.path.join(cls.work_dir, 'store'), 2, features_per_genome=100)
+        cls.impl = offline_impl(cls.store, os.path.join(cls.work_dir, 'scratch'))
+        cls.log_level = get_logger().level
+        get_logger().setLevel(logging.WARNING)
+
+    @classmethod
+    def tearDownClass(cls):
+        uninstall_local_services()
+        get_logger().setLevel(cls.log_level)
+        cls.impl.config.pop(CHECKPOINT_DIR_CONFIG_KEY, None)
+        for attr, (util_path, impl_path) in cls.BLAST_programs.items():
+            setattr(BlastUtil, attr, util_path)
+            setattr(kb_blast, attr, impl_path)
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp(prefix='checkpoints_', dir=self.work_dir)
+        self.impl.config[CHECKPOINT_DIR_CONFIG_KEY] = self.checkpoint_dir
+
+    # a FeatureSet of the first genome's features, by name so a new version
+    # of it is what the ref resolves to
+    def save_featureSet(self, name, n_features):
+        genome_ref = self.dataset['refs']['genome']
+        fids = [feature['id'] for feature in self.store.get(genome_ref)['data']['features'][0:n_features]]
+        self.store.save(WORKSPACE, 'KBaseCollections.FeatureSet',
+                        {'description': name, 'elements': dict((fid, [genome_ref]) for fid in fids)}, name=name)
+        return WORKSPACE+'/'+name
+
+    def params(self, name, input_many_refs):
+        params = method_params('BLASTp_Search', self.dataset['refs'], 0, target_names=['genome'])
+        params['output_filtered_name'] = name
+        params['input_many_refs'] = input_many_refs
+        return params
+
+    # run_search(): the method, and the target refs whose FASTA it wrote (rather
+    # than restored); params are sent afresh each time, as a retried job's are
+    def run_search(self, params, fail=False):
+        params = copy.deepcopy(params)
+        written_refs = []
+        write_target_objs_to_files = BlastUtil.write_target_objs_to_files
+
+        def spy_write_target_objs_to_files(bu, params, input_many_refs, t_seq_type):
+            written_refs.extend(input_many_refs)
+            return write_target_objs_to_files(bu, params, input_many_refs, t_seq_type)
+
+        with mock.patch.object(BlastUtil, 'write_target_objs_to_files', spy_write_target_objs_to_files):
+            if fail:
+                with mock.patch.object(BlastUtil, 'build_BLAST_report', side_effect=ValueError('simulated failure')):
+                    with self.assertRaises(ValueError):
+                        run_method(self.impl, self.store, 'BLASTp_Search', params)
+                return (None, written_refs)
+            return (run_method(self.impl, self.store, 'BLASTp_Search', params)['report_ref'], written_refs)
+
+    def test_resume_gives_same_hits(self):
+        featureSet_ref = self.save_featureSet('resume.FeatureSet', 60)
+        (expected_report_ref, written_refs) = self.run_search(self.params('resume.expected', [featureSet_ref]))
+        expected_hits = hit_features(self.store, expected_report_ref)
+        self.assertTrue(len(expected_hits) > 0)
+
+        params = self.params('resume.hits', [featureSet_ref])
+        self.run_search(params, fail=True)
+        self.assertEqual(len(os.listdir(self.checkpoint_dir)), 1)
+
+        with mock.patch.object(BlastUtil, 'save_output_objects') as save_output_objects:
+            (report_ref, written_refs) = self.run_search(params)
+        self.assertEqual(written_refs, [])
+        save_output_objects.assert_not_called()
+        self.assertEqual(hit_features(self.store, report_ref), expected_hits)
+        self.assertEqual(os.listdir(self.checkpoint_dir), [])
+
+    def test_new_target_version_is_not_restored(self):
+        featureSet_ref = self.save_featureSet('new_version.FeatureSet', 60)
+        genome_ref = self.dataset['refs']['genome']
+        params = self.params('new_version.hits', [featureSet_ref, genome_ref])
+        self.run_search(params, fail=True)
+
+        # the FeatureSet changes before the retry; the genome doesn't
+        self.save_featureSet('new_version.FeatureSet', 20)
+        (report_ref, written_refs) = self.run_search(params)
+        self.assertEqual(written_refs, [featureSet_ref])
+
+        (expected_report_ref, expected_written_refs) = \
+            self.run_search(self.params('new_version.expected', [featureSet_ref, genome_ref]))
+        self.assertEqual(hit_features(self.store, report_ref), hit_features(self.store, expected_report_ref))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from kb_blast.Utils.HitTable import read_hit_table, read_outfmt7, write_hit_table, write_outfmt7
+
+OUTFMT7 = "\n".join(["# BLASTP 2.13.0+",
+                     "# Query: q1 query protein",
+                     "# Database: db",
+                     "# Fields: query id, subject id, % identity, alignment length, mismatches, gap opens, "
+                     "q. start, q. end, s. start, s. end, evalue, bit score",
+                     "# 3 hits found",
+                     "q1\tG1.f:gene_1\t100.000\t120\t0\t0\t1\t120\t1\t120\t2.05e-87\t245",
+                     "q1\tG1.f:gene_7\t43.210\t81\t44\t2\t12\t90\t5\t83\t1.2e-10\t55.8",
+                     "q1\tkb|g.3.peg.9\t38.462\t26\t16\t0\t95\t120\t301\t326\t0.003\t31.2",
+                     "# BLAST processed 1 queries",
+                     ""])
+
+
+class kb_blastHitTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='kb_blast_hit_table_')
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+
+    def write_outfmt7_file(self, contents):
+        file_path = os.path.join(self.work_dir, 'alnout_m=7.txt')
+        with open(file_path, 'w') as aln_handle:
+            aln_handle.write(contents)
+        return file_path
+
+    def round_trip(self, contents, meta):
+        (header, columns) = read_outfmt7(self.write_outfmt7_file(contents))
+        header['meta'] = meta
+        hit_table_path = write_hit_table(os.path.join(self.work_dir, 'hits.kbhits'), header, columns)
+        return read_hit_table(hit_table_path)
+
+    def test_round_trip_gives_back_outfmt7(self):
+        meta = {'search_tool_name': 'BLASTp',
+                'target_ref': '1/2/3',
+                'params': {'e_value': '.001', 'ident_thresh': '40.0'},
+                'query_len': 120}
+        (header, columns) = self.round_trip(OUTFMT7, meta)
+        self.assertEqual(header['meta'], meta)
+        self.assertEqual(header['n_hits'], 3)
+        self.assertEqual(header['subject_ids'], ['G1.f:gene_1', 'G1.f:gene_7', 'kb|g.3.peg.9'])
+        # evalues and bit scores exactly as BLAST printed them
+        self.assertEqual(columns['evalue'], ['2.05e-87', '1.2e-10', '0.003'])
+        self.assertEqual(columns['bitscore'], ['245', '55.8', '31.2'])
+
+        out_path = write_outfmt7(header, columns, os.path.join(self.work_dir, 'regenerated.txt'))
+        with open(out_path, 'r') as out_handle:
+            self.assertEqual(out_handle.read(), OUTFMT7)
+
+    def test_round_trip_no_hits(self):
+        no_hits = "# BLASTP 2.13.0+\n# Query: q1\n# 0 hits found\n# BLAST processed 1 queries\n"
+        (header, columns) = self.round_trip(no_hits, {'target_ref': '1/2/3'})
+        self.assertEqual(header['n_hits'], 0)
+        self.assertEqual(columns['evalue'], [])
+        out_path = write_outfmt7(header, columns, os.path.join(self.work_dir, 'regenerated.txt'))
+        with open(out_path, 'r') as out_handle:
+            self.assertEqual(out_handle.read(), no_hits)
+
+    def test_not_a_hit_table(self):
+        bad_path = self.write_outfmt7_file(OUTFMT7)
+        with self.assertRaises(ValueError):
+            read_hit_table(bad_path)
+
+    def test_truncated_hit_table(self):
+        (header, columns) = read_outfmt7(self.write_outfmt7_file(OUTFMT7))
+        header['meta'] = {}
+        header['n_hits'] = 4
+        hit_table_path = write_hit_table(os.path.join(self.work_dir, 'hits.kbhits'), header, columns)
+        with self.assertRaises(ValueError):
+            read_hit_table(hit_table_path)
+
+    def test_bad_outfmt7_line(self):
+        with self.assertRaises(ValueError):
+            read_outfmt7(self.write_outfmt7_file("q1\tt1\t100.0\n"))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+import unittest
+from unittest import mock
+
+from kb_blast.Utils import JobLog as job_log_module
+from kb_blast.Utils.JobLog import JobLog, _BatchingHandler
+
+
+# a console handler that keeps the messages it is handed
+class _ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class kb_blastJobLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.console = _ListHandler()
+        self.logger = logging.getLogger('kb_blast.test_'+self.id())
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(self.logger.handlers.clear)
+
+    def job_log(self, capacity=5, flush_secs=60.0, per_key_limit=None):
+        self.handler = _BatchingHandler(capacity, flush_secs, self.console)
+        self.logger.addHandler(self.handler)
+        with mock.patch.object(job_log_module, 'get_logger', return_value=self.logger):
+            return JobLog(per_key_limit=per_key_limit)
+
+    def test_batches_by_capacity(self):
+        job_log = self.job_log(capacity=5)
+        for n in range(4):
+            job_log.log(None, 'line '+str(n))
+        self.assertEqual(self.console.messages, [])
+        job_log.log(None, 'line 4')
+        self.assertEqual(self.console.messages, ['line '+str(n) for n in range(5)])
+
+    def test_flushes_on_error_and_explicitly(self):
+        job_log = self.job_log()
+        job_log.log(None, 'parsing')
+        job_log.log(None, 'BLAST failed', level=logging.ERROR)
+        self.assertEqual(self.console.messages, ['parsing', 'BLAST failed'])
+        job_log.log(None, 'cleaning up')
+        job_log.flush()
+        self.assertEqual(self.console.messages[-1], 'cleaning up')
+
+    def test_flushes_after_flush_secs(self):
+        job_log = self.job_log(flush_secs=1.0)
+        with mock.patch.object(job_log_module.time, 'time', return_value=self.handler.last_flush + 0.5):
+            job_log.log(None, 'first')
+        self.assertEqual(self.console.messages, [])
+        with mock.patch.object(job_log_module.time, 'time', return_value=self.handler.last_flush + 1.5):
+            job_log.log(None, 'second')
+        self.assertEqual(self.console.messages, ['first', 'second'])
+
+    def test_target_gets_every_message(self):
+        job_log = self.job_log()
+        console = []
+        job_log.log(console, 'kept')
+        job_log.debug(console, 'below the level')
+        self.assertEqual(len(console), 2)
+        self.assertTrue(re.match(r'^\[\d{4}-\d\d-\d\d_\d\d:\d\d:\d\d\] kept$', console[0]))
+        job_log.flush()
+        self.assertEqual(self.console.messages, ['kept'])
+
+    def test_limited(self):
+        job_log = self.job_log(capacity=1000, per_key_limit=3)
+        console = []
+        for n in range(10):
+            job_log.limited(console, 'HIT', 'hit '+str(n))
+        job_log.limited(console, 'FILTERING', 'filtered 0')
+        job_log.suppressed_summary()
+        job_log.flush()
+        self.assertEqual(len(console), 4)
+        self.assertEqual(self.console.messages, ['hit 0', 'hit 1', 'hit 2', 'further HIT messages suppressed',
+                                                 'filtered 0', 'HIT: 7 of 10 messages suppressed'])
+
+        # nothing is dropped at DEBUG
+        self.logger.setLevel(logging.DEBUG)
+        for n in range(5):
+            job_log.limited(None, 'HIT', 'hit '+str(10 + n))
+        job_log.flush()
+        self.assertEqual(self.console.messages[-5:], ['hit '+str(10 + n) for n in range(5)])
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+
+from kb_blast.Utils.JobProfiler import JobProfiler, PROFILE_ENV_VAR, profile_memory, profile_mode
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(2048)]
+
+
+class kb_blastJobProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='kb_blast_job_profiler_')
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+
+    def tearDown(self):
+        if JobProfiler._running is not None:
+            JobProfiler._running.stop()
+
+    def check_files(self, job_files, names):
+        self.assertEqual(sorted(name for (file_path, name, label) in job_files), sorted(names))
+        for (file_path, name, label) in job_files:
+            self.assertTrue(os.path.getsize(file_path) > 0, name)
+
+    # the target runtime's tracemalloc has no reset_peak()
+    def test_memory_without_reset_peak(self):
+        with mock.patch.object(tracemalloc, 'reset_peak', side_effect=AttributeError('reset_peak')):
+            profiler = JobProfiler('cprofile', memory=True).start()
+            buffers = allocate()
+            profiler.stop()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertTrue(profiler.memory_peak_bytes >= 2 * 1024 * 1024)
+        del buffers
+
+        job_files = profiler.write_files(self.work_dir, 'BLASTp_Search')
+        self.check_files(job_files, ['BLASTp_Search-profile.pstats',
+                                     'BLASTp_Search-profile_summary.txt',
+                                     'BLASTp_Search-memory.tracemalloc'])
+        with open([file_path for (file_path, name, label) in job_files if name.endswith('summary.txt')][0]) as handle:
+            summary = handle.read()
+        self.assertIn('allocate', summary)
+        self.assertIn('tracemalloc peak', summary)
+
+    def test_peak_is_the_jobs_own(self):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        buffers = allocate()
+        del buffers
+        profiler = JobProfiler('cprofile', memory=True).start()
+        profiler.stop()
+        # tracing someone else started is left on, and their peak isn't ours
+        self.assertTrue(tracemalloc.is_tracing())
+        self.assertTrue(profiler.memory_peak_bytes < 1024 * 1024)
+
+    def test_sample_without_memory(self):
+        profiler = JobProfiler('sample', memory=False).start()
+        # at least a few ticks, however fast allocate() is
+        deadline = time.time() + 10
+        while profiler.n_samples < 3 and time.time() < deadline:
+            allocate()
+        profiler.stop()
+        self.assertTrue(profiler.n_samples >= 3)
+        self.assertIsNone(profiler.memory_peak_bytes)
+        self.check_files(profiler.write_files(self.work_dir, 'BLASTn_Search'),
+                         ['BLASTn_Search-profile_stacks.txt', 'BLASTn_Search-profile_summary.txt'])
+
+    def test_next_start_stops_one_left_running(self):
+        left_running = JobProfiler('cprofile', memory=True).start()
+        profiler = JobProfiler('cprofile', memory=True).start()
+        self.assertFalse(left_running.active)
+        self.assertTrue(left_running.stopped)
+        self.assertIs(JobProfiler._running, profiler)
+        profiler.stop()
+        self.assertIsNone(JobProfiler._running)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_off_writes_nothing(self):
+        profiler = JobProfiler(None).start()
+        self.assertFalse(profiler.active)
+        self.assertEqual(profiler.write_files(self.work_dir, 'BLASTp_Search'), [])
+
+    def test_settings(self):
+        with mock.patch.dict(os.environ, {PROFILE_ENV_VAR: 'sample'}):
+            self.assertEqual(profile_mode({}), 'sample')
+            self.assertEqual(profile_mode({'profile': 'yes'}), 'cprofile')
+            self.assertIsNone(profile_mode({'profile': '0'}))
+        with mock.patch.dict(os.environ, {PROFILE_ENV_VAR: ''}):
+            self.assertIsNone(profile_mode(None))
+        with self.assertRaises(ValueError):
+            profile_mode({'profile': 'everything'})
+        self.assertTrue(profile_memory({}))
+        self.assertFalse(profile_memory({'profile_memory': 'off'}))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from unittest import mock
+
+from kb_blast.Utils import JSONCodec
+
+PAYLOAD = {'name': 'Escherichia_colí_K-12_β',
+           'scores': [1.5, float('nan'), float('inf'), -float('inf'), 2e-300],
+           'fids': {'G1.f:gene_1', 'G1.f:gene_2'},
+           'counts': {1: 'one', 2: 'two'},
+           'nested': [{'evalue': float('nan')}, ('a', None, True)]}
+
+
+class kb_blastJSONCodecTest(unittest.TestCase):
+
+    def dumps_without_orjson(self, obj):
+        with mock.patch.object(JSONCodec, 'orjson', None):
+            return JSONCodec.dumps(obj)
+
+    def check_same_either_way(self, obj):
+        dumped = self.dumps_without_orjson(obj)
+        self.assertEqual(JSONCodec.dumps_bytes(obj), dumped.encode('utf-8'))
+        if JSONCodec.orjson is not None:
+            self.assertEqual(JSONCodec.dumps(obj), dumped)
+        return dumped
+
+    def test_same_json_either_way(self):
+        # sets have no order, so one member each
+        payload = dict(PAYLOAD, fids={'G1.f:gene_1'})
+        dumped = self.check_same_either_way(payload)
+        self.assertIn('colí_K-12_β', dumped)
+        self.assertEqual(json.loads(dumped)['scores'], [1.5, None, None, None, 2e-300])
+        self.assertEqual(json.loads(dumped)['nested'][0]['evalue'], None)
+        self.assertEqual(json.loads(dumped)['counts'], {'1': 'one', '2': 'two'})
+
+    def test_stdlib_fallback_for_wide_ints(self):
+        dumped = self.check_same_either_way({'n': 2**70, 'evalue': float('nan')})
+        self.assertEqual(json.loads(dumped), {'n': 2**70, 'evalue': None})
+
+    def test_toJSONable_and_unserializable(self):
+        class Result:
+            def toJSONable(self):
+                return {'hits': float('nan')}
+        self.assertEqual(json.loads(self.check_same_either_way([Result()])), [{'hits': None}])
+        for dumps in (JSONCodec.dumps, self.dumps_without_orjson):
+            with self.assertRaises(TypeError):
+                dumps({'obj': object()})
+
+    def test_loads(self):
+        for data in ['{"a":[1,2.5,"ß"]}', b'{"a":[1,2.5,"\\u00df"]}']:
+            self.assertEqual(JSONCodec.loads(data), {'a': [1, 2.5, 'ß']})
+        # not JSON, but what older servers wrote
+        self.assertTrue(JSONCodec.loads('[NaN]')[0] != JSONCodec.loads('[NaN]')[0])
+        with self.assertRaises(ValueError):
+            JSONCodec.loads('{"a":')
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+
+from kb_blast.Utils.ObjectFetch import get_obj_subset
+
+from local_services import subset_data
+
+OBJECTS = {'1/1/1': ('KBaseSearch.GenomeSet-2.0',
+                     {'description': 'two genomes',
+                      'elements': {'g1': {'ref': '1/2/1'}, 'g2': {'ref': '1/3/1'}}}),
+           '1/2/1': ('KBaseGenomes.Genome-17.0',
+                     {'id': 'g1', 'features': [{'id': 'f1'}, {'id': 'f2'}]}),
+           '1/4/1': ('KBaseSequences.SequenceSet-1.0',
+                     {'sequence_set_id': 'seqs', 'sequences': [{'sequence_id': 's1', 'sequence': 'MKV'}]})}
+
+
+# a workspace client that counts its calls and applies included paths as
+# the workspace does
+class _Workspace:
+
+    def __init__(self):
+        self.calls = []
+
+    def info(self, ref):
+        return [int(ref.split('/')[1]), 'obj_'+ref.split('/')[1], OBJECTS[ref][0], '', 1, 'user', 1, 'ws', '', 0, {}]
+
+    def get_object_info3(self, params):
+        self.calls.append(('get_object_info3', None))
+        return {'infos': [self.info(obj_spec['ref']) for obj_spec in params['objects']]}
+
+    def get_objects2(self, params):
+        data = []
+        for obj_spec in params['objects']:
+            self.calls.append(('get_objects2', obj_spec.get('included')))
+            obj_data = OBJECTS[obj_spec['ref']][1]
+            if obj_spec.get('included'):
+                obj_data = subset_data(obj_data, obj_spec['included'])
+            data.append({'info': self.info(obj_spec['ref']), 'data': obj_data})
+        return {'data': data}
+
+
+class kb_blastObjectFetchTest(unittest.TestCase):
+
+    INCLUDED_BY_TYPE = {'Genome': None,
+                        'FeatureSet': ['/elements', '/description'],
+                        'GenomeSet': ['/elements', '/description'],
+                        'Tree': ['/ws_refs']}
+
+    def test_listed_type_is_one_call(self):
+        ws = _Workspace()
+        obj = get_obj_subset(ws, '1/1/1', self.INCLUDED_BY_TYPE)
+        self.assertEqual(ws.calls, [('get_objects2', ['/elements', '/description', '/ws_refs'])])
+        self.assertEqual(obj['data'], OBJECTS['1/1/1'][1])
+        self.assertEqual(obj['info'][2], 'KBaseSearch.GenomeSet-2.0')
+
+    def test_type_without_data_gets_none(self):
+        ws = _Workspace()
+        obj = get_obj_subset(ws, '1/2/1', self.INCLUDED_BY_TYPE)
+        self.assertEqual(len(ws.calls), 1)
+        self.assertIsNone(obj['data'])
+        self.assertEqual(obj['info'][1], 'obj_2')
+
+    def test_unlisted_type_fetched_whole(self):
+        ws = _Workspace()
+        obj = get_obj_subset(ws, '1/4/1', self.INCLUDED_BY_TYPE)
+        self.assertEqual(ws.calls[-1], ('get_objects2', None))
+        self.assertEqual(obj['data'], OBJECTS['1/4/1'][1])
+
+    def test_no_paths_fetches_info_only(self):
+        ws = _Workspace()
+        obj = get_obj_subset(ws, '1/2/1', {'Genome': None, 'FeatureSet': None})
+        self.assertEqual(ws.calls, [('get_object_info3', None)])
+        self.assertIsNone(obj['data'])
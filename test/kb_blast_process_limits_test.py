@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+import unittest
+
+from kb_blast.Utils.ProcessLimits import ProcessLimitExceeded, ProcessLimits
+from kb_blast.Utils.ProcessMetrics import ProcessMetrics
+
+# a child that, given time to be limited, allocates more than it's allowed,
+# and says so as BLAST+ would
+ALLOCATE_CMD = [sys.executable, '-c',
+                "import time\n"
+                "time.sleep(0.5)\n"
+                "try:\n"
+                "    buf = bytearray(1 << 30)\n"
+                "except MemoryError:\n"
+                "    print('terminate called after throwing an instance of std::bad_alloc', flush=True)\n"
+                "    raise SystemExit(134)\n"]
+
+
+class kb_blastProcessLimitsTest(unittest.TestCase):
+
+    def test_returncodes(self):
+        process_metrics = ProcessMetrics()
+        self.assertEqual(process_metrics.run(['sh', '-c', 'exit 3'])['returncode'], 3)
+        self.assertEqual(process_metrics.run(['sh', '-c', 'kill -9 $$'])['returncode'], -9)
+        record = process_metrics.run(['true'], limits=ProcessLimits(), stage='search')
+        self.assertEqual(record['returncode'], 0)
+        self.assertNotIn('limit', record)
+
+    def test_stage_timeout(self):
+        process_metrics = ProcessMetrics()
+        limits = ProcessLimits(stage_timeouts={'search': 1}, kill_grace_secs=1)
+        begin = time.time()
+        with self.assertRaises(ProcessLimitExceeded) as raised:
+            process_metrics.run(['sleep', '30'], limits=limits, stage='search')
+        self.assertEqual(raised.exception.reason, 'timeout')
+        self.assertLess(time.time() - begin, 10)
+        self.assertEqual(process_metrics.records[0]['limit'], 'timeout')
+        # other stages aren't held to it
+        process_metrics.run(['true'], limits=limits, stage='format_db')
+
+    def test_cancel(self):
+        process_metrics = ProcessMetrics()
+        limits = ProcessLimits(kill_grace_secs=1)
+        threading.Timer(0.5, limits.cancel, ['test']).start()
+        with self.assertRaises(ProcessLimitExceeded) as raised:
+            process_metrics.run(['sleep', '30'], limits=limits, stage='search')
+        self.assertEqual(raised.exception.reason, 'cancelled')
+        # and nothing else starts
+        with self.assertRaises(ProcessLimitExceeded):
+            process_metrics.run(['true'], limits=limits, stage='search')
+        self.assertEqual(len(process_metrics.records), 1)
+
+    def test_signal_during_subprocess(self):
+        process_metrics = ProcessMetrics()
+        limits = ProcessLimits(kill_grace_secs=1)
+        limits.install_signal_handlers()
+        self.addCleanup(limits.restore_signal_handlers)
+        threading.Timer(0.5, os.kill, [os.getpid(), signal.SIGTERM]).start()
+        with self.assertRaises(ProcessLimitExceeded) as raised:
+            process_metrics.run(['sleep', '30'], limits=limits, stage='search')
+        self.assertEqual(raised.exception.reason, 'cancelled')
+        self.assertIn('SIGTERM', str(raised.exception))
+        self.assertEqual(process_metrics.records[0]['limit'], 'cancelled')
+        self.assertEqual(limits.n_running, 0)
+
+    def test_signal_between_subprocesses(self):
+        limits = ProcessLimits(kill_grace_secs=1)
+        limits.install_signal_handlers()
+        self.addCleanup(limits.restore_signal_handlers)
+        ProcessMetrics().run(['true'], limits=limits, stage='format_db')
+        # e.g. while saving: nothing for a watch to stop, so it's raised there
+        with self.assertRaises(ProcessLimitExceeded) as raised:
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(10)
+        self.assertEqual(raised.exception.reason, 'cancelled')
+        with self.assertRaises(ProcessLimitExceeded):
+            limits.check('save')
+        # a second signal while the job stops doesn't interrupt that
+        os.kill(os.getpid(), signal.SIGINT)
+        time.sleep(0.1)
+        limits.restore_signal_handlers()
+        self.assertIs(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+
+    def test_line_handler_error(self):
+        for limits in [None, ProcessLimits()]:
+            pids = []
+
+            def line_handler(line):
+                pids.append(int(line))
+                raise ValueError('bad line')
+
+            process_metrics = ProcessMetrics()
+            begin = time.time()
+            with self.assertRaises(ValueError):
+                process_metrics.run(['sh', '-c', 'echo $$; sleep 30'], line_handler=line_handler,
+                                    limits=limits, stage='search')
+            self.assertLess(time.time() - begin, 10)
+            # killed and reaped, with nothing left watching it
+            with self.assertRaises(ChildProcessError):
+                os.waitpid(pids[0], os.WNOHANG)
+            self.assertEqual(process_metrics.records, [])
+            if limits is not None:
+                self.assertEqual(limits.n_running, 0)
+                self.assertFalse(any(thread.name.startswith('kb_blast-watch-') for thread in threading.enumerate()))
+
+    def test_memory_limit(self):
+        memory_limit_bytes = 256 * 1024 * 1024
+        process_metrics = ProcessMetrics()
+        lines = []
+        with self.assertRaises(ProcessLimitExceeded) as raised:
+            process_metrics.run(ALLOCATE_CMD, line_handler=lines.append,
+                                limits=ProcessLimits(memory_limit_bytes=memory_limit_bytes), stage='search')
+        self.assertEqual(raised.exception.reason, 'memory')
+        self.assertEqual(process_metrics.records[0]['returncode'], 134)
+        self.assertIn('bad_alloc', ''.join(lines))
+        # only the child was limited
+        self.assertNotEqual(resource.getrlimit(resource.RLIMIT_AS)[0], memory_limit_bytes)
+
+    def test_no_memory_limit(self):
+        record = ProcessMetrics().run(ALLOCATE_CMD, limits=ProcessLimits(), stage='search')
+        self.assertEqual(record['returncode'], 0)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import glob
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+
+from kb_blast.kb_blastImpl import kb_blast
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.HitTable import HIT_TABLE_EXT
+from kb_blast.Utils.JobLog import get_logger
+
+from offline_benchmark import BLAST_PROGRAMS, hit_features, job_files, method_params, offline_impl, run_method, \
+                              set_blast_bin_dir
+from fake_blast import make_bin_dir
+from local_services import uninstall_local_services
+from synthetic_data import WORKSPACE, load_or_generate
+
+
+# BLAST_Refilter against the local service stand-ins and fake BLAST+ of
+# test/benchmark: a refilter must give what a new search would have
+class kb_blastRefilterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix='kb_blast_refilter_')
+        cls.BLAST_programs = dict((attr, (getattr(BlastUtil, attr), getattr(kb_blast, attr)))
+                                  for attr in BLAST_PROGRAMS)
+        set_blast_bin_dir(make_bin_dir(os.path.join(cls.work_dir, 'bin')))
+        (cls.store, cls.dataset) = load_or_generate(os.path.join(cls.work_dir, 'store'), 2, features_per_genome=100)
+        cls.impl = offline_impl(cls.store, os.path.join(cls.work_dir, 'scratch'))
+        cls.run_i = 0
+        cls.log_level = get_logger().level
+        get_logger().setLevel(logging.WARNING)
+
+    @classmethod
+    def tearDownClass(cls):
+        uninstall_local_services()
+        get_logger().setLevel(cls.log_level)
+        for attr, (util_path, impl_path) in cls.BLAST_programs.items():
+            setattr(BlastUtil, attr, util_path)
+            setattr(kb_blast, attr, impl_path)
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def search(self, **thresholds):
+        self.__class__.run_i += 1
+        params = method_params('BLASTp_Search', self.dataset['refs'], self.run_i)
+        params.update(thresholds)
+        return run_method(self.impl, self.store, 'BLASTp_Search', params)['report_ref']
+
+    def refilter(self, report_ref, **thresholds):
+        self.__class__.run_i += 1
+        params = {'workspace_name': WORKSPACE,
+                  'report_ref': report_ref,
+                  'output_filtered_name': 'BLAST_Refilter.run'+str(self.run_i)+'.hits'}
+        params.update(thresholds)
+        return run_method(self.impl, self.store, 'BLAST_Refilter', params)['report_ref']
+
+    def hit_table_files(self):
+        return glob.glob(os.path.join(self.store.shock_dir, '*', 'hits'+HIT_TABLE_EXT))
+
+    def test_refilter_same_as_new_search(self):
+        loose_report_ref = self.search(ident_thresh='30.0', bitscore='40')
+        strict = {'ident_thresh': '70.0', 'bitscore': '80', 'overlap_fraction': '60.0'}
+        refiltered_hits = hit_features(self.store, self.refilter(loose_report_ref, **strict))
+        searched_hits = hit_features(self.store, self.search(**strict))
+
+        self.assertTrue(len(searched_hits) > 0)
+        self.assertEqual(refiltered_hits, searched_hits)
+        self.assertTrue(refiltered_hits < hit_features(self.store, loose_report_ref))
+
+    def test_refilter_with_same_thresholds(self):
+        report_ref = self.search()
+        self.assertEqual(hit_features(self.store, self.refilter(report_ref)),
+                         hit_features(self.store, report_ref))
+        # and the refilter keeps hit tables of its own, to refilter again
+        refiltered_files = job_files(self.store, self.refilter(report_ref))
+        self.assertTrue(any(name.endswith('-hits'+HIT_TABLE_EXT) for name in refiltered_files))
+
+    def test_no_hits_uploads_no_hit_tables(self):
+        hit_table_files = self.hit_table_files()
+        # nothing under this evalue, so BLAST finds nothing to refilter
+        report_ref = self.search(e_value='1e-300')
+        self.assertEqual(hit_features(self.store, report_ref), set())
+        self.assertEqual(self.hit_table_files(), hit_table_files)
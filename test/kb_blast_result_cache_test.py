@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from kb_blast.Utils.ResultCache import ResultCache
+
+
+class kb_blastResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='kb_blast_result_cache_')
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+        self.cache = ResultCache(os.path.join(self.work_dir, 'cache'), 1024*1024)
+
+    def write_file(self, name, contents):
+        file_path = os.path.join(self.work_dir, name)
+        with open(file_path, 'w') as file_handle:
+            file_handle.write(contents)
+        return file_path
+
+    def read_file(self, file_path):
+        with open(file_path, 'r') as file_handle:
+            return file_handle.read()
+
+    # the key fields BlastUtil._fetch_cached_BLAST_outputs() uses
+    def cache_key(self, query_path, target_path, **changed):
+        fields = {'program':       'BLASTp',
+                  'BLAST_version': 'blastp: 2.13.0+',
+                  'query_sha256':  ResultCache.file_sha256(query_path),
+                  'target_sha256': ResultCache.file_sha256(target_path),
+                  'e_value':       '0.001',
+                  'maxaccepts':    '1000',
+                  'outfmt':        '7'}
+        fields.update(changed)
+        return ResultCache.key(**fields)
+
+    def meta_path(self, key):
+        return os.path.join(self.cache._entry_dir(key), 'meta.json')
+
+    def test_key_is_stable(self):
+        query_path = self.write_file('query.fasta', ">q1\nMKVLAAGIVG\n")
+        target_path = self.write_file('target.fasta', ">t1\nMKVLAAGIVG\n>t2\nMSTNPKPQRK\n")
+        key = self.cache_key(query_path, target_path)
+        self.assertEqual(key, self.cache_key(query_path, target_path))
+        self.assertEqual(ResultCache.key(a='1', b='2'), ResultCache.key(b='2', a='1'))
+        self.assertRegex(key, '^[0-9a-f]{64}$')
+        # the same contents under another name or path is the same target
+        target_copy_path = self.write_file('target_copy.fasta', self.read_file(target_path))
+        self.assertEqual(key, self.cache_key(query_path, target_copy_path))
+
+    def test_changed_params_change_key(self):
+        query_path = self.write_file('query.fasta', ">q1\nMKVLAAGIVG\n")
+        target_path = self.write_file('target.fasta', ">t1\nMKVLAAGIVG\n")
+        key = self.cache_key(query_path, target_path)
+        for changed in [{'program': 'BLASTx'},
+                        {'BLAST_version': 'blastp: 2.14.0+'},
+                        {'e_value': '1e-10'},
+                        {'maxaccepts': '10'},
+                        {'outfmt': '5'}]:
+            self.assertNotEqual(key, self.cache_key(query_path, target_path, **changed), changed)
+
+        other_query_path = self.write_file('other_query.fasta', ">q1\nMKVLAAGIVA\n")
+        self.assertNotEqual(key, self.cache_key(other_query_path, target_path))
+
+    def test_new_target_version_misses(self):
+        query_path = self.write_file('query.fasta', ">q1\nMKVLAAGIVG\n")
+        target_path = self.write_file('target.fasta', ">t1\nMKVLAAGIVG\n")
+        output_path = self.write_file('output.txt', "# BLASTP 2.13.0+\nq1\tt1\t100.0\n")
+        key = self.cache_key(query_path, target_path)
+        self.assertTrue(self.cache.put(key, output_path, target_ref='1/2/1'))
+
+        # a new version of the target object: its FASTA changes, and so the key
+        self.write_file('target.fasta', ">t1\nMKVLAAGIVG\n>t2\nMSTNPKPQRK\n")
+        new_key = self.cache_key(query_path, target_path)
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(self.cache.get(new_key, os.path.join(self.work_dir, 'got.txt')))
+        self.assertEqual(self.cache.get(key, os.path.join(self.work_dir, 'got.txt')),
+                         os.path.join(self.work_dir, 'got.txt'))
+
+    def test_get_returns_put(self):
+        output_path = self.write_file('output.txt', "q1\tt1\t100.0\n")
+        key = ResultCache.key(outfmt='7')
+        self.assertIsNone(self.cache.get(key, os.path.join(self.work_dir, 'got.txt')))
+        self.assertTrue(self.cache.put(key, output_path, outfmt='7'))
+        got_path = self.cache.get(key, os.path.join(self.work_dir, 'got.txt'))
+        self.assertEqual(self.read_file(got_path), "q1\tt1\t100.0\n")
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 2000
+        keys = [ResultCache.key(n=n) for n in range(3)]
+        for n in range(2):
+            self.cache.put(keys[n], self.write_file('output_'+str(n)+'.txt', str(n) * 900))
+        # both used a while ago, 0 before 1
+        now = time.time()
+        os.utime(self.meta_path(keys[0]), (now - 200, now - 200))
+        os.utime(self.meta_path(keys[1]), (now - 100, now - 100))
+        # using 0 again makes 1 the least recently used
+        self.assertIsNotNone(self.cache.get(keys[0], os.path.join(self.work_dir, 'got.txt')))
+
+        self.cache.put(keys[2], self.write_file('output_2.txt', '2' * 900))
+        self.assertIsNotNone(self.cache.get(keys[0], os.path.join(self.work_dir, 'got.txt')))
+        self.assertIsNone(self.cache.get(keys[1], os.path.join(self.work_dir, 'got.txt')))
+        self.assertIsNotNone(self.cache.get(keys[2], os.path.join(self.work_dir, 'got.txt')))
+
+    def test_truncated_entry_misses_and_is_replaced(self):
+        output_path = self.write_file('output.txt', 'q1\tt1\t100.0\n' * 100)
+        key = ResultCache.key(outfmt='7')
+        self.cache.put(key, output_path)
+        with open(os.path.join(self.cache._entry_dir(key), 'output'), 'r+') as entry_handle:
+            entry_handle.truncate(10)
+
+        self.assertIsNone(self.cache.get(key, os.path.join(self.work_dir, 'got.txt')))
+        self.assertTrue(self.cache.put(key, output_path))
+        got_path = self.cache.get(key, os.path.join(self.work_dir, 'got.txt'))
+        self.assertEqual(self.read_file(got_path), self.read_file(output_path))
+
+    def test_partial_entry_misses_and_is_replaced(self):
+        output_path = self.write_file('output.txt', "q1\tt1\t100.0\n")
+        for missing in ['output', 'meta.json']:
+            key = ResultCache.key(outfmt='7', missing=missing)
+            self.cache.put(key, output_path)
+            os.remove(os.path.join(self.cache._entry_dir(key), missing))
+
+            self.assertIsNone(self.cache.get(key, os.path.join(self.work_dir, 'got.txt')), missing)
+            self.assertTrue(self.cache.put(key, output_path))
+            got_path = self.cache.get(key, os.path.join(self.work_dir, 'got.txt'))
+            self.assertEqual(self.read_file(got_path), "q1\tt1\t100.0\n")
+
+    def test_unreadable_meta_misses(self):
+        output_path = self.write_file('output.txt', "q1\tt1\t100.0\n")
+        key = ResultCache.key(outfmt='7')
+        self.cache.put(key, output_path)
+        with open(self.meta_path(key), 'w') as meta_handle:
+            meta_handle.write('{"size_bytes": ')
+        self.assertIsNone(self.cache.get(key, os.path.join(self.work_dir, 'got.txt')))
+
+    def test_disabled_cache(self):
+        cache = ResultCache(None, 1024)
+        output_path = self.write_file('output.txt', "q1\tt1\t100.0\n")
+        self.assertFalse(cache.put(ResultCache.key(outfmt='7'), output_path))
+        self.assertIsNone(cache.get(ResultCache.key(outfmt='7'), os.path.join(self.work_dir, 'got.txt')))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from kb_blast.Utils.ScratchManager import KEEP_CONFIG_KEY, KEEP_ENV_VAR, QUOTA_CONFIG_KEY, QUOTA_ENV_VAR, \
+                                          ScratchManager
+
+
+class kb_blastScratchManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp(prefix='kb_blast_scratch_manager_')
+        self.addCleanup(shutil.rmtree, self.scratch, True)
+
+    def write_file(self, dir_path, name, n_bytes):
+        file_path = os.path.join(dir_path, name)
+        with open(file_path, 'wb') as file_handle:
+            file_handle.write(b'A' * n_bytes)
+        return file_path
+
+    def scratch_manager(self, **kwargs):
+        scratch_manager = ScratchManager(self.scratch, **kwargs)
+        self.addCleanup(scratch_manager.cleanup)
+        return scratch_manager
+
+    def test_stage_dirs(self):
+        scratch_manager = self.scratch_manager()
+        self.assertEqual(os.path.dirname(scratch_manager.job_dir), self.scratch)
+        self.assertEqual(scratch_manager.stage_dir('targets', '12/3/4'),
+                         os.path.join(scratch_manager.job_dir, 'targets', '12_3_4'))
+        self.assertEqual(scratch_manager.stage_dir('targets', '12/3/4'), scratch_manager.stage_dir('targets', '12/3/4'))
+        self.assertNotEqual(scratch_manager.new_dir('search'), scratch_manager.new_dir('search'))
+        self.assertNotEqual(self.scratch_manager().job_dir, scratch_manager.job_dir)
+
+    def test_quota(self):
+        scratch_manager = self.scratch_manager(quota_bytes=1000)
+        self.write_file(scratch_manager.stage_dir('query'), 'query.fasta', 600)
+        self.assertEqual(scratch_manager.check_quota('query_write'), 600)
+        self.write_file(scratch_manager.stage_dir('targets', '1/2/3'), 'target.fasta', 600)
+        with self.assertRaisesRegex(ValueError, 'scratch quota exceeded after target_write'):
+            scratch_manager.check_quota('target_write')
+        # only the job's own directory counts
+        self.write_file(self.scratch, 'other_job.fasta', 5000)
+        os.remove(os.path.join(scratch_manager.stage_dir('targets', '1/2/3'), 'target.fasta'))
+        self.assertEqual(scratch_manager.check_quota('format_db'), 600)
+        self.assertEqual(scratch_manager.peak_usage_bytes, 1200)
+
+        self.write_file(scratch_manager.stage_dir('search'), 'alnout.txt', 10**6)
+        self.scratch_manager().check_quota('search')
+
+    def test_cleanup(self):
+        scratch_manager = ScratchManager(self.scratch)
+        self.write_file(scratch_manager.stage_dir('search', 'x'), 'alnout.txt', 300)
+        self.assertIn(scratch_manager.job_dir, ScratchManager._live)
+        self.assertEqual(scratch_manager.cleanup(), 300)
+        self.assertFalse(os.path.exists(scratch_manager.job_dir))
+        self.assertNotIn(scratch_manager.job_dir, ScratchManager._live)
+        # again, as the finally of a job whose cleanup already ran would
+        self.assertEqual(scratch_manager.cleanup(), 300)
+
+    def test_keep(self):
+        scratch_manager = ScratchManager(self.scratch, keep=True)
+        self.write_file(scratch_manager.stage_dir('search'), 'alnout.txt', 10)
+        self.assertNotIn(scratch_manager.job_dir, ScratchManager._live)
+        scratch_manager.cleanup()
+        self.assertTrue(os.path.isfile(os.path.join(scratch_manager.job_dir, 'search', 'alnout.txt')))
+
+    def test_cleanup_at_exit(self):
+        died = ScratchManager(self.scratch)
+        kept = ScratchManager(self.scratch, keep=True)
+        with mock.patch.object(ScratchManager, '_live', set([died.job_dir])):
+            ScratchManager._cleanup_live()
+            self.assertEqual(ScratchManager._live, set())
+        self.assertFalse(os.path.exists(died.job_dir))
+        self.assertTrue(os.path.isdir(kept.job_dir))
+
+    def test_for_job(self):
+        with mock.patch.dict(os.environ, {QUOTA_ENV_VAR: '2048', KEEP_ENV_VAR: 'yes'}):
+            scratch_manager = ScratchManager.for_job(self.scratch, {})
+            self.assertEqual((scratch_manager.quota_bytes, scratch_manager.keep), (2048, True))
+            scratch_manager = ScratchManager.for_job(self.scratch, {QUOTA_CONFIG_KEY: '4096', KEEP_CONFIG_KEY: 'off'})
+            self.assertEqual((scratch_manager.quota_bytes, scratch_manager.keep), (4096, False))
+            scratch_manager.cleanup()
+        with mock.patch.dict(os.environ, {QUOTA_ENV_VAR: '', KEEP_ENV_VAR: ''}):
+            scratch_manager = ScratchManager.for_job(self.scratch, {})
+            self.assertEqual((scratch_manager.quota_bytes, scratch_manager.keep), (None, False))
+            scratch_manager.cleanup()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import unittest
+
+from kb_blast import kb_blastServer
+
+
+class kb_blastServerEncodingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = kb_blastServer.Application()
+
+        # methods with non-ASCII results, added the way the generated
+        # server adds the Impl's methods
+        def echo_name(ctx, name):
+            return [{'name': name}]
+
+        def fail_on_name(ctx, name):
+            raise ValueError("no protein sequences found in '"+name+"'")
+
+        cls.app.rpc_service.add(echo_name, name='kb_blast.echo_name', types=[str])
+        cls.app.method_authentication['kb_blast.echo_name'] = 'none'
+        cls.app.rpc_service.add(fail_on_name, name='kb_blast.fail_on_name', types=[str])
+        cls.app.method_authentication['kb_blast.fail_on_name'] = 'none'
+
+    # call the app as the WSGI server would, returning (status, headers, body)
+    def call_app(self, method, params):
+        request_body = json.dumps({'method': method,
+                                   'params': params,
+                                   'version': '1.1',
+                                   'id': '12345'}).encode('utf-8')
+        environ = {'REQUEST_METHOD': 'POST',
+                   'CONTENT_LENGTH': str(len(request_body)),
+                   'REMOTE_ADDR': '127.0.0.1',
+                   'wsgi.input': io.BytesIO(request_body)}
+        response = dict()
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        body = b''.join(self.app(environ, start_response))
+        return (response['status'], response['headers'], body)
+
+    def test_content_length_counts_bytes_of_non_ascii_result(self):
+        name = 'Escherichia_colí_K-12_β'
+        (status, headers, body) = self.call_app('kb_blast.echo_name', [name])
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(int(headers['content-length']), len(body))
+        self.assertEqual(json.loads(body.decode('utf-8'))['result'][0]['name'], name)
+
+    def test_content_length_counts_bytes_of_non_ascii_error(self):
+        name = 'Pseudomonas_ß'
+        (status, headers, body) = self.call_app('kb_blast.fail_on_name', [name])
+        self.assertEqual(status, '500 Internal Server Error')
+        self.assertEqual(int(headers['content-length']), len(body))
+        error = json.loads(body.decode('utf-8'))['error']
+        self.assertIn(name, error['error'])
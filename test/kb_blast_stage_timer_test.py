@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from kb_blast.Utils.StageTimer import StageTimer
+
+
+class kb_blastStageTimerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='kb_blast_stage_timer_')
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+
+    def test_summary_is_outer_spans_of_owner_thread(self):
+        stage_timer = StageTimer()
+        with stage_timer.span('validate'):
+            pass
+        with stage_timer.span('search', target='1/2/3'):
+            with stage_timer.span('format_db'):
+                pass
+        with stage_timer.span('search', target='1/3/3'):
+            pass
+
+        def convert():
+            with stage_timer.span('target_convert'):
+                pass
+
+        worker = threading.Thread(target=convert)
+        with stage_timer.span('target_write'):
+            worker.start()
+            worker.join()
+
+        self.assertEqual([stage for (stage, wall_secs) in stage_timer.summary()],
+                         ['validate', 'search', 'target_write'])
+        self.assertEqual(len(stage_timer.spans), 6)
+        nested = [span for span in stage_timer.spans if span['stage'] == 'format_db'][0]
+        self.assertEqual(nested['depth'], 1)
+
+    def test_start_stage(self):
+        stage_timer = StageTimer()
+        stage_timer.start_stage('validate')
+        stage_timer.start_stage('search')
+        with stage_timer.span('format_db'):
+            pass
+        stage_timer.end_stage()
+        stage_timer.end_stage()
+        stage_timer.start_stage('save')
+        stage_timer.end_stage('error')
+        self.assertEqual([stage for (stage, wall_secs) in stage_timer.summary()], ['validate', 'search', 'save'])
+        self.assertEqual([(span['stage'], span['depth'], span['status']) for span in stage_timer.spans],
+                         [('validate', 0, 'ok'), ('format_db', 1, 'ok'), ('search', 0, 'ok'), ('save', 0, 'error')])
+
+    def test_error_span_is_kept(self):
+        stage_timer = StageTimer()
+        with self.assertRaises(ValueError):
+            with stage_timer.span('save'):
+                raise ValueError('save failed')
+        self.assertEqual(stage_timer.spans[0]['status'], 'error')
+        self.assertEqual(stage_timer.summary()[0][0], 'save')
+
+    def test_peak_rss_is_not_reset(self):
+        stage_timer = StageTimer()
+        with stage_timer.span('parse'):
+            buf = bytearray(64 * 1024 * 1024)
+            for i in range(0, len(buf), 4096):
+                buf[i] = 1
+        del buf
+        with stage_timer.span('save'):
+            pass
+        (parse_span, save_span) = stage_timer.spans
+        self.assertTrue(save_span['peak_rss_kb'] >= parse_span['peak_rss_kb'])
+        self.assertEqual(save_span['peak_rss_growth_kb'], 0)
+        if parse_span['rss_kb'] is not None:
+            self.assertTrue(parse_span['rss_kb'] > 0)
+
+    def test_write_timeline(self):
+        stage_timer = StageTimer()
+        with stage_timer.span('validate'):
+            pass
+        timeline_path = stage_timer.write_timeline(os.path.join(self.work_dir, 'timeline.json'),
+                                                   job_info={'method': 'BLASTp_Search'})
+        with open(timeline_path, 'r') as timeline_handle:
+            timeline = json.load(timeline_handle)
+        self.assertEqual(timeline['job'], {'method': 'BLASTp_Search'})
+        self.assertEqual([span['stage'] for span in timeline['spans']], ['validate'])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+from unittest import mock
+
+from kb_blast.Utils.BlastUtil import BlastUtil
+from kb_blast.Utils.StageTimer import StageTimer
+
+
+# a DataObjectToFileUtils client that counts how many conversions run at once
+class _DOTFU:
+
+    def __init__(self, fail_ref=None):
+        self.fail_ref = fail_ref
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def GenomeToFASTA(self, params):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.05)
+            if params['genome_ref'] == self.fail_ref:
+                raise ValueError('no such genome '+params['genome_ref'])
+            return {'fasta_file_path': params['genome_ref'].replace('/', '_')+'.fasta'}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class kb_blastTargetConversionTest(unittest.TestCase):
+
+    def blast_util(self, dotfu, max_concurrent):
+        blast_util = BlastUtil.__new__(BlastUtil)
+        blast_util.job_log = mock.Mock()
+        blast_util.stage_timer = StageTimer()
+        blast_util.DOTFU = dotfu
+        blast_util.max_concurrent_DOTFU_jobs = max_concurrent
+        blast_util.DOTFU_semaphore = threading.BoundedSemaphore(max_concurrent)
+        blast_util._prep_target_obj_conversion = lambda params, ref, seq_type: \
+            {'target_name': 'genome_'+ref, 'DOTFU_method': 'GenomeToFASTA', 'DOTFU_params': {'genome_ref': ref}}
+        blast_util._finish_target_obj_conversion = lambda target_conversion, DOTFU_retVal: \
+            {'target_name': target_conversion['target_name'],
+             'target_fasta_file_path': DOTFU_retVal['fasta_file_path']}
+        return blast_util
+
+    def test_concurrent_up_to_the_limit(self):
+        refs = ['1/'+str(n)+'/1' for n in range(6)]
+        dotfu = _DOTFU()
+        blast_util = self.blast_util(dotfu, 3)
+        results = blast_util.write_target_objs_to_files({}, refs, 'NUC')
+        self.assertEqual(results, dict((ref, {'target_name': 'genome_'+ref,
+                                              'target_fasta_file_path': ref.replace('/', '_')+'.fasta'})
+                                       for ref in refs))
+        self.assertEqual(dotfu.max_running, 3)
+
+        # the stage is timed on the job's thread, each conversion on the pool's
+        spans = blast_util.stage_timer.spans
+        target_write = [span for span in spans if span['stage'] == 'target_write']
+        self.assertEqual(len(target_write), 1)
+        self.assertEqual(target_write[0]['thread'], threading.current_thread().name)
+        self.assertEqual(target_write[0]['attrs'], {'num_targets': 6})
+        convert = [span for span in spans if span['stage'] == 'target_convert']
+        self.assertEqual(sorted(span['attrs']['target'] for span in convert), sorted(refs))
+        self.assertTrue(all(span['thread'] != threading.current_thread().name for span in convert))
+
+    def test_one_at_a_time(self):
+        dotfu = _DOTFU()
+        self.blast_util(dotfu, 1).write_target_objs_to_files({}, ['1/1/1', '1/2/1', '1/3/1'], 'PROT')
+        self.assertEqual(dotfu.max_running, 1)
+
+    def test_failure_is_raised(self):
+        dotfu = _DOTFU(fail_ref='1/2/1')
+        blast_util = self.blast_util(dotfu, 4)
+        with self.assertRaisesRegex(ValueError, 'no such genome 1/2/1'):
+            blast_util.write_target_objs_to_files({}, ['1/1/1', '1/2/1', '1/3/1'], 'NUC')
+        self.assertEqual(dotfu.running, 0)
+        self.assertEqual([span['status'] for span in blast_util.stage_timer.spans if span['stage'] == 'target_write'],
+                         ['error'])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from kb_blast.Utils.UploadQueue import UploadQueue
+
+
+# a DataFileUtil client whose uploads block until released
+class _DFU:
+
+    def __init__(self, n_parties=1):
+        self.barrier = threading.Barrier(n_parties, timeout=10)
+        self.release = threading.Event()
+        self.release.set()
+        self.uploaded = []
+        self.lock = threading.Lock()
+
+    def file_to_shock(self, params):
+        self.barrier.wait()
+        self.release.wait(10)
+        if params['file_path'].endswith('bad.txt'):
+            raise IOError('no route to Shock')
+        with self.lock:
+            self.uploaded.append(params)
+        return {'shock_id': os.path.basename(params['file_path'])}
+
+
+class kb_blastUploadQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='kb_blast_upload_queue_')
+        self.addCleanup(shutil.rmtree, self.work_dir, True)
+
+    def upload_queue(self, dfu, max_workers=None):
+        upload_queue = UploadQueue('http://localhost:9', token='token', max_workers=max_workers)
+        upload_queue.dfu = dfu
+        self.addCleanup(upload_queue.shutdown)
+        return upload_queue
+
+    def write_file(self, name, contents='q1\tt1\t100.0\n'):
+        file_path = os.path.join(self.work_dir, name)
+        with open(file_path, 'w') as file_handle:
+            file_handle.write(contents)
+        return file_path
+
+    def test_uploads_run_in_parallel(self):
+        # each upload waits for all four to have started
+        dfu = _DFU(n_parties=4)
+        upload_queue = self.upload_queue(dfu, max_workers=4)
+        upload_keys = [upload_queue.submit(self.write_file('out_'+str(n)+'.txt')) for n in range(4)]
+        self.assertEqual([upload_queue.wait(upload_key)['shock_id'] for upload_key in upload_keys],
+                         ['out_'+str(n)+'.txt' for n in range(4)])
+
+    def test_compress_and_pack(self):
+        dfu = _DFU()
+        upload_queue = self.upload_queue(dfu)
+        file_path = self.write_file('alnout.txt', 'q1\tt1\t100.0\n' * 1000)
+        self.assertEqual(upload_queue.wait(upload_queue.submit(file_path, compress=True))['shock_id'], 'alnout.txt.gz')
+        with gzip.open(file_path+'.gz', 'rt') as gz_handle:
+            self.assertEqual(gz_handle.read(), 'q1\tt1\t100.0\n' * 1000)
+        html_dir = os.path.join(self.work_dir, 'html')
+        os.makedirs(html_dir)
+        upload_queue.wait(upload_queue.submit(html_dir, pack='zip'))
+        self.assertEqual(dfu.uploaded[-1], {'file_path': html_dir, 'make_handle': 0, 'pack': 'zip'})
+
+    def test_errors(self):
+        upload_queue = self.upload_queue(_DFU())
+        file_path = self.write_file('out.txt')
+        upload_queue.submit(file_path)
+        with self.assertRaises(ValueError):
+            upload_queue.submit(file_path)
+        with self.assertRaises(ValueError):
+            upload_queue.wait('never_queued.txt')
+        with self.assertRaisesRegex(ValueError, 'error uploading .*bad.txt'):
+            upload_queue.wait(upload_queue.submit(self.write_file('bad.txt')))
+
+    def test_cancel_pending(self):
+        dfu = _DFU()
+        dfu.release.clear()
+        upload_queue = self.upload_queue(dfu, max_workers=1)
+        running_key = upload_queue.submit(self.write_file('running.txt'))
+        upload_queue.submit(self.write_file('pending.txt'))
+        self.assertEqual(upload_queue.cancel_pending(), 1)
+        dfu.release.set()
+        upload_queue.shutdown()
+        self.assertEqual(upload_queue.wait(running_key)['shock_id'], 'running.txt')
+        self.assertEqual([params['file_path'] for params in dfu.uploaded], [running_key])